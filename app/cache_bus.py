@@ -0,0 +1,285 @@
+"""Cross-process invalidation bus for the per-process caches.
+
+Goals
+- Under `uvicorn --workers N` (WEB_CONCURRENCY=N) every worker has its own
+  copies of the visibility, link graph, hashtag vocabulary, hashtag stats and
+  tag->id caches. Their invalidation hooks only see the writes made by their
+  own process, so a write served by worker A must also drop the entries held
+  by workers B..N.
+- No external services: each worker binds a Unix datagram socket
+  `<CACHE_BUS_DIR>/<pid>.sock`, and an invalidation is one small datagram sent
+  to every other socket in the directory. Peers are found by listing the
+  directory at publish time, so restarted or newly forked workers are picked
+  up immediately and sockets of dead workers are unlinked on first failure.
+- Invalidations raised in one event-loop tick are coalesced into a single
+  datagram per peer.
+- Each datagram carries a per-process sequence number. A receiver that sees a
+  gap (a datagram dropped because its socket buffer was full) drops every
+  subscribed cache instead of guessing what it missed; the caches' TTLs bound
+  staleness if the very last datagram is the one lost.
+
+Usage
+- Caches call `cache_bus.publish('visibility', owner_id)` from their
+  invalidate methods (key None means "everything") and register a local-only
+  handler with `cache_bus.subscribe('visibility', fn)`; fn(key) must not
+  publish again.
+- `cache_bus.start()` / `cache_bus.stop()` run in the app lifespan when
+  multi-worker mode is on (app/workers.py). publish() is a no-op until
+  started, so the single-process server and tests pay nothing.
+- Peers apply an invalidation a moment after the writer's commit returns
+  (one loop iteration on each side), not atomically with it.
+"""
+from __future__ import annotations
+
+from typing import Callable, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# datagrams are tiny; a large receive buffer only matters for bursts
+_RCVBUF = 1 << 20
+_MAX_DATAGRAM = 1 << 16
+
+
+class CacheBus:
+    """Unix datagram pub/sub between the worker processes; see the module docstring."""
+
+    def __init__(self, directory: Optional[str] = None, name: Optional[str] = None):
+        self._dir = directory
+        # socket file name; the pid unless several buses share a process (tests)
+        self._name = name
+        self._sock: Optional[socket.socket] = None
+        self._path: Optional[str] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # unique per process start, so a recycled pid is a new origin
+        self._origin = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self._lock = threading.Lock()
+        self._seq = 0
+        # origin -> last sequence number received
+        self._seen: dict[str, int] = {}
+        self._handlers: dict[str, list[Callable]] = {}
+        # channel -> set of keys waiting for the next send (None: everything)
+        self._outbox: dict[str, set] = {}
+        self._flush_scheduled = False
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.gaps = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._sock is not None
+
+    @property
+    def directory(self) -> str:
+        if self._dir is None:
+            from .workers import runtime_dir
+            self._dir = runtime_dir()
+        return self._dir
+
+    def subscribe(self, channel: str, fn: Callable[[object], None]) -> None:
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(fn)
+
+    # --- lifecycle -----------------------------------------------------------
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> bool:
+        """Bind this process's socket and start receiving. Returns True when running."""
+        if self._sock is not None:
+            return True
+        try:
+            loop = loop or asyncio.get_running_loop()
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            path = os.path.join(self.directory, f'{self._name or os.getpid()}.sock')
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RCVBUF)
+            except OSError:
+                pass
+            sock.bind(path)
+            sock.setblocking(False)
+            loop.add_reader(sock.fileno(), self._on_readable)
+        except Exception:
+            logger.exception('cache bus: could not start in %s', self._dir)
+            return False
+        self._sock, self._path, self._loop = sock, path, loop
+        logger.info('cache bus: listening on %s', path)
+        return True
+
+    def stop(self) -> None:
+        if self._sock is None:
+            return
+        # deliver anything still queued before going away
+        self._send_outbox()
+        sock, path, loop = self._sock, self._path, self._loop
+        self._sock = self._path = self._loop = None
+        try:
+            if loop is not None and not loop.is_closed():
+                loop.remove_reader(sock.fileno())
+        except Exception:
+            pass
+        try:
+            sock.close()
+        except Exception:
+            pass
+        try:
+            os.unlink(path)
+        except Exception:
+            pass
+
+    # --- publishing ----------------------------------------------------------
+
+    def publish(self, channel: str, key=None) -> None:
+        """Tell the other workers to drop `key` (None: everything) from `channel`."""
+        if self._sock is None:
+            return
+        with self._lock:
+            keys = self._outbox.setdefault(channel, set())
+            if key is None or None in keys:
+                keys.clear()
+                keys.add(None)
+            elif isinstance(key, (list, tuple, set, frozenset)):
+                keys.update(key)
+            else:
+                keys.add(key)
+            if self._flush_scheduled:
+                return
+            self._flush_scheduled = True
+        loop = self._loop
+        try:
+            if loop is None:
+                raise RuntimeError('no loop')
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                loop.call_soon(self._send_outbox)
+            else:
+                loop.call_soon_threadsafe(self._send_outbox)
+        except Exception:
+            self._send_outbox()
+
+    def _send_outbox(self) -> None:
+        with self._lock:
+            self._flush_scheduled = False
+            outbox, self._outbox = self._outbox, {}
+            if not outbox or self._sock is None:
+                return
+            self._seq += 1
+            seq = self._seq
+        body = {c: (None if None in keys else sorted(keys, key=str)) for c, keys in outbox.items()}
+        data = json.dumps({'o': self._origin, 's': seq, 'c': body}, separators=(',', ':')).encode('utf-8')
+        if len(data) > _MAX_DATAGRAM:
+            # absurdly many keys: tell peers to drop those channels entirely
+            data = json.dumps({'o': self._origin, 's': seq, 'c': {c: None for c in outbox}}).encode('utf-8')
+        for peer in self._peers():
+            try:
+                self._sock.sendto(data, peer)
+                self.sent += 1
+            except (BlockingIOError, InterruptedError):
+                # the peer's buffer is full; it will notice the sequence gap
+                self.dropped += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # socket file of a worker that exited without cleaning up
+                try:
+                    os.unlink(peer)
+                except Exception:
+                    pass
+            except Exception:
+                self.dropped += 1
+                logger.debug('cache bus: send to %s failed', peer, exc_info=True)
+
+    def _peers(self) -> list[str]:
+        out = []
+        try:
+            with os.scandir(self.directory) as it:
+                for ent in it:
+                    if ent.name.endswith('.sock') and ent.path != self._path:
+                        out.append(ent.path)
+        except FileNotFoundError:
+            pass
+        return out
+
+    # --- receiving -----------------------------------------------------------
+
+    def _on_readable(self) -> None:
+        sock = self._sock
+        while sock is not None:
+            try:
+                data = sock.recv(_MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except Exception:
+                logger.debug('cache bus: recv failed', exc_info=True)
+                return
+            self.dispatch(data)
+
+    def dispatch(self, data: bytes) -> None:
+        """Apply one datagram from a peer."""
+        try:
+            msg = json.loads(data)
+            origin = str(msg['o'])
+            seq = int(msg['s'])
+            channels = dict(msg['c'])
+        except Exception:
+            logger.warning('cache bus: ignoring malformed datagram')
+            return
+        if origin == self._origin:
+            return
+        self.received += 1
+        with self._lock:
+            last = self._seen.get(origin)
+            self._seen[origin] = seq
+        if last is not None and seq != last + 1:
+            self.gaps += 1
+            logger.info('cache bus: %d datagram(s) from %s lost; dropping all caches', seq - last - 1, origin)
+            self._deliver_all()
+            return
+        for channel, keys in channels.items():
+            if keys is None:
+                self._deliver(channel, None)
+            else:
+                for key in keys:
+                    self._deliver(channel, key)
+
+    def _deliver(self, channel: str, key) -> None:
+        with self._lock:
+            fns = list(self._handlers.get(channel, ()))
+        for fn in fns:
+            try:
+                fn(key)
+            except Exception:
+                logger.exception('cache bus: %s handler failed', channel)
+
+    def _deliver_all(self) -> None:
+        with self._lock:
+            channels = list(self._handlers)
+        for channel in channels:
+            self._deliver(channel, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'path': self._path,
+                'peers': len(self._peers()) if self.enabled else 0,
+                'sent': self.sent,
+                'received': self.received,
+                'dropped': self.dropped,
+                'gaps': self.gaps,
+                'channels': sorted(self._handlers),
+            }
+
+
+cache_bus = CacheBus()
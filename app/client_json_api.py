@@ -8,6 +8,10 @@ from fastapi.responses import JSONResponse
 from .db import async_session
 from .models import ListState, ListHashtag, Hashtag, Todo, TodoHashtag, CompletionType, TodoCompletion, Category, UserCollation, ItemLink, JournalEntry, ListNote
 from .utils import format_in_timezone
+from .visibility import visibility
+from .link_graph import link_graph
+from . import ordering
+from .hashtag_vocab import hashtag_vocab
 from .auth import get_current_user as _gcu
 from .utils import extract_hashtags, now_utc, parse_metadata_json, validate_metadata_for_storage
 from sqlalchemy import select, func, or_, and_
@@ -109,19 +113,8 @@ async def client_search(request: Request):
                     for t in (await sess.exec(qall)).all():
                         todos_acc.setdefault(t.id, t)
                 lm = {l.id: l.name for l in (await sess.scalars(select(ListState).where(ListState.id.in_(vis_ids)))).all()}
-                todo_list_ids = list({t.list_id for t in todos_acc.values()})
-                default_ct_ids: dict[int, int] = {}
-                if todo_list_ids:
-                    qct = select(CompletionType).where(CompletionType.list_id.in_(todo_list_ids)).where(CompletionType.name == 'default')
-                    for ct in (await sess.exec(qct)).all():
-                        default_ct_ids[int(ct.list_id)] = int(ct.id)
-                todo_ids = list(todos_acc.keys())
-                completed_ids: set[int] = set()
-                if todo_ids and default_ct_ids:
-                    qdone = select(TodoCompletion.todo_id, TodoCompletion.done, TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(TodoCompletion.completion_type_id.in_(list(default_ct_ids.values())))
-                    for tid, done_val, ctid in (await sess.exec(qdone)).all():
-                        if done_val:
-                            completed_ids.add(int(tid))
+                # default completion status comes from the denormalized Todo.is_done
+                completed_ids: set[int] = {int(t.id) for t in todos_acc.values() if t.is_done}
                 results['todos'] = [
                     {'id': t.id, 'text': t.text, 'note': t.note, 'list_id': t.list_id, 'list_name': lm.get(t.list_id), 'completed': (int(t.id) in completed_ids), 'metadata': parse_metadata_json(getattr(t, 'metadata_json', None))}
                     for t in todos_acc.values() if not (exclude_completed and (int(t.id) in completed_ids))
@@ -560,15 +553,12 @@ async def list_user_collations(request: Request):
         # Exclude lists that are currently in Trash (by parent_list_id to the user's Trash list)
         trashed: set[int] = set()
         if list_ids:
-            trash_id = None
+            # lists moved to Trash (or below one); cached per user
             try:
-                trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-                trash_id = trq.first()
+                vis = await visibility.get(sess, current_user.id)
+                trashed = {int(v) for v in list_ids if int(v) in vis.trashed_list_ids}
             except Exception:
-                trash_id = None
-            if trash_id is not None:
-                tq = await sess.scalars(select(ListState.id).where(ListState.id.in_(list_ids)).where(ListState.parent_list_id == trash_id))
-                trashed = set(int(v) for v in tq.all())
+                trashed = set()
         out = [
             {'list_id': int(r.list_id), 'name': names.get(int(r.list_id)), 'active': bool(getattr(r, 'active', True))}
             for r in rows if (int(r.list_id) in names and int(r.list_id) not in trashed)
@@ -652,29 +642,19 @@ async def get_collation_status(request: Request, todo_id: int):
         # Filter out collation lists that are currently in Trash (parent to user's Trash list)
         trashed: set[int] = set()
         if ids:
-            trash_id = None
+            # lists moved to Trash (or below one); cached per user
             try:
-                trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-                trash_id = trq.first()
+                vis = await visibility.get(sess, current_user.id)
+                trashed = {int(v) for v in ids if int(v) in vis.trashed_list_ids}
             except Exception:
-                trash_id = None
-            if trash_id is not None:
-                tq = await sess.scalars(select(ListState.id).where(ListState.id.in_(ids)).where(ListState.parent_list_id == trash_id))
-                trashed = set(int(v) for v in tq.all())
+                trashed = set()
         linked_map = {}
         if ids:
-            res = await sess.scalars(
-                select(ItemLink.src_id)
-                .where(ItemLink.src_type == 'list')
-                .where(ItemLink.tgt_type == 'todo')
-                .where(ItemLink.tgt_id == todo_id)
-                .where(ItemLink.src_id.in_(ids))
-            )
-            for sid in res.all():
-                try:
+            # collations linking to this todo (backlinks in the link graph)
+            holding = (await link_graph.get(sess, current_user.id)).sources('todo', todo_id, 'list')
+            for sid in ids:
+                if int(sid) in holding:
                     linked_map[int(sid)] = True
-                except Exception:
-                    pass
         out = []
         for r in rows:
             lid = int(r.list_id)
@@ -706,16 +686,13 @@ async def toggle_collation_membership(request: Request, list_id: int):
         lst = await sess.get(ListState, list_id)
         if not lst or lst.owner_id != current_user.id:
             raise HTTPException(status_code=404, detail='list not found')
-        # Disallow toggling when the list is in Trash (parented to the user's Trash list)
+        # Disallow toggling when the list is in Trash (or below a trashed list)
         try:
-            trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-            trash_id = trq.first()
+            in_trash = list_id in (await visibility.get(sess, current_user.id)).trashed_list_ids
         except Exception:
-            trash_id = None
-        if trash_id is not None:
-            pq = await sess.scalars(select(ListState.id).where(ListState.id == list_id).where(ListState.parent_list_id == trash_id))
-            if pq.first() is not None:
-                raise HTTPException(status_code=409, detail='list is trashed')
+            in_trash = False
+        if in_trash:
+            raise HTTPException(status_code=409, detail='list is trashed')
         uc = await sess.get(UserCollation, (current_user.id, list_id))
         if not uc:
             raise HTTPException(status_code=403, detail='not a user collation')
@@ -746,23 +723,7 @@ async def toggle_collation_membership(request: Request, list_id: int):
         if want_link and not existing:
             # compute next position
             try:
-                res = await sess.exec(
-                    select(func.max(ItemLink.position))
-                    .where(ItemLink.src_type == 'list')
-                    .where(ItemLink.src_id == list_id)
-                )
-                row = res.first()
-                if row is None:
-                    max_pos = None
-                else:
-                    try:
-                        # row may be a Row or scalar depending on driver
-                        max_pos = row[0] if isinstance(row, (tuple, list)) else (
-                            row if isinstance(row, (int, type(None))) else getattr(row, '_mapping', {}).get('max_1')
-                        )
-                    except Exception:
-                        max_pos = None
-                pos = (int(max_pos) + 1) if (max_pos is not None) else 0
+                pos = await ordering.append_position(sess, ordering.link_siblings('list', list_id))
             except Exception:
                 pos = 0
             sess.add(
@@ -905,7 +866,7 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
             completed_ids = set()
             if todo_ids:
                 try:
-                    qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                    qcomp = select(Todo.id).where(Todo.id.in_(todo_ids)).where(Todo.is_done == True)
                     cres = await sess.exec(qcomp)
                     completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                 except Exception:
@@ -937,7 +898,7 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
             for lid, cnt in qcnt.all():
                 counts[lid] = int(cnt or 0)
             try:
-                qcomp = await sess.exec(select(Todo.id, Todo.list_id).join(TodoCompletion, TodoCompletion.todo_id == Todo.id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(Todo.list_id.in_(list_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                qcomp = await sess.exec(select(Todo.id, Todo.list_id).where(Todo.list_id.in_(list_ids)).where(Todo.is_done == True))
                 for tid, lid in qcomp.all():
                     counts[lid] = max(0, counts.get(lid, 0) - 1)
             except Exception:
@@ -949,14 +910,8 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
                 uc_ids_all = [r[0] if isinstance(r, (list, tuple)) else int(getattr(r, 'list_id', r)) for r in quc.all()]
                 collation_ids = [lid for lid in uc_ids_all if lid in list_ids]
                 if collation_ids:
-                    qlinks = await sess.exec(
-                        select(ItemLink.src_id, ItemLink.tgt_id)
-                        .where(ItemLink.src_type == 'list')
-                        .where(ItemLink.tgt_type == 'todo')
-                        .where(ItemLink.src_id.in_(collation_ids))
-                        .where(ItemLink.owner_id == owner_id)
-                    )
-                    link_rows = qlinks.all()
+                    # list -> todo edges of the collations, from the per-user link graph
+                    link_rows = (await link_graph.get(sess, owner_id)).pairs('list', collation_ids, 'todo')
                     coll_link_map: dict[int, set[int]] = {}
                     all_linked_ids: set[int] = set()
                     for src_id, tgt_id in link_rows:
@@ -968,7 +923,7 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
                         all_linked_ids.add(tid)
                     if all_linked_ids:
                         try:
-                            qlcomp = await sess.exec(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(list(all_linked_ids))).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                            qlcomp = await sess.exec(select(Todo.id).where(Todo.id.in_(list(all_linked_ids))).where(Todo.is_done == True))
                             linked_completed = set(r[0] if isinstance(r, tuple) else r for r in qlcomp.all())
                         except Exception:
                             linked_completed = set()
@@ -1057,7 +1012,7 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
                         p['tags'] = pm.get(p['id'], [])
                 try:
                     if pin_ids:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(pin_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                        qcomp = select(Todo.id).where(Todo.id.in_(pin_ids)).where(Todo.is_done == True)
                         cres = await sess.exec(qcomp)
                         completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                     else:
@@ -1087,6 +1042,251 @@ async def client_list_index(request: Request, per_page: Optional[int] = None):
     return JSONResponse(payload)
 
 
+# Fields a v2 index list row can carry; `fields=` selects a subset.
+_V2_LIST_FIELDS = (
+    'id', 'name', 'completed', 'owner_id', 'created_at', 'modified_at', 'category_id',
+    'priority', 'override_priority', 'hashtags', 'uncompleted_count', 'hide_icons', 'metadata',
+)
+# What the index page actually renders; used when `fields=` is absent.
+_V2_DEFAULT_FIELDS = (
+    'id', 'name', 'completed', 'category_id', 'priority', 'override_priority',
+    'hashtags', 'uncompleted_count', 'hide_icons',
+)
+
+
+def _parse_csv_param(val: Optional[str], allowed, default) -> set[str]:
+    if val is None or not str(val).strip():
+        return set(default)
+    out = {tok.strip() for tok in str(val).split(',') if tok.strip()}
+    return {f for f in out if f in allowed}
+
+
+@router.get('/v2/lists', response_class=JSONResponse)
+async def client_list_index_v2(request: Request, per_page: Optional[int] = None):
+    """Keyset-paginated list index with batched side lookups.
+
+    Same data as GET /client/json/lists, but:
+    - fetches per_page+1 rows to derive has_next (has_prev for dir=prev)
+      instead of running separate existence probes; the other direction is
+      implied by the presence of a cursor;
+    - runs a fixed number of side queries per page regardless of its size
+      (hashtags, one aggregate for counts/priorities, collation extras,
+      categories, pinned todos);
+    - returns only the fields the client renders, selectable via
+      fields=id,name,... (always includes id). include=categories,pinned
+      (default both) controls the non-list sections; include= drops them.
+
+    Query params: per_page (1..200, default 50), dir (next|prev),
+    cursor_created_at (ISO) + cursor_id (int), fields, include.
+    """
+    try:
+        current_user = await _gcu(token=None, request=request)
+    except HTTPException:
+        raise HTTPException(status_code=401, detail='authentication required')
+
+    qp = request.query_params
+    try:
+        per_page_val = max(1, min(200, int(per_page) if per_page is not None else 50))
+    except Exception:
+        per_page_val = 50
+    dir_param = 'prev' if qp.get('dir') == 'prev' else 'next'
+    cursor_dt = None
+    cursor_id = None
+    if qp.get('cursor_created_at') and qp.get('cursor_id'):
+        try:
+            cursor_dt = datetime.fromisoformat(qp.get('cursor_created_at'))
+            cursor_id = int(qp.get('cursor_id'))
+        except Exception:
+            cursor_dt, cursor_id = None, None
+    fields = _parse_csv_param(qp.get('fields'), _V2_LIST_FIELDS, _V2_DEFAULT_FIELDS)
+    fields.add('id')
+    if 'include' in qp:
+        include = {tok.strip() for tok in str(qp.get('include')).split(',')} & {'categories', 'pinned'}
+    else:
+        include = {'categories', 'pinned'}
+    owner_id = current_user.id
+
+    async with async_session() as sess:
+        # --- page query: per_page+1 rows in the direction of travel ---
+        q = select(ListState).where(ListState.owner_id == owner_id).where(ListState.parent_todo_id == None).where(ListState.parent_list_id == None)
+        if cursor_dt is not None and cursor_id is not None:
+            if dir_param == 'prev':
+                q = q.where(or_(ListState.created_at > cursor_dt, and_(ListState.created_at == cursor_dt, ListState.id > cursor_id)))
+            else:
+                q = q.where(or_(ListState.created_at < cursor_dt, and_(ListState.created_at == cursor_dt, ListState.id < cursor_id)))
+        if dir_param == 'prev':
+            # walk towards newer rows, nearest to the cursor first
+            q = q.order_by(ListState.created_at.asc(), ListState.id.asc())
+        else:
+            q = q.order_by(ListState.created_at.desc(), ListState.id.desc())
+        rows = (await sess.exec(q.limit(per_page_val + 1))).scalars().all()
+        more = len(rows) > per_page_val
+        lists = rows[:per_page_val]
+        if dir_param == 'prev':
+            lists.reverse()
+            has_prev, has_next = more, cursor_dt is not None
+        else:
+            has_prev, has_next = cursor_dt is not None, more
+        list_ids = [l.id for l in lists]
+
+        # --- pinned todos (visible top-level lists), completion folded in ---
+        pinned_todos: list[dict] = []
+        if 'pinned' in include:
+            try:
+                qp_pin = (
+                    select(Todo.id, Todo.text, Todo.list_id, ListState.name, Todo.modified_at, Todo.priority, Todo.is_done)
+                    .join(ListState, ListState.id == Todo.list_id)
+                    .where(Todo.pinned == True)
+                    .where(or_(ListState.owner_id == owner_id, ListState.owner_id == None))
+                    .where(ListState.parent_todo_id == None)
+                    .where(ListState.parent_list_id == None)
+                    .order_by(Todo.modified_at.desc())
+                )
+                for tid, ttext, lid, lname, mod, pri, done in (await sess.exec(qp_pin)).all():
+                    pinned_todos.append({
+                        'id': tid,
+                        'text': ttext,
+                        'list_id': lid,
+                        'list_name': lname,
+                        'modified_at': (mod.isoformat() if mod else None),
+                        'priority': pri,
+                        'completed': bool(done),
+                        'tags': [],
+                    })
+            except Exception:
+                logger.exception('v2 index: pinned todos lookup failed')
+                pinned_todos = []
+        pin_ids = [p['id'] for p in pinned_todos]
+
+        # --- hashtags for page lists and pinned todos in one UNION query ---
+        list_tags: dict[int, list[str]] = {}
+        todo_tags: dict[int, list[str]] = {}
+        want_list_tags = 'hashtags' in fields and list_ids
+        if want_list_tags or pin_ids:
+            from sqlalchemy import literal, union_all
+            parts = []
+            if want_list_tags:
+                parts.append(
+                    select(literal('l').label('kind'), ListHashtag.list_id.label('oid'), Hashtag.tag)
+                    .join(Hashtag, Hashtag.id == ListHashtag.hashtag_id)
+                    .where(ListHashtag.list_id.in_(list_ids))
+                )
+            if pin_ids:
+                parts.append(
+                    select(literal('t').label('kind'), TodoHashtag.todo_id.label('oid'), Hashtag.tag)
+                    .join(Hashtag, Hashtag.id == TodoHashtag.hashtag_id)
+                    .where(TodoHashtag.todo_id.in_(pin_ids))
+                )
+            uq = parts[0] if len(parts) == 1 else union_all(*parts)
+            for kind, oid, tag in (await sess.exec(uq)).all():
+                (list_tags if kind == 'l' else todo_tags).setdefault(int(oid), []).append(tag)
+            for p in pinned_todos:
+                p['tags'] = todo_tags.get(p['id'], [])
+
+        # --- uncompleted counts and highest uncompleted priority: one aggregate ---
+        counts: dict[int, int] = {}
+        max_pri: dict[int, int] = {}
+        # (always needed: override_priority drives the in-category sort order)
+        if list_ids:
+            from sqlalchemy import case
+            qagg = (
+                select(
+                    Todo.list_id,
+                    func.sum(case((Todo.is_done == True, 0), else_=1)),
+                    func.max(case((Todo.is_done == True, None), else_=Todo.priority)),
+                )
+                .where(Todo.list_id.in_(list_ids))
+                .group_by(Todo.list_id)
+            )
+            for lid, open_cnt, pri in (await sess.exec(qagg)).all():
+                counts[int(lid)] = int(open_cnt or 0)
+                if pri is not None:
+                    try:
+                        max_pri[int(lid)] = int(pri)
+                    except Exception:
+                        pass
+
+        # --- collation lists: open todos linked in from other lists ---
+        extra_counts: dict[int, int] = {}
+        if list_ids and 'uncompleted_count' in fields:
+            try:
+                qcol = (
+                    select(ItemLink.src_id, func.count(func.distinct(ItemLink.tgt_id)))
+                    .join(UserCollation, and_(UserCollation.list_id == ItemLink.src_id, UserCollation.user_id == owner_id))
+                    .join(Todo, Todo.id == ItemLink.tgt_id)
+                    .where(ItemLink.src_type == 'list')
+                    .where(ItemLink.tgt_type == 'todo')
+                    .where(ItemLink.owner_id == owner_id)
+                    .where(ItemLink.src_id.in_(list_ids))
+                    .where(Todo.list_id != ItemLink.src_id)
+                    .where(Todo.is_done == False)
+                    .group_by(ItemLink.src_id)
+                )
+                for lid, cnt in (await sess.exec(qcol)).all():
+                    extra_counts[int(lid)] = int(cnt or 0)
+            except Exception:
+                logger.exception('v2 index: collation counts failed')
+
+        categories: list[dict] = []
+        if 'categories' in include:
+            try:
+                qcat = select(Category).where(Category.owner_id == owner_id).order_by(Category.position.asc())
+                categories = [{'id': c.id, 'name': c.name, 'position': c.position, 'sort_alphanumeric': getattr(c, 'sort_alphanumeric', False)} for c in (await sess.exec(qcat)).scalars().all()]
+            except Exception:
+                categories = []
+
+    # --- build rows, sort within categories as v1 does, then project ---
+    full_rows: list[dict] = []
+    for l in lists:
+        full_rows.append({
+            'id': l.id,
+            'name': l.name,
+            'completed': l.completed,
+            'owner_id': l.owner_id,
+            'created_at': (l.created_at.isoformat() if getattr(l, 'created_at', None) else None),
+            'modified_at': (l.modified_at.isoformat() if getattr(l, 'modified_at', None) else None),
+            'category_id': l.category_id,
+            'priority': getattr(l, 'priority', None),
+            'override_priority': max_pri.get(l.id),
+            'hashtags': list_tags.get(l.id, []),
+            'uncompleted_count': counts.get(l.id, 0) + extra_counts.get(l.id, 0),
+            'hide_icons': getattr(l, 'hide_icons', False),
+            'metadata': parse_metadata_json(getattr(l, 'metadata_json', None)) if 'metadata' in fields else None,
+        })
+
+    def _sort_key(r):
+        lp = r.get('priority') if (r.get('priority') is not None and not r.get('completed')) else None
+        op = r.get('override_priority') if (r.get('override_priority') is not None and not r.get('completed')) else None
+        cands = [p for p in (lp, op) if p is not None]
+        p = max(cands) if cands else None
+        return (0 if p is not None else 1, p or 0, -(datetime.fromisoformat(r['created_at']).timestamp() if r.get('created_at') else 0))
+
+    lists_by_category: dict[int, list[dict]] = {}
+    for r in full_rows:
+        lists_by_category.setdefault(r.get('category_id') or 0, []).append(r)
+    for cid, rows_c in lists_by_category.items():
+        rows_c.sort(key=_sort_key)
+        lists_by_category[cid] = [{k: r[k] for k in _V2_LIST_FIELDS if k in fields} for r in rows_c]
+
+    first = lists[0] if lists else None
+    last = lists[-1] if lists else None
+    payload = {
+        'ok': True,
+        'lists_by_category': lists_by_category,
+        'pagination': {
+            'has_prev': has_prev,
+            'has_next': has_next,
+            'prev_cursor': ({'created_at': first.created_at.isoformat(), 'id': first.id} if first and first.created_at else None),
+            'next_cursor': ({'created_at': last.created_at.isoformat(), 'id': last.id} if last and last.created_at else None),
+        },
+    }
+    if 'categories' in include:
+        payload['categories'] = categories
+    if 'pinned' in include:
+        payload['pinned_todos'] = pinned_todos
+    return JSONResponse(payload)
+
+
 @router.get('/lists/{list_id}', response_class=JSONResponse)
 async def client_get_list(request: Request, list_id: int):
     """Return detailed list information (todos, completion types, categories, sublists) for a single list."""
@@ -1204,31 +1404,9 @@ async def client_get_list(request: Request, list_id: int):
 
         completion_types = [{'id': c.id, 'name': c.name} for c in ctypes]
 
-        # fetch user's hashtags for suggestions
-        owner_id_val = current_user.id
-        q_user_list_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id)
-            .join(ListState, ListState.id == ListHashtag.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_list_tags = await sess.exec(q_user_list_tags)
-        q_user_todo_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id)
-            .join(Todo, Todo.id == TodoHashtag.todo_id)
-            .join(ListState, ListState.id == Todo.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_todo_tags = await sess.exec(q_user_todo_tags)
-        _all_rows = list(r_user_list_tags.all()) + list(r_user_todo_tags.all())
-        all_hashtags = []
-        for row in _all_rows:
-            val = row[0] if isinstance(row, (tuple, list)) else row
-            if isinstance(val, str) and val not in all_hashtags:
-                all_hashtags.append(val)
+        # this user's hashtags for completion suggestions; cached per user and
+        # kept current by tag sync (app/hashtag_vocab.py)
+        all_hashtags: list[str] = list((await hashtag_vocab.get(sess, current_user.id)).tags)
 
         # categories (user-scoped)
         try:
@@ -1282,7 +1460,7 @@ async def client_get_list(request: Request, list_id: int):
                     completed_ids = set()
                     if todo_ids:
                         try:
-                            qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                            qcomp = select(Todo.id).where(Todo.id.in_(todo_ids)).where(Todo.is_done == True)
                             cres = await sess.exec(qcomp)
                             completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                         except Exception:
@@ -1444,6 +1622,24 @@ async def create_todo(request: Request):
     return await _create_todo_internal(text, note, list_id, priority, current_user, metadata=metadata)
 
 
+@router.post('/todos/bulk', response_class=JSONResponse)
+async def create_todos_bulk(request: Request):
+    """Create many todos in one transaction. Expects {"items": [{text, list_id, note?, priority?, metadata?}, ...]}."""
+    try:
+        current_user = await _gcu(token=None, request=request)
+    except HTTPException:
+        raise HTTPException(status_code=401, detail='authentication required')
+
+    try:
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid JSON")
+
+    from .main import _validate_bulk_todo_items, _bulk_create_todos_internal
+    items = _validate_bulk_todo_items(payload)
+    return await _bulk_create_todos_internal(items, current_user)
+
+
 @router.patch('/todos/{todo_id}', response_class=JSONResponse)
 async def update_todo(todo_id: int, request: Request):
     """Update a todo. Expects JSON payload with optional fields."""
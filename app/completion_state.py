@@ -0,0 +1,146 @@
+"""Denormalized default-completion state (Todo.is_done / Todo.completed_at).
+
+Goals
+- Views that only need "is this todo done?" read Todo.is_done (indexed with
+  list_id) instead of joining TodoCompletion -> CompletionType on
+  name == 'default' and done == True for every page.
+- Keep the column exact without touching each writer: a session hook runs
+  after every flush that adds, changes or deletes TodoCompletion rows (or
+  renames/deletes a CompletionType) and re-derives is_done for just the
+  affected todos with one UPDATE ... RETURNING in the same transaction. That
+  covers _complete_todo_impl, html_toggle_complete, PATCH /todos, the
+  completion-type endpoints, import and the REPL's ORM writes.
+
+Usage
+- Importing the module registers the hook; app.main imports it at startup.
+- `resync_statement(todo_ids)` is the UPDATE the hook runs; with
+  todo_ids=None it rewrites every stale row (init_db uses it as the backfill).
+- `await check_consistency(sess, repair=False)` lists todos whose stored
+  state disagrees with their TodoCompletion rows (raw SQL writes, old DBs)
+  and fixes them when repair=True. See scripts/check_completion_state.py.
+
+Rule: a todo is done when any TodoCompletion row with done=True points at a
+CompletionType named 'default' (the same rule the join-based views used).
+completed_at keeps its first value while the todo stays done and is cleared
+when it is undone; the backfill falls back to modified_at for old rows.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+import logging
+
+from sqlalchemy import case, event, exists, func
+from sqlalchemy import update as sqlalchemy_update
+from sqlalchemy.orm import Session as _OrmSession
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import select
+
+from .models import CompletionType, Todo, TodoCompletion
+from .utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPLETION = 'default'
+
+
+def default_done_exists():
+    """Correlated EXISTS: the enclosing Todo row has a done default completion."""
+    return exists(
+        select(TodoCompletion.todo_id)
+        .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
+        .where(TodoCompletion.todo_id == Todo.id)
+        .where(CompletionType.name == DEFAULT_COMPLETION)
+        .where(TodoCompletion.done == True)
+    )
+
+
+def resync_statement(todo_ids: Optional[Iterable[int]] = None, now=None):
+    """UPDATE re-deriving is_done/completed_at; only rows that change are written.
+
+    Returns (id, is_done, completed_at) of the rewritten rows.
+    """
+    done = default_done_exists()
+    became_done_at = now if now is not None else func.coalesce(Todo.modified_at, Todo.created_at)
+    stmt = (
+        sqlalchemy_update(Todo)
+        .where(Todo.is_done != done)
+        .values(
+            is_done=done,
+            completed_at=case((done, func.coalesce(Todo.completed_at, became_done_at)), else_=None),
+        )
+        .returning(Todo.id, Todo.is_done, Todo.completed_at)
+        .execution_options(synchronize_session=False)
+    )
+    if todo_ids is not None:
+        stmt = stmt.where(Todo.id.in_(sorted({int(t) for t in todo_ids})))
+    return stmt
+
+
+async def check_consistency(sess, repair: bool = False, limit: int = 1000) -> list[dict]:
+    """Return up to `limit` todos whose is_done disagrees with TodoCompletion.
+
+    With repair=True the mismatching rows are rewritten and committed.
+    """
+    done = default_done_exists()
+    res = await sess.exec(
+        select(Todo.id, Todo.is_done, done.label('expected'))
+        .where(Todo.is_done != done)
+        .order_by(Todo.id)
+        .limit(limit)
+    )
+    rows = [{'todo_id': int(r[0]), 'is_done': bool(r[1]), 'expected': bool(r[2])} for r in res.all()]
+    if repair and rows:
+        await sess.exec(resync_statement([r['todo_id'] for r in rows]))
+        await sess.commit()
+    return rows
+
+
+# --- flush hook --------------------------------------------------------------
+
+def _name_changed(obj) -> bool:
+    try:
+        from sqlalchemy import inspect as sa_inspect
+        return sa_inspect(obj).attrs['name'].history.has_changes()
+    except Exception:
+        return True
+
+
+def _affected(session) -> tuple[set, set]:
+    """(todo ids, completion type ids) whose done state may have changed."""
+    todo_ids: set = set()
+    ctype_ids: set = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TodoCompletion):
+            if obj.todo_id is not None:
+                todo_ids.add(int(obj.todo_id))
+        elif isinstance(obj, CompletionType):
+            if obj in session.new or obj.id is None:
+                continue
+            if obj in session.deleted or _name_changed(obj):
+                ctype_ids.add(int(obj.id))
+    return todo_ids, ctype_ids
+
+
+@event.listens_for(_OrmSession, 'after_flush')
+def _on_flush(session, flush_context) -> None:
+    try:
+        todo_ids, ctype_ids = _affected(session)
+        if not (todo_ids or ctype_ids):
+            return
+        conn = session.connection()
+        if ctype_ids:
+            res = conn.execute(select(TodoCompletion.todo_id).where(TodoCompletion.completion_type_id.in_(sorted(ctype_ids))))
+            todo_ids.update(int(r[0]) for r in res.fetchall())
+        if not todo_ids:
+            return
+        changed = conn.execute(resync_statement(todo_ids, now=now_utc())).fetchall()
+        # keep Todo objects already loaded in this session in step, since
+        # sessions here do not expire on commit
+        for tid, is_done, completed_at in changed:
+            obj = session.identity_map.get(session.identity_key(Todo, tid))
+            if obj is not None:
+                set_committed_value(obj, 'is_done', bool(is_done))
+                set_committed_value(obj, 'completed_at', completed_at)
+    except Exception:
+        # never break the caller's write; check_consistency repairs stragglers
+        logger.exception('completion_state: could not resync is_done')
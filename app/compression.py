@@ -0,0 +1,212 @@
+"""HTTP response compression middleware.
+
+Goals
+- Tree, list and calendar pages and the JSON sync/occurrence payloads are
+  large and compress 5-10x; send them gzip- or br-encoded to clients that
+  accept it (mobile data).
+- Only compress what pays off: media types in COMPRESSION_TYPES, bodies of
+  at least COMPRESSION_MIN_SIZE bytes, and only when the encoded body is
+  actually smaller.
+- Never touch responses that are already encoded (precompressed static files
+  from app/static_assets.py), event streams (not in the allow-list), HEAD
+  requests, Range requests, or 204/206/304 responses.
+- Streaming bodies are compressed chunk by chunk with a sync flush per chunk,
+  so nothing is held back from the client.
+
+Usage
+- `app.add_middleware(CompressionMiddleware)`; settings come from config
+  (COMPRESSION_ENABLED, COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL,
+  COMPRESSION_BROTLI_QUALITY, COMPRESSION_TYPES) unless passed explicitly.
+- br is offered only when the optional `brotli` (or `brotlicffi`) package is
+  installed; gzip needs nothing extra.
+- ETags are passed through unchanged so endpoints comparing If-None-Match
+  keep working; Vary: Accept-Encoding tells caches the body depends on it.
+"""
+from __future__ import annotations
+
+from typing import Optional
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from . import config
+
+_SKIP_STATUS = frozenset({204, 206, 304})
+
+
+def parse_accept_encoding(value: Optional[str]) -> dict[str, float]:
+    """Map coding -> q-value from an Accept-Encoding header."""
+    out: dict[str, float] = {}
+    for part in (value or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        out[name] = q
+    return out
+
+
+# codings this process can produce on the fly
+DYNAMIC_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding: Optional[str], available=DYNAMIC_ENCODINGS) -> Optional[str]:
+    """Best coding among `available` the client accepts (earlier wins ties)."""
+    prefs = parse_accept_encoding(accept_encoding)
+    star = prefs.get('*', 0.0)
+    best, best_q = None, 0.0
+    for enc in available:
+        q = prefs.get(enc, star)
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def _media_type(headers) -> str:
+    return (headers.get('content-type') or '').split(';', 1)[0].strip().lower()
+
+
+class _Encoder:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._c = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 31: gzip container
+            self._c = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == 'br':
+            return self._c.process(data) + self._c.flush()
+        return self._c.compress(data) + self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._c.finish()
+        return self._c.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str, gzip_level: int = 6, brotli_quality: int = 4) -> bytes:
+    """One-shot encode of a complete body."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware; see the module docstring."""
+
+    def __init__(self, app, minimum_size: Optional[int] = None, gzip_level: Optional[int] = None,
+                 brotli_quality: Optional[int] = None, content_types=None):
+        self.app = app
+        self.minimum_size = config.COMPRESSION_MIN_SIZE if minimum_size is None else minimum_size
+        self.gzip_level = config.COMPRESSION_GZIP_LEVEL if gzip_level is None else gzip_level
+        self.brotli_quality = config.COMPRESSION_BROTLI_QUALITY if brotli_quality is None else brotli_quality
+        self.content_types = frozenset(config.COMPRESSION_TYPES if content_types is None else content_types)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not config.COMPRESSION_ENABLED or scope.get('method') == 'HEAD':
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        if 'range' in headers:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(self, choose_encoding(headers.get('accept-encoding')), send)
+        await self.app(scope, receive, responder)
+
+
+class _Responder:
+    def __init__(self, mw: CompressionMiddleware, encoding: Optional[str], send):
+        self.mw = mw
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        # set once the first body chunk decided between pass-through and
+        # compressing with self.encoder
+        self.encoder = None
+        self.decided = False
+
+    def _eligible(self, headers) -> bool:
+        status = self.start.get('status', 200)
+        if status < 200 or status in _SKIP_STATUS:
+            return False
+        if 'content-encoding' in headers:
+            return False
+        return _media_type(headers) in self.mw.content_types
+
+    async def __call__(self, message):
+        kind = message['type']
+        if kind == 'http.response.start':
+            # held back until the first body chunk shows how big the body is
+            self.start = message
+            return
+        if kind != 'http.response.body':
+            # anything else (e.g. a pathsend extension) goes out untouched
+            if self.start is not None and not self.decided:
+                self.decided = True
+                await self.send(self.start)
+            await self.send(message)
+            return
+        if self.decided:
+            if self.encoder is not None:
+                await self._send_encoded(message)
+            else:
+                await self.send(message)
+            return
+        self.decided = True
+        headers = MutableHeaders(scope=self.start)
+        body = message.get('body', b'')
+        more = message.get('more_body', False)
+        if not self._eligible(headers):
+            await self.send(self.start)
+            await self.send(message)
+            return
+        headers.add_vary_header('Accept-Encoding')
+        declared = headers.get('content-length')
+        small = len(body) < self.mw.minimum_size if not more else (
+            declared is not None and declared.isdigit() and int(declared) < self.mw.minimum_size)
+        if self.encoding is None or small:
+            await self.send(self.start)
+            await self.send(message)
+            return
+        if not more:
+            data = compress(body, self.encoding, self.mw.gzip_level, self.mw.brotli_quality)
+            if len(data) >= len(body):
+                await self.send(self.start)
+                await self.send(message)
+                return
+            headers['Content-Encoding'] = self.encoding
+            headers['Content-Length'] = str(len(data))
+            await self.send(self.start)
+            await self.send({'type': 'http.response.body', 'body': data})
+            return
+        self.encoder = _Encoder(self.encoding, self.mw.gzip_level, self.mw.brotli_quality)
+        headers['Content-Encoding'] = self.encoding
+        if 'content-length' in headers:
+            del headers['Content-Length']
+        await self.send(self.start)
+        await self._send_encoded(message)
+
+    async def _send_encoded(self, message):
+        data = self.encoder.chunk(message.get('body', b''))
+        more = message.get('more_body', False)
+        if not more:
+            data += self.encoder.finish()
+        await self.send({'type': 'http.response.body', 'body': data, 'more_body': more})
@@ -68,6 +68,191 @@ SKIP_INDEX_CALENDAR = _trueish(os.getenv('SKIP_INDEX_CALENDAR', '0'))
 DEV_MODE = _trueish(os.getenv('DEV_MODE', '0'))
 
 
+# Number of worker processes used for dateparser-based parsing (see
+# app/parse_pool.py). 0 keeps parsing inline on the event loop, which is the
+# previous behaviour and what tests expect. Set DATE_PARSE_WORKERS=N in
+# production to move parsing onto N cores.
+try:
+    DATE_PARSE_WORKERS = int(os.getenv('DATE_PARSE_WORKERS', '0'))
+except Exception:
+    DATE_PARSE_WORKERS = 0
+
+# Batches smaller than this are parsed inline even when the pool is enabled;
+# the round trip to a worker costs more than parsing a couple of texts.
+try:
+    DATE_PARSE_MIN_BATCH = int(os.getenv('DATE_PARSE_MIN_BATCH', '8'))
+except Exception:
+    DATE_PARSE_MIN_BATCH = 8
+
+
+# Upper bound on the number of items accepted by POST /todos/bulk (and the
+# /client/json equivalent) in a single request.
+try:
+    BULK_TODO_MAX_ITEMS = int(os.getenv('BULK_TODO_MAX_ITEMS', '5000'))
+except Exception:
+    BULK_TODO_MAX_ITEMS = 5000
+
+
+# Debug/logging flags, read once at import so hot paths (SSE debug emission,
+# fn:link rendering, calendar occurrence expansion) don't hit os.environ on
+# every call. Changing them requires a restart, as before for most flags.
+SSE_DEBUG_ENABLED = _trueish(os.getenv('SSE_DEBUG_ENABLED', '0'))
+SSE_DEBUG_ALLOW_BACKGROUND = _trueish(os.getenv('SSE_DEBUG_ALLOW_BACKGROUND', '0'))
+SSE_DEBUG_ALLOW_NONLOCAL = _trueish(os.getenv('SSE_DEBUG_ALLOW_NONLOCAL', '0'))
+DEBUG_FN_LINKS = _trueish(os.getenv('DEBUG_FN_LINKS', '0'))
+DEBUG_RETENTION_ID = os.getenv('DEBUG_RETENTION_ID') or None
+DEBUG_RETENTION_ANY_WINDOWEVENT = bool(os.getenv('DEBUG_RETENTION_ANY_WINDOWEVENT'))
+
+# Sampling for per-request / per-item INFO logs. TIMING_LOG_SAMPLE=N logs one
+# request timing line in N (1 = every request, 0 = none); requests slower
+# than TIMING_LOG_SLOW_MS are always logged. CALENDAR_OCC_LOG_SAMPLE does the
+# same for calendar_occurrences.added lines (default 0: DEBUG only).
+try:
+    TIMING_LOG_SAMPLE = int(os.getenv('TIMING_LOG_SAMPLE', '20'))
+except Exception:
+    TIMING_LOG_SAMPLE = 20
+try:
+    TIMING_LOG_SLOW_MS = float(os.getenv('TIMING_LOG_SLOW_MS', '500'))
+except Exception:
+    TIMING_LOG_SLOW_MS = 500.0
+try:
+    CALENDAR_OCC_LOG_SAMPLE = int(os.getenv('CALENDAR_OCC_LOG_SAMPLE', '0'))
+except Exception:
+    CALENDAR_OCC_LOG_SAMPLE = 0
+
+
+# Per-request SQL statement budget / N+1 detector (app/query_budget.py).
+# SQL_BUDGET_MODE: 'warn' logs a structured sql_budget.exceeded warning,
+# 'raise' also raises QueryBudgetExceeded (tests), 'off' disables checks.
+# SQL_BUDGET_DEFAULT is the statement budget for any route;
+# SQL_BUDGET_ROUTES overrides it per route template, e.g.
+#   SQL_BUDGET_ROUTES='/html_no_js/lists/{list_id}=40,/calendar/occurrences=30'
+# SQL_N1_THRESHOLD flags one statement shape repeated this many times in a
+# request (same SQL, different parameters).
+SQL_BUDGET_MODE = (os.getenv('SQL_BUDGET_MODE', 'warn') or 'warn').lower()
+try:
+    SQL_BUDGET_DEFAULT = int(os.getenv('SQL_BUDGET_DEFAULT', '100'))
+except Exception:
+    SQL_BUDGET_DEFAULT = 100
+SQL_BUDGET_ROUTES = os.getenv('SQL_BUDGET_ROUTES', '')
+try:
+    SQL_N1_THRESHOLD = int(os.getenv('SQL_N1_THRESHOLD', '10'))
+except Exception:
+    SQL_N1_THRESHOLD = 10
+
+# Per-user Trash / trashed-list cache (app/visibility.py). Entries are
+# invalidated by session events on every ORM write that can move a list in or
+# out of Trash; the TTL only bounds staleness after raw SQL writes (REPL).
+# 0 disables caching.
+try:
+    VISIBILITY_CACHE_TTL = float(os.getenv('VISIBILITY_CACHE_TTL', '300'))
+except Exception:
+    VISIBILITY_CACHE_TTL = 300.0
+
+# Per-user ItemLink adjacency cache (app/link_graph.py); same invalidation
+# model as VISIBILITY_CACHE_TTL. 0 disables caching.
+try:
+    LINK_GRAPH_CACHE_TTL = float(os.getenv('LINK_GRAPH_CACHE_TTL', '300'))
+except Exception:
+    LINK_GRAPH_CACHE_TTL = 300.0
+
+# Per-user hashtag suggestion vocabulary (app/hashtag_vocab.py). Tag sync
+# updates cached entries in place; other link writes drop them. 0 disables
+# caching.
+try:
+    HASHTAG_VOCAB_CACHE_TTL = float(os.getenv('HASHTAG_VOCAB_CACHE_TTL', '300'))
+except Exception:
+    HASHTAG_VOCAB_CACHE_TTL = 300.0
+
+# Seconds between background rebuilds of users whose hashtag stats were
+# marked stale (app/hashtag_stats.py). Only the leader worker rebuilds.
+try:
+    HASHTAG_STATS_REBUILD_SECONDS = float(os.getenv('HASHTAG_STATS_REBUILD_SECONDS', '5'))
+except Exception:
+    HASHTAG_STATS_REBUILD_SECONDS = 5.0
+
+# Force-layout iterations per link map layout pass (app/linkmap_layout.py).
+# Incremental passes only move the nodes whose links changed.
+try:
+    LINKMAP_LAYOUT_ITERATIONS = int(os.getenv('LINKMAP_LAYOUT_ITERATIONS', '60'))
+except Exception:
+    LINKMAP_LAYOUT_ITERATIONS = 60
+
+# Online database snapshots (app/backup.py, POST /admin/backup,
+# scripts/backup_db.sh). BACKUP_METHOD is 'backup' (online backup API,
+# BACKUP_PAGES_PER_STEP pages per step with BACKUP_STEP_SLEEP seconds between
+# steps) or 'vacuum' (VACUUM INTO). BACKUP_COMPRESSION: none, gzip, zstd
+# (needs the zstandard package) or auto. BACKUP_KEEP newest snapshots are kept
+# (0 keeps all).
+BACKUP_DIR = os.getenv('BACKUP_DIR', 'backups')
+BACKUP_METHOD = (os.getenv('BACKUP_METHOD', 'backup') or 'backup').lower()
+BACKUP_COMPRESSION = (os.getenv('BACKUP_COMPRESSION', 'gzip') or 'gzip').lower()
+try:
+    BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', '10'))
+except Exception:
+    BACKUP_KEEP = 10
+try:
+    BACKUP_PAGES_PER_STEP = int(os.getenv('BACKUP_PAGES_PER_STEP', '1024'))
+except Exception:
+    BACKUP_PAGES_PER_STEP = 1024
+try:
+    BACKUP_STEP_SLEEP = float(os.getenv('BACKUP_STEP_SLEEP', '0.01'))
+except Exception:
+    BACKUP_STEP_SLEEP = 0.01
+
+# Multi-process serving (app/workers.py, app/cache_bus.py). WEB_WORKERS
+# follows uvicorn's own WEB_CONCURRENCY variable, so `WEB_CONCURRENCY=4
+# uvicorn app.main:app` both forks four workers and tells each of them it has
+# peers. CACHE_BUS is auto (on when WEB_WORKERS > 1), 1 or 0; CACHE_BUS_DIR
+# holds the per-process sockets and lock files (default: a directory in the
+# system temp dir derived from the database path). Non-leader workers check
+# every LEADER_CHECK_SECONDS whether the leader is gone and they should take
+# over.
+try:
+    WEB_WORKERS = max(1, int(os.getenv('WEB_CONCURRENCY', '1') or '1'))
+except Exception:
+    WEB_WORKERS = 1
+CACHE_BUS = (os.getenv('CACHE_BUS', 'auto') or 'auto').lower()
+CACHE_BUS_DIR = os.getenv('CACHE_BUS_DIR') or None
+try:
+    LEADER_CHECK_SECONDS = max(1.0, float(os.getenv('LEADER_CHECK_SECONDS', '15')))
+except Exception:
+    LEADER_CHECK_SECONDS = 15.0
+
+# HTTP response compression (app/compression.py). Responses whose media type
+# is in COMPRESSION_TYPES and whose body is at least COMPRESSION_MIN_SIZE
+# bytes are sent gzip- or (when the brotli package is installed) br-encoded.
+# Event streams and already-encoded responses are never touched.
+COMPRESSION_ENABLED = _trueish(os.getenv('COMPRESSION_ENABLED', '1'))
+try:
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+except Exception:
+    COMPRESSION_MIN_SIZE = 1024
+try:
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+except Exception:
+    COMPRESSION_GZIP_LEVEL = 6
+try:
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+except Exception:
+    COMPRESSION_BROTLI_QUALITY = 4
+COMPRESSION_TYPES = tuple(
+    t.strip().lower() for t in os.getenv(
+        'COMPRESSION_TYPES',
+        'text/html,text/plain,text/css,text/javascript,application/javascript,'
+        'application/json,application/manifest+json,application/xml,text/xml,image/svg+xml',
+    ).split(',') if t.strip()
+)
+
+# Static assets (app/static_assets.py). Templates link versioned URLs
+# (name.<hash>.ext) that are cached for STATIC_IMMUTABLE_MAX_AGE seconds;
+# STATIC_PRECOMPRESS writes .gz/.br siblings under static/ at startup.
+try:
+    STATIC_IMMUTABLE_MAX_AGE = int(os.getenv('STATIC_IMMUTABLE_MAX_AGE', str(365 * 24 * 3600)))
+except Exception:
+    STATIC_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+STATIC_PRECOMPRESS = _trueish(os.getenv('STATIC_PRECOMPRESS', '1'))
+
 DOKUWIKI_NOTE_LINK_PREFIX = os.getenv('DOKUWIKI_NOTE_LINK_PREFIX', 'https://myserver.hopto.org/dokuwiki/doku.php?id=')
 
 # Default SQLite database filename used when a full DATABASE_URL is not
@@ -9,6 +9,7 @@ from sqlalchemy.pool import NullPool
 
 import os
 from . import config as app_config
+from . import metrics as request_metrics
 import logging
 import contextvars
 import time
@@ -152,6 +153,20 @@ def _sqlite_path_from_url(url: str | None) -> str | None:
     except Exception:
         return None
 
+# Schema version gate. init_db's create_all / ALTER / index / dedupe passes
+# (and the import-time _ensure_sqlite_minimal_migrations) only run when the
+# schema_version row is missing or stale; a booted, current DB skips them.
+# Bump SCHEMA_VERSION whenever _migrate_schema or the import-time migrations
+# gain new work. New model tables or columns change the fingerprint on their
+# own, so forgetting the bump for those is harmless. FORCE_SCHEMA_MIGRATIONS=1
+# always runs the full pass.
+SCHEMA_VERSION = 2
+
+
+def _force_schema_migrations() -> bool:
+    return os.getenv('FORCE_SCHEMA_MIGRATIONS', '0').lower() in ('1', 'true', 'yes')
+
+
 def _ensure_sqlite_minimal_migrations(url: str | None) -> None:
     try:
         db_path = _sqlite_path_from_url(url)
@@ -164,6 +179,16 @@ def _ensure_sqlite_minimal_migrations(url: str | None) -> None:
         conn = sqlite3.connect(db_path)
         try:
             cur = conn.cursor()
+            # init_db already completed a full pass at this schema version
+            if not _force_schema_migrations():
+                try:
+                    cur.execute("SELECT version FROM schema_version WHERE id = 1")
+                    row = cur.fetchone()
+                    if row and row[0] == SCHEMA_VERSION:
+                        return
+                except Exception:
+                    # no schema_version table yet: fall through to the checks
+                    pass
             # Helper to add metadata_json column to a table if missing
             def _ensure_metadata_col(table: str):
                 try:
@@ -282,6 +307,25 @@ def _ensure_sqlite_minimal_migrations(url: str | None) -> None:
                             conn.commit()
                         except Exception:
                             pass
+                    # Denormalized default-completion state (app/completion_state.py);
+                    # init_db backfills the values
+                    if 'is_done' not in tcols:
+                        try:
+                            cur.execute("ALTER TABLE todo ADD COLUMN is_done BOOLEAN DEFAULT 0 NOT NULL")
+                            conn.commit()
+                        except Exception:
+                            pass
+                    if 'completed_at' not in tcols:
+                        try:
+                            cur.execute("ALTER TABLE todo ADD COLUMN completed_at DATETIME")
+                            conn.commit()
+                        except Exception:
+                            pass
+                    try:
+                        cur.execute("CREATE INDEX IF NOT EXISTS ix_todo_list_id_is_done ON todo(list_id, is_done)")
+                        conn.commit()
+                    except Exception:
+                        pass
                     try:
                         cur.execute("CREATE INDEX IF NOT EXISTS ix_todo_calendar_ignored ON todo(calendar_ignored)")
                         conn.commit()
@@ -753,6 +797,7 @@ class TracedAsyncSession(AsyncSession):
                         pass
             except Exception:
                 pass
+            request_metrics.note_query()
             res = await super().execute(*args, **kwargs)
             # Note: do not close the session here. Closing a session
             # prematurely (after a single execute) can detach instances
@@ -795,6 +840,7 @@ class TracedAsyncSession(AsyncSession):
                         pass
                 except Exception:
                     pass
+            request_metrics.note_query()
             res = await super().exec(*args, **kwargs)
             # See note in execute(): do not auto-close the session here.
             return res
@@ -949,6 +995,12 @@ TracedAsyncSession.sync_session_class = TracedSyncSession
 
 async_session = sessionmaker(engine, class_=TracedAsyncSession, expire_on_commit=False)
 
+# per-request SQL statement counts and DB time for /server/metrics
+try:
+    request_metrics.install_sql_listeners(engine)
+except Exception:
+    logger.exception('failed to install SQL metrics listeners')
+
 
 # Optional runtime tracing: attach pool/engine event listeners only when
 # tracing is enabled. Guarded via _tracing_enabled() so instrumentation
@@ -1045,7 +1097,68 @@ if _tracing_enabled():
     except Exception:
         pass
 
+
+
+def _schema_fingerprint() -> str:
+    import hashlib
+    parts = []
+    for t in sorted(SQLModel.metadata.tables.values(), key=lambda t: t.name):
+        parts.append(t.name + ':' + ','.join(sorted(c.name for c in t.columns)))
+    digest = hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:16]
+    return f'{SCHEMA_VERSION}:{digest}'
+
+
+_SCHEMA_VERSION_DDL = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, "
+    "fingerprint TEXT NOT NULL, applied_at TEXT NOT NULL)"
+)
+
+
+async def _schema_is_current(fingerprint: str) -> bool:
+    """True when the stored fingerprint matches and every model table exists."""
+    try:
+        async with engine.connect() as conn:
+            res = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+            tables = {r[0] for r in res.fetchall()}
+            if 'schema_version' not in tables:
+                return False
+            # a table dropped behind our back (tests, manual repair) forces a full pass
+            if not set(SQLModel.metadata.tables).issubset(tables):
+                return False
+            res = await conn.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1"))
+            row = res.first()
+            return bool(row) and row[0] == fingerprint
+    except Exception:
+        return False
+
+
+async def _store_schema_fingerprint(fingerprint: str) -> None:
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(_SCHEMA_VERSION_DDL))
+            await conn.execute(
+                text(
+                    "INSERT INTO schema_version (id, version, fingerprint, applied_at) VALUES (1, :v, :fp, :ts) "
+                    "ON CONFLICT(id) DO UPDATE SET version = excluded.version, fingerprint = excluded.fingerprint, applied_at = excluded.applied_at"
+                ),
+                {'v': SCHEMA_VERSION, 'fp': fingerprint, 'ts': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())},
+            )
+    except Exception:
+        logger.exception('failed to record schema_version')
+
+
 async def init_db():
+    fingerprint = _schema_fingerprint()
+    if not _force_schema_migrations() and await _schema_is_current(fingerprint):
+        logger.info('init_db: schema %s is current; skipping migrations', fingerprint)
+    else:
+        await _migrate_schema()
+        await _store_schema_fingerprint(fingerprint)
+    await _ensure_server_state()
+
+
+async def _migrate_schema():
     async with engine.begin() as conn:
         # create tables
         await conn.run_sync(SQLModel.metadata.create_all)
@@ -1080,6 +1193,11 @@ async def init_db():
             # first_date_only toggle column
             if 'first_date_only' not in cols:
                 add_sql.append("ALTER TABLE todo ADD COLUMN first_date_only INTEGER DEFAULT 0 NOT NULL")
+            # denormalized default-completion state (backfilled below)
+            if 'is_done' not in cols:
+                add_sql.append("ALTER TABLE todo ADD COLUMN is_done BOOLEAN DEFAULT 0 NOT NULL")
+            if 'completed_at' not in cols:
+                add_sql.append("ALTER TABLE todo ADD COLUMN completed_at DATETIME")
             for s in add_sql:
                 try:
                     await conn.execute(text(s))
@@ -1088,6 +1206,17 @@ async def init_db():
         except Exception:
             # Best-effort only; do not fail init_db if PRAGMA isn't supported
             logger.exception('failed to ensure recurrence columns in init_db')
+        # Backfill / repair Todo.is_done from TodoCompletion rows. Only rows
+        # whose stored state is wrong are written, so this is cheap once done.
+        try:
+            await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_todo_list_id_is_done ON todo(list_id, is_done)"))
+            from .completion_state import resync_statement
+            res = await conn.execute(resync_statement())
+            fixed = len(res.fetchall())
+            if fixed:
+                logger.info('init_db: backfilled is_done on %d todos', fixed)
+        except Exception:
+            logger.exception('failed to backfill todo.is_done during init_db')
         # Ensure new recursive-lists column exists on liststate for older DBs.
         # This keeps tests and dev DBs working without requiring a manual migration.
         try:
@@ -1140,6 +1269,10 @@ async def init_db():
                 await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_todo_priority ON todo(priority)"))
             except Exception:
                 logger.exception('failed to create ix_todo_priority during init_db')
+            try:
+                await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_todo_deferred_until ON todo(deferred_until)"))
+            except Exception:
+                logger.exception('failed to create ix_todo_deferred_until during init_db')
             # Indices for bookmarked flags
             try:
                 await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_todo_bookmarked ON todo(bookmarked)"))
@@ -1317,6 +1450,9 @@ async def init_db():
             await conn.execute(text("DROP INDEX IF EXISTS ix_liststate_name"))
         except Exception:
             logger.exception("failed to drop ix_liststate_name during init_db")
+
+
+async def _ensure_server_state():
     # ensure ServerState exists
     from .models import ServerState
     async with async_session() as sess:
@@ -0,0 +1,169 @@
+"""Pre-rendered HTML fragments for todo rows on list pages.
+
+Goals
+- Stop re-rendering every todo row (links, priority badge, completion forms,
+  collation dots, tag chips) on every list page view. A row is rendered once
+  through the `_todo_row.html` macros and reused until something it shows
+  changes.
+- Report hit rates through the jinja_stats middleware (X-Jinja-Fragment-*
+  headers) and in /server/runtime_flags.
+
+Usage
+- In html_view_list, after the todo rows and page context are built:
+    render_todo_rows(TEMPLATES.env, todo_rows, variant='table'|'li', ...)
+  which sets row['row_html'] on each row; list.html prints it and falls back
+  to the macros for rows without one.
+- TODO_ROW_CACHE_SIZE (default 4096) bounds the cache; 0 disables it.
+
+Cache key: (variant, todo_id, modified_at, template version, row state,
+display flags). modified_at alone is not enough. Completion, pinning, tags
+and collation membership live in other tables. Some edit paths (the REPL,
+for example) do not bump modified_at. So the key also carries every
+row field the macros read. The template version is a hash of
+`_todo_row.html`, so editing the template (with auto_reload) invalidates
+every row. Forms inside cached rows carry a placeholder that is swapped for
+the request's CSRF token on the way out.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable, Optional
+import hashlib
+import logging
+import os
+import threading
+
+from markupsafe import Markup, escape
+
+from .render_filters import _LRU
+from .jinja_stats import note_fragment_cache
+
+logger = logging.getLogger(__name__)
+
+ROW_TEMPLATE = '_todo_row.html'
+# stands in for the per-request CSRF token inside cached fragments
+CSRF_PLACEHOLDER = '__TODO_ROW_CSRF__'
+
+
+def _cache_size() -> int:
+    try:
+        return int(os.getenv('TODO_ROW_CACHE_SIZE', '4096'))
+    except Exception:
+        return 4096
+
+
+_rows = _LRU(_cache_size())
+_version_lock = threading.Lock()
+# (template object, version); Jinja hands out a new Template object when
+# auto_reload picks up an edit, which is when the version must change
+_version: tuple[Any, str] | None = None
+
+
+def fragment_cache_stats() -> dict:
+    return _rows.stats()
+
+
+def clear_fragment_cache() -> None:
+    _rows.clear()
+
+
+def _template_version(env, tmpl) -> str:
+    global _version
+    with _version_lock:
+        if _version is not None and _version[0] is tmpl:
+            return _version[1]
+    try:
+        source, _filename, _uptodate = env.loader.get_source(env, ROW_TEMPLATE)
+        ver = hashlib.sha1(source.encode('utf-8')).hexdigest()[:12]
+    except Exception:
+        ver = str(id(tmpl))
+    with _version_lock:
+        _version = (tmpl, ver)
+    return ver
+
+
+def _iso(v) -> Optional[str]:
+    try:
+        return v.isoformat() if v is not None else None
+    except Exception:
+        return str(v)
+
+
+def row_key(variant: str, t: dict, linked_ids: Iterable[int], version: str, flags: tuple) -> tuple:
+    """Everything a rendered row depends on (see module docstring)."""
+    extra = tuple(
+        (e.get('id'), bool(e.get('done')))
+        for e in (t.get('extra_completions') or [])
+        if isinstance(e, dict)
+    )
+    return (
+        variant,
+        t.get('id'),
+        _iso(t.get('modified_at')),
+        version,
+        (
+            t.get('text'), t.get('note'), _iso(t.get('created_at')),
+            bool(t.get('completed')), bool(t.get('pinned')), t.get('priority'),
+            tuple(t.get('tags') or ()), extra,
+            bool(t.get('is_linked')), t.get('origin_list_id'), t.get('origin_list_name'),
+            tuple(sorted(linked_ids)),
+        ),
+        flags,
+    )
+
+
+def render_todo_rows(
+    env,
+    todo_rows: list[dict],
+    *,
+    variant: str,
+    list_row: dict,
+    client_tz: Optional[str],
+    csrf_token: Optional[str],
+    completion_types: Iterable[dict] = (),
+    active_collations: Optional[list[dict]] = None,
+    todo_collation_linked: Optional[dict] = None,
+    date_order: Optional[str] = None,
+) -> tuple[int, int]:
+    """Set row['row_html'] on each todo row, rendering only cache misses.
+
+    variant is 'table' (icons shown) or 'li' (hide_icons lists). Returns
+    (hits, misses). Template errors propagate; rows left without row_html
+    are rendered inline by list.html as before.
+    """
+    if not todo_rows:
+        return 0, 0
+    tmpl = env.get_template(ROW_TEMPLATE)
+    version = _template_version(env, tmpl)
+    module = tmpl.module
+    active_collations = active_collations or []
+    todo_collation_linked = todo_collation_linked or {}
+    extra_types = [c for c in completion_types if c.get('name') != 'default']
+    flags = (
+        client_tz,
+        date_order if variant == 'li' else None,
+        tuple((c.get('id'), c.get('name')) for c in extra_types) if variant == 'table' else (),
+        tuple((c.get('list_id'), c.get('name')) for c in active_collations),
+        bool(list_row.get('is_collation')),
+        bool(csrf_token) if variant == 'table' else None,
+    )
+    csrf_value = str(escape(csrf_token)) if csrf_token else ''
+    hits = misses = 0
+    for t in todo_rows:
+        tid = t.get('id')
+        linked = todo_collation_linked.get(tid, [])
+        key = row_key(variant, t, linked, version, flags)
+        html = _rows.get(key)
+        if html is None:
+            misses += 1
+            if variant == 'table':
+                html = str(module.table_row(t, extra_types, active_collations, todo_collation_linked, list_row, client_tz, CSRF_PLACEHOLDER if csrf_token else ''))
+            else:
+                html = str(module.list_item(t, active_collations, todo_collation_linked, list_row, client_tz, date_order))
+            _rows.put(key, html)
+        else:
+            hits += 1
+        if csrf_value and variant == 'table':
+            html = html.replace(CSRF_PLACEHOLDER, csrf_value)
+        t['row_html'] = Markup(html)
+    note_fragment_cache(hits, misses)
+    return hits, misses
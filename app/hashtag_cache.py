@@ -0,0 +1,209 @@
+"""Process-wide hashtag tag->id cache and set-based tag linker.
+
+Goals
+- Hashtags are a small, nearly append-only vocabulary, so resolving tag
+  strings to ids should not cost a SELECT on every todo/list save.
+- Replace the flush / rollback-on-IntegrityError dance in tag sync with
+  INSERT ... ON CONFLICT DO NOTHING, so syncing the tags of one todo or list
+  costs at most one write statement per table (Hashtag, link table).
+
+Usage
+- Call `await hashtag_cache.warm()` once at startup to load the vocabulary.
+- `await resolve_hashtag_ids(sess, tags)` returns {normalized_tag: id},
+  creating missing Hashtag rows. Ids of rows created in the current
+  transaction are only published to the cache after the session commits, so a
+  rollback can never leave a dangling id behind.
+- `await sync_hashtag_links(sess, TodoHashtag, TodoHashtag.todo_id, todo_id, ids)`
+  makes the link table match `ids` for one owner (one DELETE, one INSERT)
+  and returns the (added, removed) hashtag ids for app/hashtag_stats.py.
+- Code that deletes Hashtag rows must call `hashtag_cache.discard_ids(ids)`;
+  other worker processes drop the same ids via app/cache_bus.py.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+import logging
+import threading
+
+from sqlalchemy import delete as sqlalchemy_delete
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from .cache_bus import cache_bus
+from .utils import normalize_hashtag
+
+logger = logging.getLogger(__name__)
+
+
+class HashtagIdCache:
+    """Thread-safe tag->id map with simple hit/miss counters."""
+
+    def __init__(self):
+        self._by_tag: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.warmed = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._by_tag)
+
+    def get_many(self, tags: Iterable[str]) -> tuple[dict[str, int], list[str]]:
+        """Split tags into ({tag: id} found in cache, [missing tags])."""
+        found: dict[str, int] = {}
+        missing: list[str] = []
+        with self._lock:
+            for t in tags:
+                hid = self._by_tag.get(t)
+                if hid is None:
+                    missing.append(t)
+                else:
+                    found[t] = hid
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def update(self, mapping: dict[str, int]) -> None:
+        if not mapping:
+            return
+        with self._lock:
+            for t, hid in mapping.items():
+                self._by_tag[t] = int(hid)
+
+    def discard_ids(self, ids: Iterable[int], *, broadcast: bool = True) -> None:
+        """Forget cached tags whose Hashtag row was deleted."""
+        drop = {int(i) for i in ids if i is not None}
+        if not drop:
+            return
+        with self._lock:
+            self._by_tag = {t: hid for t, hid in self._by_tag.items() if hid not in drop}
+        if broadcast:
+            # other workers would otherwise link to the deleted ids
+            cache_bus.publish('hashtag_ids', sorted(drop))
+
+    def clear(self, *, broadcast: bool = True) -> None:
+        with self._lock:
+            self._by_tag.clear()
+            self.warmed = False
+        if broadcast:
+            cache_bus.publish('hashtag_ids', None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._by_tag), 'hits': self.hits, 'misses': self.misses, 'warmed': self.warmed}
+
+    async def warm(self, session_factory=None) -> int:
+        """Load the whole Hashtag vocabulary. Returns the number of tags cached."""
+        from .models import Hashtag
+        if session_factory is None:
+            from .db import async_session as session_factory
+        async with session_factory() as sess:
+            res = await sess.exec(select(Hashtag.tag, Hashtag.id))
+            rows = res.all()
+        mapping = {tag: int(hid) for tag, hid in rows if tag and hid is not None}
+        with self._lock:
+            self._by_tag = mapping
+            self.warmed = True
+        return len(mapping)
+
+
+hashtag_cache = HashtagIdCache()
+
+
+def _on_bus(hid) -> None:
+    if hid is None:
+        hashtag_cache.clear(broadcast=False)
+    else:
+        hashtag_cache.discard_ids([hid], broadcast=False)
+
+
+cache_bus.subscribe('hashtag_ids', _on_bus)
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> list[str]:
+    """Normalize and dedupe tags preserving first-seen order; drops invalid ones."""
+    out: list[str] = []
+    for t in tags or []:
+        if not t:
+            continue
+        try:
+            nt = normalize_hashtag(t)
+        except Exception:
+            continue
+        if nt and nt not in out:
+            out.append(nt)
+    return out
+
+
+def _on_commit(s) -> None:
+    hashtag_cache.update(s.info.pop('_hashtag_cache_pending', None) or {})
+
+
+def _on_rollback(s, *args) -> None:
+    s.info.pop('_hashtag_cache_pending', None)
+
+
+def _publish_after_commit(sess, mapping: dict[str, int]) -> None:
+    """Add mapping to the cache once sess commits; drop it on rollback."""
+    sync_sess = getattr(sess, 'sync_session', sess)
+    if not sync_sess.info.get('_hashtag_cache_listening'):
+        # listeners stay attached for the (short) life of the session; they
+        # are no-ops when nothing is pending
+        event.listen(sync_sess, 'after_commit', _on_commit)
+        event.listen(sync_sess, 'after_rollback', _on_rollback)
+        sync_sess.info['_hashtag_cache_listening'] = True
+    sync_sess.info.setdefault('_hashtag_cache_pending', {}).update(mapping)
+
+
+async def resolve_hashtag_ids(sess, tags: Iterable[str], *, normalized: bool = False) -> dict[str, int]:
+    """Return {tag: id} for tags, creating missing Hashtag rows.
+
+    Cache hits cost nothing. Misses cost one INSERT ... ON CONFLICT DO NOTHING
+    plus one SELECT. Caller commits.
+    """
+    from .models import Hashtag
+    norm = list(tags) if normalized else normalize_tags(tags)
+    if not norm:
+        return {}
+    out, missing = hashtag_cache.get_many(norm)
+    if not missing:
+        return out
+    await sess.execute(
+        sqlite_insert(Hashtag).on_conflict_do_nothing(index_elements=['tag']),
+        [{'tag': t} for t in missing],
+    )
+    res = await sess.exec(select(Hashtag.tag, Hashtag.id).where(Hashtag.tag.in_(missing)))
+    fresh = {tag: int(hid) for tag, hid in res.all()}
+    out.update(fresh)
+    _publish_after_commit(sess, fresh)
+    return out
+
+
+async def sync_hashtag_links(sess, link_model, owner_col, owner_id: int, hashtag_ids: Iterable[int]) -> tuple[list[int], list[int]]:
+    """Make link_model rows for owner_id match hashtag_ids exactly.
+
+    One DELETE for links no longer wanted and one INSERT ... ON CONFLICT DO
+    NOTHING for the desired set; no pre-read of current links. Both use
+    RETURNING so the caller learns which links really changed. Returns
+    (added_ids, removed_ids). Caller commits.
+    """
+    from .hashtag_stats import TRACKED_OPTION
+    ids = sorted({int(h) for h in hashtag_ids if h is not None})
+    q = sqlalchemy_delete(link_model).where(owner_col == owner_id)
+    if ids:
+        q = q.where(link_model.hashtag_id.not_in(ids))
+    res = await sess.execute(q.returning(link_model.hashtag_id).execution_options(**{TRACKED_OPTION: True}))
+    removed = [int(r[0]) for r in res.all()]
+    added: list[int] = []
+    if ids:
+        res = await sess.execute(
+            sqlite_insert(link_model)
+            .values([{owner_col.key: owner_id, 'hashtag_id': hid} for hid in ids])
+            .on_conflict_do_nothing()
+            .returning(link_model.hashtag_id)
+            .execution_options(**{TRACKED_OPTION: True})
+        )
+        added = [int(r[0]) for r in res.all()]
+    return added, removed
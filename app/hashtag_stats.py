@@ -0,0 +1,609 @@
+"""Per-user hashtag usage statistics (UserHashtagStats).
+
+Goals
+- Serve the hashtags page, "top tags" and "recent tags" views from a small
+  precomputed table instead of re-aggregating ListHashtag/TodoHashtag joins
+  (and backfilling UserHashtag) on every GET. Reads never aggregate and never
+  write.
+- Keep the counters current at write time: `_sync_todo_hashtags`,
+  `_sync_list_hashtags` and bulk import report exactly which links they added
+  and removed, and `apply_link_delta` turns that into one upsert plus one
+  decrement.
+- Other code paths that touch link tables (single-tag add/remove, list/todo
+  deletion, hashtag deletion, the REPL) are not rewritten. Session events
+  see their flushes and bulk DELETEs, look up which links (and whose) are
+  going away or arriving, and apply the same counter deltas inside the same
+  transaction. The owners found this way are also reported to the
+  suggestion vocabulary cache (app/hashtag_vocab.py).
+- Writes whose effect cannot be resolved to counter deltas (bulk inserts or
+  updates of link rows, moving a todo or list to another owner, links on
+  public lists) mark only the owners involved stale once the transaction
+  commits. The leader worker rebuilds stale users in the background
+  (`run_stats_rebuilder`), and rebuilds every user once when it starts, which
+  also covers data written before the table existed.
+
+Usage
+- `await apply_link_delta(sess, user_id, 'todo'|'list', added_ids, removed_ids)`
+  inside the transaction that changed the links (caller commits).
+- `await user_hashtag_stats(sess, user_id, order='tag'|'top'|'recent')`
+  returns [{id, tag, list_count, todo_count, last_used_at}, ...].
+- The lifespan runs `run_stats_rebuilder(stop_event)`; every
+  HASHTAG_STATS_REBUILD_SECONDS the leader rebuilds the users marked stale
+  here or, through app/cache_bus.py, in other worker processes.
+"""
+from __future__ import annotations
+
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Optional
+import asyncio
+import logging
+import threading
+
+from sqlalchemy import delete as sqlalchemy_delete
+from sqlalchemy import event, func, or_, true
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy import update as sqlalchemy_update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session as _OrmSession
+from sqlmodel import select
+
+from . import config, workers
+from .cache_bus import cache_bus
+from .owner_cache import statement_columns
+from .utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+# execution option set on statements whose effect on the stats is applied
+# explicitly, so the session hooks below do not treat them as untracked
+TRACKED_OPTION = 'hashtag_stats_tracked'
+
+_WATCHED_TABLES = frozenset({'todohashtag', 'listhashtag', 'hashtag', 'todo', 'liststate'})
+
+_lock = threading.Lock()
+# user ids whose rows need a rebuild; None means every user
+_stale: set = set()
+
+
+def mark_all_stale(*, broadcast: bool = True) -> None:
+    """Queue every user's stats for a background rebuild."""
+    with _lock:
+        _stale.add(None)
+    if broadcast:
+        cache_bus.publish('hashtag_stats', None)
+
+
+def mark_user_stale(user_id: Optional[int], *, broadcast: bool = True) -> None:
+    if user_id is None:
+        mark_all_stale(broadcast=broadcast)
+        return
+    with _lock:
+        _stale.add(int(user_id))
+    if broadcast:
+        cache_bus.publish('hashtag_stats', int(user_id))
+
+
+cache_bus.subscribe('hashtag_stats', lambda user_id: mark_user_stale(user_id, broadcast=False))
+
+
+def _take_stale() -> set:
+    with _lock:
+        out = set(_stale)
+        _stale.clear()
+    return out
+
+
+def untracked_link_write(state) -> bool:
+    """True when an ORM execute event may change link counts behind tag sync's back."""
+    if not (state.is_insert or state.is_delete or state.is_update):
+        return False
+    if state.execution_options.get(TRACKED_OPTION):
+        return False
+    tbl = getattr(state.statement, 'table', None)
+    name = getattr(tbl, 'name', None)
+    if name not in _WATCHED_TABLES:
+        return False
+    if state.is_update and name in ('todo', 'liststate'):
+        # plain column updates of todos/lists (text, deferrals, timestamps)
+        # do not change link counts; moves to another owner can
+        cols = statement_columns(state.statement)
+        owner_col = 'list_id' if name == 'todo' else 'owner_id'
+        return cols is None or owner_col in cols
+    if state.is_insert and name in ('todo', 'liststate', 'hashtag'):
+        return False
+    return True
+
+
+# --- counter deltas ----------------------------------------------------------
+
+def _delta_statements(user_id: int, kind: str, added_n: Counter, removed_n: Counter, now: datetime) -> list:
+    """(statement, params) pairs applying one owner's link deltas."""
+    from .models import UserHashtagStats, UserHashtag
+    col = 'todo_count' if kind == 'todo' else 'list_count'
+    c = getattr(UserHashtagStats, col)
+    out: list = []
+    if added_n:
+        ins = sqlite_insert(UserHashtagStats)
+        out.append((
+            ins.on_conflict_do_update(
+                index_elements=['user_id', 'hashtag_id'],
+                set_={col: c + ins.excluded[col], 'last_used_at': ins.excluded.last_used_at},
+            ),
+            [{'user_id': user_id, 'hashtag_id': hid, 'list_count': 0, 'todo_count': 0, col: n, 'last_used_at': now} for hid, n in sorted(added_n.items())],
+        ))
+        # using a tag makes it the user's (replaces the old lazy GET backfill)
+        out.append((
+            sqlite_insert(UserHashtag).on_conflict_do_nothing(),
+            [{'user_id': user_id, 'hashtag_id': hid, 'first_seen_at': now} for hid in sorted(added_n)],
+        ))
+    # one UPDATE per distinct decrement (almost always just 1)
+    by_step: dict[int, list[int]] = {}
+    for hid, n in removed_n.items():
+        by_step.setdefault(n, []).append(hid)
+    for n, ids in sorted(by_step.items()):
+        out.append((
+            sqlalchemy_update(UserHashtagStats)
+            .where(UserHashtagStats.user_id == user_id)
+            .where(UserHashtagStats.hashtag_id.in_(sorted(ids)))
+            .values({col: func.max(c - n, 0)})
+            .execution_options(synchronize_session=False),
+            None,
+        ))
+    return out
+
+
+async def apply_link_delta(sess, user_id: Optional[int], kind: str, added: Iterable[int], removed: Iterable[int], now: Optional[datetime] = None) -> None:
+    """Apply link changes for one owner to UserHashtagStats. Caller commits.
+
+    kind is 'todo' or 'list'. added/removed hold one hashtag id per link, so
+    an id repeated n times moves its counter by n. Links on public (ownerless)
+    lists are visible to every user, so those queue a rebuild of everyone.
+    """
+    added_n = Counter(int(h) for h in added or [] if h is not None)
+    removed_n = Counter(int(h) for h in removed or [] if h is not None)
+    if not added_n and not removed_n:
+        return
+    if user_id is None:
+        _stale_on_commit(getattr(sess, 'sync_session', sess), {None}, vocab=False)
+        return
+    # the suggestion vocabulary follows the same deltas once this commits
+    from .hashtag_vocab import hashtag_vocab
+    await hashtag_vocab.stage(sess, user_id, added_n.elements(), removed_n.elements())
+    for stmt, params in _delta_statements(user_id, kind, added_n, removed_n, now or now_utc()):
+        if params is None:
+            await sess.execute(stmt)
+        else:
+            await sess.execute(stmt, params)
+
+
+def _link_rows_stmt(kind: str, where):
+    """(item_id, hashtag_id, owner_id) of the link rows matching `where`."""
+    from .models import ListHashtag, ListState, Todo, TodoHashtag
+    if kind == 'todo':
+        return (
+            select(TodoHashtag.todo_id, TodoHashtag.hashtag_id, ListState.owner_id)
+            .select_from(TodoHashtag)
+            .join(Todo, Todo.id == TodoHashtag.todo_id)
+            .join(ListState, ListState.id == Todo.list_id)
+            .where(where)
+        )
+    return (
+        select(ListHashtag.list_id, ListHashtag.hashtag_id, ListState.owner_id)
+        .select_from(ListHashtag)
+        .join(ListState, ListState.id == ListHashtag.list_id)
+        .where(where)
+    )
+
+
+def _apply_sync(session, conn, kind: str, rows, sign: int) -> None:
+    """Apply +1/-1 per (item_id, hashtag_id, owner_id) row on the flush connection."""
+    per_owner: dict = {}
+    for _item, hid, owner in rows:
+        per_owner.setdefault(owner, Counter())[int(hid)] += 1
+    _links_changed(session, {o for o in per_owner if o is not None})
+    now = now_utc()
+    for owner, counts in per_owner.items():
+        if owner is None:
+            # public list: every user's counts move
+            _stale_on_commit(session, {None}, vocab=False)
+            continue
+        added, removed = (counts, Counter()) if sign > 0 else (Counter(), counts)
+        for stmt, params in _delta_statements(int(owner), kind, added, removed, now):
+            if params is None:
+                conn.execute(stmt)
+            else:
+                conn.execute(stmt, params)
+
+
+def _rows(conn, kind: str, where, params=None) -> dict:
+    """Matching link rows keyed by (item_id, hashtag_id), so overlaps count once."""
+    res = conn.execute(_link_rows_stmt(kind, where), params or {})
+    return {(int(i), int(h)): (i, h, o) for i, h, o in res.all()}
+
+
+def _owners_of_lists(conn, list_ids) -> set:
+    from .models import ListState
+    ids = sorted({int(i) for i in list_ids if i is not None})
+    if not ids:
+        return set()
+    return {o for (o,) in conn.execute(select(ListState.owner_id).where(ListState.id.in_(ids))).all()}
+
+
+def _drop_hashtags(session, conn, hashtag_ids) -> None:
+    from .models import ListHashtag, TodoHashtag, UserHashtagStats
+    ids = sorted({int(i) for i in hashtag_ids if i is not None})
+    if ids:
+        # links still pointing at the tags leave their owners' vocabularies
+        rows = list(_rows(conn, 'todo', TodoHashtag.hashtag_id.in_(ids)).values())
+        rows += list(_rows(conn, 'list', ListHashtag.hashtag_id.in_(ids)).values())
+        _links_changed(session, {o for _i, _h, o in rows if o is not None})
+        conn.execute(sqlalchemy_delete(UserHashtagStats).where(UserHashtagStats.hashtag_id.in_(ids)))
+
+
+def _remove_items(session, conn, todo_ids=(), list_ids=(), todo_pairs=(), list_pairs=()) -> None:
+    """Decrement for links that disappear with todos/lists (or individually).
+
+    Todos in a deleted list drop out of the counts too, as they would in a
+    rebuild (which joins todos to their list).
+    """
+    from .models import ListHashtag, Todo, TodoHashtag
+    todo_ids, list_ids = set(todo_ids), set(list_ids)
+    todo_pairs, list_pairs = set(todo_pairs), set(list_pairs)
+    rows: dict = {}
+    if todo_ids:
+        rows.update(_rows(conn, 'todo', TodoHashtag.todo_id.in_(sorted(todo_ids))))
+    if list_ids:
+        rows.update(_rows(conn, 'todo', Todo.list_id.in_(sorted(list_ids))))
+    if todo_pairs:
+        found = _rows(conn, 'todo', TodoHashtag.todo_id.in_(sorted({t for t, _ in todo_pairs})))
+        rows.update({k: v for k, v in found.items() if k in todo_pairs})
+    if rows:
+        _apply_sync(session, conn, 'todo', rows.values(), -1)
+    rows = {}
+    if list_ids:
+        rows.update(_rows(conn, 'list', ListHashtag.list_id.in_(sorted(list_ids))))
+    if list_pairs:
+        found = _rows(conn, 'list', ListHashtag.list_id.in_(sorted({lid for lid, _ in list_pairs})))
+        rows.update({k: v for k, v in found.items() if k in list_pairs})
+    if rows:
+        _apply_sync(session, conn, 'list', rows.values(), -1)
+
+
+# --- session hooks -----------------------------------------------------------
+
+# session.info key: owners (None = everyone) to queue for a rebuild once the
+# transaction commits
+_PENDING_KEY = 'hashtag_stats_pending'
+
+
+def _stale_on_commit(session, owners, *, vocab: bool = True) -> None:
+    """Queue owners for a rebuild at commit (and drop their vocabularies).
+
+    vocab=False when None stands for a public list rather than "unknown":
+    public lists are in nobody's suggestion vocabulary.
+    """
+    if owners:
+        session.info.setdefault(_PENDING_KEY, set()).update(owners)
+        if vocab:
+            _links_changed(session, owners)
+
+
+def _links_changed(session, owners) -> None:
+    """Report owners whose links changed outside tag sync to the vocabulary cache."""
+    if owners:
+        from .hashtag_vocab import hashtag_vocab
+        hashtag_vocab.remember(session, owners)
+
+
+def _owner_moves(session, conn) -> None:
+    """Todos moved to another list and lists given to another owner."""
+    from .models import ListState, Todo
+    owners: set = set()
+    for obj in session.dirty:
+        if isinstance(obj, Todo):
+            hist = sa_inspect(obj).attrs.list_id.history
+            if hist.deleted and hist.added:
+                moved = _owners_of_lists(conn, list(hist.deleted) + list(hist.added))
+                if len(moved) > 1 or None in moved:
+                    owners |= moved
+        elif isinstance(obj, ListState):
+            hist = sa_inspect(obj).attrs.owner_id.history
+            if hist.deleted and hist.added:
+                owners |= set(hist.deleted) | set(hist.added)
+    _stale_on_commit(session, owners)
+
+
+@event.listens_for(_OrmSession, 'before_flush')
+def _on_before_flush(session, flush_context, instances) -> None:
+    from .models import Hashtag, ListHashtag, ListState, Todo, TodoHashtag
+    try:
+        todo_ids, list_ids, tag_ids = set(), set(), set()
+        todo_pairs, list_pairs = set(), set()
+        for obj in session.deleted:
+            if isinstance(obj, TodoHashtag):
+                todo_pairs.add((obj.todo_id, obj.hashtag_id))
+            elif isinstance(obj, ListHashtag):
+                list_pairs.add((obj.list_id, obj.hashtag_id))
+            elif isinstance(obj, Todo) and obj.id is not None:
+                todo_ids.add(obj.id)
+            elif isinstance(obj, ListState) and obj.id is not None:
+                list_ids.add(obj.id)
+            elif isinstance(obj, Hashtag) and obj.id is not None:
+                tag_ids.add(obj.id)
+        moves = any(isinstance(o, (Todo, ListState)) for o in session.dirty)
+        if not (todo_ids or list_ids or tag_ids or todo_pairs or list_pairs or moves):
+            return
+        # rows are read before the flush deletes them
+        conn = session.connection()
+        _remove_items(session, conn, todo_ids, list_ids, todo_pairs, list_pairs)
+        _drop_hashtags(session, conn, tag_ids)
+        if moves:
+            _owner_moves(session, conn)
+    except Exception:
+        logger.exception('hashtag stats: could not resolve flushed deletes')
+        _stale_on_commit(session, {None})
+
+
+@event.listens_for(_OrmSession, 'after_flush')
+def _on_flush(session, flush_context) -> None:
+    from .models import ListHashtag, TodoHashtag
+    try:
+        todo_pairs = {(o.todo_id, o.hashtag_id) for o in session.new if isinstance(o, TodoHashtag)}
+        list_pairs = {(o.list_id, o.hashtag_id) for o in session.new if isinstance(o, ListHashtag)}
+        if not (todo_pairs or list_pairs):
+            return
+        # rows exist now (and new todos/lists have ids)
+        conn = session.connection()
+        if todo_pairs:
+            found = _rows(conn, 'todo', TodoHashtag.todo_id.in_(sorted({t for t, _ in todo_pairs})))
+            _apply_sync(session, conn, 'todo', [v for k, v in found.items() if k in todo_pairs], +1)
+        if list_pairs:
+            found = _rows(conn, 'list', ListHashtag.list_id.in_(sorted({lid for lid, _ in list_pairs})))
+            _apply_sync(session, conn, 'list', [v for k, v in found.items() if k in list_pairs], +1)
+    except Exception:
+        logger.exception('hashtag stats: could not resolve flushed links')
+        _stale_on_commit(session, {None})
+
+
+def _bulk_owners(conn, name: str, where, params) -> set:
+    """Owners of the rows a bulk UPDATE/INSERT is about to change."""
+    from .models import ListState, Todo
+    if name == 'todo':
+        q = select(ListState.owner_id).select_from(Todo).join(ListState, ListState.id == Todo.list_id).where(where)
+    elif name == 'liststate':
+        q = select(ListState.owner_id).where(where)
+    else:
+        return {o for _i, _h, o in _rows(conn, 'todo' if name == 'todohashtag' else 'list', where, params).values()}
+    return {o for (o,) in conn.execute(q.distinct(), params or {}).all()}
+
+
+@event.listens_for(_OrmSession, 'do_orm_execute')
+def _on_orm_execute(state) -> None:
+    try:
+        if not untracked_link_write(state):
+            return
+        params = state.parameters
+        if isinstance(params, (list, tuple)):
+            # executemany: nothing to read the affected rows with
+            _stale_on_commit(state.session, {None})
+            return
+        from .models import Hashtag, ListState, Todo
+        name = state.statement.table.name
+        where = getattr(state.statement, 'whereclause', None)
+        where = true() if where is None else where
+        conn = state.session.connection()
+        if state.is_delete:
+            if name == 'todohashtag':
+                _apply_sync(state.session, conn, 'todo', _rows(conn, 'todo', where, params).values(), -1)
+            elif name == 'listhashtag':
+                _apply_sync(state.session, conn, 'list', _rows(conn, 'list', where, params).values(), -1)
+            elif name == 'todo':
+                ids = [i for (i,) in conn.execute(select(Todo.id).where(where), params or {}).all()]
+                _remove_items(state.session, conn, todo_ids=ids)
+            elif name == 'liststate':
+                ids = [i for (i,) in conn.execute(select(ListState.id).where(where), params or {}).all()]
+                _remove_items(state.session, conn, list_ids=ids)
+            elif name == 'hashtag':
+                _drop_hashtags(state.session, conn, [i for (i,) in conn.execute(select(Hashtag.id).where(where), params or {}).all()])
+            return
+        if state.is_insert:
+            # inserted link rows are not readable yet; rebuild their owners
+            # (todo_id/list_id of each row, falling back to everyone)
+            _stale_on_commit(state.session, _insert_owners(conn, state.statement, name, params))
+            return
+        # owner-changing updates: old owners now, plus everyone if the new
+        # owner cannot be read off the statement
+        owners = _bulk_owners(conn, name, where, params)
+        owners.add(None)
+        new_vals = getattr(state.statement, '_values', None) or {}
+        for k, v in new_vals.items():
+            key = getattr(k, 'key', None) or str(k)
+            value = getattr(v, 'value', None)
+            if key in ('list_id', 'owner_id') and isinstance(value, int):
+                owners.discard(None)
+                owners |= _owners_of_lists(conn, [value]) if key == 'list_id' else {value}
+        _stale_on_commit(state.session, owners)
+    except Exception:
+        logger.exception('hashtag stats: could not resolve bulk statement')
+        _stale_on_commit(state.session, {None})
+
+
+def _insert_owners(conn, stmt, name: str, params) -> set:
+    from .models import Todo
+    item_col = 'todo_id' if name == 'todohashtag' else 'list_id'
+    ids: set = set()
+    vals = getattr(stmt, '_values', None) or {}
+    for k, v in vals.items():
+        if (getattr(k, 'key', None) or str(k)) == item_col:
+            ids.add(getattr(v, 'value', None))
+    if isinstance(params, dict) and item_col in params:
+        ids.add(params[item_col])
+    if not ids or None in ids:
+        return {None}
+    if name == 'todohashtag':
+        list_ids = [lid for (lid,) in conn.execute(select(Todo.list_id).where(Todo.id.in_(sorted(ids)))).all()]
+        return _owners_of_lists(conn, list_ids) or {None}
+    return _owners_of_lists(conn, ids) or {None}
+
+
+@event.listens_for(_OrmSession, 'after_commit')
+def _on_commit(session) -> None:
+    owners = session.info.pop(_PENDING_KEY, None)
+    if owners:
+        if None in owners:
+            mark_all_stale()
+        else:
+            for oid in owners:
+                mark_user_stale(oid)
+
+
+@event.listens_for(_OrmSession, 'after_rollback')
+def _on_rollback(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# --- background rebuild --------------------------------------------------------
+
+async def rebuild_user_stats(sess, user_id: int) -> int:
+    """Recompute one user's rows from the link tables. Returns rows written.
+
+    Mirrors the visibility the hashtags page always used: the user's own lists
+    and todos plus public (ownerless) lists. Also backfills UserHashtag rows.
+    The DELETE goes first so the transaction holds SQLite's write lock while
+    it aggregates. Caller commits.
+    """
+    from .models import UserHashtagStats, UserHashtag, ListHashtag, TodoHashtag, ListState, Todo
+    await sess.exec(sqlalchemy_delete(UserHashtagStats).where(UserHashtagStats.user_id == user_id).execution_options(**{TRACKED_OPTION: True}))
+    visible = or_(ListState.owner_id == user_id, ListState.owner_id == None)
+    agg: dict[int, dict] = {}
+    ql = (
+        select(ListHashtag.hashtag_id, func.count(), func.max(ListState.modified_at))
+        .join(ListState, ListState.id == ListHashtag.list_id)
+        .where(visible)
+        .group_by(ListHashtag.hashtag_id)
+    )
+    for hid, cnt, last in (await sess.exec(ql)).all():
+        agg[int(hid)] = {'list_count': int(cnt), 'todo_count': 0, 'last_used_at': last}
+    qt = (
+        select(TodoHashtag.hashtag_id, func.count(), func.max(Todo.modified_at))
+        .join(Todo, Todo.id == TodoHashtag.todo_id)
+        .join(ListState, ListState.id == Todo.list_id)
+        .where(visible)
+        .group_by(TodoHashtag.hashtag_id)
+    )
+    for hid, cnt, last in (await sess.exec(qt)).all():
+        row = agg.setdefault(int(hid), {'list_count': 0, 'todo_count': 0, 'last_used_at': None})
+        row['todo_count'] = int(cnt)
+        prev = row['last_used_at']
+        if last is not None and (prev is None or last > prev):
+            row['last_used_at'] = last
+    if agg:
+        await sess.execute(
+            sqlite_insert(UserHashtagStats),
+            [{'user_id': user_id, 'hashtag_id': hid, **vals} for hid, vals in agg.items()],
+        )
+        await sess.execute(
+            sqlite_insert(UserHashtag).on_conflict_do_nothing(),
+            [{'user_id': user_id, 'hashtag_id': hid} for hid in agg],
+        )
+    logger.debug('rebuilt hashtag stats user_id=%s rows=%d', user_id, len(agg))
+    return len(agg)
+
+
+async def rebuild_stale(session_factory=None) -> int:
+    """Rebuild every user queued by mark_user_stale/mark_all_stale. Returns users rebuilt."""
+    owners = _take_stale()
+    if not owners:
+        return 0
+    if session_factory is None:
+        from .db import async_session as session_factory
+    if None in owners:
+        from .models import User
+        async with session_factory() as sess:
+            owners = {int(uid) for uid in (await sess.exec(select(User.id))).all()}
+    done = 0
+    for uid in sorted(owners):
+        try:
+            async with session_factory() as sess:
+                await rebuild_user_stats(sess, uid)
+                await sess.commit()
+            done += 1
+        except Exception:
+            logger.exception('hashtag stats rebuild failed user_id=%s; will retry', uid)
+            mark_user_stale(uid, broadcast=False)
+    return done
+
+
+async def run_stats_rebuilder(stop_event: asyncio.Event, interval: Optional[float] = None) -> None:
+    """Background task: the leader rebuilds stale users every `interval` seconds.
+
+    On becoming leader (at startup, or taking over from one that exited) it
+    queues every user once. Other workers drop their queue: the users in it
+    were already broadcast to the leader.
+    """
+    interval = config.HASHTAG_STATS_REBUILD_SECONDS if interval is None else interval
+    full_pass = True
+    while not stop_event.is_set():
+        try:
+            if workers.is_leader():
+                if full_pass:
+                    full_pass = False
+                    mark_all_stale(broadcast=False)
+                n = await rebuild_stale()
+                if n:
+                    logger.info('rebuilt hashtag stats for %d users', n)
+            else:
+                _take_stale()
+        except asyncio.CancelledError:
+            break
+        except Exception:
+            logger.exception('hashtag stats rebuilder encountered an error')
+        try:
+            await asyncio.wait_for(stop_event.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def user_hashtag_stats(sess, user_id: int, order: str = 'tag', limit: Optional[int] = None, prefix: Optional[str] = None) -> list[dict]:
+    """Return the user's hashtags with usage counters.
+
+    order='tag' lists every hashtag the user owns (UserHashtag), including
+    ones with no current links; 'top' and 'recent' list only tags in use,
+    by total link count or by last_used_at respectively.
+    """
+    from .models import UserHashtagStats, UserHashtag, Hashtag
+    S = UserHashtagStats
+    if order in ('top', 'recent'):
+        q = (
+            select(Hashtag.id, Hashtag.tag, S.list_count, S.todo_count, S.last_used_at)
+            .join(S, S.hashtag_id == Hashtag.id)
+            .where(S.user_id == user_id)
+            .where((S.list_count + S.todo_count) > 0)
+        )
+        if order == 'top':
+            q = q.order_by((S.list_count + S.todo_count).desc(), Hashtag.tag.asc())
+        else:
+            q = q.order_by(S.last_used_at.desc(), Hashtag.tag.asc())
+    else:
+        q = (
+            select(Hashtag.id, Hashtag.tag, S.list_count, S.todo_count, S.last_used_at)
+            .join(UserHashtag, UserHashtag.hashtag_id == Hashtag.id)
+            .outerjoin(S, (S.hashtag_id == Hashtag.id) & (S.user_id == UserHashtag.user_id))
+            .where(UserHashtag.user_id == user_id)
+            .order_by(Hashtag.tag.asc())
+        )
+    if prefix:
+        q = q.where(Hashtag.tag.startswith(prefix, autoescape=True))
+    if limit:
+        q = q.limit(int(limit))
+    out: list[dict] = []
+    for hid, tag, lc, tc, last in (await sess.exec(q)).all():
+        out.append({
+            'id': int(hid),
+            'tag': tag,
+            'list_count': int(lc or 0),
+            'todo_count': int(tc or 0),
+            'last_used_at': last,
+        })
+    return out
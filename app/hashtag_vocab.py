@@ -0,0 +1,218 @@
+"""Per-user hashtag vocabulary for tag suggestions.
+
+Goals
+- The list and todo pages (and /client/json/lists/{id}) offered "this user's
+  hashtags" as suggestions by joining every ListHashtag and TodoHashtag row of
+  the user's lists on every page view.
+- Keep that vocabulary per user in memory instead: a sorted tuple of tags
+  (the compact array served to templates and JSON) plus a prefix index of
+  [lo, hi) ranges by first letter after '#', so a prefix lookup is a bisect
+  inside one small range.
+- Tag sync (`_sync_todo_hashtags` / `_sync_list_hashtags` / bulk import, all
+  via hashtag_stats.apply_link_delta) updates a cached vocabulary in place
+  once the transaction commits, using per-tag link counts; a tag leaves the
+  vocabulary when its last link goes.
+- Every other write to the link tables (single-tag add/remove, deletes, the
+  REPL) drops the vocabularies of the owners whose links it touched, both at
+  flush time and again after commit; app/hashtag_stats.py resolves those
+  owners for its counters and reports them here.
+- The ETag is a hash of the tags, so it only changes when the vocabulary does
+  and is the same in every worker process.
+
+Usage
+- `vocab = await hashtag_vocab.get(sess, user_id)`; `vocab.tags` is the sorted
+  tuple, `vocab.prefix('#sh', limit=20)` the tags starting with a prefix (with
+  or without '#'), `vocab.etag` the validator.
+- GET /api/hashtags/vocab serves it as JSON with ETag /
+  If-None-Match support (304 when unchanged). The list and todo pages fetch
+  their suggestions from it (static/no_js/hashtag_vocab.js) instead of
+  inlining the vocabulary in every render.
+- Only links on lists the user owns count (what the pages always used);
+  HASHTAG_VOCAB_CACHE_TTL bounds staleness after raw SQL writes.
+- Other worker processes do not replay deltas; they drop the user's entry
+  (app/cache_bus.py) and reload it on next use.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+import hashlib
+import logging
+
+from sqlalchemy import func, union_all
+from sqlmodel import select
+
+from .cache_bus import cache_bus
+from .models import Hashtag, ListHashtag, ListState, Todo, TodoHashtag
+from .owner_cache import OwnerCache, install_session_hooks
+
+logger = logging.getLogger(__name__)
+
+
+def _index_key(tag: str) -> str:
+    return tag[1:2] if tag.startswith('#') else tag[:1]
+
+
+@dataclass(frozen=True)
+class Vocab:
+    owner_id: int
+    # sorted, unique
+    tags: tuple
+    # hashtag id -> (tag, number of the user's links using it)
+    counts: dict = field(repr=False)
+    # first letter after '#' -> (lo, hi) range in tags
+    index: dict = field(repr=False)
+    etag: str = ''
+
+    @classmethod
+    def build(cls, owner_id: int, counts: dict) -> 'Vocab':
+        tags = tuple(sorted({t for t, n in counts.values() if n > 0 and t}))
+        index: dict[str, tuple[int, int]] = {}
+        for i, t in enumerate(tags):
+            k = _index_key(t)
+            lo, _ = index.get(k, (i, i))
+            index[k] = (lo, i + 1)
+        digest = hashlib.sha1('\n'.join(tags).encode('utf-8')).hexdigest()[:20]
+        return cls(owner_id, tags, counts, index, f'W/"hv-{digest}"')
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def prefix(self, prefix: Optional[str], limit: Optional[int] = None) -> list[str]:
+        """Tags starting with prefix ('#sh' or 'sh'); all tags when empty."""
+        p = (prefix or '').strip().lower()
+        if p and not p.startswith('#'):
+            p = '#' + p
+        if len(p) <= 1:
+            out = list(self.tags)
+        else:
+            rng = self.index.get(_index_key(p))
+            if rng is None:
+                return []
+            lo, hi = rng
+            i = bisect_left(self.tags, p, lo, hi)
+            j = bisect_left(self.tags, p + '\uffff', i, hi)
+            out = list(self.tags[i:j])
+        return out[:limit] if limit else out
+
+    def apply(self, added: dict, removed: Counter) -> 'Vocab':
+        """Return a copy with link deltas applied (added: {id: (tag, n)})."""
+        counts = dict(self.counts)
+        for hid, (tag, n) in added.items():
+            cur_tag, cur = counts.get(hid, (tag, 0))
+            counts[hid] = (cur_tag or tag, cur + n)
+        for hid, n in removed.items():
+            if hid in counts:
+                tag, cur = counts[hid]
+                if cur - n > 0:
+                    counts[hid] = (tag, cur - n)
+                else:
+                    counts.pop(hid)
+        return Vocab.build(self.owner_id, counts)
+
+
+class HashtagVocabCache(OwnerCache[Vocab]):
+    """Caches one Vocab per user; see the module docstring."""
+
+    channel = 'hashtag_vocab'
+    ttl_setting = 'HASHTAG_VOCAB_CACHE_TTL'
+
+    async def _load(self, sess, owner_id: int) -> Vocab:
+        links = union_all(
+            select(ListHashtag.hashtag_id.label('hid'))
+            .join(ListState, ListState.id == ListHashtag.list_id)
+            .where(ListState.owner_id == owner_id),
+            select(TodoHashtag.hashtag_id.label('hid'))
+            .join(Todo, Todo.id == TodoHashtag.todo_id)
+            .join(ListState, ListState.id == Todo.list_id)
+            .where(ListState.owner_id == owner_id),
+        ).subquery('links')
+        q = (
+            select(Hashtag.id, Hashtag.tag, func.count())
+            .join(links, links.c.hid == Hashtag.id)
+            .group_by(Hashtag.id, Hashtag.tag)
+        )
+        counts = {int(hid): (tag, int(n)) for hid, tag, n in (await sess.exec(q)).all() if tag}
+        return Vocab.build(owner_id, counts)
+
+    def _apply(self, owner_id: int, added: dict, removed: Counter) -> None:
+        # peers reload the user's vocabulary rather than replaying the delta
+        cache_bus.publish('hashtag_vocab', int(owner_id))
+        with self._lock:
+            self._generation += 1
+            ent = self._cache.get(owner_id)
+            if ent is None:
+                return
+            try:
+                self._cache[owner_id] = (ent[0], ent[1].apply(added, removed))
+            except Exception:
+                self._cache.pop(owner_id, None)
+
+    async def stage(self, sess, owner_id: Optional[int], added: Iterable[int], removed: Iterable[int]) -> None:
+        """Record link deltas from tag sync; applied when sess commits.
+
+        added/removed hold one hashtag id per link. Names of tags new to a
+        cached vocabulary cost one SELECT; nothing is read when the user has
+        no cached vocabulary (the next get() loads it fresh).
+        """
+        if owner_id is None:
+            return
+        owner_id = int(owner_id)
+        add_n = Counter(int(h) for h in added or [] if h is not None)
+        rem_n = Counter(int(h) for h in removed or [] if h is not None)
+        if not add_n and not rem_n:
+            return
+        sync_sess = getattr(sess, 'sync_session', sess)
+        pending = sync_sess.info.setdefault(_DELTA_KEY, [])
+        cur = self.peek(owner_id)
+        if cur is None:
+            # a load landing before our commit would miss these links, so
+            # drop the user's entry again at commit instead
+            pending.append((owner_id, None, None))
+            return
+        unknown = sorted(h for h in add_n if h not in cur.counts)
+        names: dict[int, str] = {}
+        if unknown:
+            res = await sess.exec(select(Hashtag.id, Hashtag.tag).where(Hashtag.id.in_(unknown)))
+            names = {int(hid): tag for hid, tag in res.all()}
+        delta = {hid: (cur.counts.get(hid, (names.get(hid), 0))[0], n) for hid, n in add_n.items()}
+        pending.append((owner_id, delta, rem_n))
+
+    def committed(self, session, owners: set) -> None:
+        super().committed(session, owners)
+        deltas = session.info.pop(_DELTA_KEY, None)
+        if None in owners:
+            return
+        for owner_id, added, removed in deltas or []:
+            if owner_id in owners:
+                # already dropped; the next get() reloads it
+                continue
+            if added is None:
+                self.invalidate(owner_id)
+            else:
+                self._apply(owner_id, added, removed)
+
+    def rolled_back(self, session, owners: set) -> None:
+        session.info.pop(_DELTA_KEY, None)
+        super().rolled_back(session, owners)
+
+
+hashtag_vocab = HashtagVocabCache().subscribe()
+
+
+def invalidate_hashtag_vocab(owner_id: Optional[int] = None) -> None:
+    """Drop the cached vocabulary for one user (None: every user)."""
+    hashtag_vocab.invalidate(owner_id)
+
+
+# --- session hooks -----------------------------------------------------------
+
+# session.info key: staged tag-sync deltas, applied once the transaction
+# commits. Owners whose links changed behind tag sync's back are reported by
+# app/hashtag_stats.py (`hashtag_vocab.remember(session, owners)`), which
+# already resolves them for the stats counters.
+_DELTA_KEY = 'hashtag_vocab_deltas'
+
+install_session_hooks(hashtag_vocab)
@@ -4,6 +4,8 @@ Goals
 - Count how many templates are looked up vs. how many were loaded from source
   (a proxy for compile events) using Jinja's built-in in-memory cache only.
 - Expose simple percentages via response headers without changing behavior.
+- Also report todo-row fragment cache hits/misses (app/fragment_cache.py)
+  as X-Jinja-Fragment-* headers and in the log line per request.
 
 Usage
 - Call install_jinja_cache_stats(app, [env1, env2, ...]) once at startup.
@@ -64,6 +66,8 @@ def _reset_stats() -> dict:
         "load_calls": 0,         # loader.get_source calls (proxy for compile/miss)
         "unique_templates": set(),  # names seen in get_template
         "loaded_names": [],      # sequence of names passed to loader.get_source
+        "fragment_hits": 0,      # todo-row fragments served from cache
+        "fragment_misses": 0,    # todo-row fragments rendered
     }
     _stats_var.set(data)
     return data
@@ -76,6 +80,22 @@ def _get_stats() -> dict:
     return data
 
 
+def note_fragment_cache(hits: int, misses: int) -> None:
+    """Add fragment cache counters to the current request's stats.
+
+    No-op unless the stats middleware reset counters for this request, so
+    it costs one ContextVar read when JINJA_CACHE_STATS is off.
+    """
+    st = _stats_var.get()
+    if st is None:
+        return
+    try:
+        st["fragment_hits"] = int(st.get("fragment_hits", 0) or 0) + int(hits)
+        st["fragment_misses"] = int(st.get("fragment_misses", 0) or 0) + int(misses)
+    except Exception:
+        pass
+
+
 def _patch_env(env) -> None:
     """Monkey patch a Jinja2 Environment to count get_template and loader.get_source.
 
@@ -169,6 +189,18 @@ class JinjaCacheStatsMiddleware(BaseHTTPMiddleware):
             response.headers[f"{hp}Unique-Templates"] = str(uniq_n)
             response.headers[f"{hp}Compile-Percent-Unique"] = f"{pct_unique:.2f}"
             response.headers[f"{hp}Compile-Percent-Calls"] = f"{pct_calls:.2f}"
+            f_hits = int(st.get("fragment_hits", 0) or 0)
+            f_misses = int(st.get("fragment_misses", 0) or 0)
+            if f_hits or f_misses:
+                f_pct = 100.0 * f_hits / (f_hits + f_misses)
+                response.headers[f"{hp}Fragment-Hits"] = str(f_hits)
+                response.headers[f"{hp}Fragment-Misses"] = str(f_misses)
+                response.headers[f"{hp}Fragment-Hit-Percent"] = f"{f_pct:.2f}"
+                try:
+                    url = _req_url_var.get() or "-"
+                    _append_log(f"{_now_iso()} url={url} fragments hits={f_hits} misses={f_misses} hit_pct={f_pct:.2f}")
+                except Exception:
+                    pass
             # Provide the log file location for discovery (relative if possible)
             try:
                 lp = _log_path()
@@ -0,0 +1,186 @@
+"""Per-user ItemLink adjacency cache.
+
+Goals
+- Load a user's ItemLink graph with one query and answer the link questions
+  pages keep asking from memory: outgoing links of a todo/list (todo and
+  list pages), backlinks (edges pointing at an item), collation membership
+  (list -> todo edges of the user's collation lists) and the link map.
+- The link map used to load every edge and then `sess.get(ListState, ...)`
+  once per linked todo; the todo/list pages, the priorities/index collation
+  passes and the collation-status endpoints each ran their own ItemLink
+  query per request.
+
+Usage
+- `graph = await link_graph.get(sess, user_id)` returns an immutable
+  LinkGraph:
+  - `graph.outgoing('todo', todo_id)` -> edges ordered like the pages list
+    them (position, nulls last, then created_at);
+  - `graph.incoming('todo', todo_id)` -> backlinks;
+  - `graph.pairs('list', collation_ids, 'todo')` -> [(src_id, tgt_id)];
+  - `graph.sources('todo', todo_id, 'list')` -> set of linking list ids.
+  Edges carry the ItemLink attributes the views read (id, src_type, src_id,
+  tgt_type, tgt_id, label, position, created_at).
+- `await outgoing_links(sess, owner_id, 'list', list_id)` is the page
+  helper: the owner's graph, or a direct query for ownerless items.
+- The graph holds edges whose ItemLink.owner_id is the user. Link writers
+  require the caller to own the source item and store its id as owner_id,
+  so a user's graph holds every edge out of that user's todos and lists.
+- Entries are dropped by `_add_link_core` / `_remove_link_core`, by session
+  events on any flush that adds, changes or deletes an ItemLink (collation
+  toggle, bulk link creation) and on bulk ItemLink statements (list delete;
+  scoped to the owners of the rows the statement matches), and again once
+  that transaction commits (app/owner_cache.py). Raw SQL writers should call
+  `invalidate_link_graph(owner_id)`; LINK_GRAPH_CACHE_TTL bounds staleness
+  otherwise. Every invalidation is also sent to the other worker processes
+  (app/cache_bus.py).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlmodel import select
+
+from .models import ItemLink
+from .owner_cache import (
+    OwnerCache, install_session_hooks, statement_columns, statement_literals,
+    statement_table, where_owners,
+)
+
+
+@dataclass(frozen=True)
+class Edge:
+    id: int
+    src_type: str
+    src_id: int
+    tgt_type: str
+    tgt_id: int
+    label: Optional[str]
+    position: Optional[int]
+    created_at: Optional[datetime]
+
+
+def _edge_order(e: Edge):
+    # position ASC NULLS LAST, created_at ASC, then id for a stable tie-break
+    return (e.position is None, e.position or 0, e.created_at is None, e.created_at or datetime.min, e.id)
+
+
+class LinkGraph:
+    """Forward and backward adjacency for one user's ItemLink rows."""
+
+    def __init__(self, owner_id: int, edges: Iterable[Edge]):
+        self.owner_id = owner_id
+        out: dict[tuple, list] = {}
+        inc: dict[tuple, list] = {}
+        for e in sorted(edges, key=_edge_order):
+            out.setdefault((e.src_type, e.src_id), []).append(e)
+            inc.setdefault((e.tgt_type, e.tgt_id), []).append(e)
+        self._out = {k: tuple(v) for k, v in out.items()}
+        self._in = {k: tuple(v) for k, v in inc.items()}
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._out.values())
+
+    @property
+    def edges(self) -> list[Edge]:
+        return [e for v in self._out.values() for e in v]
+
+    def outgoing(self, kind: str, item_id: int) -> tuple:
+        return self._out.get((kind, int(item_id)), ())
+
+    def incoming(self, kind: str, item_id: int) -> tuple:
+        return self._in.get((kind, int(item_id)), ())
+
+    def pairs(self, src_type: str, src_ids: Iterable[int], tgt_type: str) -> list[tuple[int, int]]:
+        """(src_id, tgt_id) of edges from the given sources to `tgt_type` items."""
+        out: list[tuple[int, int]] = []
+        for sid in src_ids:
+            for e in self.outgoing(src_type, sid):
+                if e.tgt_type == tgt_type:
+                    out.append((e.src_id, e.tgt_id))
+        return out
+
+    def sources(self, tgt_type: str, tgt_id: int, src_type: str) -> set[int]:
+        """Ids of `src_type` items linking to the given target (e.g. collations holding a todo)."""
+        return {e.src_id for e in self.incoming(tgt_type, tgt_id) if e.src_type == src_type}
+
+
+def _edge_from_row(r) -> Optional[Edge]:
+    try:
+        return Edge(
+            id=int(r.id),
+            src_type=(r.src_type or '').strip().lower(),
+            src_id=int(r.src_id),
+            tgt_type=(r.tgt_type or '').strip().lower(),
+            tgt_id=int(r.tgt_id),
+            label=r.label,
+            position=r.position,
+            created_at=r.created_at,
+        )
+    except Exception:
+        return None
+
+
+class LinkGraphCache(OwnerCache[LinkGraph]):
+    """Caches one LinkGraph per user; see the module docstring."""
+
+    channel = 'link_graph'
+    ttl_setting = 'LINK_GRAPH_CACHE_TTL'
+
+    async def _load(self, sess, owner_id: int) -> LinkGraph:
+        q = select(
+            ItemLink.id, ItemLink.src_type, ItemLink.src_id, ItemLink.tgt_type,
+            ItemLink.tgt_id, ItemLink.label, ItemLink.position, ItemLink.created_at,
+        ).where(ItemLink.owner_id == owner_id)
+        rows = (await sess.exec(q)).all()
+        return LinkGraph(owner_id, [e for e in (_edge_from_row(r) for r in rows) if e is not None])
+
+
+link_graph = LinkGraphCache().subscribe()
+
+
+async def outgoing_links(sess, owner_id: Optional[int], src_type: str, src_id: int) -> tuple:
+    """Outgoing edges of an item whose owner is `owner_id`.
+
+    Items without an owner (legacy public lists) have no graph, so they fall
+    back to a direct query.
+    """
+    if owner_id is not None:
+        return (await link_graph.get(sess, owner_id)).outgoing(src_type, src_id)
+    q = select(ItemLink).where(ItemLink.src_type == src_type).where(ItemLink.src_id == src_id)
+    edges = [e for e in (_edge_from_row(r) for r in (await sess.exec(q)).all()) if e is not None]
+    return tuple(sorted(edges, key=_edge_order))
+
+
+def invalidate_link_graph(owner_id: Optional[int] = None) -> None:
+    """Drop the cached LinkGraph for one user (None: every user)."""
+    link_graph.invalidate(owner_id)
+
+
+# --- invalidation hooks ------------------------------------------------------
+
+def _flush_owners(session) -> set:
+    return {
+        getattr(obj, 'owner_id', None)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(obj, ItemLink)
+    }
+
+
+def _statement_owners(state) -> set:
+    """Owners of the ItemLink rows a bulk statement touches (None: unknown)."""
+    if statement_table(state.statement) != 'itemlink':
+        return set()
+    owners: set = set()
+    if not state.is_insert:
+        owners |= where_owners(state, select(ItemLink.owner_id))
+    cols = statement_columns(state.statement)
+    if state.is_insert or (state.is_update and (cols is None or 'owner_id' in cols)):
+        lits = statement_literals(state.statement)
+        if 'owner_id' not in lits or isinstance(state.parameters, (list, tuple)):
+            return {None}
+        owners.add(lits['owner_id'])
+    return owners
+
+
+install_session_hooks(link_graph, flush_owners=_flush_owners, statement_owners=_statement_owners)
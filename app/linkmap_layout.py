@@ -0,0 +1,336 @@
+"""Server-side link map layout with versioned deltas.
+
+Goals
+- The link map page used to receive every node and edge on each load and
+  run the force layout from scratch in the browser, which stalls phones for
+  users with thousands of links. The server now keeps node coordinates per
+  user (LinkMapNode rows) and the page draws them as they are.
+- Only affected nodes are re-laid out: nodes that appeared, and nodes whose
+  neighbour set changed (both ends of an added or removed link). Everything
+  else keeps its stored position and acts as a fixed anchor.
+- Each layout pass bumps a per-user version. `/html_no_js/linkmap/delta`
+  returns only nodes placed or removed after a version the client already
+  has, plus the edges touching them.
+
+Usage
+- `await full_payload(sess, owner_id)` -> {version, nodes, links}; nodes carry
+  x/y alongside the existing id/raw_id/kind/label keys.
+- `await delta_payload(sess, owner_id, since)` -> {version, full, nodes,
+  removed, links}. When `since` is ahead of the server (new database) the
+  reply is a full payload with full=True. The client drops links touching
+  any changed or removed node and adds the returned ones.
+- `compute_layout(adj, fixed, movable)` is the pure layout function.
+
+Notes
+- The layout is Fruchterman-Reingold with grid-bucketed repulsion (only
+  nodes in neighbouring cells repel), so a pass is roughly linear in the
+  number of moving nodes. It is plain Python: NumPy is not a dependency.
+  Large passes run in the default thread pool, small ones inline.
+- Layout is derived by diffing the cached link graph (app/link_graph.py)
+  with the stored rows, so it follows every ItemLink writer without hooks.
+  The diff is skipped while the cached graph object is unchanged.
+- Label edits do not bump the version; a full load picks them up.
+"""
+from __future__ import annotations
+
+from typing import Iterable, Optional
+import asyncio
+import hashlib
+import logging
+import math
+import random
+import threading
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from . import config
+from .link_graph import link_graph
+from .models import LinkMapNode, ListState, Todo
+
+logger = logging.getLogger(__name__)
+
+# ideal edge length in layout units (force-graph's default link distance is 30)
+EDGE_LENGTH = 40.0
+GRAVITY = 0.01
+# passes moving more nodes than this run in a worker thread
+_INLINE_MAX = 200
+
+
+def node_key(kind: str, item_id: int) -> str:
+    return f"{kind}:{int(item_id)}"
+
+
+def _split(node: str) -> tuple[str, int]:
+    kind, _, raw = node.partition(':')
+    return kind, int(raw)
+
+
+def _sig(neighbours: Iterable[str]) -> str:
+    return hashlib.sha1('|'.join(sorted(neighbours)).encode('utf-8')).hexdigest()[:16]
+
+
+def compute_layout(
+    adj: dict[str, set],
+    fixed: dict[str, tuple[float, float]],
+    movable: Iterable[str],
+    iterations: Optional[int] = None,
+    seed: int = 0,
+) -> dict[str, tuple[float, float]]:
+    """Place `movable` nodes; `fixed` nodes keep their positions.
+
+    adj maps every node to its (undirected) neighbour set. Returns positions
+    for the movable nodes only.
+    """
+    iterations = config.LINKMAP_LAYOUT_ITERATIONS if iterations is None else iterations
+    movable = sorted(set(movable))
+    if not movable:
+        return {}
+    rng = random.Random(seed)
+    k = EDGE_LENGTH
+    k2 = k * k
+    radius = k * math.sqrt(len(adj) or 1)
+    pos: dict[str, list] = {n: [float(x), float(y)] for n, (x, y) in fixed.items()}
+
+    # initial placement: near already-placed neighbours, else a random point
+    pending = list(movable)
+    for _ in range(2):
+        later = []
+        for n in pending:
+            placed = [pos[m] for m in adj.get(n, ()) if m in pos]
+            if placed:
+                cx = sum(p[0] for p in placed) / len(placed)
+                cy = sum(p[1] for p in placed) / len(placed)
+                ang = rng.uniform(0, 2 * math.pi)
+                pos[n] = [cx + k * math.cos(ang), cy + k * math.sin(ang)]
+            else:
+                later.append(n)
+        pending = later
+    for n in pending:
+        ang = rng.uniform(0, 2 * math.pi)
+        r = radius * math.sqrt(rng.random())
+        pos[n] = [r * math.cos(ang), r * math.sin(ang)]
+
+    # repulsion is cut off beyond `cell`, so only the 3x3 neighbouring cells
+    # are scanned; grid entries carry the position to skip dict lookups
+    cell = 1.5 * k
+    cell2 = cell * cell
+    fixed_grid: dict[tuple, list] = {}
+    for n in fixed:
+        x, y = pos[n]
+        fixed_grid.setdefault((math.floor(x / cell), math.floor(y / cell)), []).append((n, x, y))
+
+    temp0 = max(k, min(radius / 4, k * math.sqrt(len(movable))))
+    for it in range(max(0, iterations)):
+        grid = {c: list(ns) for c, ns in fixed_grid.items()}
+        for n in movable:
+            x, y = pos[n]
+            grid.setdefault((math.floor(x / cell), math.floor(y / cell)), []).append((n, x, y))
+        disp: dict[str, tuple[float, float]] = {}
+        for v in movable:
+            vx, vy = pos[v]
+            gx, gy = math.floor(vx / cell), math.floor(vy / cell)
+            dx = dy = 0.0
+            for i in (-1, 0, 1):
+                for j in (-1, 0, 1):
+                    for u, ux, uy in grid.get((gx + i, gy + j), ()):
+                        ddx = vx - ux
+                        ddy = vy - uy
+                        d2 = ddx * ddx + ddy * ddy
+                        if d2 > cell2:
+                            continue
+                        if d2 < 1e-6:
+                            if u == v:
+                                continue
+                            ddx, ddy = rng.uniform(-1, 1), rng.uniform(-1, 1)
+                            d2 = ddx * ddx + ddy * ddy + 1e-6
+                        f = k2 / d2
+                        dx += ddx * f
+                        dy += ddy * f
+            for u in adj.get(v, ()):
+                pu = pos.get(u)
+                if pu is None or u == v:
+                    continue
+                ddx = vx - pu[0]
+                ddy = vy - pu[1]
+                d = math.sqrt(ddx * ddx + ddy * ddy)
+                dx -= ddx * d / k
+                dy -= ddy * d / k
+            dx -= GRAVITY * vx
+            dy -= GRAVITY * vy
+            disp[v] = (dx, dy)
+        temp = temp0 * (1 - it / iterations)
+        for v, (dx, dy) in disp.items():
+            length = math.sqrt(dx * dx + dy * dy)
+            if length > 0:
+                step = min(length, temp)
+                pos[v][0] += dx / length * step
+                pos[v][1] += dy / length * step
+    return {n: (round(pos[n][0], 2), round(pos[n][1], 2)) for n in movable}
+
+
+def _adjacency(graph) -> dict[str, set]:
+    adj: dict[str, set] = {}
+    for e in graph.edges:
+        s = node_key(e.src_type, e.src_id)
+        t = node_key(e.tgt_type, e.tgt_id)
+        adj.setdefault(s, set())
+        adj.setdefault(t, set())
+        if s != t:
+            adj[s].add(t)
+            adj[t].add(s)
+    return adj
+
+
+# owner -> (LinkGraph object the stored layout matches, version)
+_synced: dict[int, tuple[object, int]] = {}
+_synced_lock = threading.Lock()
+
+
+def forget(owner_id: Optional[int] = None) -> None:
+    """Force the next request to re-diff the stored layout (None: everyone)."""
+    with _synced_lock:
+        if owner_id is None:
+            _synced.clear()
+        else:
+            _synced.pop(int(owner_id), None)
+
+
+async def sync_layout(sess, owner_id: int):
+    """Bring the stored layout in line with the link graph.
+
+    Returns (graph, adjacency, version).
+    """
+    owner_id = int(owner_id)
+    graph = await link_graph.get(sess, owner_id)
+    adj = _adjacency(graph)
+    with _synced_lock:
+        ent = _synced.get(owner_id)
+        if ent is not None and ent[0] is graph:
+            return graph, adj, ent[1]
+
+    for attempt in range(2):
+        rows = (await sess.exec(select(LinkMapNode).where(LinkMapNode.owner_id == owner_id))).all()
+        stored = {r.node_id: r for r in rows}
+        version = max((r.version for r in rows), default=0)
+        sigs = {n: _sig(ns) for n, ns in adj.items()}
+        live = {n for n, r in stored.items() if not r.removed}
+        removed = live - set(adj)
+        movable = {n for n in adj if n not in live or stored[n].sig != sigs[n]}
+        if not (movable or removed):
+            break
+        version += 1
+        fixed = {n: (stored[n].x, stored[n].y) for n in live if n in adj and n not in movable}
+        iterations = config.LINKMAP_LAYOUT_ITERATIONS
+        if len(movable) > _INLINE_MAX:
+            loop = asyncio.get_running_loop()
+            placed = await loop.run_in_executor(None, compute_layout, adj, fixed, movable, iterations, owner_id)
+        else:
+            placed = compute_layout(adj, fixed, movable, iterations, owner_id)
+        for n, (x, y) in placed.items():
+            row = stored.get(n)
+            if row is None:
+                row = LinkMapNode(owner_id=owner_id, node_id=n)
+            row.x, row.y, row.sig, row.version, row.removed = x, y, sigs[n], version, False
+            sess.add(row)
+        for n in removed:
+            row = stored[n]
+            row.version, row.removed = version, True
+            sess.add(row)
+        try:
+            await sess.commit()
+            logger.debug('linkmap_layout: owner=%s version=%s moved=%d removed=%d', owner_id, version, len(movable), len(removed))
+            break
+        except IntegrityError:
+            # a concurrent request laid out the same nodes; re-read its result
+            await sess.rollback()
+            if attempt:
+                raise
+    with _synced_lock:
+        _synced[owner_id] = (graph, version)
+    return graph, adj, version
+
+
+async def _labels(sess, owner_id: int, nodes: Iterable[str]) -> dict[str, str]:
+    list_ids: set[int] = set()
+    todo_ids: set[int] = set()
+    for n in nodes:
+        kind, raw = _split(n)
+        (list_ids if kind == 'list' else todo_ids).add(raw)
+    out: dict[str, str] = {}
+    if list_ids:
+        ql = select(ListState.id, ListState.name).where(ListState.id.in_(list(list_ids))).where(ListState.owner_id == owner_id)
+        for lid, name in (await sess.exec(ql)).all():
+            out[node_key('list', lid)] = name
+    if todo_ids:
+        # only include todos whose parent list is visible to this user
+        qt = (
+            select(Todo.id, Todo.text)
+            .join(ListState, ListState.id == Todo.list_id)
+            .where(Todo.id.in_(list(todo_ids)))
+            .where(or_(ListState.owner_id == None, ListState.owner_id == owner_id))
+        )
+        for tid, text in (await sess.exec(qt)).all():
+            out[node_key('todo', tid)] = text
+    return out
+
+
+async def _nodes(sess, owner_id: int, node_ids: Iterable[str]) -> list[dict]:
+    node_ids = sorted(set(node_ids))
+    if not node_ids:
+        return []
+    labels = await _labels(sess, owner_id, node_ids)
+    rows = (await sess.exec(
+        select(LinkMapNode.node_id, LinkMapNode.x, LinkMapNode.y)
+        .where(LinkMapNode.owner_id == owner_id)
+        .where(LinkMapNode.node_id.in_(node_ids))
+    )).all()
+    coords = {nid: (x, y) for nid, x, y in rows}
+    out = []
+    for n in node_ids:
+        kind, raw = _split(n)
+        d = {"id": n, "raw_id": raw, "kind": kind, "label": labels.get(n) or f"{kind.capitalize()} #{raw}"}
+        if n in coords:
+            d["x"], d["y"] = coords[n]
+        out.append(d)
+    return out
+
+
+def _links(graph, touching: Optional[set] = None) -> list[dict]:
+    out = []
+    for e in graph.edges:
+        s = node_key(e.src_type, e.src_id)
+        t = node_key(e.tgt_type, e.tgt_id)
+        if touching is None or s in touching or t in touching:
+            out.append({"source": s, "target": t})
+    return out
+
+
+async def full_payload(sess, owner_id: int) -> dict:
+    graph, adj, version = await sync_layout(sess, owner_id)
+    return {"version": version, "nodes": await _nodes(sess, owner_id, adj), "links": _links(graph)}
+
+
+async def delta_payload(sess, owner_id: int, since: int) -> dict:
+    graph, adj, version = await sync_layout(sess, owner_id)
+    if since > version or since < 0:
+        out = await full_payload(sess, owner_id)
+        out.update({"full": True, "removed": []})
+        return out
+    if since == version:
+        return {"version": version, "full": False, "nodes": [], "removed": [], "links": []}
+    rows = (await sess.exec(
+        select(LinkMapNode.node_id, LinkMapNode.removed)
+        .where(LinkMapNode.owner_id == owner_id)
+        .where(LinkMapNode.version > since)
+    )).all()
+    changed = {nid for nid, gone in rows if not gone and nid in adj}
+    removed = sorted(nid for nid, gone in rows if gone)
+    return {
+        "version": version,
+        "full": False,
+        "nodes": await _nodes(sess, owner_id, changed),
+        "removed": removed,
+        "links": _links(graph, changed | set(removed)),
+    }
@@ -0,0 +1,243 @@
+"""Queue-based in-memory logging pipeline (replaces InMemoryHandler).
+
+Goals
+- Keep log handling off the request path. The root logger only gets a
+  QueueHandler that enqueues the LogRecord; a QueueListener thread stores it
+  in a preallocated ring buffer and fans it out to SSE subscribers.
+- Format lazily. Records are kept as LogRecords and turned into
+  {ts, level, logger, message} dicts only when /server/logs or the SSE
+  stream reads them, so records nobody looks at are never formatted.
+- Provide `Sampler` for hot paths that used to log INFO unconditionally.
+
+Usage
+- `install(capacity)` once at import of app.main (idempotent).
+- `recent(limit=None, level=None)` -> newest-last list of dicts; `clear()`.
+- `subscribe(queue, loop)` / `unsubscribe(queue)` for SSE streams; records
+  are delivered with loop.call_soon_threadsafe from the listener thread.
+- `await drain()` before reading, to include records logged just now.
+
+Because formatting is deferred, a record whose args are mutated after the
+log call shows the mutated value. Tracebacks are rendered at enqueue time so
+no frames are kept alive.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+import asyncio
+import atexit
+import itertools
+import logging
+import queue
+import threading
+import time
+
+_FORMAT = '%(asctime)s %(levelname)s:%(name)s: %(message)s'
+
+
+class RingBuffer:
+    """Fixed-capacity FIFO over a preallocated list; the oldest item is overwritten."""
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, int(capacity))
+        self._slots: list = [None] * self.capacity
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def append(self, item) -> None:
+        with self._lock:
+            self._slots[self._next] = item
+            self._next = (self._next + 1) % self.capacity
+            if self._size < self.capacity:
+                self._size += 1
+
+    def items(self) -> list:
+        """Return items oldest first."""
+        with self._lock:
+            if self._size < self.capacity:
+                return self._slots[:self._size]
+            return self._slots[self._next:] + self._slots[:self._next]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slots = [None] * self.capacity
+            self._next = 0
+            self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class Sampler:
+    """Let 1 in every `every` calls through (<=0: never, 1: always)."""
+
+    def __init__(self, every: int):
+        self.every = int(every)
+        self._n = itertools.count()
+
+    def hit(self) -> bool:
+        if self.every <= 0:
+            return False
+        if self.every == 1:
+            return True
+        return next(self._n) % self.every == 0
+
+
+_formatter = logging.Formatter(_FORMAT)
+
+
+def record_to_dict(record: logging.LogRecord) -> dict:
+    # memoised on the record: SSE fan-out and /server/logs share the work
+    d = getattr(record, '_inmem_dict', None)
+    if d is None:
+        try:
+            msg = _formatter.format(record)
+        except Exception:
+            msg = str(getattr(record, 'msg', ''))
+        d = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': msg,
+        }
+        try:
+            record._inmem_dict = d
+        except Exception:
+            pass
+    return d
+
+
+class _EnqueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # unlike the stdlib default, do not format here; only render the
+        # traceback so exc_info (and its frames) can be dropped
+        if record.exc_info:
+            if not record.exc_text:
+                try:
+                    record.exc_text = _formatter.formatException(record.exc_info)
+                except Exception:
+                    record.exc_text = None
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        _pipeline._note_enqueued()
+        super().enqueue(record)
+
+
+class _RingHandler(logging.Handler):
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            _pipeline.ring.append(record)
+            if _pipeline.subscribers:
+                _pipeline._broadcast(record_to_dict(record))
+        except Exception:
+            # logging must never raise
+            pass
+        finally:
+            _pipeline._note_handled()
+
+
+class _Pipeline:
+    def __init__(self):
+        self.ring = RingBuffer(10000)
+        self.subscribers: dict[int, tuple[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+        self.queue: Optional[queue.SimpleQueue] = None
+        self.listener: Optional[QueueListener] = None
+        self.handler: Optional[_EnqueueHandler] = None
+        self._count_lock = threading.Lock()
+        self._enqueued = 0
+        self._handled = 0
+
+    def _note_enqueued(self) -> None:
+        with self._count_lock:
+            self._enqueued += 1
+
+    def _note_handled(self) -> None:
+        with self._count_lock:
+            self._handled += 1
+
+    def pending(self) -> int:
+        with self._count_lock:
+            return self._enqueued - self._handled
+
+    def _broadcast(self, rec: dict) -> None:
+        for key, (q, loop) in list(self.subscribers.items()):
+            try:
+                if loop.is_closed():
+                    raise RuntimeError('loop closed')
+                loop.call_soon_threadsafe(q.put_nowait, rec)
+            except Exception:
+                self.subscribers.pop(key, None)
+
+
+_pipeline = _Pipeline()
+_install_lock = threading.Lock()
+
+
+def install(capacity: int = 10000, level: int = logging.DEBUG) -> None:
+    """Attach the queue handler to the root logger and start the listener."""
+    with _install_lock:
+        if _pipeline.listener is not None:
+            return
+        _pipeline.ring = RingBuffer(capacity)
+        _pipeline.queue = queue.SimpleQueue()
+        handler = _EnqueueHandler(_pipeline.queue)
+        handler.setLevel(level)
+        ring_handler = _RingHandler()
+        ring_handler.setLevel(level)
+        listener = QueueListener(_pipeline.queue, ring_handler, respect_handler_level=False)
+        listener.start()
+        _pipeline.handler = handler
+        _pipeline.listener = listener
+        logging.getLogger().addHandler(handler)
+        atexit.register(shutdown)
+
+
+def shutdown() -> None:
+    """Detach from the root logger and flush the listener thread."""
+    with _install_lock:
+        if _pipeline.handler is not None:
+            logging.getLogger().removeHandler(_pipeline.handler)
+            _pipeline.handler = None
+        if _pipeline.listener is not None:
+            try:
+                _pipeline.listener.stop()
+            except Exception:
+                pass
+            _pipeline.listener = None
+
+
+async def drain(timeout: float = 0.25) -> None:
+    """Wait (bounded) until records enqueued so far are in the ring buffer."""
+    deadline = time.monotonic() + timeout
+    while _pipeline.pending() > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(0.002)
+
+
+def recent(limit: Optional[int] = None, level: Optional[str] = None) -> list[dict]:
+    records = _pipeline.ring.items()
+    if level:
+        lvl = level.upper()
+        records = [r for r in records if r.levelname == lvl]
+    if limit is not None:
+        records = records[-limit:] if limit > 0 else []
+    return [record_to_dict(r) for r in records]
+
+
+def clear() -> None:
+    _pipeline.ring.clear()
+
+
+def capacity() -> int:
+    return _pipeline.ring.capacity
+
+
+def subscribe(q: asyncio.Queue, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+    _pipeline.subscribers[id(q)] = (q, loop or asyncio.get_running_loop())
+
+
+def unsubscribe(q: asyncio.Queue) -> None:
+    _pipeline.subscribers.pop(id(q), None)
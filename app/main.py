@@ -2,9 +2,9 @@ from .models import TrashMeta, ListTrashMeta
 from fastapi import FastAPI, HTTPException, Depends
 from sqlmodel import select
 from sqlalchemy import update as sqlalchemy_update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy import delete as sqlalchemy_delete
 from sqlalchemy import and_, or_
-from sqlalchemy import exists
 from .db import async_session, init_db
 from .models import ListState, Todo, CompletionType, TodoCompletion, User
 from .models import TreeView, TreeViewItem
@@ -23,13 +23,11 @@ from contextvars import ContextVar
 from .models import Hashtag, TodoHashtag, ListHashtag, ServerState, Tombstone, Category, JournalEntry, UserHashtag
 from .models import ItemLink
 from .models import UserCollation
-from .models import RecentListVisit, RecentTodoVisit
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import text, func
+from sqlalchemy import func
 from fastapi import Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 from .utils import format_server_local, format_in_timezone
 from .utils import extract_hashtags
 from .utils import extract_dates
@@ -40,9 +38,30 @@ from .utils import inject_phantom_occurrences
 from .models import Session
 import logging
 from . import config
-from .repl_api import run_code_for_user
-from .profiling import install_profiler
+from . import log_pipeline
+from . import metrics
+from . import query_budget  # noqa: F401  registers the per-request SQL budget / N+1 observer
+from . import completion_state  # noqa: F401  registers the Todo.is_done flush hook
+from .visibility import visibility
+from .link_graph import link_graph, outgoing_links
+from . import linkmap_layout
+from . import ordering
+from . import backup
+from . import workers
+from . import static_assets
+from .compression import CompressionMiddleware
+from .cache_bus import cache_bus
+from .todo_page import TodoPageLoader
+from .profiling import install_profiler, get_sampling_profiler
 from .jinja_stats import install_jinja_cache_stats
+from .undefer import undefer_scheduler, clear_due_deferrals
+from .hashtag_cache import hashtag_cache, resolve_hashtag_ids, sync_hashtag_links, normalize_tags
+from .hashtag_stats import apply_link_delta as apply_hashtag_link_delta, user_hashtag_stats, run_stats_rebuilder, TRACKED_OPTION as HASHTAG_STATS_TRACKED
+from .hashtag_vocab import hashtag_vocab
+from .visits import list_visits, todo_visits, run_visit_flusher, buffer_enabled as visit_buffer_enabled
+from .render_filters import linkify, render_fn_tags, prefetch_fn_link_labels, render_cache_stats, _fn_link_label_cache, FN_LINK_TOKEN_RE
+from .fragment_cache import render_todo_rows, fragment_cache_stats
+from .parse_pool import parse_todo_text, parse_todo_texts_many, extract_dates_meta_many, pool_enabled as parse_pool_enabled, start_parse_pool, shutdown_parse_pool
 
 import sys
 from asyncio import Queue
@@ -261,17 +280,15 @@ except Exception:
     pass
 
 # In-memory log store for lightweight debugging access via HTTP.
-# Uses a deque with a configurable max length so memory usage stays bounded.
-from collections import deque
+# Records go through a QueueHandler/QueueListener pipeline into a preallocated
+# ring buffer (app/log_pipeline.py) and are only formatted when read.
 try:
     LOG_STORE_MAX = int(os.getenv('INMEM_LOG_MAX', '10000'))
 except Exception:
     LOG_STORE_MAX = 10000
 
-# store items as dicts: {ts, level, logger, message}
-_inmemory_log = deque(maxlen=LOG_STORE_MAX)
-
-# Global list of asyncio Queues used by SSE log stream (always defined)
+# Global list of asyncio Queues used by _sse_debug emissions (always defined);
+# log records reach SSE streams via log_pipeline.subscribe
 _sse_queues: list[Queue] = []
 
 # contextvar to annotate whether current execution is handling an HTTP request
@@ -280,67 +297,17 @@ _sse_origin: ContextVar[str | None] = ContextVar('_sse_origin', default=None)
 # Whether SSE debug emissions are permitted in current context. Set per HTTP request
 # by middleware based on client origin (localhost only by default) and env overrides.
 _sse_allowed: ContextVar[bool] = ContextVar('_sse_allowed', default=False)
-# Per-request cache for fn:link label resolution to avoid DB lookups during template render
-_fn_link_label_cache: ContextVar[dict | None] = ContextVar('_fn_link_label_cache', default=None)
-
-
-class InMemoryHandler(logging.Handler):
-    def emit(self, record):
-        try:
-            # Format using the handler's formatter if present, else basic message
-            msg = self.format(record) if self.formatter else record.getMessage()
-            # timestamp in UTC ISO (use timezone-aware now)
-            ts = datetime.now(timezone.utc).isoformat()
-            _inmemory_log.append({
-                'ts': ts,
-                'level': record.levelname,
-                'logger': record.name,
-                'message': msg,
-            })
-        except Exception:
-            # ensure logging never raises
-            pass
 
 
-# Attach in-memory handler to root logger so all module logs are captured
+# Attach the queue handler to the root logger so all module logs are captured
 try:
-    _inmem_handler = InMemoryHandler()
-    _inmem_handler.setLevel(logging.DEBUG)
-    _inmem_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s:%(name)s: %(message)s'))
-    logging.getLogger().addHandler(_inmem_handler)
+    log_pipeline.install(capacity=LOG_STORE_MAX, level=logging.DEBUG)
 except Exception:
-    logger.exception('failed to attach in-memory log handler')
+    logger.exception('failed to attach in-memory log pipeline')
 
-    # Simple Server-Sent Events (SSE) broadcaster for live log streaming.
-    # Simple Server-Sent Events (SSE) broadcaster for live log streaming.
-    from asyncio import Queue
-
-    def _broadcast_log(record: dict):
-        # push record into all active queues (non-blocking)
-        for q in list(_sse_queues):
-            try:
-                # do not await here; put_nowait is fine for in-memory small queues
-                q.put_nowait(record)
-            except Exception:
-                try:
-                    _sse_queues.remove(q)
-                except Exception:
-                    pass
-
-    # augment the InMemoryHandler to also broadcast
-    orig_emit = InMemoryHandler.emit
-    def _emit_and_broadcast(self, record):
-        try:
-            orig_emit(self, record)
-            # prepare the dict similarly
-            msg = self.format(record) if self.formatter else record.getMessage()
-            ts = datetime.now(timezone.utc).isoformat()
-            rec = {'ts': ts, 'level': record.levelname, 'logger': record.name, 'message': msg}
-            _broadcast_log(rec)
-        except Exception:
-            pass
-
-    InMemoryHandler.emit = _emit_and_broadcast
+# per-hot-path samplers for INFO lines that used to be unconditional
+_timing_log_sampler = log_pipeline.Sampler(config.TIMING_LOG_SAMPLE)
+_calendar_occ_log_sampler = log_pipeline.Sampler(config.CALENDAR_OCC_LOG_SAMPLE)
 
 # templating for no-JS HTML client
 TEMPLATES = Jinja2Templates(directory="html_no_js/templates")
@@ -356,596 +323,23 @@ except Exception:
     logger.exception('failed to add jinja2.ext.do extension to TEMPLATES.env')
 TEMPLATES.env.filters['server_local_dt'] = format_server_local
 TEMPLATES.env.filters['in_tz'] = format_in_timezone
-# Expose config in Jinja templates (e.g., for DOKUWIKI_NOTE_LINK_PREFIX)
+# Expose config in Jinja templates (e.g., for DOKUWIKI_NOTE_LINK_PREFIX) and
+# static_url() for versioned, long-cached asset URLs (app/static_assets.py)
 try:
     TEMPLATES.env.globals['config'] = config
+    TEMPLATES.env.globals['static_url'] = static_assets.static_url
 except Exception:
     # keep template setup robust if globals assignment fails
     logger.exception('failed to inject config into Jinja env globals')
-from markupsafe import Markup, escape
 import re
 import time
-from urllib.parse import quote_plus
-
-
-def linkify(text: str | None) -> Markup:
-    """Convert bare http(s) URLs in text into clickable links and return
-    safe HTML Markup. Keeps other text escaped.
-    """
-    if not text:
-        return Markup("")
-
-    # Regex for bare URLs in text segments (not inside existing anchors)
-    url_re = re.compile(r"(https?://[^\s<]+)")
-    # Regex to split into anchor vs non-anchor segments
-    anchor_re = re.compile(r"(<a\b[^>]*>.*?</a>)", re.IGNORECASE | re.DOTALL)
-
-    def _linkify_segment(segment: str) -> str:
-        # Escape non-anchor text first, then replace bare URLs with anchors
-        seg = escape(segment)
-        def _repl(m: re.Match) -> str:
-            url = m.group(1)
-            return f'<a href="{url}" target="_blank" rel="noopener noreferrer">{escape(url)}</a>'
-        return url_re.sub(lambda m: _repl(m), str(seg))
-
-    s = str(text)
-    parts = anchor_re.split(s)
-    out_parts: list[str] = []
-    for i, part in enumerate(parts):
-        if not part:
-            continue
-        if anchor_re.match(part):
-            # Preserve existing anchors verbatim
-            out_parts.append(part)
-        else:
-            out_parts.append(_linkify_segment(part))
-    return Markup(''.join(out_parts))
 
 
+# linkify / render_fn_tags live in render_filters (precompiled patterns, LRU
+# of rendered Markup, batch fn:link pre-resolution)
 TEMPLATES.env.filters['linkify'] = linkify
 
 
-def render_fn_tags(text: str | None) -> Markup:
-    """Render {{fn:...}} tags into safe HTML buttons with data attributes.
-
-    Recognizes tags of the form:
-      {{fn:identifier arg1=val1,arg2=val2 | Label ?confirm="Are you sure?"}}
-
-    Produces HTML like:
-      <button data-fn="identifier" data-args='{"arg1":"val1"}'>Label</button>
-
-    Malformed tags are returned escaped.
-    """
-    if not text:
-        return Markup("")
-
-    # Regex to find {{fn: ... }} non-greedy
-    tag_re = re.compile(r"\{\{\s*fn:([^\}]+?)\s*\}\}")
-
-    def _render_match(m: re.Match) -> str:
-        body = m.group(1).strip()
-        try:
-            # Split off a label part after a '|' if present
-            label = None
-            confirm = None
-            if '|' in body:
-                before, after = body.split('|', 1)
-                body = before.strip()
-                label_part = after.strip()
-                # label may include ?confirm="..."
-                if '?confirm=' in label_part:
-                    lp, conf = label_part.split('?confirm=', 1)
-                    label = lp.strip()
-                    # strip optional surrounding quotes
-                    conf = conf.strip()
-                    if (conf.startswith('"') and conf.endswith('"')) or (conf.startswith("'") and conf.endswith("'")):
-                        conf = conf[1:-1]
-                    confirm = conf
-                else:
-                    label = label_part
-
-            # Now parse identifier and arg list
-            parts = body.split(None, 1)
-            identifier = parts[0].strip()
-            args_text = parts[1].strip() if len(parts) > 1 else ''
-
-            args = {}
-            if args_text:
-                # Support comma-separated key=val pairs, values may be quoted
-                # Simple parser: split on commas not inside quotes
-                cur = ''
-                in_q = None
-                pairs = []
-                for ch in args_text:
-                    if ch in ('"', "'"):
-                        if in_q is None:
-                            in_q = ch
-                        elif in_q == ch:
-                            in_q = None
-                        cur += ch
-                    elif ch == ',' and in_q is None:
-                        pairs.append(cur)
-                        cur = ''
-                    else:
-                        cur += ch
-                if cur.strip():
-                    pairs.append(cur)
-
-                for p in pairs:
-                    if '=' in p:
-                        k, v = p.split('=', 1)
-                        k = k.strip()
-                        v = v.strip()
-                        # strip quotes
-                        if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
-                            v = v[1:-1]
-                        # normalize tags into a list
-                        if k == 'tags':
-                            # allow tags="#a,#b" or tags=#a,#b (we split earlier on commas so handle single value)
-                            if isinstance(v, str) and ',' in v:
-                                args[k] = [t.strip() for t in v.split(',') if t.strip()]
-                            else:
-                                args[k] = [v]
-                        else:
-                            args[k] = v
-                    else:
-                        # positional tag-like argument, e.g., #tag -> collect into tags list
-                        val = p.strip()
-                        if val:
-                            if 'tags' in args and isinstance(args['tags'], str):
-                                # convert stray string to list
-                                args['tags'] = [args['tags']]
-                            args.setdefault('tags', []).append(val)
-
-            # Final normalization: ensure tags is a list when present
-            if 'tags' in args and not isinstance(args['tags'], list):
-                if isinstance(args['tags'], str):
-                    args['tags'] = [t.strip() for t in args['tags'].split(',') if t.strip()]
-                else:
-                    args['tags'] = [args['tags']]
-
-            # Build data-args JSON safely
-            data_args = json.dumps(args, ensure_ascii=False)
-
-            btn_label = (label or identifier)
-
-            # Escape label for HTML
-            esc_label = escape(btn_label)
-            esc_ident = escape(identifier)
-            esc_args = escape(data_args)
-
-            attrs = f'data-fn="{esc_ident}" data-args="{esc_args}"'
-            if confirm:
-                attrs += f' data-confirm="{escape(confirm)}"'
-
-            # For navigation-style functions (search.multi) render an anchor so
-            # middle-click / Ctrl+click / right-click -> open in new tab works
-            if identifier == 'search.multi':
-                # Build a simple query from tags if present (comma-separated)
-                q = ''
-                try:
-                    if 'tags' in args and isinstance(args['tags'], list):
-                        # remove any internal whitespace from tags (server convention)
-                        cleaned = [t.replace(' ', '') for t in args['tags'] if isinstance(t, str)]
-                        # join with spaces so the search page receives separate tokens
-                        q = ' '.join(cleaned)
-                except Exception:
-                    q = ''
-                href = '/html_no_js/search?q=' + quote_plus(q)
-                # Important: emit a plain anchor without data-fn so middle/Ctrl-click works and no exec-fn intercept
-                return f'<a class="fn-button" role="link" href="{escape(href)}">{esc_label}</a>'
-
-            # External URL link with optional custom label
-            if identifier == 'url':
-                try:
-                    # Determine href from explicit args or first positional token
-                    href_val = None
-                    if isinstance(args, dict):
-                        href_val = args.get('href') or args.get('url')
-                        if (not href_val) and isinstance(args.get('tags'), list) and args.get('tags'):
-                            href_val = args['tags'][0]
-                    href = str(href_val or '').strip()
-                    # basic scheme safety: require http/https
-                    if not href.lower().startswith('http://') and not href.lower().startswith('https://'):
-                        # if missing scheme but looks like domain, prepend http:// as a convenience
-                        if href and '://' not in href and ('.' in href or href.startswith('www.')):
-                            href = 'http://' + href
-                    if not href:
-                        # malformed; fall back to button rendering
-                        raise ValueError('missing href')
-                    # Label: use custom label if provided; else show the URL
-                    link_label = btn_label if label else href
-                    # Attributes
-                    target = (args.get('target') if isinstance(args, dict) else None) or '_blank'
-                    rel = (args.get('rel') if isinstance(args, dict) else None) or 'noopener noreferrer'
-                    # Optional nofollow/noreferrer flags
-                    try:
-                        def _is_true(v):
-                            s = str(v).strip().lower() if v is not None else ''
-                            return s in ('1','true','yes','on') or v is True
-                        if isinstance(args, dict) and (_is_true(args.get('nofollow')) or ('nofollow' in args and args.get('nofollow') is None)):
-                            if 'nofollow' not in rel:
-                                rel = (rel + ' nofollow').strip()
-                    except Exception:
-                        pass
-                    return (
-                        f'<a class="fn-button fn-url" role="link" href="{escape(href)}" target="{escape(target)}" rel="{escape(rel)}">'
-                        f'{escape(link_label)}</a>'
-                    )
-                except Exception:
-                    # fall through to default
-                    pass
-
-            # Navigation link to a specific todo or list by id
-            if identifier == 'link':
-                try:
-                    kind = None
-                    target_id = None
-                    # Prefer a combined target like "todo:123" or "list:45"
-                    tval = args.get('target') if isinstance(args, dict) else None
-                    if isinstance(tval, str) and ':' in tval:
-                        k, v = tval.split(':', 1)
-                        kind = (k or '').strip().lower()
-                        try:
-                            target_id = int((v or '').strip())
-                        except Exception:
-                            target_id = None
-                    else:
-                        # Accept separate keys: type + id, or todo/list keys directly
-                        if 'type' in args and 'id' in args:
-                            kind = str(args.get('type') or '').strip().lower()
-                            try:
-                                target_id = int(str(args.get('id') or '').strip())
-                            except Exception:
-                                target_id = None
-                        elif 'todo' in args:
-                            kind = 'todo'
-                            try:
-                                target_id = int(str(args.get('todo') or '').strip())
-                            except Exception:
-                                target_id = None
-                        elif 'list' in args:
-                            kind = 'list'
-                            try:
-                                target_id = int(str(args.get('list') or '').strip())
-                            except Exception:
-                                target_id = None
-
-                    if kind in ('todo', 'list') and isinstance(target_id, int) and target_id > 0:
-                        href = f"/html_no_js/{'todos' if kind=='todo' else 'lists'}/{target_id}"
-                        # Resolve label: prefer explicit |Label; else use the actual item name/text when possible
-                        has_custom_label = bool(label)
-                        link_label = btn_label if has_custom_label else None
-                        link_priority: int | None = None
-                        link_tags: list[str] | None = None
-                        # determine if priority should be suppressed via args
-                        def _is_false(v: str | bool | None) -> bool:
-                            if v is None:
-                                return False
-                            if isinstance(v, bool):
-                                return (v is False)
-                            s = str(v).strip().lower()
-                            return s in ('0','false','no','off')
-                        show_prio = True
-                        try:
-                            if _is_false(args.get('show_priority')) or _is_false(args.get('priority')) or ('no_priority' in args) or ('nopriority' in args):
-                                show_prio = False
-                        except Exception:
-                            show_prio = True
-                        # First check per-request cache for name, priority, and tags
-                        cache = _fn_link_label_cache.get() or {}
-                        cache_key = f"{kind}:{target_id}"
-                        cached = cache.get(cache_key) if cache else None
-                        if isinstance(cached, dict):
-                            try:
-                                if link_priority is None:
-                                    link_priority = cached.get('priority')
-                                # Only adopt cached label when no custom label given
-                                if not has_custom_label and (not link_label):
-                                    link_label = cached.get('name') or cached.get('label')
-                                if link_tags is None:
-                                    ct = cached.get('tags')
-                                    if isinstance(ct, list):
-                                        link_tags = [str(x) for x in ct if isinstance(x, str)] or []
-                            except Exception:
-                                pass
-                        elif isinstance(cached, str) and cached and not has_custom_label and not link_label:
-                            link_label = cached
-
-                        # Decide if we need a DB lookup: if label is missing (no custom) or we need priority or tags
-                        need_lookup = (not has_custom_label and not link_label) or (show_prio and (link_priority is None)) or (link_tags is None)
-                        resolved_name: str | None = None
-                        if need_lookup:
-                            # Try SQLAlchemy sync session first; if that fails (e.g., async driver), try sqlite3 direct.
-                            looked_up = False
-                            try:
-                                from .db import engine, TracedSyncSession
-                                with TracedSyncSession(bind=getattr(engine, 'sync_engine', None)) as _s:
-                                    if kind == 'todo':
-                                        res = _s.execute(select(Todo.text, Todo.priority).where(Todo.id == target_id)).first()
-                                        if res:
-                                            txt = res[0] if isinstance(res, (tuple, list)) else None
-                                            pr = res[1] if isinstance(res, (tuple, list)) and len(res) > 1 else None
-                                            if isinstance(txt, str) and txt.strip():
-                                                resolved_name = txt.strip()
-                                                if not has_custom_label and not link_label:
-                                                    link_label = resolved_name
-                                            try:
-                                                if link_priority is None:
-                                                    link_priority = int(pr) if pr is not None else None
-                                            except Exception:
-                                                link_priority = None
-                                            # fetch hashtags for todo
-                                            try:
-                                                qtags = select(Hashtag.tag).join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id).where(TodoHashtag.todo_id == target_id)
-                                                rtags = _s.execute(qtags).all()
-                                                tags_list: list[str] = []
-                                                for row in rtags:
-                                                    val = row[0] if isinstance(row, (tuple, list)) else row
-                                                    if isinstance(val, str) and val:
-                                                        tags_list.append(val)
-                                                link_tags = tags_list
-                                            except Exception:
-                                                pass
-                                            looked_up = True
-                                    else:
-                                        res = _s.execute(select(ListState.name, ListState.priority).where(ListState.id == target_id)).first()
-                                        if res:
-                                            name = res[0] if isinstance(res, (tuple, list)) else None
-                                            pr = res[1] if isinstance(res, (tuple, list)) and len(res) > 1 else None
-                                            if isinstance(name, str) and name.strip():
-                                                resolved_name = name.strip()
-                                                if not has_custom_label and not link_label:
-                                                    link_label = resolved_name
-                                            try:
-                                                if link_priority is None:
-                                                    link_priority = int(pr) if pr is not None else None
-                                            except Exception:
-                                                link_priority = None
-                                            # fetch hashtags for list
-                                            try:
-                                                qtags = select(Hashtag.tag).join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id).where(ListHashtag.list_id == target_id)
-                                                rtags = _s.execute(qtags).all()
-                                                tags_list: list[str] = []
-                                                for row in rtags:
-                                                    val = row[0] if isinstance(row, (tuple, list)) else row
-                                                    if isinstance(val, str) and val:
-                                                        tags_list.append(val)
-                                                link_tags = tags_list
-                                            except Exception:
-                                                pass
-                                            looked_up = True
-                            except Exception:
-                                pass
-                            # Fallback: direct sqlite3 if using local sqlite DB
-                            if not looked_up:
-                                try:
-                                    from .db import DATABASE_URL as _DB_URL
-                                    from .db import _sqlite_path_from_url as _sqlite_path_from_url
-                                    path = _sqlite_path_from_url(_DB_URL)
-                                    if path:
-                                        import sqlite3
-                                        import os as _os
-                                        abs_path = _os.path.abspath(path)
-                                        if _os.path.exists(abs_path):
-                                            con = sqlite3.connect(abs_path)
-                                            try:
-                                                cur = con.cursor()
-                                                if kind == 'todo':
-                                                    cur.execute('SELECT text, priority FROM todo WHERE id = ?', (target_id,))
-                                                else:
-                                                    cur.execute('SELECT name, priority FROM liststate WHERE id = ?', (target_id,))
-                                                row = cur.fetchone()
-                                                if row:
-                                                    if isinstance(row[0], str) and row[0].strip():
-                                                        resolved_name = row[0].strip()
-                                                        if not has_custom_label and not link_label:
-                                                            link_label = resolved_name
-                                                    try:
-                                                        if link_priority is None:
-                                                            link_priority = int(row[1]) if len(row) > 1 and row[1] is not None else None
-                                                    except Exception:
-                                                        link_priority = None
-                                                # fetch hashtags via sqlite
-                                                try:
-                                                    if kind == 'todo':
-                                                        cur.execute('SELECT h.tag FROM hashtag h JOIN todohashtag th ON th.hashtag_id = h.id WHERE th.todo_id = ?', (target_id,))
-                                                    else:
-                                                        cur.execute('SELECT h.tag FROM hashtag h JOIN listhashtag lh ON lh.hashtag_id = h.id WHERE lh.list_id = ?', (target_id,))
-                                                    rows = cur.fetchall()
-                                                    link_tags = [r[0] for r in rows if r and isinstance(r[0], str) and r[0]]
-                                                except Exception:
-                                                    pass
-                                            finally:
-                                                try:
-                                                    con.close()
-                                                except Exception:
-                                                    pass
-                                except Exception:
-                                    pass
-                        # If tags were not resolved yet, attempt a light sqlite fallback just for hashtags
-                        if link_tags is None:
-                            try:
-                                from .db import DATABASE_URL as _DB_URL
-                                from .db import _sqlite_path_from_url as _sqlite_path_from_url
-                                path = _sqlite_path_from_url(_DB_URL)
-                                if path:
-                                    import sqlite3
-                                    import os as _os
-                                    abs_path = _os.path.abspath(path)
-                                    if _os.path.exists(abs_path):
-                                        con = sqlite3.connect(abs_path)
-                                        try:
-                                            cur = con.cursor()
-                                            if kind == 'todo':
-                                                cur.execute('SELECT h.tag FROM hashtag h JOIN todohashtag th ON th.hashtag_id = h.id WHERE th.todo_id = ?', (target_id,))
-                                            else:
-                                                cur.execute('SELECT h.tag FROM hashtag h JOIN listhashtag lh ON lh.hashtag_id = h.id WHERE lh.list_id = ?', (target_id,))
-                                            rows = cur.fetchall()
-                                            link_tags = [r[0] for r in rows if r and isinstance(r[0], str) and r[0]]
-                                            if os.getenv('DEBUG_FN_LINKS', '0').lower() in ('1','true','yes'):
-                                                try:
-                                                    import os as _os
-                                                    import time as _time
-                                                    _os.makedirs('debug_logs', exist_ok=True)
-                                                    with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
-                                                        _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
-                                                        _f.write(f"[{_ts}] sqlite-tags kind={kind} id={target_id} count={len(link_tags or [])} rows={link_tags!r}\n")
-                                                except Exception:
-                                                    pass
-                                        finally:
-                                            try:
-                                                con.close()
-                                            except Exception:
-                                                pass
-                            except Exception:
-                                pass
-                        # Final debug snapshot of what will be rendered
-                        if os.getenv('DEBUG_FN_LINKS', '0').lower() in ('1','true','yes'):
-                            try:
-                                import os as _os
-                                import time as _time
-                                _os.makedirs('debug_logs', exist_ok=True)
-                                with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
-                                    _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
-                                    _f.write(f"[{_ts}] final-tags kind={kind} id={target_id} tags={link_tags!r}\n")
-                            except Exception:
-                                pass
-                        if link_label is None:
-                            # Final fallback if lookup failed
-                            link_label = f"Todo #{target_id}" if kind == 'todo' else f"List #{target_id}"
-                        else:
-                            # Save into per-request cache for subsequent references in same render/request
-                            cache = _fn_link_label_cache.get() or {}
-                            try:
-                                cache_key = f"{kind}:{target_id}"
-                                # Store true resolved name when available; avoid caching custom labels as titles
-                                store_name = resolved_name if isinstance(resolved_name, str) and resolved_name else (None if has_custom_label else link_label)
-                                entry = cache.get(cache_key) if isinstance(cache.get(cache_key), dict) else {}
-                                if store_name:
-                                    entry['name'] = store_name
-                                    entry['label'] = store_name
-                                if link_priority is not None:
-                                    entry['priority'] = link_priority
-                                if isinstance(link_tags, list):
-                                    entry['tags'] = [str(x) for x in link_tags if isinstance(x, str)]
-                                if entry:
-                                    cache[cache_key] = entry
-                                    _fn_link_label_cache.set(cache)
-                            except Exception:
-                                pass
-                        # Important: do NOT include data-fn/data-args here so clicks navigate normally (no exec-fn)
-                        # Optionally append priority circle if available and not suppressed
-                        def _circled(n: int | None) -> str:
-                            try:
-                                if n is None:
-                                    return ''
-                                n = int(n)
-                                if 1 <= n <= 10:
-                                    return chr(0x2460 + (n - 1))
-                                return str(n)
-                            except Exception:
-                                return ''
-                        pr_html = ''
-                        if show_prio and (link_priority is not None):
-                            ch = _circled(link_priority)
-                            if ch:
-                                pr_html = f' <span class="meta priority-inline" title="Priority {int(link_priority)}"><span class="priority-circle">{escape(ch)}</span></span>'
-                        # Place the priority markup inside the anchor so post-processing (linkify) preserves it
-                        # Build hashtags as separate tag-chip anchors outside the main link
-                        tags_html = ''
-                        try:
-                            if isinstance(link_tags, list) and link_tags:
-                                chips: list[str] = []
-                                for t in link_tags:
-                                    if not isinstance(t, str) or not t:
-                                        continue
-                                    chips.append(f'<a class="tag-chip" href="/html_no_js/search?q={quote_plus(t)}" role="link">{escape(t)}</a>')
-                                if chips:
-                                    # No wrapper span to avoid linkify escaping non-anchor HTML; chips have their own spacing.
-                                    tags_html = ' ' + ''.join(chips)
-                        except Exception:
-                            tags_html = ''
-                        # Optional debug logging for troubleshooting link rendering
-                        try:
-                            if os.getenv('DEBUG_FN_LINKS', '0').lower() in ('1','true','yes'):
-                                try:
-                                    import os as _os
-                                    import time as _time
-                                    _os.makedirs('debug_logs', exist_ok=True)
-                                    with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
-                                        _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
-                                        _f.write(f"[{_ts}] fn:link kind={kind} id={target_id} label={link_label!r} pr={link_priority!r} tags={link_tags!r}\n")
-                                except Exception:
-                                    pass
-                        except Exception:
-                            pass
-                        # Compose label using Markup to avoid double-escaping of our span fragments
-                        label_html = escape(link_label) + Markup(pr_html)
-                        # Attempt to detect whether the target todo is completed so
-                        # we can mark inline anchors with `done` and let CSS
-                        # apply a strikethrough. Best-effort: try a sync DB
-                        # lookup first, fall back to sqlite direct query.
-                        link_completed = False
-                        try:
-                            if kind == 'todo' and isinstance(target_id, int):
-                                try:
-                                    from .db import engine, TracedSyncSession
-                                    with TracedSyncSession(bind=getattr(engine, 'sync_engine', None)) as _s:
-                                        q = _s.execute(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id == target_id).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
-                                        row = q.first()
-                                        if row:
-                                            link_completed = True
-                                except Exception:
-                                    try:
-                                        from .db import DATABASE_URL as _DB_URL
-                                        from .db import _sqlite_path_from_url as _sqlite_path_from_url
-                                        path = _sqlite_path_from_url(_DB_URL)
-                                        if path:
-                                            import sqlite3
-                                            import os as _os
-                                            abs_path = _os.path.abspath(path)
-                                            if _os.path.exists(abs_path):
-                                                con = sqlite3.connect(abs_path)
-                                                try:
-                                                    cur = con.cursor()
-                                                    cur.execute("SELECT tc.todo_id FROM todocompletion tc JOIN completiontype ct ON tc.completion_type_id = ct.id WHERE tc.todo_id = ? AND ct.name = 'default' AND tc.done = 1", (target_id,))
-                                                    prow = cur.fetchone()
-                                                    if prow:
-                                                        link_completed = True
-                                                finally:
-                                                    try:
-                                                        con.close()
-                                                    except Exception:
-                                                        pass
-                                    except Exception:
-                                        pass
-                        except Exception:
-                            pass
-                        cls = 'fn-button fn-link'
-                        if link_completed:
-                            cls += ' done'
-                        return f'<a class="{cls}" role="link" href="{escape(href)}">{label_html}</a>' + tags_html
-                    # If parsing failed, fall through to default button rendering
-                except Exception:
-                    pass
-
-            return f'<button type="button" class="fn-button" {attrs}>{esc_label}</button>'
-        except Exception:
-            # On any parse error, return the original text escaped
-            return escape(m.group(0))
-
-    # First escape the whole text to avoid HTML injection, then un-escape/replace tags
-    esc = escape(text)
-
-    # We need to run tag replacement on the raw text, not the escaped one, to preserve parsing
-    try:
-        out = tag_re.sub(lambda m: _render_match(m), str(text))
-        return Markup(out)
-    except Exception:
-        return Markup(escape(text))
-
-
 TEMPLATES.env.filters['render_fn_tags'] = render_fn_tags
  
 
@@ -955,14 +349,8 @@ def _sse_debug(event: str, payload: dict):
     try:
         # Toggle to completely disable SSE debug broadcasting for tests or
         # performance-sensitive runs. Default disabled; set env var
-        # SSE_DEBUG_ENABLED=1 to enable without changing code (restart
-        # required), or edit this variable in-code for a quick local toggle.
-        try:
-            # default to '0' -> disabled
-            SSE_DEBUG_ENABLED = os.getenv('SSE_DEBUG_ENABLED', '0').lower() in ('1', 'true', 'yes')
-        except Exception:
-            SSE_DEBUG_ENABLED = False
-        if not SSE_DEBUG_ENABLED:
+        # SSE_DEBUG_ENABLED=1 to enable (read once at startup in config).
+        if not config.SSE_DEBUG_ENABLED:
             return
         # include optional source annotation when available from contextvar
         origin = None
@@ -978,10 +366,7 @@ def _sse_debug(event: str, payload: dict):
             allowed_ctx = _sse_allowed.get()
         except Exception:
             allowed_ctx = False
-        try:
-            allow_background = os.getenv('SSE_DEBUG_ALLOW_BACKGROUND', '0').lower() in ('1', 'true', 'yes')
-        except Exception:
-            allow_background = False
+        allow_background = config.SSE_DEBUG_ALLOW_BACKGROUND
         # If origin is None, treat as background context
         is_background = origin is None
         if (is_background and not allow_background) or (not is_background and not allowed_ctx):
@@ -1062,8 +447,10 @@ async def lifespan(app: FastAPI):
     if _SECRET_KEY is None or _SECRET_KEY == "CHANGE_ME_IN_ENV_FOR_TESTS":
         raise RuntimeError("SECRET_KEY not set or insecure fallback in use; set the SECRET_KEY environment variable before starting the server")
 
-    # initialize DB and ensure default list exists
-    await init_db()
+    # initialize DB and ensure default list exists. With several workers
+    # (WEB_CONCURRENCY > 1) they take turns, so only the first one migrates.
+    async with workers.startup_lock():
+        await init_db()
     # Log which database URL the server is using so startup console shows active DB
     try:
         from . import db as _dbmod
@@ -1076,8 +463,7 @@ async def lifespan(app: FastAPI):
         logger.exception('could not determine DATABASE_URL at startup')
     # Announce fn:link debug if enabled so it’s visible in console
     try:
-        _d = os.getenv('DEBUG_FN_LINKS', '0').lower()
-        if _d in ('1','true','yes'):
+        if config.DEBUG_FN_LINKS:
             logger.info('DEBUG_FN_LINKS enabled: fn:link will log to debug_logs/fn_link_debug.log')
             # Also print directly in case logger routing filters this out
             print('[app] DEBUG_FN_LINKS enabled: fn:link will log to debug_logs/fn_link_debug.log', flush=True)
@@ -1097,7 +483,9 @@ async def lifespan(app: FastAPI):
     except Exception:
         # dateparser may not be installed in some environments; log and continue
         logger.info('DateDataParser not initialized (dateparser may be missing)')
-    async with async_session() as sess:
+    # Optional process pool for dateparser work (DATE_PARSE_WORKERS > 0)
+    start_parse_pool()
+    async with workers.startup_lock(), async_session() as sess:
         # Ensure ServerState exists; do not create or treat any ListState named
         # "default" specially. Server default must be set explicitly via the
         # `/server/default_list/{id}` API or by application logic elsewhere.
@@ -1107,55 +495,43 @@ async def lifespan(app: FastAPI):
             ss = ServerState()
             sess.add(ss)
             await sess.commit()
-    # start background undefer worker
+    # multi-worker mode: peers drop their cache entries when this worker
+    # writes (app/cache_bus.py), and singleton jobs run in the leader only
+    if workers.multi_worker():
+        cache_bus.start()
+    leader = workers.is_leader()
+    # warm the process-wide hashtag tag->id cache used by tag sync
+    try:
+        n_tags = await hashtag_cache.warm()
+        logger.info('hashtag cache warmed with %d tags', n_tags)
+    except Exception:
+        logger.exception('failed to warm hashtag cache')
+    # start background undefer scheduler: seeded once from the indexed
+    # deferred_until column, then woken by defer_todo instead of polling.
     stop_event = asyncio.Event()
-
-    async def _undefer_worker(interval: int):
-        from .utils import now_utc
-        while not stop_event.is_set():
-            try:
-                await asyncio.sleep(interval)
-                async with async_session() as wsess:
-                    # diagnostic CALLSITE: record exec id and stack when worker runs
-                    try:
-                        if os.getenv('TRACE_SQL_CONN') == '1':
-                            try:
-                                from app.db import current_exec_id
-                                cid = None
-                                try:
-                                    cid = current_exec_id.get()
-                                except Exception:
-                                    cid = None
-                                import traceback as _tb
-                                stack = ''.join(_tb.format_stack(limit=6))
-                                import os as _os
-                                _os.makedirs('debug_logs', exist_ok=True)
-                                with open(_os.path.join('debug_logs', 'sql_checkout_traces.log'), 'a') as f:
-                                    f.write(f"CALLSITE undefer_worker {cid or 'none'}\n")
-                                    f.write(stack)
-                                    f.write('--- end ---\n\n')
-                            except Exception:
-                                pass
-                    except Exception:
-                        pass
-                    now = now_utc()
-                    q = select(Todo).where(Todo.deferred_until != None).where(Todo.deferred_until <= now)
-                    res = await wsess.exec(q)
-                    due = res.all()
-                    for t in due:
-                        t.deferred_until = None
-                        t.modified_at = now_utc()
-                        wsess.add(t)
-                    if due:
-                        await wsess.commit()
-            except asyncio.CancelledError:
-                break
-            except Exception:
-                # log unexpected errors but keep worker running
-                logger.exception("undefer worker encountered an error")
-
-    interval = int(os.getenv("UNDEFER_INTERVAL_SECONDS", "60"))
-    task = asyncio.create_task(_undefer_worker(interval))
+    # every worker seeds and runs its own scheduler (clearing is idempotent),
+    # so deferrals held by a worker that exits are picked up by the next
+    # worker to start, or by a new leader taking over (watch_leadership)
+    try:
+        seeded = await undefer_scheduler.seed()
+        logger.info('undefer scheduler seeded with %d pending deferrals', seeded)
+    except Exception:
+        logger.exception('failed to seed undefer scheduler')
+    task = asyncio.create_task(undefer_scheduler.run(stop_event))
+
+    async def _on_leader_takeover():
+        # deferrals the previous leader scheduled after this worker started
+        seeded = await undefer_scheduler.seed()
+        logger.info('took over as leader; undefer scheduler re-seeded with %d deferrals', seeded)
+
+    leader_task = asyncio.create_task(workers.watch_leadership(stop_event, _on_leader_takeover))
+    # .gz/.br siblings for static/ (app/static_assets.py), off the event loop
+    if config.STATIC_PRECOMPRESS and leader:
+        asyncio.get_running_loop().run_in_executor(None, static_assets.precompress)
+    # write-behind flusher for recent list/todo visits (app/visits.py)
+    visit_task = asyncio.create_task(run_visit_flusher(stop_event))
+    # background rebuild of stale per-user hashtag stats (app/hashtag_stats.py)
+    stats_task = asyncio.create_task(run_stats_rebuilder(stop_event))
     # Tombstone pruning configuration: TTL (days) and prune interval (seconds)
     TOMBSTONE_TTL_DAYS = int(os.getenv("TOMBSTONE_TTL_DAYS", "90"))
     PRUNE_INTERVAL_SECONDS = int(os.getenv("TOMBSTONE_PRUNE_INTERVAL_SECONDS", str(24 * 3600)))
@@ -1165,6 +541,9 @@ async def lifespan(app: FastAPI):
         while not stop_event.is_set():
             try:
                 await asyncio.sleep(interval)
+                # one worker prunes; another takes over if the leader exits
+                if not workers.is_leader():
+                    continue
                 cutoff = now_utc() - timedelta(days=ttl_days)
                 async with async_session() as wsess:
                     # diagnostic CALLSITE: record exec id and stack when prune runs
@@ -1210,7 +589,9 @@ async def lifespan(app: FastAPI):
         _enable_ssh = os.getenv('SSH_REPL_ENABLE', '0').lower() in ('1','true','yes')
     except Exception:
         _enable_ssh = False
-    if _enable_ssh:
+    if _enable_ssh and not leader:
+        logger.info('SSH REPL: started by the leader worker, not this one')
+    elif _enable_ssh:
         try:
             bind = os.getenv('SSH_REPL_BIND','0.0.0.0')
             port = int(os.getenv('SSH_REPL_PORT','2222'))
@@ -1257,6 +638,7 @@ async def lifespan(app: FastAPI):
         stop_event.set()
         task.cancel()
         prune_task.cancel()
+        shutdown_parse_pool()
         try:
             await task
         except Exception:
@@ -1265,6 +647,22 @@ async def lifespan(app: FastAPI):
             await prune_task
         except Exception:
             pass
+        leader_task.cancel()
+        try:
+            await leader_task
+        except BaseException:
+            pass
+        # cancelling the visit flusher makes it do a final flush
+        visit_task.cancel()
+        try:
+            await visit_task
+        except BaseException:
+            pass
+        stats_task.cancel()
+        try:
+            await stats_task
+        except BaseException:
+            pass
         # Stop SSH REPL server on shutdown
         try:
             if ssh_server is not None:
@@ -1274,6 +672,8 @@ async def lifespan(app: FastAPI):
                 logger.info('SSH REPL: stopped')
         except Exception:
             logger.exception('SSH REPL: error while stopping')
+        cache_bus.stop()
+        workers.release_leader()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -1291,7 +691,7 @@ except Exception:
     pass
 
 # serve static assets (manifest, service-worker, icons, pwa helper JS, etc.)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", static_assets.AssetStaticFiles(directory="static"), name="static")
 
 
 # Startup instrumentation: write a marker to scripts/index_calendar.log when
@@ -1342,6 +742,7 @@ async def runtime_flags():
         },
         'profiling': {
             'per_request_enabled': ('RequestProfilerMiddleware' in mw_names),
+            'sampling': get_sampling_profiler().status(),
             'global_dir': glob_dir,
             'global_files': _count_prof_files(glob_dir),
             'requests_dir': req_dir,
@@ -1353,6 +754,8 @@ async def runtime_flags():
             'exists': _os.path.exists(jinja_log),
             'size': (_os.path.getsize(jinja_log) if _os.path.exists(jinja_log) else 0),
         },
+        'render_filter_cache': render_cache_stats(),
+        'todo_row_fragment_cache': fragment_cache_stats(),
     }
     return JSONResponse(payload)
 
@@ -1398,6 +801,7 @@ try:
     TEMPLATES_TAILWIND.env.filters['in_tz'] = format_in_timezone
     TEMPLATES_TAILWIND.env.filters['linkify'] = linkify
     TEMPLATES_TAILWIND.env.filters['render_fn_tags'] = render_fn_tags
+    TEMPLATES_TAILWIND.env.globals['static_url'] = static_assets.static_url
 except Exception:
     # Best-effort only; template rendering will raise if critical filters missing
     logger.exception('failed to register filters on TEMPLATES_TAILWIND')
@@ -1600,32 +1004,6 @@ async def html_tailwind_view_list(request: Request):
 
         completion_types = [{'id': c.id, 'name': c.name} for c in ctypes]
 
-        # gather user hashtags
-        owner_id_val = current_user.id
-        q_user_list_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id)
-            .join(ListState, ListState.id == ListHashtag.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_list_tags = await sess.exec(q_user_list_tags)
-        q_user_todo_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id)
-            .join(Todo, Todo.id == TodoHashtag.todo_id)
-            .join(ListState, ListState.id == Todo.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_todo_tags = await sess.exec(q_user_todo_tags)
-        _all_rows = list(r_user_list_tags.all()) + list(r_user_todo_tags.all())
-        all_hashtags: list[str] = []
-        for row in _all_rows:
-            val = row[0] if isinstance(row, (tuple, list)) else row
-            if isinstance(val, str) and val and val not in all_hashtags:
-                all_hashtags.append(val)
-
         # categories (user-scoped)
         try:
             qcat = select(Category).where(Category.owner_id == current_user.id).order_by(Category.position.asc())
@@ -1676,7 +1054,7 @@ async def html_tailwind_view_list(request: Request):
                     completed_ids = set()
                     if todo_ids:
                         try:
-                            qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                            qcomp = select(Todo.id).where(Todo.id.in_(todo_ids)).where(Todo.is_done == True)
                             cres = await sess.exec(qcomp)
                             completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                         except Exception:
@@ -1732,7 +1110,7 @@ async def html_tailwind_view_list(request: Request):
     except Exception:
         logger.exception('failed to record list visit for list %s', list_id)
     client_tz = await get_session_timezone(request)
-    return TEMPLATES_TAILWIND.TemplateResponse(request, "list.html", {"request": request, "list": list_row, "todos": todo_rows, "csrf_token": csrf_token, "client_tz": client_tz, "completion_types": completion_types, "all_hashtags": all_hashtags, "categories": categories, "sublists": sublists, "current_user": current_user})
+    return TEMPLATES_TAILWIND.TemplateResponse(request, "list.html", {"request": request, "list": list_row, "todos": todo_rows, "csrf_token": csrf_token, "client_tz": client_tz, "completion_types": completion_types, "categories": categories, "sublists": sublists, "current_user": current_user})
 
 
 @app.get('/html_tailwind/login', response_class=HTMLResponse)
@@ -1807,10 +1185,7 @@ async def _sse_origin_middleware(request: Request, call_next):
         # set the contextvar to a concise string we can surface in SSE
         token = _sse_origin.set(f'http_request:{request.url.path}')
         # set allow flag: permit local requests by default; allow non-local via env override
-        try:
-            allow_nonlocal = os.getenv('SSE_DEBUG_ALLOW_NONLOCAL', '0').lower() in ('1', 'true', 'yes')
-        except Exception:
-            allow_nonlocal = False
+        allow_nonlocal = config.SSE_DEBUG_ALLOW_NONLOCAL
         try:
             is_local = _is_local_request(request)
         except Exception:
@@ -1862,10 +1237,9 @@ async def get_server_logs(request: Request, limit: int = 200, level: str | None
         limit = min(max(int(limit), 1), LOG_STORE_MAX)
     except Exception:
         limit = 200
-    items = list(_inmemory_log)
-    if level:
-        lvl = level.upper()
-        items = [i for i in items if i.get('level') == lvl]
+    # let the listener thread catch up so just-logged records are included
+    await log_pipeline.drain()
+    items = log_pipeline.recent(level=level or None)
     # return most recent first
     return {'count': len(items), 'logs': list(reversed(items))[:limit]}
 
@@ -2003,12 +1377,63 @@ async def truncate_logs(current_user: User = Depends(require_login)):
     return RedirectResponse(url='/html_no_js/logs', status_code=303)
 
 
+@app.get('/server/metrics')
+async def get_server_metrics(request: Request):
+    """Per-route latency / SQL histograms in Prometheus text format.
+
+    Same access rule as /server/logs: local requests unless ENABLE_LOG_ENDPOINT=1.
+    """
+    if not _log_endpoint_allowed(request):
+        raise HTTPException(status_code=403, detail='forbidden')
+    return PlainTextResponse(metrics.render_prometheus(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class SamplingControl(BaseModel):
+    action: str  # 'start' | 'stop' | 'reset'
+    hz: float | None = None
+
+
+@app.get('/server/profile/sampling')
+async def get_sampling_profile_status(request: Request):
+    """Sampling profiler state: running flag, rate and samples per route."""
+    if not _log_endpoint_allowed(request):
+        raise HTTPException(status_code=403, detail='forbidden')
+    return get_sampling_profiler().status()
+
+
+@app.post('/server/profile/sampling')
+async def control_sampling_profile(request: Request, payload: SamplingControl):
+    """Start, stop or reset the sampling profiler (see app/profiling.py)."""
+    if not _log_endpoint_allowed(request):
+        raise HTTPException(status_code=403, detail='forbidden')
+    prof = get_sampling_profiler()
+    action = (payload.action or '').lower()
+    if action == 'start':
+        prof.start(hz=payload.hz)
+    elif action == 'stop':
+        prof.stop()
+    elif action == 'reset':
+        prof.reset()
+    else:
+        raise HTTPException(status_code=400, detail='action must be start, stop or reset')
+    return prof.status()
+
+
+@app.get('/server/profile/sampling/folded')
+async def get_sampling_profile_folded(request: Request, route: str | None = None, include_idle: bool = False):
+    """Folded stacks ('route;frame;...;frame count'), ready for flamegraph.pl or speedscope."""
+    if not _log_endpoint_allowed(request):
+        raise HTTPException(status_code=403, detail='forbidden')
+    return PlainTextResponse(get_sampling_profiler().folded(route=route, include_idle=include_idle))
+
+
 @app.delete('/server/logs')
 async def clear_server_logs(request: Request):
     """Clear the in-memory logs (local-only or enabled by env var)."""
     if not _log_endpoint_allowed(request):
         raise HTTPException(status_code=403, detail='forbidden')
-    _inmemory_log.clear()
+    await log_pipeline.drain()
+    log_pipeline.clear()
     return {'ok': True}
 
 
@@ -2026,9 +1451,10 @@ async def no_cache_dynamic(request: Request, call_next):
         is_dynamic_path = any(path.startswith(p) for p in ('/html_no_js', '/todos', '/lists', '/server', '/html_pwa'))
         is_html = 'text/html' in content_type
         is_json = 'application/json' in content_type
-        if is_dynamic_path or is_html or is_json:
+        cc = resp.headers.get('Cache-Control', '')
+        # versioned static assets carry their own long-lived caching
+        if (is_dynamic_path or is_html or is_json) and 'immutable' not in cc.lower():
             # preserve existing Cache-Control if it's already explicitly set to no-store
-            cc = resp.headers.get('Cache-Control', '')
             if 'no-store' not in cc.lower():
                 resp.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate'
             resp.headers['Pragma'] = 'no-cache'
@@ -2044,11 +1470,13 @@ async def timing_middleware(request: Request, call_next):
     start = time.perf_counter()
     resp = await call_next(request)
     duration_ms = (time.perf_counter() - start) * 1000.0
-    try:
-        # include query string for context but keep logs concise
-        logger.info('timing %s %s %s %.1fms', request.method, request.url.path, request.url.query, duration_ms)
-    except Exception:
-        logger.info('timing %s %s %.1fms', request.method, request.url.path, duration_ms)
+    # sampled: one request in TIMING_LOG_SAMPLE, plus every slow request
+    if duration_ms >= config.TIMING_LOG_SLOW_MS or _timing_log_sampler.hit():
+        try:
+            # include query string for context but keep logs concise
+            logger.info('timing %s %s %s %.1fms', request.method, request.url.path, request.url.query, duration_ms)
+        except Exception:
+            logger.info('timing %s %s %.1fms', request.method, request.url.path, duration_ms)
     return resp
 
 
@@ -2102,6 +1530,8 @@ async def html_repl_exec(request: Request, code: str = Form(...), current_user:
     from .auth import create_csrf_token
     next_csrf = create_csrf_token(current_user.username)
     try:
+        # imported on first use: the REPL is an admin/debug surface
+        from .repl_api import run_code_for_user
         out, val = await loop.run_in_executor(None, run_code_for_user, current_user, code)
         # present last value as text
         if val is None:
@@ -2374,6 +1804,11 @@ try:
 except Exception:
     _thresh = 300
 app.add_middleware(_CSRFMiddleware, threshold_seconds=_thresh)
+# gzip/br response bodies (app/compression.py); inside metrics so its cost is
+# counted in request latency
+app.add_middleware(CompressionMiddleware)
+# outermost: request metrics (latency, SQL statements, DB time) per route
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 @app.get("/")
@@ -2427,72 +1862,23 @@ async def html_linkmap_data(request: Request, current_user: User = Depends(requi
 
     Only includes nodes that are either the source or target of an ItemLink row owned by the user.
     Node id is a string "list:<id>" or "todo:<id>"; label is the list name or todo text.
+    Nodes carry server-side layout coordinates (x, y) and the reply a layout
+    `version` for /html_no_js/linkmap/delta (see app/linkmap_layout.py).
     """
-    owner_id = current_user.id if current_user else None
-    nodes_map: dict[str, dict] = {}
-    links: list[dict] = []
-    list_ids: set[int] = set()
-    todo_ids: set[int] = set()
     async with async_session() as sess:
-        # Fetch all ItemLink rows for this owner
-        q = select(ItemLink).where(ItemLink.owner_id == owner_id)
-        res = await sess.exec(q)
-        rows = res.all() or []
-        for r in rows:
-            try:
-                s_kind = (r.src_type or '').strip().lower()
-                t_kind = (r.tgt_type or '').strip().lower()
-                s_id = int(r.src_id)
-                t_id = int(r.tgt_id)
-            except Exception:
-                continue
-            sid = f"{s_kind}:{s_id}"
-            tid = f"{t_kind}:{t_id}"
-            # collect ids for batch fetch
-            if s_kind == 'list':
-                list_ids.add(s_id)
-            elif s_kind == 'todo':
-                todo_ids.add(s_id)
-            if t_kind == 'list':
-                list_ids.add(t_id)
-            elif t_kind == 'todo':
-                todo_ids.add(t_id)
-            links.append({"source": sid, "target": tid})
-
-        # Batch-load labels
-        list_labels: dict[int, str] = {}
-        todo_labels: dict[int, str] = {}
-        if list_ids:
-            ql = select(ListState.id, ListState.name).where(ListState.id.in_(list(list_ids))).where(ListState.owner_id == owner_id)
-            for lid, name in (await sess.exec(ql)).all():
-                try:
-                    list_labels[int(lid)] = name
-                except Exception:
-                    pass
-        if todo_ids:
-            qt = select(Todo.id, Todo.text, Todo.list_id).where(Todo.id.in_(list(todo_ids)))
-            for tid, text, lid in (await sess.exec(qt)).all():
-                try:
-                    # only include todo if its parent list is visible to this user
-                    lst = await sess.get(ListState, lid)
-                    if not lst or lst.owner_id not in (None, owner_id):
-                        continue
-                    todo_labels[int(tid)] = text
-                except Exception:
-                    pass
+        return JSONResponse(await linkmap_layout.full_payload(sess, current_user.id))
 
-        # Build nodes
-        for lid in list_ids:
-            sid = f"list:{int(lid)}"
-            if sid not in nodes_map:
-                nodes_map[sid] = {"id": sid, "raw_id": int(lid), "kind": "list", "label": list_labels.get(int(lid)) or f"List #{int(lid)}"}
-        for tid in todo_ids:
-            sid = f"todo:{int(tid)}"
-            if sid not in nodes_map:
-                nodes_map[sid] = {"id": sid, "raw_id": int(tid), "kind": "todo", "label": todo_labels.get(int(tid)) or f"Todo #{int(tid)}"}
 
-    nodes = list(nodes_map.values())
-    return JSONResponse({"nodes": nodes, "links": links})
+@app.get('/html_no_js/linkmap/delta', response_class=JSONResponse)
+async def html_linkmap_delta(request: Request, since: int = 0, current_user: User = Depends(require_login)):
+    """Return link map nodes placed or removed after layout version `since`.
+
+    Reply: {version, full, nodes, removed, links}; links are every edge touching
+    a changed or removed node. full=True means `since` was unknown and the
+    reply is the whole graph.
+    """
+    async with async_session() as sess:
+        return JSONResponse(await linkmap_layout.delta_payload(sess, current_user.id, since))
 
 
 @app.get('/__debug_echo', response_class=JSONResponse)
@@ -2619,15 +2005,8 @@ async def html_tailwind_search(request: Request):
             if vis_ids:
                 # Build NOT EXISTS clause to exclude completed todos when requested
                 def not_completed_clause():
-                    subq = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, TodoCompletion.completion_type_id == CompletionType.id)
-                        .where(TodoCompletion.todo_id == Todo.id)
-                        .where(CompletionType.list_id == Todo.list_id)
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
-                    )
-                    return ~exists(subq)
+                    # denormalized default-completion state (app/completion_state.py)
+                    return Todo.is_done == False
                 qtodos = (
                     select(Todo)
                     .where(Todo.list_id.in_(vis_ids))
@@ -2659,19 +2038,8 @@ async def html_tailwind_search(request: Request):
                     for t in (await sess.exec(qall)).all():
                         todos_acc.setdefault(t.id, t)
                 lm = {l.id: l.name for l in (await sess.scalars(select(ListState).where(ListState.id.in_(vis_ids)))).all()}
-                todo_list_ids = list({t.list_id for t in todos_acc.values()})
-                default_ct_ids: dict[int, int] = {}
-                if todo_list_ids:
-                    qct = select(CompletionType).where(CompletionType.list_id.in_(todo_list_ids)).where(CompletionType.name == 'default')
-                    for ct in (await sess.exec(qct)).all():
-                        default_ct_ids[int(ct.list_id)] = int(ct.id)
-                todo_ids = list(todos_acc.keys())
-                completed_ids: set[int] = set()
-                if todo_ids and default_ct_ids:
-                    qdone = select(TodoCompletion.todo_id, TodoCompletion.done, TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(TodoCompletion.completion_type_id.in_(list(default_ct_ids.values())))
-                    for tid, done_val, ctid in (await sess.exec(qdone)).all():
-                        if done_val:
-                            completed_ids.add(int(tid))
+                # default completion status comes from the denormalized Todo.is_done
+                completed_ids: set[int] = {int(t.id) for t in todos_acc.values() if t.is_done}
                 results['todos'] = [
                     {'id': t.id, 'text': t.text, 'note': t.note, 'list_id': t.list_id, 'list_name': lm.get(t.list_id), 'completed': (int(t.id) in completed_ids)}
                     for t in todos_acc.values() if not (exclude_completed and (int(t.id) in completed_ids))
@@ -2918,49 +2286,18 @@ async def html_priorities(request: Request, current_user: User = Depends(require
         hide_completed_cookie = request.cookies.get('priorities_hide_completed')
         hide_completed = True if hide_completed_cookie is None else (hide_completed_cookie == '1')
 
-        # Look up the user's Trash list id to exclude todos in Trash
-        trash_list_id: int | None = None
-        try:
-            q_trash = await sess.exec(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-            trash_list_id = q_trash.first()
-            if isinstance(trash_list_id, tuple):
-                trash_list_id = trash_list_id[0]
-        except Exception:
-            trash_list_id = None
-
-        # Build a set of trashed list ids to exclude (lists that have been moved to Trash)
-        trashed_list_ids: set[int] = set()
-        try:
-            q_ltrash = await sess.exec(select(ListTrashMeta.list_id))
-            for row in q_ltrash.all():
-                try:
-                    lid = int(row[0] if isinstance(row, tuple) else row)
-                    trashed_list_ids.add(lid)
-                except Exception:
-                    try:
-                        lid = int(getattr(row, 'list_id'))
-                        trashed_list_ids.add(lid)
-                    except Exception:
-                        pass
-        except Exception:
-            trashed_list_ids = set()
+        # Trash list id plus every list hidden by Trash (moved there, or below
+        # such a list), cached per user by the visibility resolver
+        vis = await visibility.get(sess, current_user.id)
+        hidden_list_ids = vis.hidden_list_ids
 
         # lists with priority (optionally exclude completed)
         ql_stmt = select(ListState).where(ListState.owner_id == current_user.id).where(ListState.priority != None)
         if hide_completed:
             ql_stmt = ql_stmt.where(ListState.completed == False)
         ql = await sess.exec(ql_stmt)
-        # Exclude lists that were moved to Trash (either recorded in ListTrashMeta
-        # or whose parent_list_id is the user's Trash list id)
-        lists = [
-            l for l in ql.all()
-            if (
-                getattr(l, 'id', None) not in trashed_list_ids
-                and not (
-                    trash_list_id is not None and getattr(l, 'parent_list_id', None) == trash_list_id
-                )
-            )
-        ]
+        # Exclude lists that were moved to Trash (or live below one)
+        lists = [l for l in ql.all() if getattr(l, 'id', None) not in hidden_list_ids]
         # todos with priority: fetch todos that have a priority (and optionally exclude completed)
         qt2_stmt = select(Todo).where(Todo.priority != None)
         # do not attempt to filter by a non-existent Todo.completed column here;
@@ -2973,12 +2310,8 @@ async def html_priorities(request: Request, current_user: User = Depends(require
             if not lst:
                 continue
             if lst.owner_id is None or lst.owner_id == current_user.id:
-                # Skip todos in the Trash list, todos under lists that were moved to Trash,
-                # or belonging to lists recorded as trashed in ListTrashMeta
-                if (
-                    (trash_list_id is not None and (lst.id == trash_list_id or getattr(lst, 'parent_list_id', None) == trash_list_id))
-                    or (getattr(lst, 'id', None) in trashed_list_ids)
-                ):
+                # Skip todos in the Trash list or in lists hidden by Trash
+                if getattr(lst, 'id', None) in hidden_list_ids:
                     continue
                 # If hide_completed is requested, skip todos that have any
                 # completion rows marked done=True.
@@ -3052,12 +2385,8 @@ async def html_priorities(request: Request, current_user: User = Depends(require
             if not lst:
                 continue
             if lst.owner_id is None or lst.owner_id == current_user.id:
-                # Exclude todos in the Trash list, todos under lists parented to Trash,
-                # and those on lists recorded as trashed
-                if (
-                    (trash_list_id is not None and (lst.id == trash_list_id or getattr(lst, 'parent_list_id', None) == trash_list_id))
-                    or (getattr(lst, 'id', None) in trashed_list_ids)
-                ):
+                # Exclude todos in the Trash list or in lists hidden by Trash
+                if getattr(lst, 'id', None) in hidden_list_ids:
                     continue
                 # skip if todo is completed (check TodoCompletion rows)
                 qc = await sess.exec(select(TodoCompletion).where(TodoCompletion.todo_id == t.id).where(TodoCompletion.done == True))
@@ -3152,24 +2481,11 @@ async def calendar_events(request: Request, start: Optional[str] = None, end: Op
         # fetch lists for this owner
         qlists = await sess.exec(select(ListState).where(ListState.owner_id == owner_id).where(ListState.parent_todo_id == None).where(ListState.parent_list_id == None))
         lists = qlists.all()
-        # Determine the user's Trash list id and exclude it from calendar scanning
-        trash_id = None
-        try:
-            q_trash = await sess.scalars(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-            trash_id = q_trash.first()
-        except Exception:
-            trash_id = None
-        if trash_id is not None and lists:
-            try:
-                lists = [l for l in lists if getattr(l, 'id', None) != trash_id]
-            except Exception:
-                pass
         # Exclude the user's Trash list from calendar scanning so trashed items
         # do not appear in the calendar.
         trash_id = None
         try:
-            q_trash = await sess.scalars(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-            trash_id = q_trash.first()
+            trash_id = (await visibility.get(sess, owner_id)).trash_list_id
         except Exception:
             trash_id = None
         if trash_id is not None and lists:
@@ -3287,6 +2603,61 @@ async def calendar_events(request: Request, start: Optional[str] = None, end: Op
     return {'events': events}
 
 
+# Cheap pre-regex gate used by calendar_occurrences: only run extract_dates_meta
+# if text likely contains date tokens
+def _likely_has_date_tokens(_s: str) -> bool:
+    try:
+        import re as _re
+        s = _s or ''
+        # ISO date like 2025-09-05 (year-month-day)
+        if _re.search(r"\b\d{4}-\d{1,2}-\d{1,2}\b", s):
+            return True
+        # numeric date shapes like 12/9 or 12-9-2025
+        if _re.search(r"\b\d{1,2}[./-]\d{1,2}(?:[./-]\d{2,4})?\b", s):
+            return True
+        # month names (short or long)
+        if _re.search(r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b", s, flags=_re.IGNORECASE):
+            return True
+        # weekday names
+        if _re.search(r"\b(?:mon|tue|wed|thu|fri|sat|sun)(?:day|days)?\b", s, flags=_re.IGNORECASE):
+            return True
+        # ordinal day tokens (1st, 22nd)
+        if _re.search(r"\b\d{1,2}(?:st|nd|rd|th)\b", s, flags=_re.IGNORECASE):
+            return True
+        # relative date phrases (in 2 days, next week)
+        if _re.search(r"\b(?:in\s+\d+\s+(?:day|days|week|weeks|month|months|year|years)|next\s+(?:week|month|year|mon|tue|wed|thu|fri|sat|sun))\b", s, flags=_re.IGNORECASE):
+            return True
+        return False
+    except Exception:
+        return True  # fail-open to avoid hiding dates on error
+
+
+def _calendar_text_hash(combined: str) -> Optional[str]:
+    try:
+        import hashlib as _hashlib
+        return 'sha1:' + _hashlib.sha1((combined or '').encode('utf-8', errors='ignore')).hexdigest()
+    except Exception:
+        return None
+
+
+# Negative cache gate used by calendar_occurrences: True when the todo's
+# metadata_json records that this exact text (by hash) had no dates.
+def _calendar_neg_cache_hit(t, text_hash: Optional[str]) -> bool:
+    if text_hash is None:
+        return False
+    try:
+        import json as _json
+        raw = getattr(t, 'metadata_json', None)
+        md = _json.loads(raw) if raw else {}
+        if isinstance(md, dict):
+            cd = md.get('calendar_extract_cache')
+            if isinstance(cd, dict) and cd.get('v') == 1 and cd.get('text_hash') == text_hash and (cd.get('found_any') is False):
+                return True
+    except Exception:
+        pass
+    return False
+
+
 @app.get('/calendar/occurrences')
 async def calendar_occurrences(request: Request,
                                start: Optional[str] = None,
@@ -3433,12 +2804,7 @@ async def calendar_occurrences(request: Request,
         # for downstream filtering when fetching todos.
         trash_id = None
         try:
-            q_trash = await sess.scalars(
-                select(ListState.id)
-                .where(ListState.owner_id == owner_id)
-                .where(ListState.name == 'Trash')
-            )
-            trash_id = q_trash.first()
+            trash_id = (await visibility.get(sess, owner_id)).trash_list_id
         except Exception:
             trash_id = None
         if trash_id is not None and lists:
@@ -3491,15 +2857,7 @@ async def calendar_occurrences(request: Request,
         except Exception:
             todo_map = {}
         # compute completed todo ids to exclude when computing override priorities
-        completed_ids = set()
-        try:
-            todo_ids = [int(getattr(t, 'id')) for t in todos if getattr(t, 'id', None) is not None]
-            if todo_ids:
-                qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
-                cres = await sess.exec(qcomp)
-                completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
-        except Exception:
-            completed_ids = set()
+        completed_ids = {int(t.id) for t in todos if getattr(t, 'id', None) is not None and getattr(t, 'is_done', False)}
         # per-list highest uncompleted todo priority
         list_override_map: dict[int, int] = {}
         try:
@@ -3610,18 +2968,19 @@ async def calendar_occurrences(request: Request,
                 if source:
                     pay['source'] = source
                 _sse_debug('calendar_occurrences.added', pay)
-                # Also emit an INFO log so appended occurrences are visible in server stdout and in /server/logs
+                # Also log appended occurrences (INFO when sampled via
+                # CALENDAR_OCC_LOG_SAMPLE, else DEBUG) for stdout and /server/logs
                 try:
                     # include title to make it easier to correlate occurrences
                     # include occ_hash for easier tracing when filtering occurs later
-                    logger.info('calendar_occurrences.added owner_id=%s item_type=%s item_id=%s title=%s occurrence=%s rrule=%s recurring=%s source=%s occ_hash=%s', owner_id, item_type, item_id, (title or '')[:60], occ_dt.isoformat(), rrule_str or '', bool(is_rec), source, pay.get('occ_hash'))
+                    logger.log(logging.INFO if _calendar_occ_log_sampler.hit() else logging.DEBUG, 'calendar_occurrences.added owner_id=%s item_type=%s item_id=%s title=%s occurrence=%s rrule=%s recurring=%s source=%s occ_hash=%s', owner_id, item_type, item_id, (title or '')[:60], occ_dt.isoformat(), rrule_str or '', bool(is_rec), source, pay.get('occ_hash'))
                 except Exception:
                     pass
                 # Guarded retention debug: when DEBUG_RETENTION_ID is set to an item id,
                 # emit an explicit debug log if this occurrence belongs to that id.
                 try:
-                    _ret_id = os.environ.get('DEBUG_RETENTION_ID')
-                    _ret_any = os.environ.get('DEBUG_RETENTION_ANY_WINDOWEVENT')
+                    _ret_id = config.DEBUG_RETENTION_ID
+                    _ret_any = config.DEBUG_RETENTION_ANY_WINDOWEVENT
                     if (_ret_id and str(item_id) == str(_ret_id)) or (_ret_any and title and 'WindowEvent Jan 22' in title):
                         # include a short stack to make it easy to see call-site in tests
                         import traceback as _tb
@@ -3638,6 +2997,45 @@ async def calendar_occurrences(request: Request,
             except Exception:
                 pass
 
+        # When the parse pool is enabled, extract plain-date metadata for every
+        # candidate list/todo text in one batch spread across worker processes.
+        # The scan loops below read these results instead of parsing inline.
+        pre_list_meta: dict[int, list] = {}
+        pre_todo_meta: dict[int, list] = {}
+        if parse_pool_enabled() and not scanning_disabled:
+            _t = _pt('extract_meta_batch')
+            try:
+                _neg_cache_enabled = str(os.environ.get('CALENDAR_NEG_CACHE', '1')).lower() in ('1','true','yes')
+                batch_keys: list[tuple[str, int]] = []
+                batch_texts: list[str] = []
+                for l in lists:
+                    if expand and getattr(l, 'recurrence_rrule', None) and recurring_enabled:
+                        continue
+                    batch_keys.append(('list', l.id))
+                    batch_texts.append(l.name or '')
+                for t in todos:
+                    if expand and getattr(t, 'recurrence_rrule', None) and recurring_enabled:
+                        continue
+                    texts = [t.text or '']
+                    if getattr(t, 'note', None):
+                        texts.append((t.note or '')[:8192])
+                    combined = ' \n '.join(texts)
+                    if not _likely_has_date_tokens(combined):
+                        continue
+                    # the scan loop skips these without parsing; so does the batch
+                    if _neg_cache_enabled and _calendar_neg_cache_hit(t, _calendar_text_hash(combined)):
+                        continue
+                    batch_keys.append(('todo', t.id))
+                    batch_texts.append(combined)
+                metas = await extract_dates_meta_many(batch_texts)
+                for (kind, key), m in zip(batch_keys, metas):
+                    (pre_list_meta if kind == 'list' else pre_todo_meta)[key] = m
+            except Exception:
+                logger.exception('calendar_occurrences batch date extraction failed; parsing inline')
+                pre_list_meta, pre_todo_meta = {}, {}
+            _pa('extract_meta_batch', _t)
+            _pc('extract_meta_batch_size', len(pre_list_meta) + len(pre_todo_meta))
+
         # scan lists
         from dateutil.rrule import rrulestr
         t_scan_lists = _pt('scan_lists')
@@ -3689,9 +3087,12 @@ async def calendar_occurrences(request: Request,
             # DISABLE_CALENDAR_TEXT_SCAN flag to skip extraction.
             meta = []
             if not scanning_disabled:
-                _t = _pt('extract_meta_lists')
-                meta = extract_dates_meta(combined)
-                _pa('extract_meta_lists', _t)
+                if l.id in pre_list_meta:
+                    meta = pre_list_meta[l.id]
+                else:
+                    _t = _pt('extract_meta_lists')
+                    meta = extract_dates_meta(combined)
+                    _pa('extract_meta_lists', _t)
             # expand year-explicit matches directly
             for m in meta:
                 if m.get('year_explicit'):
@@ -3877,59 +3278,14 @@ async def calendar_occurrences(request: Request,
                     logger.info('DEBUG_WINDOWEVENT_MARKER todo_id=%s title=%s created_at=%s', getattr(t, 'id', None), (getattr(t, 'text', '') or '')[:120], (ca.isoformat() if isinstance(ca, datetime) else str(ca)))
             except Exception:
                 pass
-            # Cheap pre-regex gate: only run extract_dates_meta if text likely contains date tokens
-            def _likely_has_date_tokens(_s: str) -> bool:
-                try:
-                    import re as _re
-                    s = _s or ''
-                    # ISO date like 2025-09-05 (year-month-day)
-                    if _re.search(r"\b\d{4}-\d{1,2}-\d{1,2}\b", s):
-                        return True
-                    # numeric date shapes like 12/9 or 12-9-2025
-                    if _re.search(r"\b\d{1,2}[./-]\d{1,2}(?:[./-]\d{2,4})?\b", s):
-                        return True
-                    # month names (short or long)
-                    if _re.search(r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\b", s, flags=_re.IGNORECASE):
-                        return True
-                    # weekday names
-                    if _re.search(r"\b(?:mon|tue|wed|thu|fri|sat|sun)(?:day|days)?\b", s, flags=_re.IGNORECASE):
-                        return True
-                    # ordinal day tokens (1st, 22nd)
-                    if _re.search(r"\b\d{1,2}(?:st|nd|rd|th)\b", s, flags=_re.IGNORECASE):
-                        return True
-                    # relative date phrases (in 2 days, next week)
-                    if _re.search(r"\b(?:in\s+\d+\s+(?:day|days|week|weeks|month|months|year|years)|next\s+(?:week|month|year|mon|tue|wed|thu|fri|sat|sun))\b", s, flags=_re.IGNORECASE):
-                        return True
-                    return False
-                except Exception:
-                    return True  # fail-open to avoid hiding dates on error
 
             meta = []
             # Negative cache gate: if metadata_json has a matching hash with found_any=false, skip extraction
             _neg_cache_enabled = str(os.environ.get('CALENDAR_NEG_CACHE', '1')).lower() in ('1','true','yes')
             _neg_cache_write = str(os.environ.get('CALENDAR_NEG_CACHE_WRITE', '0')).lower() in ('1','true','yes')
             _neg_cache_commit = str(os.environ.get('CALENDAR_NEG_CACHE_COMMIT', '0')).lower() in ('1','true','yes')
-            _cache_hit_skip = False
-            _combined_hash = None
-            try:
-                import hashlib as _hashlib
-                _combined_hash = 'sha1:' + _hashlib.sha1((combined or '').encode('utf-8', errors='ignore')).hexdigest()
-            except Exception:
-                _combined_hash = None
-
-            _cache_dict = None
-            if _neg_cache_enabled and _combined_hash is not None:
-                try:
-                    import json as _json
-                    raw = getattr(t, 'metadata_json', None)
-                    md = _json.loads(raw) if raw else {}
-                    if isinstance(md, dict):
-                        cd = md.get('calendar_extract_cache')
-                        if isinstance(cd, dict) and cd.get('v') == 1 and cd.get('text_hash') == _combined_hash and (cd.get('found_any') is False):
-                            _cache_dict = cd
-                            _cache_hit_skip = True
-                except Exception:
-                    _cache_hit_skip = False
+            _combined_hash = _calendar_text_hash(combined)
+            _cache_hit_skip = _neg_cache_enabled and _calendar_neg_cache_hit(t, _combined_hash)
 
             if _cache_hit_skip:
                 # Skip extraction entirely due to negative cache
@@ -3938,9 +3294,12 @@ async def calendar_occurrences(request: Request,
                 except Exception:
                     pass
             elif _likely_has_date_tokens(combined) and not scanning_disabled:
-                _t = _pt('extract_meta_todos')
-                meta = extract_dates_meta(combined)
-                _pa('extract_meta_todos', _t)
+                if t.id in pre_todo_meta:
+                    meta = pre_todo_meta[t.id]
+                else:
+                    _t = _pt('extract_meta_todos')
+                    meta = extract_dates_meta(combined)
+                    _pa('extract_meta_todos', _t)
                 # Opportunistically update cache
                 if _neg_cache_enabled and _combined_hash is not None and _neg_cache_write:
                     try:
@@ -4763,23 +4122,12 @@ async def mark_occurrence_completed(request: Request, hash: str | None = Form(No
             csrf_assert(True, 'csrf_complete_persisted', user_id=getattr(current_user, 'id', None), occ_hash=hash)
         except Exception:
             pass
-        # Ensure positions are unique and sequential. If previous data had
-        # duplicate positions (can happen with older imports or a bug),
-        # normalize positions so order becomes deterministic and contiguous.
-        try:
-            cres = await sess.exec(select(Category).where(Category.owner_id == current_user.id).order_by(Category.position.asc(), Category.id.asc()))
-            cats_all = cres.all()
-            need_fix = False
-            for idx, c in enumerate(cats_all):
-                if c.position != idx:
-                    need_fix = True
-                    break
-            if need_fix:
-                logger.info('move_category: normalizing %d category positions', len(cats_all))
-                for idx, c in enumerate(cats_all):
-                    await sess.exec(sqlalchemy_update(Category).where(Category.id == c.id).values(position=idx))
+        # Repair duplicate or missing category positions (older imports or a
+        # bug) so order stays deterministic; a no-op beyond one aggregate query.
+        try:
+            if await ordering.repair(sess, ordering.category_siblings(current_user.id)):
+                logger.info('move_category: renumbered category positions')
                 await sess.commit()
-                logger.info('move_category: normalization complete')
         except Exception:
             logger.exception('move_category: failed to normalize category positions')
     return {'ok': True, 'created': True}
@@ -5199,10 +4547,10 @@ async def stream_server_logs(request: Request):
     async def event_generator():
         q: Queue = Queue()
         _sse_queues.append(q)
+        log_pipeline.subscribe(q)
         try:
             # on connect, send a small warm-up batch of recent logs
-            recent = list(_inmemory_log)
-            for r in recent[-50:]:
+            for r in log_pipeline.recent(limit=50):
                 yield f"event: log\ndata: {json.dumps(r)}\n\n"
             while True:
                 # if client disconnects, stop
@@ -5216,6 +4564,7 @@ async def stream_server_logs(request: Request):
                 except Exception:
                     continue
         finally:
+            log_pipeline.unsubscribe(q)
             try:
                 _sse_queues.remove(q)
             except Exception:
@@ -6165,214 +5514,122 @@ async def record_list_visit(list_id: int, current_user: User = Depends(require_l
 
     This endpoint is intentionally small and idempotent; clients should call it
     when a list is viewed to let the server store a per-user recent-list timestamp.
+    The write itself is buffered (see app/visits.py): top-N position upkeep and
+    pruning happen in periodic batched transactions, off the request path.
     """
     async with async_session() as sess:
         # ensure list exists
-        q = await sess.scalars(select(ListState).where(ListState.id == list_id))
-        lst = q.first()
-        if not lst:
+        q = await sess.exec(select(ListState.id, ListState.owner_id).where(ListState.id == list_id))
+        row = q.first()
+        if not row:
             raise HTTPException(status_code=404, detail='list not found')
         # only allow recording visits for lists the user may legitimately access
-        if lst.owner_id is not None and lst.owner_id != current_user.id:
+        if row[1] is not None and row[1] != current_user.id:
             raise HTTPException(status_code=403, detail='forbidden')
-        now = now_utc()
-        # Top-N behavior: default top_n preserved order size
-        try:
-            top_n = int(os.getenv('RECENT_LISTS_TOP_N', '10'))
-        except Exception:
-            top_n = 10
-
-        # Read existing row if present
-        qv = await sess.exec(select(RecentListVisit).where(RecentListVisit.user_id == current_user.id).where(RecentListVisit.list_id == list_id))
-        rv = qv.first()
-
-        if rv and rv.position is not None and rv.position < top_n:
-            # If already in top-N, only update visited_at, preserving positions
-            rv.visited_at = now
-            sess.add(rv)
-            await sess.commit()
-        else:
-            # Need to insert/update this row as the new top (position=0)
-            # Shift existing positions down by +1 for positions in [0, top_n-2]
-            try:
-                # We want to increment positions 0..(top_n-2) so the previous
-                # position top_n-1 becomes the candidate for eviction. Use a
-                # consistent threshold `evict_pos = top_n - 1` for both queries.
-                evict_pos = max(0, top_n - 1)
-                shift_sql = text(
-                    "UPDATE recentlistvisit SET position = position + 1 "
-                    "WHERE user_id = :uid AND position IS NOT NULL AND position < :maxpos"
-                )
-                await sess.exec(shift_sql.bindparams(uid=current_user.id, maxpos=evict_pos))
-                # Any position that is now >= evict_pos should be evicted (set NULL)
-                clear_sql = text(
-                    "UPDATE recentlistvisit SET position = NULL WHERE user_id = :uid AND position >= :maxpos"
-                )
-                await sess.exec(clear_sql.bindparams(uid=current_user.id, maxpos=evict_pos))
-            except Exception:
-                # Best-effort: ignore shift failures and continue
-                logger.exception('failed to shift recentlist positions')
-
-            if rv:
-                rv.position = 0
-                rv.visited_at = now
-                sess.add(rv)
-            else:
-                rv = RecentListVisit(user_id=current_user.id, list_id=list_id, visited_at=now, position=0)
-                sess.add(rv)
-            await sess.commit()
-
-        # Prune older visits for this user to keep storage bounded.
-        # Configurable via RECENT_LISTS_PER_USER env var (default: 100).
+    now = list_visits.record(current_user.id, list_id)
+    if not visit_buffer_enabled():
+        # best-effort: a failed flush requeues the visit for the flusher
         try:
-            cap = int(os.getenv('RECENT_LISTS_PER_USER', '100'))
+            await list_visits.flush(user_id=current_user.id)
         except Exception:
-            cap = 100
-        if cap > 0:
-            # Delete pairs (user_id, list_id) whose row is ranked > cap by visited_at
-            prune_sql = text(
-                "DELETE FROM recentlistvisit WHERE (user_id, list_id) IN ("
-                "SELECT user_id, list_id FROM ("
-                "SELECT user_id, list_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY visited_at DESC) AS rn "
-                "FROM recentlistvisit WHERE user_id = :uid) t WHERE t.rn > :cap)"
-            )
-            try:
-                await sess.exec(prune_sql.bindparams(uid=current_user.id, cap=cap))
-                await sess.commit()
-            except Exception:
-                # Best-effort pruning; do not fail the request if pruning SQL isn't supported
-                pass
-
-        return {"list_id": list_id, "visited_at": now}
+            logger.exception('failed to write list visit for list %s', list_id)
+    return {"list_id": list_id, "visited_at": now}
 
 
 @app.post('/todos/{todo_id}/visit')
 async def record_todo_visit(todo_id: int, current_user: User = Depends(require_login)):
     """Record that the current_user visited the given todo (mirrors list visits).
 
-    Preserves a top-N order via position field and prunes older rows per-user.
+    Preserves a top-N order via position field and prunes older rows per-user;
+    both are applied by the buffered flusher in app/visits.py.
     """
     async with async_session() as sess:
         # ensure todo exists and is visible to user via parent list ownership or public
-        t = await sess.get(Todo, todo_id)
-        if not t:
+        q = await sess.exec(
+            select(Todo.id, ListState.owner_id)
+            .outerjoin(ListState, ListState.id == Todo.list_id)
+            .where(Todo.id == todo_id)
+        )
+        row = q.first()
+        if not row:
             raise HTTPException(status_code=404, detail='todo not found')
-        ql = await sess.exec(select(ListState).where(ListState.id == t.list_id))
-        lst = ql.first()
-        if lst and lst.owner_id not in (None, current_user.id):
+        if row[1] not in (None, current_user.id):
             raise HTTPException(status_code=403, detail='forbidden')
-        now = now_utc()
+    now = todo_visits.record(current_user.id, todo_id)
+    if not visit_buffer_enabled():
+        # best-effort: a failed flush requeues the visit for the flusher
         try:
-            top_n = int(os.getenv('RECENT_TODOS_TOP_N', '10'))
+            await todo_visits.flush(user_id=current_user.id)
         except Exception:
-            top_n = 10
-        qv = await sess.exec(select(RecentTodoVisit).where(RecentTodoVisit.user_id == current_user.id).where(RecentTodoVisit.todo_id == todo_id))
-        rv = qv.first()
-        if rv and rv.position is not None and rv.position < top_n:
-            rv.visited_at = now
-            sess.add(rv)
-            await sess.commit()
-        else:
-            try:
-                evict_pos = max(0, top_n - 1)
-                shift_sql = text(
-                    "UPDATE recenttodovisit SET position = position + 1 "
-                    "WHERE user_id = :uid AND position IS NOT NULL AND position < :maxpos"
-                )
-                await sess.exec(shift_sql.bindparams(uid=current_user.id, maxpos=evict_pos))
-                clear_sql = text(
-                    "UPDATE recenttodovisit SET position = NULL WHERE user_id = :uid AND position >= :maxpos"
-                )
-                await sess.exec(clear_sql.bindparams(uid=current_user.id, maxpos=evict_pos))
-            except Exception:
-                logger.exception('failed to shift recenttodo positions')
-            if rv:
-                rv.position = 0
-                rv.visited_at = now
-                sess.add(rv)
-            else:
-                rv = RecentTodoVisit(user_id=current_user.id, todo_id=todo_id, visited_at=now, position=0)
-                sess.add(rv)
-            await sess.commit()
+            logger.exception('failed to write todo visit for todo %s', todo_id)
+    return {"todo_id": todo_id, "visited_at": now}
 
-        try:
-            cap = int(os.getenv('RECENT_TODOS_PER_USER', '100'))
-        except Exception:
-            cap = 100
-        if cap > 0:
-            prune_sql = text(
-                "DELETE FROM recenttodovisit WHERE (user_id, todo_id) IN ("
-                "SELECT user_id, todo_id FROM ("
-                "SELECT user_id, todo_id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY visited_at DESC) AS rn "
-                "FROM recenttodovisit WHERE user_id = :uid) t WHERE t.rn > :cap)"
-            )
-            try:
-                await sess.exec(prune_sql.bindparams(uid=current_user.id, cap=cap))
-                await sess.commit()
-            except Exception:
-                pass
-        return {"todo_id": todo_id, "visited_at": now}
+
+async def _recent_visited(sess, visits, user_id: int, limit: int, top_n: int, load, keep=None) -> list:
+    """Return up to `limit` (item, visited_at, position) rows from a visit view.
+
+    The view may include items the caller drops (sublists, deleted or hidden
+    items), so it is paged (doubling) until `limit` rows survive or the view
+    runs out. `load(sess, ids)` returns {id: item} for the ids it accepts;
+    `keep(item, position)` optionally filters further.
+    """
+    if limit <= 0:
+        return []
+    fetch = limit + top_n
+    # item id -> loaded item, or None when `load` rejected it
+    loaded: dict = {}
+    while True:
+        view = await visits.view(sess, user_id, fetch)
+        new_ids = [iid for iid, _, _ in view if iid not in loaded]
+        if new_ids:
+            found = await load(sess, new_ids)
+            for iid in new_ids:
+                loaded[iid] = found.get(iid)
+        results: list = []
+        for iid, visited_at, pos in view:
+            item = loaded.get(iid)
+            if item is None or (keep is not None and not keep(item, pos)):
+                continue
+            results.append((item, visited_at, pos))
+            if len(results) >= limit:
+                break
+        if len(results) >= limit or len(view) < fetch:
+            return results
+        fetch *= 2
 
 
 async def _get_recent_lists_impl(limit: int, current_user: User):
-    """Return the recent lists visited by the current user ordered by preserved top-N then recent views."""
+    """Return the recent lists visited by the current user ordered by preserved top-N then recent views.
+
+    Reads through the visit buffer so visits not yet flushed are reflected.
+    """
     try:
         top_n = int(os.getenv('RECENT_LISTS_TOP_N', '10'))
     except Exception:
         top_n = 10
-    async with async_session() as sess:
-        # First fetch top-N positioned rows ordered by position ASC
-        top_q = (
-            select(RecentListVisit)
-            .where(RecentListVisit.user_id == current_user.id)
-            .where(RecentListVisit.position != None)
-            .order_by(RecentListVisit.position.asc())
-            .limit(top_n)
-        )
-        top_res = await sess.exec(top_q)
-        top_rows = top_res.all()
-        top_ids = [r.list_id for r in top_rows]
-
-        results: list[dict] = []
-        # load ListState for top rows preserving order
-        if top_ids:
-            qlists = (
-                select(ListState)
-                .where(ListState.id.in_(top_ids))
-                .where(ListState.parent_todo_id == None)
-                .where(ListState.parent_list_id == None)
-            )
-            lres = await sess.exec(qlists)
-            lmap = {l.id: l for l in lres.all()}
-            for r in top_rows:
-                lst = lmap.get(r.list_id)
-                if lst:
-                    # attach visited_at for template/clients
-                    try:
-                        setattr(lst, 'visited_at', r.visited_at)
-                    except Exception:
-                        pass
-                    results.append(lst)
 
-        # If we still need more, fetch others ordered by visited_at desc excluding top_ids
-        remaining = max(0, limit - len(results))
-        if remaining > 0:
-            q = (
-                select(ListState)
-                .join(RecentListVisit, RecentListVisit.list_id == ListState.id)
-                .where(RecentListVisit.user_id == current_user.id)
-                .where(ListState.parent_todo_id == None)
-                .where(ListState.parent_list_id == None)
-            )
-            if top_ids:
-                q = q.where(RecentListVisit.list_id.notin_(top_ids))
-            q = q.order_by(RecentListVisit.visited_at.desc()).limit(remaining)
-            res = await sess.exec(q)
-            other_lists = res.all()
-            for lst in other_lists:
-                results.append(lst)
+    async def _load(sess, ids):
+        # top-level lists only; sublists and deleted lists are dropped
+        qlists = (
+            select(ListState)
+            .where(ListState.id.in_(ids))
+            .where(ListState.parent_todo_id == None)
+            .where(ListState.parent_list_id == None)
+        )
+        return {l.id: l for l in (await sess.exec(qlists)).all()}
 
-        return results
+    async with async_session() as sess:
+        rows = await _recent_visited(sess, list_visits, current_user.id, max(0, int(limit)), top_n, _load)
+    results: list = []
+    for lst, visited_at, pos in rows:
+        if pos is not None:
+            # attach visited_at for template/clients (top-N rows only, as before)
+            try:
+                setattr(lst, 'visited_at', visited_at)
+            except Exception:
+                pass
+        results.append(lst)
+    return results
 
 
 @app.post("/todos")
@@ -6435,18 +5692,20 @@ async def _create_todo_internal(text: str, note: Optional[str], list_id: int, pr
         except Exception:
             clean_text = text
         # compute recurrence metadata for the todo text/note and persist
-        from .utils import parse_text_to_rrule_string, parse_date_and_recurrence, extract_dates_meta
         combined_for_parse = (text or '') + ('\n' + note if note else '')
         # For recurrence-only phrases, parse_text_to_rrule_string will synthesize
         # a dtstart (e.g., now_utc, honoring simple 'at 9am' time tokens).
-        dtstart_val, rrule_str = parse_text_to_rrule_string(combined_for_parse)
-        # Extract structured recurrence meta (non-RRULE details) using the same combined text
-        _, recdict = parse_date_and_recurrence(combined_for_parse)
+        # All three parsers run in one round trip to the parse pool (inline
+        # when DATE_PARSE_WORKERS=0) so the event loop is not blocked.
+        parsed = await parse_todo_text(combined_for_parse)
+        dtstart_val, rrule_str = parsed['dtstart'], parsed['rrule']
+        # Structured recurrence meta (non-RRULE details) from the same combined text
+        recdict = parsed['recurrence']
         import json
         meta_json = json.dumps(recdict) if recdict else None
         # compute plain date metadata and JSON-encode for storage
         try:
-            pd_meta = extract_dates_meta(combined_for_parse)
+            pd_meta = parsed['plain_dates']
             # store compact JSON with ISO dts
             def _j(m):
                 from datetime import datetime as _dt
@@ -6506,6 +5765,168 @@ async def _create_todo_internal(text: str, note: Optional[str], list_id: int, pr
     return todo_resp
 
 
+def _validate_bulk_todo_items(payload) -> list[dict]:
+    """Validate a bulk todo payload and return normalized item dicts.
+
+    Accepts either {"items": [...]} or a bare JSON array. Each item mirrors the
+    POST /todos body: text (required), list_id (required), note, priority,
+    metadata. Raises HTTPException(400) naming the first invalid item.
+    """
+    items = payload.get('items') if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="items must be a list")
+    max_items = config.BULK_TODO_MAX_ITEMS
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"too many items (max {max_items})")
+    out: list[dict] = []
+    for idx, it in enumerate(items):
+        if not isinstance(it, dict):
+            raise HTTPException(status_code=400, detail=f"items[{idx}] must be an object")
+        text = it.get('text')
+        if not text or not isinstance(text, str):
+            raise HTTPException(status_code=400, detail=f"items[{idx}]: text is required and must be a string")
+        if it.get('list_id') is None:
+            raise HTTPException(status_code=400, detail=f"items[{idx}]: list_id is required")
+        try:
+            list_id = int(it.get('list_id'))
+        except Exception:
+            raise HTTPException(status_code=400, detail=f"items[{idx}]: list_id must be an integer")
+        priority = it.get('priority')
+        if priority is not None:
+            try:
+                priority = int(priority)
+            except Exception:
+                raise HTTPException(status_code=400, detail=f"items[{idx}]: priority must be an integer")
+        note = it.get('note')
+        if note is not None and not isinstance(note, str):
+            raise HTTPException(status_code=400, detail=f"items[{idx}]: note must be a string")
+        out.append({'text': text, 'note': note, 'list_id': list_id, 'priority': priority, 'metadata': it.get('metadata')})
+    return out
+
+
+async def _bulk_create_todos_internal(items: list[dict], current_user: User) -> dict:
+    """Create many todos in one transaction.
+
+    Compared to calling _create_todo_internal per item this:
+      - checks every target list with one SELECT,
+      - parses all texts in one batch (spread over the parse pool if enabled),
+      - inserts todos with a single executemany INSERT ... RETURNING id,
+      - resolves every hashtag in one pass and links them with one INSERT,
+      - touches each affected list once.
+    """
+    if not items:
+        return {'ok': True, 'created': 0, 'ids': []}
+    import json
+    from sqlalchemy import insert as sqlalchemy_insert
+    list_ids = sorted({it['list_id'] for it in items})
+    combined_texts = [(it['text'] or '') + ('\n' + it['note'] if it['note'] else '') for it in items]
+    parsed_all = await parse_todo_texts_many(combined_texts)
+
+    def _j(m):
+        dd = m.get('dt')
+        return {
+            'year_explicit': bool(m.get('year_explicit')),
+            'match_text': m.get('match_text'),
+            'month': m.get('month'),
+            'day': m.get('day'),
+            'dt': (dd.isoformat() if hasattr(dd, 'isoformat') else dd),
+        }
+
+    rows: list[dict] = []
+    item_tags: list[list[str]] = []
+    for it, parsed in zip(items, parsed_all):
+        try:
+            clean_text = remove_hashtags_from_text(it['text'].lstrip())
+        except Exception:
+            clean_text = it['text']
+        recdict = parsed.get('recurrence')
+        try:
+            plain_dates_json = json.dumps([_j(m) for m in (parsed.get('plain_dates') or [])])
+        except Exception:
+            plain_dates_json = None
+        try:
+            meta_col = validate_metadata_for_storage(it.get('metadata'))
+        except Exception:
+            meta_col = None
+        # Build through the model so column defaults (timestamps, flags) apply
+        todo = Todo(
+            text=clean_text, note=it['note'], list_id=it['list_id'], priority=it['priority'],
+            recurrence_rrule=parsed.get('rrule') or None,
+            recurrence_meta=json.dumps(recdict) if recdict else None,
+            recurrence_dtstart=parsed.get('dtstart'),
+            metadata_json=meta_col, plain_dates_meta=plain_dates_json,
+        )
+        row = todo.model_dump(exclude={'id'})
+        rows.append(row)
+        item_tags.append(normalize_tags(extract_hashtags(it['text']) + extract_hashtags(it['note'])))
+
+    async with async_session() as sess:
+        res = await sess.exec(select(ListState.id, ListState.owner_id).where(ListState.id.in_(list_ids)))
+        owners = {int(lid): oid for lid, oid in res.all()}
+        for lid in list_ids:
+            if lid not in owners:
+                raise HTTPException(status_code=404, detail=f"list not found: {lid}")
+            if owners[lid] not in (None, current_user.id):
+                raise HTTPException(status_code=403, detail="forbidden")
+        ins = await sess.execute(
+            sqlalchemy_insert(Todo).returning(Todo.id, sort_by_parameter_order=True),
+            rows,
+        )
+        new_ids = [int(r[0]) for r in ins.all()]
+        # hashtags: one lookup/insert for the vocabulary, one insert for links
+        all_tags: list[str] = []
+        for tags in item_tags:
+            for t in tags:
+                if t not in all_tags:
+                    all_tags.append(t)
+        if all_tags:
+            tag_ids = await resolve_hashtag_ids(sess, all_tags)
+            links = []
+            for tid, tags in zip(new_ids, item_tags):
+                for t in tags:
+                    hid = tag_ids.get(t)
+                    if hid is not None:
+                        links.append({'todo_id': tid, 'hashtag_id': hid})
+            if links:
+                await sess.execute(
+                    sqlite_insert(TodoHashtag).on_conflict_do_nothing().execution_options(**{HASHTAG_STATS_TRACKED: True}),
+                    links,
+                )
+                # new todos cannot already have links, so every row is an addition
+                item_list = {tid: it['list_id'] for tid, it in zip(new_ids, items)}
+                added_by_owner: dict = {}
+                for ln in links:
+                    added_by_owner.setdefault(owners[item_list[ln['todo_id']]], []).append(ln['hashtag_id'])
+                for owner_id, hids in added_by_owner.items():
+                    await apply_hashtag_link_delta(sess, owner_id, 'todo', hids, [])
+        now = now_utc()
+        await sess.exec(
+            sqlalchemy_update(ListState)
+            .where(ListState.id.in_(list_ids))
+            .values(modified_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        await sess.commit()
+    logger.info('bulk created %d todos across %d lists for user_id=%s', len(new_ids), len(list_ids), current_user.id)
+    return {'ok': True, 'created': len(new_ids), 'ids': new_ids}
+
+
+@app.post("/todos/bulk")
+async def create_todos_bulk(request: Request, current_user: User = Depends(require_login)):
+    """
+    Create many todos in one request and one transaction. Expects JSON:
+    {"items": [{"text": str, "list_id": int, "note"?: str, "priority"?: int, "metadata"?: obj}, ...]}
+    (a bare array of items is also accepted). Returns {ok, created, ids} with
+    ids in the same order as the submitted items.
+    """
+    try:
+        payload = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid JSON")
+    items = _validate_bulk_todo_items(payload)
+    return await _bulk_create_todos_internal(items, current_user)
+
+
 @app.get("/todos/{todo_id}")
 async def get_todo(todo_id: int, current_user: User = Depends(require_login)):
     async with async_session() as sess:
@@ -6695,17 +6116,17 @@ async def _update_todo_internal(todo_id: int, payload: dict, current_user: User)
         # If text or note changed, recompute recurrence metadata and plain-date metadata
         if 'text' in payload or 'note' in payload:
             try:
-                from .utils import parse_text_to_rrule_string, parse_date_and_recurrence, extract_dates_meta
                 combined_text = (todo.text or '') + ('\n' + todo.note if todo.note else '')
-                dtstart_val, rrule_str = parse_text_to_rrule_string(combined_text)
-                _, recdict = parse_date_and_recurrence(combined_text)
+                parsed = await parse_todo_text(combined_text)
+                dtstart_val, rrule_str = parsed['dtstart'], parsed['rrule']
+                recdict = parsed['recurrence']
                 import json
                 todo.recurrence_rrule = rrule_str or None
                 todo.recurrence_meta = json.dumps(recdict) if recdict else None
                 todo.recurrence_dtstart = dtstart_val
                 # update plain date metadata
                 try:
-                    pd_meta = extract_dates_meta(combined_text)
+                    pd_meta = parsed['plain_dates']
                     try:
                         if bool(getattr(todo, 'first_date_only', False)) and pd_meta:
                             pd_meta = [pd_meta[0]]
@@ -7015,12 +6436,10 @@ def _ensure_owner_todo_parent_list(todo: Todo | None, lst: ListState | None, use
 
 async def _next_position_for_parent(sess, *, parent_todo_id: int | None = None, parent_list_id: int | None = None) -> int:
     if parent_todo_id is not None:
-        q = await sess.scalars(select(ListState.parent_todo_position).where(ListState.parent_todo_id == parent_todo_id))
-        positions = [p[0] if isinstance(p, (tuple, list)) else p for p in q.fetchall()]
-        try:
-            return (max([pp for pp in positions if pp is not None]) + 1) if positions else 0
-        except Exception:
-            return 0
+        return await ordering.append_position(sess, ordering.todo_sublist_siblings(parent_todo_id))
+    if parent_list_id is not None:
+        return await ordering.append_position(sess, ordering.list_sublist_siblings(parent_list_id))
+    return 0
     if parent_list_id is not None:
         q = await sess.scalars(select(ListState.parent_list_position).where(ListState.parent_list_id == parent_list_id))
         positions = [p[0] if isinstance(p, (tuple, list)) else p for p in q.fetchall()]
@@ -7284,6 +6703,7 @@ async def defer_todo(todo_id: int, hours: int, current_user: User = Depends(requ
         sess.add(todo)
         await sess.commit()
         await sess.refresh(todo)
+        undefer_scheduler.schedule(todo.id, todo.deferred_until)
         # touch parent list modified_at
         try:
             await _touch_list_modified(sess, getattr(todo, 'list_id', None))
@@ -7354,29 +6774,9 @@ async def undefer_due(current_user: User = Depends(require_login)):
         except Exception:
             raise HTTPException(status_code=403, detail='forbidden')
     async with async_session() as sess:
-        now = now_utc()
-        q = select(Todo).where(Todo.deferred_until != None).where(Todo.deferred_until <= now)
-        res = await sess.exec(q)
-        due = res.all()
-        affected_lists: set[int] = set()
-        for t in due:
-            t.deferred_until = None
-            t.modified_at = now_utc()
-            sess.add(t)
-            if getattr(t, 'list_id', None) is not None:
-                try:
-                    affected_lists.add(int(t.list_id))
-                except Exception:
-                    pass
+        n = await clear_due_deferrals(sess)
         await sess.commit()
-        # touch lists that had todos changed
-        try:
-            for lid in affected_lists:
-                await _touch_list_modified(sess, lid)
-            await sess.commit()
-        except Exception:
-            await sess.rollback()
-        return {"undeferred": len(due)}
+        return {"undeferred": n}
 
 
     @app.post('/admin/prune_tombstones')
@@ -7400,6 +6800,70 @@ async def undefer_due(current_user: User = Depends(require_login)):
         return {'pruned': deleted, 'cutoff': cutoff.isoformat()}
 
 
+@app.post('/admin/backup')
+async def admin_backup(request: Request, current_user: User = Depends(require_login)):
+    """Take an online snapshot of the database (admin only).
+
+    Optional query params override the BACKUP_* config: method=backup|vacuum,
+    compress=none|gzip|zstd|auto, keep=N, verify=1 (re-check the written file).
+    """
+    if not getattr(current_user, 'is_admin', False):
+        raise HTTPException(status_code=403, detail='admin required')
+    qp = request.query_params
+    kwargs = {}
+    if qp.get('method'):
+        kwargs['method'] = qp.get('method')
+    if qp.get('compress'):
+        kwargs['compression'] = qp.get('compress')
+    if qp.get('keep'):
+        try:
+            kwargs['keep'] = int(qp.get('keep'))
+        except Exception:
+            raise HTTPException(status_code=400, detail='keep must be an integer')
+    try:
+        res = await backup.run_backup(**kwargs)
+    except backup.BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception:
+        logger.exception('admin backup failed')
+        raise HTTPException(status_code=500, detail='backup failed')
+    out = {'ok': True, 'backup': res.to_dict()}
+    if qp.get('verify') in ('1', 'true', 'yes'):
+        loop = asyncio.get_running_loop()
+        out['verify'] = await loop.run_in_executor(None, lambda: backup.verify_backup(res.path, deep=True))
+        out['ok'] = bool(out['verify'].get('checksum_ok') and out['verify'].get('integrity_ok'))
+    return out
+
+
+@app.get('/admin/backups')
+async def admin_list_backups(current_user: User = Depends(require_login)):
+    """List database snapshots, newest first (admin only)."""
+    if not getattr(current_user, 'is_admin', False):
+        raise HTTPException(status_code=403, detail='admin required')
+    try:
+        return {'ok': True, 'dir': config.BACKUP_DIR, 'backups': backup.list_backups()}
+    except backup.BackupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get('/admin/worker')
+async def admin_worker_status(current_user: User = Depends(require_login)):
+    """Report the worker process that served this request (admin only).
+
+    Repeated calls land on different workers; `cache_bus.peers` is the number
+    of other workers this one can reach.
+    """
+    if not getattr(current_user, 'is_admin', False):
+        raise HTTPException(status_code=403, detail='admin required')
+    return {
+        'pid': os.getpid(),
+        'multi_worker': workers.multi_worker(),
+        'web_workers': config.WEB_WORKERS,
+        'leader': workers.is_leader(),
+        'cache_bus': cache_bus.stats(),
+    }
+
+
 def _serialize_todo(todo: Todo, completions: list[dict] | dict | None = None) -> dict:
     def _fmt(dt):
         if not dt:
@@ -7485,100 +6949,18 @@ async def _touch_list_modified(sess, list_id: Optional[int]):
 async def _sync_todo_hashtags(sess, todo_id: int, tags: list[str]):
     """Ensure Hashtag rows exist for each tag and ensure TodoHashtag links exist
     for the given todo. This is idempotent and safe under concurrency.
-    """
-    # Normalize/dedupe defensively to avoid invalid entries (e.g., '#')
-    raw = [t for t in (tags or []) if t]
-    norm: list[str] = []
-    for t in raw:
-        try:
-            nt = normalize_hashtag(t)
-        except Exception:
-            continue
-        if nt and nt not in norm:
-            norm.append(nt)
-    tags = norm
-
-    if not tags:
-        # If no tags are desired, remove all links for this todo and exit.
-        await sess.exec(sqlalchemy_delete(TodoHashtag).where(TodoHashtag.todo_id == todo_id))
-        await sess.commit()
-        return
-
-    # Step 1: ensure Hashtag rows exist and collect a map of tag -> id.
-    existing: dict[str, int] = {}
-    res = await sess.exec(select(Hashtag.tag, Hashtag.id).where(Hashtag.tag.in_(tags)))
-    for tag_val, id_val in res.all():
-        existing[tag_val] = id_val
-
-    missing = [t for t in tags if t not in existing]
-    if missing:
-        # Try to insert all missing hashtags in one go; fall back to reselect on conflict.
-        new_objs = [Hashtag(tag=t) for t in missing]
-        sess.add_all(new_objs)
-        try:
-            # flush assigns primary keys without committing the transaction
-            await sess.flush()
-            for h in new_objs:
-                # capture scalar ids now and discard ORM refs
-                existing[h.tag] = int(h.id)
-        except IntegrityError:
-            # Another transaction raced us; drop pending inserts and reselect ids
-            await sess.rollback()
-            res2 = await sess.exec(select(Hashtag.tag, Hashtag.id).where(Hashtag.tag.in_(tags)))
-            for tag_val, id_val in res2.all():
-                existing[tag_val] = id_val
-
-    desired_ids = [existing[t] for t in tags if t in existing]
-    if not desired_ids:
-        # Nothing to link; ensure all links are removed.
-        await sess.exec(sqlalchemy_delete(TodoHashtag).where(TodoHashtag.todo_id == todo_id))
-        await sess.commit()
-        return
-
-    # Step 2: determine current links, then compute deletes/inserts before mutating.
-    res_links0 = await sess.exec(select(TodoHashtag.hashtag_id).where(TodoHashtag.todo_id == todo_id))
-    have_rows0 = res_links0.all()
-    existing_ids: set[int] = set(
-        [r[0] if isinstance(r, (tuple, list)) else int(getattr(r, 'hashtag_id', r)) for r in have_rows0]
-    )
-    desired_set = set(desired_ids)
-    to_delete = list(existing_ids - desired_set)
-    to_insert = [hid for hid in desired_ids if hid not in existing_ids]
-
-    if to_delete:
-        await sess.exec(
-            sqlalchemy_delete(TodoHashtag)
-            .where(TodoHashtag.todo_id == todo_id)
-            .where(TodoHashtag.hashtag_id.in_(to_delete))
-        )
-
-    if to_insert:
-        sess.add_all([TodoHashtag(todo_id=todo_id, hashtag_id=hid) for hid in to_insert])
-        try:
-            await sess.flush()
-        except IntegrityError:
-            # Rollback and retry with granular operations (recompute sets post-rollback)
-            await sess.rollback()
-            res_links1 = await sess.exec(select(TodoHashtag.hashtag_id).where(TodoHashtag.todo_id == todo_id))
-            have_rows1 = res_links1.all()
-            existing_ids2: set[int] = set(
-                [r[0] if isinstance(r, (tuple, list)) else int(getattr(r, 'hashtag_id', r)) for r in have_rows1]
-            )
-            to_delete2 = list(existing_ids2 - desired_set)
-            to_insert2 = [hid for hid in desired_ids if hid not in existing_ids2]
-            if to_delete2:
-                await sess.exec(
-                    sqlalchemy_delete(TodoHashtag)
-                    .where(TodoHashtag.todo_id == todo_id)
-                    .where(TodoHashtag.hashtag_id.in_(to_delete2))
-                )
-            for hid in to_insert2:
-                sess.add(TodoHashtag(todo_id=todo_id, hashtag_id=hid))
-                try:
-                    await sess.flush()
-                except IntegrityError:
-                    await sess.rollback()
 
+    Tag ids come from the process-wide hashtag cache; missing tags and links
+    are written with INSERT ... ON CONFLICT DO NOTHING (see app/hashtag_cache.py).
+    """
+    norm = normalize_tags(tags)
+    ids_by_tag = await resolve_hashtag_ids(sess, norm, normalized=True)
+    desired_ids = [ids_by_tag[t] for t in norm if t in ids_by_tag]
+    added, removed = await sync_hashtag_links(sess, TodoHashtag, TodoHashtag.todo_id, todo_id, desired_ids)
+    if added or removed:
+        # keep the owner's UserHashtagStats counters in step with the links
+        res_owner = await sess.exec(select(ListState.owner_id).join(Todo, Todo.list_id == ListState.id).where(Todo.id == todo_id))
+        await apply_hashtag_link_delta(sess, res_owner.first(), 'todo', added, removed)
     # Single commit at the end for all changes (creates, deletes, links)
     await sess.commit()
     return
@@ -7588,100 +6970,15 @@ async def _sync_list_hashtags(sess, list_id: int, tags: list[str]):
     """Ensure list-level hashtags reflect the provided tags (idempotent).
     Creates missing Hashtag rows, then updates ListHashtag links via set-diff.
     """
-    # Normalize/dedupe to ensure only valid hashtags are synced
-    raw = [t for t in (tags or []) if t]
-    norm: list[str] = []
-    for t in raw:
-        try:
-            nt = normalize_hashtag(t)
-        except Exception:
-            continue
-        if nt and nt not in norm:
-            norm.append(nt)
-    tags = norm
-    if not tags:
-        await sess.exec(sqlalchemy_delete(ListHashtag).where(ListHashtag.list_id == list_id))
-        await sess.commit()
-        return
-    # ensure Hashtag rows exist
-    existing: dict[str, int] = {}
-    res = await sess.exec(select(Hashtag.tag, Hashtag.id).where(Hashtag.tag.in_(tags)))
-    for tag_val, id_val in res.all():
-        existing[tag_val] = id_val
-    missing = [t for t in tags if t not in existing]
-    if missing:
-        objs = [Hashtag(tag=t) for t in missing]
-        sess.add_all(objs)
-        try:
-            await sess.flush()
-            for h in objs:
-                existing[h.tag] = int(h.id)
-        except IntegrityError:
-            await sess.rollback()
-            res2 = await sess.exec(select(Hashtag.tag, Hashtag.id).where(Hashtag.tag.in_(tags)))
-            for tag_val, id_val in res2.all():
-                existing[tag_val] = id_val
-    desired_ids = [existing[t] for t in tags if t in existing]
-    # current links
-    rl = await sess.exec(select(ListHashtag.hashtag_id).where(ListHashtag.list_id == list_id))
-    have_rows = rl.all()
-    existing_ids: set[int] = set([r[0] if isinstance(r, (tuple, list)) else int(getattr(r, 'hashtag_id', r)) for r in have_rows])
-    desired_set = set(desired_ids)
-    to_delete = list(existing_ids - desired_set)
-    to_insert = [hid for hid in desired_ids if hid not in existing_ids]
-    if to_delete:
-        await sess.exec(
-            sqlalchemy_delete(ListHashtag)
-            .where(ListHashtag.list_id == list_id)
-            .where(ListHashtag.hashtag_id.in_(to_delete))
-        )
-    if to_insert:
-        sess.add_all([ListHashtag(list_id=list_id, hashtag_id=hid) for hid in to_insert])
-        try:
-            await sess.flush()
-        except IntegrityError:
-            await sess.rollback()
-            # recompute and add individually
-            rl2 = await sess.exec(select(ListHashtag.hashtag_id).where(ListHashtag.list_id == list_id))
-            have_rows2 = rl2.all()
-            existing_ids2: set[int] = set([r[0] if isinstance(r, (tuple, list)) else int(getattr(r, 'hashtag_id', r)) for r in have_rows2])
-            to_delete2 = list(existing_ids2 - desired_set)
-            to_insert2 = [hid for hid in desired_ids if hid not in existing_ids2]
-            if to_delete2:
-                await sess.exec(
-                    sqlalchemy_delete(ListHashtag)
-                    .where(ListHashtag.list_id == list_id)
-                    .where(ListHashtag.hashtag_id.in_(to_delete2))
-                )
-            for hid in to_insert2:
-                sess.add(ListHashtag(list_id=list_id, hashtag_id=hid))
-                try:
-                    await sess.flush()
-                except IntegrityError:
-                    await sess.rollback()
+    norm = normalize_tags(tags)
+    ids_by_tag = await resolve_hashtag_ids(sess, norm, normalized=True)
+    desired_ids = [ids_by_tag[t] for t in norm if t in ids_by_tag]
+    added, removed = await sync_hashtag_links(sess, ListHashtag, ListHashtag.list_id, list_id, desired_ids)
+    if added or removed:
+        # Counters (and UserHashtag ownership for newly used tags) for the list owner
+        res_owner = await sess.exec(select(ListState.owner_id).where(ListState.id == list_id))
+        await apply_hashtag_link_delta(sess, res_owner.first(), 'list', added, removed)
     await sess.commit()
-    # Backfill ownership for list owner so hashtags page shows them even without separate actions.
-    try:
-        lst_obj = await sess.get(ListState, list_id)
-        if lst_obj and lst_obj.owner_id is not None:
-            owner_id = lst_obj.owner_id
-            if desired_ids:
-                res_owned = await sess.exec(
-                    select(UserHashtag.hashtag_id)
-                    .where(UserHashtag.user_id == owner_id)
-                    .where(UserHashtag.hashtag_id.in_(desired_ids))
-                )
-                owned_set = {int(hid) for (hid,) in res_owned.all() if hid is not None}
-                new_ids = [hid for hid in desired_ids if hid not in owned_set]
-                if new_ids:
-                    for hid in new_ids:
-                        sess.add(UserHashtag(user_id=owner_id, hashtag_id=hid))
-                    try:
-                        await sess.commit()
-                    except IntegrityError:
-                        await sess.rollback()
-    except Exception:
-        pass
     return
 
 
@@ -8001,7 +7298,7 @@ async def html_index(request: Request):
             completed_ids = set()
             if todo_ids:
                 try:
-                    qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                    qcomp = select(Todo.id).where(Todo.id.in_(todo_ids)).where(Todo.is_done == True)
                     cres = await sess.exec(qcomp)
                     completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                 except Exception:
@@ -8069,14 +7366,8 @@ async def html_index(request: Request):
                 collation_ids = [lid for lid in uc_ids_all if lid in list_ids]
                 if collation_ids:
                     # Map list_id -> linked todo ids
-                    qlinks = await sess.exec(
-                        select(ItemLink.src_id, ItemLink.tgt_id)
-                        .where(ItemLink.src_type == 'list')
-                        .where(ItemLink.tgt_type == 'todo')
-                        .where(ItemLink.src_id.in_(collation_ids))
-                        .where(ItemLink.owner_id == owner_id)
-                    )
-                    link_rows = qlinks.all()
+                    # list -> todo edges of the collations, from the per-user link graph
+                    link_rows = (await link_graph.get(sess, owner_id)).pairs('list', collation_ids, 'todo')
                     coll_link_map: dict[int, list[int]] = {}
                     linked_todo_ids: list[int] = []
                     for src_id, tgt_id in link_rows:
@@ -8099,7 +7390,7 @@ async def html_index(request: Request):
                                 continue
                         # Determine completed set for linked todos as well
                         try:
-                            qlcomp = await sess.exec(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(linked_todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                            qlcomp = await sess.exec(select(Todo.id).where(Todo.id.in_(linked_todo_ids)).where(Todo.is_done == True))
                             linked_completed = set(r[0] if isinstance(r, tuple) else r for r in qlcomp.all())
                         except Exception:
                             linked_completed = set()
@@ -8140,7 +7431,7 @@ async def html_index(request: Request):
                 counts[lid] = int(cnt or 0)
             # Subtract completed todos (if completion records mark them done)
             try:
-                qcomp = await sess.exec(select(Todo.id, Todo.list_id).join(TodoCompletion, TodoCompletion.todo_id == Todo.id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(Todo.list_id.in_(list_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                qcomp = await sess.exec(select(Todo.id, Todo.list_id).where(Todo.list_id.in_(list_ids)).where(Todo.is_done == True))
                 for tid, lid in qcomp.all():
                     counts[lid] = max(0, counts.get(lid, 0) - 1)
             except Exception:
@@ -8153,14 +7444,8 @@ async def html_index(request: Request):
                 uc_ids_all = [r[0] if isinstance(r, (list, tuple)) else int(getattr(r, 'list_id', r)) for r in quc.all()]
                 collation_ids = [lid for lid in uc_ids_all if lid in list_ids]
                 if collation_ids:
-                    qlinks = await sess.exec(
-                        select(ItemLink.src_id, ItemLink.tgt_id)
-                        .where(ItemLink.src_type == 'list')
-                        .where(ItemLink.tgt_type == 'todo')
-                        .where(ItemLink.src_id.in_(collation_ids))
-                        .where(ItemLink.owner_id == owner_id)
-                    )
-                    link_rows = qlinks.all()
+                    # list -> todo edges of the collations, from the per-user link graph
+                    link_rows = (await link_graph.get(sess, owner_id)).pairs('list', collation_ids, 'todo')
                     coll_link_map: dict[int, set[int]] = {}
                     all_linked_ids: set[int] = set()
                     for src_id, tgt_id in link_rows:
@@ -8173,7 +7458,7 @@ async def html_index(request: Request):
                     if all_linked_ids:
                         # Completed set among linked todos
                         try:
-                            qlcomp = await sess.exec(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(list(all_linked_ids))).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                            qlcomp = await sess.exec(select(Todo.id).where(Todo.id.in_(list(all_linked_ids))).where(Todo.is_done == True))
                             linked_completed = set(r[0] if isinstance(r, tuple) else r for r in qlcomp.all())
                         except Exception:
                             linked_completed = set()
@@ -8350,7 +7635,7 @@ async def html_index(request: Request):
                 # determine completed state for pinned todos using the list's 'default' completion type
                 try:
                     if pin_ids:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(pin_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                        qcomp = select(Todo.id).where(Todo.id.in_(pin_ids)).where(Todo.is_done == True)
                         cres = await sess.exec(qcomp)
                         completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                     else:
@@ -8365,8 +7650,7 @@ async def html_index(request: Request):
                 qpl = select(ListState).where(ListState.pinned == True).where(ListState.owner_id == owner_id)
                 try:
                     trash_id = None
-                    trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-                    trash_id = trq.first()
+                    trash_id = (await visibility.get(sess, owner_id)).trash_list_id
                     if trash_id is not None:
                         qpl = qpl.where(or_(ListState.parent_list_id == None, ListState.parent_list_id != trash_id))
                 except Exception:
@@ -8415,11 +7699,9 @@ async def html_index(request: Request):
                         if todo_ids:
                             try:
                                 qcomp = (
-                                    select(TodoCompletion.todo_id)
-                                    .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                                    .where(TodoCompletion.todo_id.in_(todo_ids))
-                                    .where(CompletionType.name == 'default')
-                                    .where(TodoCompletion.done == True)
+                                    select(Todo.id)
+                                    .where(Todo.id.in_(todo_ids))
+                                    .where(Todo.is_done == True)
                                 )
                                 cres = await sess.exec(qcomp)
                                 completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
@@ -8525,7 +7807,7 @@ async def html_index(request: Request):
                 # determine completed state for bookmarked todos using the list's 'default' completion type
                 try:
                     if bm_ids:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(bm_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                        qcomp = select(Todo.id).where(Todo.id.in_(bm_ids)).where(Todo.is_done == True)
                         cres = await sess.exec(qcomp)
                         completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                     else:
@@ -8576,8 +7858,7 @@ async def html_index(request: Request):
             qbl = select(ListState).where(ListState.owner_id == owner_id).where(ListState.bookmarked == True)
             try:
                 trash_id = None
-                trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-                trash_id = trq.first()
+                trash_id = (await visibility.get(sess, owner_id)).trash_list_id
                 if trash_id is not None:
                     # Keep top-level (NULL parent) and any list whose parent is not Trash
                     qbl = qbl.where(or_(ListState.parent_list_id == None, ListState.parent_list_id != trash_id))
@@ -8627,11 +7908,9 @@ async def html_index(request: Request):
                     if todo_ids:
                         try:
                             qcomp = (
-                                select(TodoCompletion.todo_id)
-                                .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                                .where(TodoCompletion.todo_id.in_(todo_ids))
-                                .where(CompletionType.name == 'default')
-                                .where(TodoCompletion.done == True)
+                                select(Todo.id)
+                                .where(Todo.id.in_(todo_ids))
+                                .where(Todo.is_done == True)
                             )
                             cres = await sess.exec(qcomp)
                             completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
@@ -8703,8 +7982,7 @@ async def html_index(request: Request):
                 # Determine the current user's Trash list id (if any) so we can exclude it from high-priority
                 trash_id = None
                 try:
-                    trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-                    trash_id = trq.first()
+                    trash_id = (await visibility.get(sess, current_user.id)).trash_list_id
                 except Exception:
                     trash_id = None
                 # Todos with priority >=7 in visible lists, newest modified first
@@ -9206,7 +8484,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
             completed_ids = set()
             if todo_ids:
                 try:
-                    qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                    qcomp = select(Todo.id).where(Todo.id.in_(todo_ids)).where(Todo.is_done == True)
                     cres = await sess.exec(qcomp)
                     completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                 except Exception:
@@ -9241,14 +8519,8 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                 uc_ids_all = [r[0] if isinstance(r, (list, tuple)) else int(getattr(r, 'list_id', r)) for r in quc.all()]
                 collation_ids = [lid for lid in uc_ids_all if lid in list_ids]
                 if collation_ids:
-                    qlinks = await sess.exec(
-                        select(ItemLink.src_id, ItemLink.tgt_id)
-                        .where(ItemLink.src_type == 'list')
-                        .where(ItemLink.tgt_type == 'todo')
-                        .where(ItemLink.src_id.in_(collation_ids))
-                        .where(ItemLink.owner_id == owner_id)
-                    )
-                    link_rows = qlinks.all()
+                    # list -> todo edges of the collations, from the per-user link graph
+                    link_rows = (await link_graph.get(sess, owner_id)).pairs('list', collation_ids, 'todo')
                     coll_link_map: dict[int, list[int]] = {}
                     linked_todo_ids: list[int] = []
                     for src_id, tgt_id in link_rows:
@@ -9269,7 +8541,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                             except Exception:
                                 continue
                         try:
-                            qlcomp = await sess.exec(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(linked_todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                            qlcomp = await sess.exec(select(Todo.id).where(Todo.id.in_(linked_todo_ids)).where(Todo.is_done == True))
                             linked_completed = set(r[0] if isinstance(r, tuple) else r for r in qlcomp.all())
                         except Exception:
                             linked_completed = set()
@@ -9305,7 +8577,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
             for lid, cnt in qcnt.all():
                 counts[lid] = int(cnt or 0)
             try:
-                qcomp = await sess.exec(select(Todo.id, Todo.list_id).join(TodoCompletion, TodoCompletion.todo_id == Todo.id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(Todo.list_id.in_(list_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                qcomp = await sess.exec(select(Todo.id, Todo.list_id).where(Todo.list_id.in_(list_ids)).where(Todo.is_done == True))
                 for tid, lid in qcomp.all():
                     counts[lid] = max(0, counts.get(lid, 0) - 1)
             except Exception:
@@ -9318,14 +8590,8 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                 uc_ids_all = [r[0] if isinstance(r, (list, tuple)) else int(getattr(r, 'list_id', r)) for r in quc.all()]
                 collation_ids = [lid for lid in uc_ids_all if lid in list_ids]
                 if collation_ids:
-                    qlinks = await sess.exec(
-                        select(ItemLink.src_id, ItemLink.tgt_id)
-                        .where(ItemLink.src_type == 'list')
-                        .where(ItemLink.tgt_type == 'todo')
-                        .where(ItemLink.src_id.in_(collation_ids))
-                        .where(ItemLink.owner_id == owner_id)
-                    )
-                    link_rows = qlinks.all()
+                    # list -> todo edges of the collations, from the per-user link graph
+                    link_rows = (await link_graph.get(sess, owner_id)).pairs('list', collation_ids, 'todo')
                     coll_link_map: dict[int, set[int]] = {}
                     all_linked_ids: set[int] = set()
                     for src_id, tgt_id in link_rows:
@@ -9337,7 +8603,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                         all_linked_ids.add(tid)
                     if all_linked_ids:
                         try:
-                            qlcomp = await sess.exec(select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(list(all_linked_ids))).where(CompletionType.name == 'default').where(TodoCompletion.done == True))
+                            qlcomp = await sess.exec(select(Todo.id).where(Todo.id.in_(list(all_linked_ids))).where(Todo.is_done == True))
                             linked_completed = set(r[0] if isinstance(r, tuple) else r for r in qlcomp.all())
                         except Exception:
                             linked_completed = set()
@@ -9423,7 +8689,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                         p['tags'] = pm.get(p['id'], [])
                 try:
                     if pin_ids:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(pin_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                        qcomp = select(Todo.id).where(Todo.id.in_(pin_ids)).where(Todo.is_done == True)
                         cres = await sess.exec(qcomp)
                         completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                     else:
@@ -9470,7 +8736,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
                         p['tags'] = pm.get(p['id'], [])
                 try:
                     if bm_ids:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(bm_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
+                        qcomp = select(Todo.id).where(Todo.id.in_(bm_ids)).where(Todo.is_done == True)
                         cres = await sess.exec(qcomp)
                         completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
                     else:
@@ -9483,8 +8749,7 @@ async def _prepare_index_context(request: Request, current_user: User | None) ->
             # but exclude lists that are direct children of user's Trash if present.
             qbl = select(ListState).where(ListState.owner_id == owner_id).where(ListState.bookmarked == True)
             try:
-                trq = await sess.scalars(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-                trash_id = trq.first()
+                trash_id = (await visibility.get(sess, owner_id)).trash_list_id
                 if trash_id is not None:
                     qbl = qbl.where(or_(ListState.parent_list_id == None, ListState.parent_list_id != trash_id))
             except Exception:
@@ -10019,19 +9284,8 @@ async def api_exec_fn(request: Request, payload: ExecFnRequest, current_user: Us
 
             # Compute completion status (reuse same logic as html_search)
             lm = {l.id: l.name for l in (await sess.scalars(select(ListState).where(ListState.id.in_(vis_ids)))).all()} if vis_ids else {}
-            todo_list_ids = list({t.list_id for t in todos_acc.values()})
-            default_ct_ids: dict[int, int] = {}
-            if todo_list_ids:
-                qct = select(CompletionType).where(CompletionType.list_id.in_(todo_list_ids)).where(CompletionType.name == 'default')
-                for ct in (await sess.exec(qct)).all():
-                    default_ct_ids[int(ct.list_id)] = int(ct.id)
-            todo_ids = list(todos_acc.keys())
-            completed_ids: set[int] = set()
-            if todo_ids and default_ct_ids:
-                qdone = select(TodoCompletion.todo_id, TodoCompletion.done, TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(TodoCompletion.completion_type_id.in_(list(default_ct_ids.values())))
-                for tid, done_val, ctid in (await sess.exec(qdone)).all():
-                    if done_val:
-                        completed_ids.add(int(tid))
+            # default completion status comes from the denormalized Todo.is_done
+            completed_ids: set[int] = {int(t.id) for t in todos_acc.values() if t.is_done}
 
             results['todos'] = [
                 {'id': t.id, 'text': t.text, 'note': t.note, 'list_id': t.list_id, 'list_name': lm.get(t.list_id), 'completed': (int(t.id) in completed_ids)}
@@ -10100,14 +9354,7 @@ async def api_create_category(request: Request, payload: CreateCategoryRequest,
         # determine position within this user's categories only
         pos = payload.position
         if pos is None:
-            qmax = await sess.exec(
-                select(Category)
-                .where(Category.owner_id == current_user.id)
-                .order_by(Category.position.desc())
-                .limit(1)
-            )
-            maxc = qmax.first()
-            pos = (maxc.position + 1) if maxc else 0
+            pos = await ordering.append_position(sess, ordering.category_siblings(current_user.id))
         # Always set the owner to the current user
         nc = Category(name=name, position=pos, sort_alphanumeric=False, owner_id=current_user.id)
         sess.add(nc)
@@ -10248,42 +9495,6 @@ class MoveCatRequest(BaseModel):
     direction: str
 
 
-async def _normalize_category_positions(sess, owner_id: int) -> list[Category]:
-    """Ensure Category.position values are contiguous (0..N-1) and unique for a single owner.
-    Returns categories for that owner ordered by position after normalization."""
-    cres = await sess.exec(
-        select(Category)
-        .where(Category.owner_id == owner_id)
-        .order_by(Category.position.asc(), Category.id.asc())
-    )
-    cats = cres.all()
-    changed = False
-    for idx, c in enumerate(cats):
-        try:
-            if c.position != idx:
-                await sess.exec(
-                    sqlalchemy_update(Category)
-                    .where(Category.id == c.id)
-                    .values(position=idx)
-                )
-                changed = True
-        except Exception:
-            # fallback: still attempt to continue normalizing others
-            logger.exception('normalize positions failed for cat_id=%s', getattr(c, 'id', None))
-    if changed:
-        try:
-            await sess.commit()
-        except Exception:
-            logger.exception('commit failed during category position normalization')
-    # re-read in normalized order
-    cres2 = await sess.exec(
-        select(Category)
-        .where(Category.owner_id == owner_id)
-        .order_by(Category.position.asc(), Category.id.asc())
-    )
-    return cres2.all()
-
-
 @app.post('/api/categories/{cat_id}/move')
 async def api_move_category(request: Request, cat_id: int, payload: MoveCatRequest, current_user: User = Depends(require_login)):
     """Move category up or down. Accepts JSON {direction: 'up'|'down'}."""
@@ -10318,42 +9529,16 @@ async def api_move_category(request: Request, cat_id: int, payload: MoveCatReque
             raise HTTPException(status_code=404, detail='category not found')
         if getattr(cur, 'owner_id', None) != current_user.id:
             raise HTTPException(status_code=403, detail='forbidden')
-        if direction == 'up':
-            qprev = await sess.exec(
-                select(Category)
-                .where(Category.owner_id == current_user.id)
-                .where(Category.position < cur.position)
-                .order_by(Category.position.desc())
-                .limit(1)
-            )
-            prev = qprev.first()
-            if prev:
-                cur_pos = cur.position
-                prev_pos = prev.position
-                logger.info('api_move_category: swapping up cat_id=%s cur_pos=%s prev_id=%s prev_pos=%s', cur.id, cur_pos, prev.id, prev_pos)
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == prev.id).values(position=cur_pos))
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == cur.id).values(position=prev_pos))
-                logger.info('api_move_category: swap executed for cat_id=%s', cur.id)
-        else:
-            qnext = await sess.exec(
-                select(Category)
-                .where(Category.owner_id == current_user.id)
-                .where(Category.position > cur.position)
-                .order_by(Category.position.asc())
-                .limit(1)
-            )
-            nxt = qnext.first()
-            if nxt:
-                cur_pos = cur.position
-                next_pos = nxt.position
-                logger.info('api_move_category: swapping down cat_id=%s cur_pos=%s next_id=%s next_pos=%s', cur.id, cur_pos, nxt.id, next_pos)
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == nxt.id).values(position=cur_pos))
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == cur.id).values(position=next_pos))
-                logger.info('api_move_category: swap executed for cat_id=%s', cur.id)
+        # usually a single-row UPDATE into the gap above/below the neighbour
+        moved = await ordering.move(sess, ordering.category_siblings(current_user.id), cur.id, direction)
+        logger.info('api_move_category: cat_id=%s direction=%s moved=%s', cur.id, direction, moved)
         await sess.commit()
-        # Normalize positions to avoid duplicates or gaps, then return list
-        cats2 = await _normalize_category_positions(sess, current_user.id)
-        after = [{'id': c.id, 'name': c.name, 'position': c.position} for c in cats2]
+        ares = await sess.exec(
+            select(Category.id, Category.name, Category.position)
+            .where(Category.owner_id == current_user.id)
+            .order_by(Category.position.asc(), Category.id.asc())
+        )
+        after = [{'id': cid, 'name': name, 'position': pos} for cid, name, pos in ares.all()]
         try:
             logger.info('api_move_category: before=%s after=%s',
                         [(x['id'], x['position']) for x in before],
@@ -10371,15 +9556,8 @@ async def create_category(request: Request, name: str = Form(...)):
     except HTTPException:
         return RedirectResponse(url='/html_no_js/login', status_code=303)
     async with async_session() as sess:
-        # determine max position for this user's categories and append
-        qmax = await sess.exec(
-            select(Category)
-            .where(Category.owner_id == current_user.id)
-            .order_by(Category.position.desc())
-            .limit(1)
-        )
-        maxc = qmax.first()
-        pos = (maxc.position + 1) if maxc else 0
+        # append after this user's last category
+        pos = await ordering.append_position(sess, ordering.category_siblings(current_user.id))
         nc = Category(name=name.strip()[:200], position=pos, owner_id=current_user.id)
         sess.add(nc)
         await sess.commit()
@@ -10451,39 +9629,9 @@ async def move_category(request: Request, cat_id: int, direction: str = Form(...
         cur = q.first()
         if not cur or getattr(cur, 'owner_id', None) != current_user.id:
             return RedirectResponse(url='/html_no_js/categories', status_code=303)
-        if direction == 'up':
-            # find previous (lower position) item
-            qprev = await sess.exec(
-                select(Category)
-                .where(Category.owner_id == current_user.id)
-                .where(Category.position < cur.position)
-                .order_by(Category.position.desc())
-                .limit(1)
-            )
-            prev = qprev.first()
-            if prev:
-                cur_pos = cur.position
-                prev_pos = prev.position
-                logger.info('move_category: swapping up cat_id=%s cur_pos=%s prev_id=%s prev_pos=%s', cur.id, cur_pos, prev.id, prev_pos)
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == prev.id).values(position=cur_pos))
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == cur.id).values(position=prev_pos))
-                logger.info('move_category: swap executed for cat_id=%s', cur.id)
-        elif direction == 'down':
-            qnext = await sess.exec(
-                select(Category)
-                .where(Category.owner_id == current_user.id)
-                .where(Category.position > cur.position)
-                .order_by(Category.position.asc())
-                .limit(1)
-            )
-            nxt = qnext.first()
-            if nxt:
-                cur_pos = cur.position
-                next_pos = nxt.position
-                logger.info('move_category: swapping down cat_id=%s cur_pos=%s next_id=%s next_pos=%s', cur.id, cur_pos, nxt.id, next_pos)
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == nxt.id).values(position=cur_pos))
-                await sess.exec(sqlalchemy_update(Category).where(Category.id == cur.id).values(position=next_pos))
-                logger.info('move_category: swap executed for cat_id=%s', cur.id)
+        if direction in ('up', 'down'):
+            moved = await ordering.move(sess, ordering.category_siblings(current_user.id), cur.id, direction)
+            logger.info('move_category: cat_id=%s direction=%s moved=%s', cur.id, direction, moved)
         await sess.commit()
     accept = (request.headers.get('Accept') or '')
     if 'application/json' in accept.lower():
@@ -10527,29 +9675,9 @@ async def html_search(request: Request):
             search_tags = []
         async with async_session() as sess:
             owner_id = current_user.id
-            # Resolve user's Trash list id and lists moved to Trash
-            trash_list_id: int | None = None
-            try:
-                q_trash = await sess.exec(select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash'))
-                trash_list_id = q_trash.first()
-                if isinstance(trash_list_id, tuple):
-                    trash_list_id = trash_list_id[0]
-            except Exception:
-                trash_list_id = None
-            trashed_list_ids: set[int] = set()
-            try:
-                q_ltrash = await sess.exec(select(ListTrashMeta.list_id))
-                for row in q_ltrash.all():
-                    try:
-                        lid = int(row[0] if isinstance(row, tuple) else row)
-                    except Exception:
-                        try:
-                            lid = int(getattr(row, 'list_id'))
-                        except Exception:
-                            continue
-                    trashed_list_ids.add(lid)
-            except Exception:
-                trashed_list_ids = set()
+            # Resolve user's Trash list id and the lists hidden by Trash
+            vis = await visibility.get(sess, owner_id)
+            hidden_list_ids = vis.hidden_list_ids
             # search lists visible to user by name
             qlists = select(ListState).where(ListState.owner_id == owner_id).where(ListState.name.ilike(like))
             if exclude_completed:
@@ -10558,11 +9686,8 @@ async def html_search(request: Request):
             lists_by_id: dict[int, ListState] = {}
             for l in rlists.all():
                 try:
-                    lid = getattr(l, 'id', None)
                     # Exclude lists moved to Trash or nested under Trash list
-                    if lid in trashed_list_ids:
-                        continue
-                    if trash_list_id is not None and getattr(l, 'parent_list_id', None) == trash_list_id:
+                    if getattr(l, 'id', None) in hidden_list_ids:
                         continue
                     lists_by_id[l.id] = l
                 except Exception:
@@ -10581,10 +9706,7 @@ async def html_search(request: Request):
                 rlh = await sess.exec(qlh)
                 for l in rlh.all():
                     try:
-                        lid = getattr(l, 'id', None)
-                        if lid in trashed_list_ids:
-                            continue
-                        if trash_list_id is not None and getattr(l, 'parent_list_id', None) == trash_list_id:
+                        if getattr(l, 'id', None) in hidden_list_ids:
                             continue
                         lists_by_id.setdefault(l.id, l)
                     except Exception:
@@ -10620,40 +9742,22 @@ async def html_search(request: Request):
                     'completed': getattr(l, 'completed', False),
                     'priority': getattr(l, 'priority', None),
                     'tags': sorted(list_tags_map.get(int(l.id), [])) if list_tags_map else [],
-                    'trashed': (int(l.id) in trashed_list_ids) or (trash_list_id is not None and getattr(l, 'parent_list_id', None) == trash_list_id),
+                    'trashed': vis.is_hidden(int(l.id)),
                 }
                 for l in lists_by_id.values()
                 # Already filtered by SQL when exclude_completed is True
                 if True
             ]
-            # search todos in visible lists
-            qvis = select(ListState).where((ListState.owner_id == owner_id) | (ListState.owner_id == None))
-            rvis = await sess.exec(qvis)
-            vis_ids = []
-            for l in rvis.all():
-                try:
-                    lid = getattr(l, 'id', None)
-                    # Exclude lists moved to trash, lists nested under Trash, and the Trash list itself
-                    if lid in trashed_list_ids:
-                        continue
-                    if trash_list_id is not None and (lid == trash_list_id or getattr(l, 'parent_list_id', None) == trash_list_id):
-                        continue
-                    vis_ids.append(lid)
-                except Exception:
-                    continue
+            # search todos in visible lists, excluding lists moved to trash,
+            # lists nested under Trash, and the Trash list itself
+            qvis = select(ListState.id).where((ListState.owner_id == owner_id) | (ListState.owner_id == None))
+            vis_ids = [lid for lid in (await sess.exec(qvis)).all() if lid not in hidden_list_ids]
             todos_acc: dict[int, Todo] = {}
             if vis_ids:
                 # text/note match
                 def not_completed_clause():
-                    subq = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, TodoCompletion.completion_type_id == CompletionType.id)
-                        .where(TodoCompletion.todo_id == Todo.id)
-                        .where(CompletionType.list_id == Todo.list_id)
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
-                    )
-                    return ~exists(subq)
+                    # denormalized default-completion state (app/completion_state.py)
+                    return Todo.is_done == False
                 qtodos = (
                     select(Todo)
                     .where(Todo.list_id.in_(vis_ids))
@@ -10689,19 +9793,8 @@ async def html_search(request: Request):
                 # include list name for display
                 lm = {l.id: l.name for l in (await sess.scalars(select(ListState).where(ListState.id.in_(vis_ids)))).all()}
                 # Compute default completion status per todo for strike-out and optional exclusion
-                todo_list_ids = list({t.list_id for t in todos_acc.values()})
-                default_ct_ids: dict[int, int] = {}
-                if todo_list_ids:
-                    qct = select(CompletionType).where(CompletionType.list_id.in_(todo_list_ids)).where(CompletionType.name == 'default')
-                    for ct in (await sess.exec(qct)).all():
-                        default_ct_ids[int(ct.list_id)] = int(ct.id)
-                todo_ids = list(todos_acc.keys())
-                completed_ids: set[int] = set()
-                if todo_ids and default_ct_ids:
-                    qdone = select(TodoCompletion.todo_id, TodoCompletion.done, TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(TodoCompletion.completion_type_id.in_(list(default_ct_ids.values())))
-                    for tid, done_val, ctid in (await sess.exec(qdone)).all():
-                        if done_val:
-                            completed_ids.add(int(tid))
+                # default completion status comes from the denormalized Todo.is_done
+                completed_ids: set[int] = {int(t.id) for t in todos_acc.values() if t.is_done}
                 # gather todo hashtags
                 todo_ids = list(todos_acc.keys())
                 todo_tags_map: dict[int, list[str]] = {}
@@ -10735,7 +9828,7 @@ async def html_search(request: Request):
                         'completed': (int(t.id) in completed_ids),
                         'priority': getattr(t, 'priority', None),
                         'tags': sorted(todo_tags_map.get(int(t.id), [])) if todo_tags_map else [],
-                        'trashed': (trash_list_id is not None and int(t.list_id) == int(trash_list_id)) or (int(t.list_id) in trashed_list_ids),
+                        'trashed': vis.is_hidden(int(t.list_id)),
                     }
                     # Already filtered by SQL when exclude_completed is True
                     for t in todos_acc.values()
@@ -11527,13 +10620,7 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
         try:
             if list_row.get("is_collation"):
                 # collect linked todo ids from ItemLink
-                q_linked = await sess.exec(
-                    select(ItemLink.tgt_id)
-                    .where(ItemLink.src_type == 'list')
-                    .where(ItemLink.src_id == list_id)
-                    .where(ItemLink.tgt_type == 'todo')
-                )
-                linked_ids_all = [int(v) for v in q_linked.all() if v is not None]
+                linked_ids_all = [e.tgt_id for e in (await link_graph.get(sess, current_user.id)).outgoing('list', list_id) if e.tgt_type == 'todo']
                 if linked_ids_all:
                     existing_ids = {int(r['id']) for r in todo_rows}
                     new_ids = [tid for tid in linked_ids_all if tid not in existing_ids]
@@ -11594,12 +10681,7 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
                     try:
                         all_ids = [int(r['id']) for r in todo_rows]
                         if all_ids:
-                            qdef = await sess.exec(
-                                select(TodoCompletion.todo_id, TodoCompletion.done)
-                                .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                                .where(CompletionType.name == 'default')
-                                .where(TodoCompletion.todo_id.in_(all_ids))
-                            )
+                            qdef = await sess.exec(select(Todo.id, Todo.is_done).where(Todo.id.in_(all_ids)))
                             def_map = {}
                             for tid, done_val in qdef.all():
                                 try:
@@ -11643,33 +10725,7 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
                 list_row["parent_list_name"] = None
     # also pass completion types for management UI
         completion_types = [{'id': c.id, 'name': c.name} for c in ctypes]
-        # fetch this user's hashtags for completion suggestions (from lists and todos they own)
-        owner_id_val = current_user.id
-        # tags from lists owned by the user
-        q_user_list_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id)
-            .join(ListState, ListState.id == ListHashtag.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_list_tags = await sess.exec(q_user_list_tags)
-        # tags from todos in lists owned by the user
-        q_user_todo_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id)
-            .join(Todo, Todo.id == TodoHashtag.todo_id)
-            .join(ListState, ListState.id == Todo.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_todo_tags = await sess.exec(q_user_todo_tags)
-        _all_rows = list(r_user_list_tags.all()) + list(r_user_todo_tags.all())
-        all_hashtags: list[str] = []
-        for row in _all_rows:
-            val = row[0] if isinstance(row, (tuple, list)) else row
-            if isinstance(val, str) and val and val not in all_hashtags:
-                all_hashtags.append(val)
+        # hashtag suggestions are fetched by the page from /api/hashtags/vocab
         # fetch categories for assignment UI (ordered by position)
         try:
             qcat = select(Category).where(Category.owner_id == current_user.id).order_by(Category.position.asc())
@@ -11737,11 +10793,9 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
                     if todo_ids:
                         try:
                             qcomp = (
-                                select(TodoCompletion.todo_id)
-                                .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                                .where(TodoCompletion.todo_id.in_(todo_ids))
-                                .where(CompletionType.name == 'default')
-                                .where(TodoCompletion.done == True)
+                                select(Todo.id)
+                                .where(Todo.id.in_(todo_ids))
+                                .where(Todo.is_done == True)
                             )
                             cres = await sess.exec(qcomp)
                             completed_ids = set(int(r[0] if isinstance(r, tuple) else r) for r in cres.all())
@@ -11810,9 +10864,7 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
     # Fetch outgoing links from this list (to todos or lists), order by position then created_at
         links: list[dict] = []
         try:
-            qlnk = select(ItemLink).where(ItemLink.src_type == 'list').where(ItemLink.src_id == list_id).order_by(ItemLink.position.asc().nullslast(), ItemLink.created_at.asc())
-            rlnk = await sess.exec(qlnk)
-            rows = rlnk.all()
+            rows = await outgoing_links(sess, lst.owner_id, 'list', list_id)
             # Preload names/texts for targets in batch
             todo_targets = [r.tgt_id for r in rows if r.tgt_type == 'todo']
             list_targets = [r.tgt_id for r in rows if r.tgt_type == 'list']
@@ -11898,19 +10950,12 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
             # Exclude collations that are currently in the user's Trash
             trashed: set[int] = set()
             if col_ids:
-                trash_id = None
+                # lists moved to Trash (or below one); cached per user
                 try:
-                    q_trash = await sess.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-                    trash_id = q_trash.first()
+                    vis = await visibility.get(sess, current_user.id)
+                    trashed = {int(v) for v in col_ids if int(v) in vis.trashed_list_ids}
                 except Exception:
-                    trash_id = None
-                if trash_id is not None:
-                    q_tr = await sess.scalars(
-                        select(ListState.id)
-                        .where(ListState.id.in_(col_ids))
-                        .where(ListState.parent_list_id == trash_id)
-                    )
-                    trashed = set(int(v) for v in q_tr.all())
+                    trashed = set()
             if ENABLE_VERBOSE_DEBUG:
                 try:
                     logger.info('collation-debug(list:%s,user:%s): trashed_ids=%s', list_id, getattr(current_user, 'id', None), sorted(list(trashed)))
@@ -11935,14 +10980,11 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
                 todo_ids = []
             if todo_ids and active_collations:
                 ac_ids = [int(c['list_id']) for c in active_collations]
-                q_links = await sess.exec(
-                    select(ItemLink.src_id, ItemLink.tgt_id)
-                    .where(ItemLink.src_type == 'list')
-                    .where(ItemLink.tgt_type == 'todo')
-                    .where(ItemLink.tgt_id.in_(todo_ids))
-                    .where(ItemLink.src_id.in_(ac_ids))
-                )
-                for src_id, tgt_id in q_links.all():
+                page_todo_ids = set(todo_ids)
+                link_pairs = (await link_graph.get(sess, current_user.id)).pairs('list', ac_ids, 'todo')
+                for src_id, tgt_id in link_pairs:
+                    if tgt_id not in page_todo_ids:
+                        continue
                     try:
                         tid = int(tgt_id); lid = int(src_id)
                     except Exception:
@@ -12015,6 +11057,23 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
     except Exception:
         # Fail safe: leave ordering untouched if any unexpected structure occurs.
         original_priority_order = []
+    # Pre-render todo rows through the fragment cache; unchanged rows are
+    # reused from earlier views instead of being rendered again.
+    try:
+        render_todo_rows(
+            TEMPLATES.env,
+            todo_rows,
+            variant='li' if list_row.get('hide_icons') else 'table',
+            list_row=list_row,
+            client_tz=client_tz,
+            csrf_token=csrf_token,
+            completion_types=completion_types,
+            active_collations=active_collations,
+            todo_collation_linked={int(k): list(v) for k, v in todo_collation_linked.items()},
+            date_order=config.DATE_ORDER,
+        )
+    except Exception:
+        logger.exception('todo row fragment rendering failed for list %s', list_id)
     return TEMPLATES.TemplateResponse(
         request,
         "list.html",
@@ -12025,7 +11084,6 @@ async def html_view_list(request: Request, list_id: int, current_user: User = De
             "csrf_token": csrf_token,
             "client_tz": client_tz,
             "completion_types": completion_types,
-            "all_hashtags": all_hashtags,
             "categories": categories,
             "sublists": sublists,
             "links": links,
@@ -12066,8 +11124,10 @@ async def api_lookup_names(request: Request, current_user: User = Depends(requir
     Query params:
     - todos=1,2,3
     - lists=4,5
+    - tags=#pre (optional) also returns the user's hashtags starting with that
+      prefix, most used first, read from UserHashtagStats
 
-    Response: { ok: true, todos: {"1": "todo text"}, lists: {"4": "list name"} }
+    Response: { ok: true, todos: {"1": "todo text"}, lists: {"4": "list name"}[, tags: [{tag, count}]] }
     """
     # Parse query params into integer ID lists
     def _parse_ids(val: str | None) -> list[int]:
@@ -12091,9 +11151,23 @@ async def api_lookup_names(request: Request, current_user: User = Depends(requir
 
     todos_map: dict[str, str] = {}
     lists_map: dict[str, str] = {}
+    tag_prefix = request.query_params.get('tags')
+    extra: dict = {}
+    if tag_prefix is not None:
+        tag_prefix = tag_prefix.strip()
+        if tag_prefix and not tag_prefix.startswith('#'):
+            tag_prefix = '#' + tag_prefix
+        tags_out: list[dict] = []
+        try:
+            async with async_session() as sess:
+                rows = await user_hashtag_stats(sess, current_user.id, order='top', limit=20, prefix=tag_prefix.lower() or None)
+            tags_out = [{'tag': r['tag'], 'count': r['list_count'] + r['todo_count']} for r in rows]
+        except Exception:
+            pass
+        extra['tags'] = tags_out
 
     if not todo_ids and not list_ids:
-        return JSONResponse({'ok': True, 'todos': todos_map, 'lists': lists_map})
+        return JSONResponse({'ok': True, 'todos': todos_map, 'lists': lists_map, **extra})
 
     try:
         async with async_session() as sess:
@@ -12123,154 +11197,31 @@ async def api_lookup_names(request: Request, current_user: User = Depends(requir
         # best-effort; do not fail callers if a transient DB error occurs
         pass
 
-    return JSONResponse({'ok': True, 'todos': todos_map, 'lists': lists_map})
+    return JSONResponse({'ok': True, 'todos': todos_map, 'lists': lists_map, **extra})
 
 
 @app.get('/html_no_js/hashtags', response_class=HTMLResponse)
 async def html_no_js_hashtags(request: Request, current_user: User = Depends(require_login)):
     """List all hashtags the user has ever created/used.
 
-    Adds a lazy backfill step: if there are hashtags currently linked to the user's
-    lists or todos but missing from UserHashtag (e.g. created before ownership tracking
-    was added, or introduced through older code paths), we insert those ownership rows
-    first. This keeps migration seamless without requiring an explicit one-off script
-    run in production.
-    """
-    async with async_session() as sess:
-        hashtags: list[Hashtag] = []
-        try:
-            # 1. Gather hashtag ids from list associations owned by user
-            # Also consider public (owner_id IS NULL) lists as visible sources; user should "own" tags they can see.
-            q_list_hids = (
-                select(ListHashtag.hashtag_id)
-                .join(ListState, ListState.id == ListHashtag.list_id)
-                .where(or_(ListState.owner_id == current_user.id, ListState.owner_id == None))
-            )
-            res_lh = await sess.exec(q_list_hids)
-            list_hids = set()
-            for row in res_lh.all():
-                if isinstance(row, (tuple, list)):
-                    hid = row[0]
-                else:
-                    hid = row
-                if hid is not None:
-                    try:
-                        list_hids.add(int(hid))
-                    except Exception:
-                        continue
-
-            # 2. Gather hashtag ids from todo associations via lists owned by user
-            q_todo_hids = (
-                select(TodoHashtag.hashtag_id)
-                .join(Todo, Todo.id == TodoHashtag.todo_id)
-                .join(ListState, ListState.id == Todo.list_id)
-                .where(or_(ListState.owner_id == current_user.id, ListState.owner_id == None))
-            )
-            res_th = await sess.exec(q_todo_hids)
-            todo_hids = set()
-            for row in res_th.all():
-                if isinstance(row, (tuple, list)):
-                    hid = row[0]
-                else:
-                    hid = row
-                if hid is not None:
-                    try:
-                        todo_hids.add(int(hid))
-                    except Exception:
-                        continue
+    Reads the precomputed UserHashtagStats table (see app/hashtag_stats.py)
+    instead of aggregating link tables per request; the GET never writes.
+    Ownership rows for tags that are linked but not yet owned (older data)
+    are backfilled by the leader's background rebuild.
 
-            all_assoc_hids = list_hids | todo_hids
-            missing: set[int] = set()
-            if all_assoc_hids:
-                # 3. Fetch existing ownership for those ids
-                q_owned = select(UserHashtag.hashtag_id).where(UserHashtag.user_id == current_user.id).where(UserHashtag.hashtag_id.in_(all_assoc_hids))
-                res_owned = await sess.exec(q_owned)
-                owned_ids = set()
-                for row in res_owned.all():
-                    if isinstance(row, (tuple, list)):
-                        hid = row[0]
-                    else:
-                        hid = row
-                    if hid is None:
-                        continue
-                    try:
-                        owned_ids.add(int(hid))
-                    except Exception:
-                        continue
-                missing = all_assoc_hids - owned_ids
-            # 4. Insert missing ownership rows (best-effort)
-            if missing:
-                logger.info('hashtags page: attempting ownership insert user_id=%s missing_count=%s ids_sample=%s', current_user.id, len(missing), list(sorted(missing))[:10])
-                for hid in missing:
-                    try:
-                        sess.add(UserHashtag(user_id=current_user.id, hashtag_id=hid))
-                    except Exception:
-                        continue
-                try:
-                    await sess.commit()
-                except IntegrityError:
-                    logger.warning('hashtags page: integrity error inserting ownership user_id=%s', current_user.id)
-                    await sess.rollback()
-                except Exception:
-                    logger.exception('hashtags page: unexpected error inserting ownership user_id=%s', current_user.id)
-                else:
-                    try:
-                        post_cnt = await sess.exec(select(sqlalchemy_func.count(UserHashtag.hashtag_id)).where(UserHashtag.user_id == current_user.id))
-                        logger.info('hashtags page: ownership insert complete user_id=%s new_total=%s', current_user.id, post_cnt.one()[0])
-                    except Exception:
-                        pass
-            # 5. Now query all user-owned hashtags
-            q = (
-                select(Hashtag)
-                .join(UserHashtag, UserHashtag.hashtag_id == Hashtag.id)
-                .where(UserHashtag.user_id == current_user.id)
-                .order_by(Hashtag.tag.asc())
-            )
-            res2 = await sess.exec(q)
-            hashtags = res2.all()
-            if not hashtags:
-                try:
-                    # extra diagnostic counts
-                    cnt_user = await sess.exec(select(sqlalchemy_func.count(UserHashtag.hashtag_id)).where(UserHashtag.user_id == current_user.id))
-                    user_cnt = cnt_user.one()[0]
-                    cnt_assoc = len(all_assoc_hids)
-                    logger.info('hashtags page debug: user_id=%s user_hashtag_rows=%s assoc_hids=%s missing=%s', current_user.id, user_cnt, cnt_assoc, len(missing))
-                    # Stronger fallback path: if there are association ids, attempt direct fetch
-                    if cnt_assoc > 0:
-                        # fetch hashtags by association ids directly
-                        assoc_fetch = await sess.exec(select(Hashtag).where(Hashtag.id.in_(all_assoc_hids)).order_by(Hashtag.tag.asc()))
-                        assoc_tags = assoc_fetch.all()
-                        if assoc_tags:
-                            # ensure ownership rows exist one-by-one (idempotent)
-                            for h in assoc_tags:
-                                try:
-                                    sess.add(UserHashtag(user_id=current_user.id, hashtag_id=int(h.id)))
-                                except Exception:
-                                    pass
-                            try:
-                                await sess.commit()
-                            except IntegrityError:
-                                await sess.rollback()
-                            hashtags = assoc_tags  # use as display fallback now
-                            logger.info('hashtags page fallback populated %s tags directly from associations for user_id=%s', len(hashtags), current_user.id)
-                except Exception:
-                    pass
-        except Exception:
-            logger.exception('failed to load/backfill user-owned hashtags id=%s', getattr(current_user, 'id', None))
-            hashtags = []
-    from .auth import create_csrf_token
-    csrf_token = create_csrf_token(current_user.username)
+    Query params:
+    - sort=tag (default) | top | recent
+    - nobackfill=1 shows raw UserHashtag ownership without touching the stats
+    """
     qp = request.query_params
     debug_flag = str(qp.get('debug','')).lower() in ('1','true','yes')
     nobackfill = str(qp.get('nobackfill','')).lower() in ('1','true','yes')
-    if nobackfill:
-        # When nobackfill is requested, re-run the selection but SKIP the ownership insertion logic.
-        # We achieve this by re-querying purely user-owned hashtags WITHOUT attempting to insert missing ownership.
-        # If the earlier logic inserted ownership already in this request, it will still appear; for a true
-        # baseline view, load with nobackfill=1 on a cold start (before visiting without the flag).
-        try:
-            # direct user-owned only
-            async with async_session() as sess:
+    sort = qp.get('sort') if qp.get('sort') in ('tag', 'top', 'recent') else 'tag'
+    hashtags: list = []
+    try:
+        async with async_session() as sess:
+            if nobackfill:
+                # direct user-owned only; no rebuild/backfill side effects
                 q_nb = (
                     select(Hashtag)
                     .join(UserHashtag, UserHashtag.hashtag_id == Hashtag.id)
@@ -12278,10 +11229,68 @@ async def html_no_js_hashtags(request: Request, current_user: User = Depends(req
                     .order_by(Hashtag.tag.asc())
                 )
                 res_nb = await sess.exec(q_nb)
-                hashtags = res_nb.all()
-        except Exception:
-            pass
-    return TEMPLATES.TemplateResponse(request, 'hashtags.html', {'request': request, 'hashtags': hashtags, 'csrf_token': csrf_token, 'current_user': current_user, 'debug': debug_flag, 'nobackfill': nobackfill})
+                hashtags = [{'id': h.id, 'tag': h.tag, 'list_count': 0, 'todo_count': 0, 'last_used_at': None} for h in res_nb.all()]
+            else:
+                hashtags = await user_hashtag_stats(sess, current_user.id, order=sort)
+    except Exception:
+        logger.exception('failed to load user-owned hashtags id=%s', getattr(current_user, 'id', None))
+        hashtags = []
+    from .auth import create_csrf_token
+    csrf_token = create_csrf_token(current_user.username)
+    return TEMPLATES.TemplateResponse(request, 'hashtags.html', {'request': request, 'hashtags': hashtags, 'csrf_token': csrf_token, 'current_user': current_user, 'debug': debug_flag, 'nobackfill': nobackfill, 'sort': sort})
+
+
+@app.get('/api/hashtags/stats')
+async def api_hashtag_stats(request: Request, current_user: User = Depends(require_login)):
+    """Return the current user's hashtags with usage counters.
+
+    Query params: order=tag|top|recent (default top), limit (default 50, max
+    500), prefix (optional, e.g. "#sh").
+    """
+    qp = request.query_params
+    order = qp.get('order') if qp.get('order') in ('tag', 'top', 'recent') else 'top'
+    try:
+        limit = max(1, min(500, int(qp.get('limit') or 50)))
+    except Exception:
+        limit = 50
+    prefix = qp.get('prefix') or None
+    async with async_session() as sess:
+        rows = await user_hashtag_stats(sess, current_user.id, order=order, limit=limit, prefix=prefix)
+    for r in rows:
+        lu = r.get('last_used_at')
+        r['last_used_at'] = lu.isoformat() if hasattr(lu, 'isoformat') else lu
+    return JSONResponse({'ok': True, 'order': order, 'hashtags': rows})
+
+
+@app.get('/api/hashtags/vocab')
+async def api_hashtag_vocab(request: Request, current_user: User = Depends(require_login)):
+    """Return the current user's hashtag suggestion vocabulary (sorted).
+
+    Query params: prefix (optional, e.g. "#sh" or "sh"), limit (optional).
+    Carries an ETag that only changes with the vocabulary; a matching
+    If-None-Match gets 304, so clients can revalidate instead of refetching.
+    The list and todo pages load their tag suggestions from here
+    (static/no_js/hashtag_vocab.js) rather than inlining them.
+    """
+    import hashlib
+    from fastapi.responses import Response
+    qp = request.query_params
+    prefix = qp.get('prefix') or None
+    try:
+        limit = max(1, int(qp.get('limit'))) if qp.get('limit') else None
+    except Exception:
+        limit = None
+    async with async_session() as sess:
+        vocab = await hashtag_vocab.get(sess, current_user.id)
+    etag = vocab.etag
+    if prefix or limit:
+        # a filtered reply is a different representation of the same version
+        etag = f'{etag[:-1]}-{hashlib.sha1(f"{prefix}|{limit}".encode("utf-8")).hexdigest()[:8]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Authorization, Cookie'}
+    inm = request.headers.get('if-none-match') or ''
+    if etag in [t.strip() for t in inm.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({'ok': True, 'etag': vocab.etag, 'count': len(vocab), 'tags': vocab.prefix(prefix, limit)}, headers=headers)
 
 
 @app.post('/html_no_js/hashtags/delete')
@@ -12408,6 +11417,7 @@ async def html_no_js_hashtags_delete(request: Request, current_user: User = Depe
                     await sess.exec(sa_delete(TodoHashtag).where(TodoHashtag.hashtag_id.in_(ids)))
                     await sess.exec(sa_delete(Hashtag).where(Hashtag.id.in_(ids)))
                     await sess.commit()
+                    hashtag_cache.discard_ids(ids)
                     try:
                         chk = await sess.exec(select(Hashtag.id).where(Hashtag.id.in_(ids)))
                         remaining = [int(r[0] if isinstance(r,(tuple,list)) else r) for r in chk.all()]
@@ -12829,57 +11839,33 @@ async def html_recent_lists(request: Request, current_user: User = Depends(requi
     except Exception:
         top_n = 10
     async with async_session() as sess:
-        # First fetch top-N positioned rows ordered by position ASC
-        top_q = select(RecentListVisit).where(RecentListVisit.user_id == current_user.id).where(RecentListVisit.position != None).order_by(RecentListVisit.position.asc()).limit(top_n)
-        top_res = await sess.exec(top_q)
-        top_rows = top_res.all()
-        top_ids = [r.list_id for r in top_rows]
-
+        # Recent lists come from the visit buffer view (stored rows plus
+        # not-yet-flushed visits): top-N by position, then by visited_at.
         results: list[dict] = []
         list_ids: list[int] = []
         tags_map: dict[int, list[str]] = {}
 
-        # load ListState for top rows preserving order
-        if top_ids:
-            qlists = select(ListState).where(ListState.id.in_(top_ids))
-            lres = await sess.exec(qlists)
-            lmap = {l.id: l for l in lres.all()}
-            for r in top_rows:
-                lst = lmap.get(r.list_id)
-                if lst:
-                    results.append({
-                        'id': lst.id,
-                        'name': lst.name,
-                        'completed': getattr(lst, 'completed', False),
-                        'created_at': getattr(lst, 'created_at', None),
-                        'modified_at': getattr(lst, 'modified_at', None),
-                        'visited_at': r.visited_at,
-                        'position': r.position,
-                        'hashtags': [],
-                    })
-                    list_ids.append(lst.id)
-
-        # If we still need more, fetch others ordered by visited_at desc excluding top_ids
-        remaining = max(0, 25 - len(results))
-        if remaining > 0:
-            q = select(ListState, RecentListVisit.visited_at).join(RecentListVisit, RecentListVisit.list_id == ListState.id).where(RecentListVisit.user_id == current_user.id).where(ListState.parent_todo_id == None)
-            if top_ids:
-                q = q.where(RecentListVisit.list_id.notin_(top_ids))
-            q = q.order_by(RecentListVisit.visited_at.desc()).limit(remaining)
-            res = await sess.exec(q)
-            other_rows = res.all()
-            for lst, visited_at in other_rows:
-                results.append({
-                    'id': lst.id,
-                    'name': lst.name,
-                    'completed': getattr(lst, 'completed', False),
-                    'created_at': getattr(lst, 'created_at', None),
-                    'modified_at': getattr(lst, 'modified_at', None),
-                    'visited_at': visited_at,
-                    'position': None,
-                    'hashtags': [],
-                })
-                list_ids.append(lst.id)
+        async def _load_lists(sess, ids):
+            lres = await sess.exec(select(ListState).where(ListState.id.in_(ids)))
+            return {l.id: l for l in lres.all()}
+
+        # sublists of todos only show when pinned in the top-N
+        rows = await _recent_visited(
+            sess, list_visits, current_user.id, 25, top_n, _load_lists,
+            keep=lambda lst, pos: pos is not None or lst.parent_todo_id is None,
+        )
+        for lst, visited_at, pos in rows:
+            results.append({
+                'id': lst.id,
+                'name': lst.name,
+                'completed': getattr(lst, 'completed', False),
+                'created_at': getattr(lst, 'created_at', None),
+                'modified_at': getattr(lst, 'modified_at', None),
+                'visited_at': visited_at,
+                'position': pos,
+                'hashtags': [],
+            })
+            list_ids.append(lst.id)
 
         # fetch hashtags for all list_ids we've collected
         if list_ids:
@@ -12900,55 +11886,31 @@ async def html_recent_lists(request: Request, current_user: User = Depends(requi
         try:
             top_n_t = int(os.getenv('RECENT_TODOS_TOP_N', str(top_n)))
         except Exception:
-            top_n_t = top_n
-        # First: top positioned todos
-        t_top_q = select(RecentTodoVisit).where(RecentTodoVisit.user_id == current_user.id).where(RecentTodoVisit.position != None).order_by(RecentTodoVisit.position.asc()).limit(top_n_t)
-        t_top_res = await sess.exec(t_top_q)
-        t_top_rows = t_top_res.all()
-        t_top_ids = [r.todo_id for r in t_top_rows]
-        todo_results: list[dict] = []
-        todo_ids: list[int] = []
-        t_tags_map: dict[int, list[str]] = {}
-        # load Todo rows for top preserving order; ensure user can view via parent list
-        if t_top_ids:
-            qtodos = select(Todo, ListState).join(ListState, ListState.id == Todo.list_id).where(Todo.id.in_(t_top_ids)).where(or_(ListState.owner_id == current_user.id, ListState.owner_id == None))
-            t_res = await sess.exec(qtodos)
-            # map id -> (todo, list)
-            tmap = {t.id: (t, l) for t, l in t_res.all()}
-            for r in t_top_rows:
-                row = tmap.get(r.todo_id)
-                if not row:
-                    continue
-                t, l = row
-                todo_results.append({
-                    'id': t.id,
-                    'text': t.text,
-                    'list_id': t.list_id,
-                    'list_name': getattr(l, 'name', None),
-                    'visited_at': r.visited_at,
-                    'position': r.position,
-                    'hashtags': [],
-                })
-                todo_ids.append(int(t.id))
-        # Remaining by visited_at desc
-        t_remaining = max(0, 25 - len(todo_results))
-        if t_remaining > 0:
-            tq = select(Todo, RecentTodoVisit, ListState).join(RecentTodoVisit, RecentTodoVisit.todo_id == Todo.id).join(ListState, ListState.id == Todo.list_id).where(RecentTodoVisit.user_id == current_user.id).where(or_(ListState.owner_id == current_user.id, ListState.owner_id == None))
-            if t_top_ids:
-                tq = tq.where(RecentTodoVisit.todo_id.notin_(t_top_ids))
-            tq = tq.order_by(RecentTodoVisit.visited_at.desc()).limit(t_remaining)
-            tres = await sess.exec(tq)
-            for t, rvisit, l in tres.all():
-                todo_results.append({
-                    'id': t.id,
-                    'text': t.text,
-                    'list_id': t.list_id,
-                    'list_name': getattr(l, 'name', None),
-                    'visited_at': rvisit.visited_at,
-                    'position': None,
-                    'hashtags': [],
-                })
-                todo_ids.append(int(t.id))
+            top_n_t = top_n
+        # Recent todos through the visit buffer, mirroring lists
+        todo_results: list[dict] = []
+        todo_ids: list[int] = []
+        t_tags_map: dict[int, list[str]] = {}
+
+        async def _load_todos(sess, ids):
+            # ensure user can view via parent list
+            qtodos = select(Todo, ListState).join(ListState, ListState.id == Todo.list_id).where(Todo.id.in_(ids)).where(or_(ListState.owner_id == current_user.id, ListState.owner_id == None))
+            t_res = await sess.exec(qtodos)
+            # map id -> (todo, list)
+            return {t.id: (t, l) for t, l in t_res.all()}
+
+        t_rows = await _recent_visited(sess, todo_visits, current_user.id, 25, top_n_t, _load_todos)
+        for (t, l), visited_at, pos in t_rows:
+            todo_results.append({
+                'id': t.id,
+                'text': t.text,
+                'list_id': t.list_id,
+                'list_name': getattr(l, 'name', None),
+                'visited_at': visited_at,
+                'position': pos,
+                'hashtags': [],
+            })
+            todo_ids.append(int(t.id))
     # Fetch hashtags for todos
         if todo_ids:
             try:
@@ -12973,11 +11935,9 @@ async def html_recent_lists(request: Request, current_user: User = Depends(requi
             completed_ids: set[int] = set()
             if todo_ids:
                 qcomp = (
-                    select(TodoCompletion.todo_id)
-                    .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                    .where(TodoCompletion.todo_id.in_(todo_ids))
-                    .where(CompletionType.name == 'default')
-                    .where(TodoCompletion.done == True)
+                    select(Todo.id)
+                    .where(Todo.id.in_(todo_ids))
+                    .where(Todo.is_done == True)
                 )
                 for tid_done in (await sess.exec(qcomp)).all():
                     try:
@@ -13047,11 +12007,9 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                 completed_ids: set[int] = set()
                 if todo_ids:
                     qcomp = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                        .where(TodoCompletion.todo_id.in_(todo_ids))
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
+                        select(Todo.id)
+                        .where(Todo.id.in_(todo_ids))
+                        .where(Todo.is_done == True)
                     )
                     cres = await sess.exec(qcomp)
                     completed_ids = set(int(r[0] if isinstance(r, tuple) else r) for r in cres.all())
@@ -13096,16 +12054,22 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                 pass
             return override
 
+        # All of the owner's lists grouped by parent_list_id, loaded on first
+        # use so the recursion below does not run one SELECT per tree node.
+        # Top-level entries (key None) exclude sublists owned by todos.
+        children_by_parent: dict[int | None, list] | None = None
+
         # fetch children lists for a given parent_list_id
         async def fetch_children(parent_id: int | None, include_todos_override: bool | None = None) -> list[dict]:
-            q = select(ListState).where(ListState.owner_id == owner_id)
-            if parent_id is None:
-                q = q.where(ListState.parent_list_id == None).where(ListState.parent_todo_id == None)
-            else:
-                q = q.where(ListState.parent_list_id == parent_id)
-            q = q.order_by(ListState.created_at.asc())
-            r = await sess.exec(q)
-            rows = r.all()
+            nonlocal children_by_parent
+            if children_by_parent is None:
+                children_by_parent = {}
+                r = await sess.exec(select(ListState).where(ListState.owner_id == owner_id).order_by(ListState.created_at.asc()))
+                for l in r.all():
+                    if l.parent_list_id is None and l.parent_todo_id is not None:
+                        continue
+                    children_by_parent.setdefault(l.parent_list_id, []).append(l)
+            rows = list(children_by_parent.get(parent_id, []))
             ids = [int(l.id) for l in rows if l.id is not None]
             # hashtags
             tag_map: dict[int, list[str]] = {}
@@ -13141,17 +12105,7 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                 todos = t_exec.all()
                 # completion map by default completion type
                 t_ids = [int(t.id) for t in todos]
-                completed: set[int] = set()
-                if t_ids:
-                    qcomp2 = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                        .where(TodoCompletion.todo_id.in_(t_ids))
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
-                    )
-                    comp_rows = await sess.exec(qcomp2)
-                    completed = set(int(v[0] if isinstance(v, tuple) else v) for v in comp_rows.all())
+                completed: set[int] = {int(t.id) for t in todos if t.is_done}
                 t_by_list: dict[int, list] = {}
                 for t in todos:
                     try:
@@ -13308,17 +12262,7 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                     t_exec = await sess.exec(select(Todo).where(Todo.list_id == int(lst.id)).order_by(Todo.created_at.asc()))
                     trows = t_exec.all()
                     t_ids = [int(t.id) for t in trows]
-                    completed: set[int] = set()
-                    if t_ids:
-                        qcomp3 = (
-                            select(TodoCompletion.todo_id)
-                            .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                            .where(TodoCompletion.todo_id.in_(t_ids))
-                            .where(CompletionType.name == 'default')
-                            .where(TodoCompletion.done == True)
-                        )
-                        comp_rows = await sess.exec(qcomp3)
-                        completed = set(int(v[0] if isinstance(v, tuple) else v) for v in comp_rows.all())
+                    completed: set[int] = {int(t.id) for t in trows if t.is_done}
                     node['todos'] = [{ 'id': int(t.id), 'text': t.text, 'priority': getattr(t, 'priority', None), 'completed': int(t.id) in completed, 'child_lists': [] } for t in trows]
                     if t_ids and not roots:
                         q_subs = (
@@ -13380,19 +12324,7 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                 parent_list = await sess.get(ListState, int(getattr(t, 'list_id')))
                 if not parent_list or int(getattr(parent_list, 'owner_id', -1)) != int(owner_id):
                     raise HTTPException(status_code=404, detail='todo not accessible')
-                completed = False
-                try:
-                    qcomp = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                        .where(TodoCompletion.todo_id == int(t.id))
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
-                    )
-                    cres = await sess.exec(qcomp)
-                    completed = (cres.first() is not None)
-                except Exception:
-                    completed = False
+                completed = bool(getattr(t, 'is_done', False))
                 node = {
                     'id': int(t.id),
                     'text': t.text,
@@ -13524,11 +12456,9 @@ async def html_tree_view(request: Request, root_list_id: int | None = None, show
                 completed: set[int] = set()
                 if t_ids:
                     qcomp3 = (
-                        select(TodoCompletion.todo_id)
-                        .join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id)
-                        .where(TodoCompletion.todo_id.in_(t_ids))
-                        .where(CompletionType.name == 'default')
-                        .where(TodoCompletion.done == True)
+                        select(Todo.id)
+                        .where(Todo.id.in_(t_ids))
+                        .where(Todo.is_done == True)
                     )
                     comp_rows = await sess.exec(qcomp3)
                     completed = set(int(v[0] if isinstance(v, tuple) else v) for v in comp_rows.all())
@@ -14513,6 +13443,10 @@ async def html_view_trash(request: Request, current_user: User = Depends(require
             # also include lists that were moved under the Trash list (parent_list_id == trash.id)
             ql = await sess.exec(select(ListState).where(ListState.parent_list_id == trash.id).order_by(ListState.modified_at.desc()))
             lists = ql.all()
+            try:
+                await prefetch_fn_link_labels(sess, [t.note for t in todos])
+            except Exception:
+                logger.exception('fn:link prefetch failed for trash page')
         # render a simple trash page
         csrf = None
         try:
@@ -14737,276 +13671,13 @@ async def html_permanent_delete_trash(request: Request, todo_id: int, current_us
 
 @app.get('/html_no_js/todos/{todo_id}', response_class=HTMLResponse)
 async def html_view_todo(request: Request, todo_id: int, current_user: User = Depends(require_login)):
-    async with async_session() as sess:
-        todo = await sess.get(Todo, todo_id)
-        if not todo:
-            raise HTTPException(status_code=404, detail='todo not found')
-        # check ownership via list
-        ql = await sess.exec(select(ListState).where(ListState.id == todo.list_id))
-        lst = ql.first()
-        # require login: only owners or public lists allowed
-        if lst and lst.owner_id not in (None, current_user.id):
-            raise HTTPException(status_code=403, detail='forbidden')
-        qc = select(TodoCompletion).where(TodoCompletion.todo_id == todo_id)
-        cres = await sess.exec(qc)
-        completed = any(c.done for c in cres.all())
-        # fetch hashtags for this todo while session is open
-        qh = select(Hashtag.tag).join(TodoHashtag, Hashtag.id == TodoHashtag.hashtag_id).where(TodoHashtag.todo_id == todo_id)
-        hres = await sess.exec(qh)
-        todo_tags = [r for r in hres.all()]
-
-        # fetch this user's hashtags for completion suggestions (from lists and todos they own)
-        owner_id_val = current_user.id
-        q_user_list_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id)
-            .join(ListState, ListState.id == ListHashtag.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_list_tags = await sess.exec(q_user_list_tags)
-        q_user_todo_tags = (
-            select(Hashtag.tag)
-            .distinct()
-            .join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id)
-            .join(Todo, Todo.id == TodoHashtag.todo_id)
-            .join(ListState, ListState.id == Todo.list_id)
-            .where(ListState.owner_id == owner_id_val)
-        )
-        r_user_todo_tags = await sess.exec(q_user_todo_tags)
-        _all_rows = list(r_user_list_tags.all()) + list(r_user_todo_tags.all())
-        all_hashtags: list[str] = []
-        for row in _all_rows:
-            val = row[0] if isinstance(row, (tuple, list)) else row
-            if isinstance(val, str) and val and val not in all_hashtags:
-                all_hashtags.append(val)
-
-        # Build plain dicts to avoid lazy-loading on detached ORM objects during template rendering
-        todo_row = {
-            "id": todo.id,
-            "text": todo.text,
-            "note": todo.note,
-            "created_at": todo.created_at,
-            "modified_at": todo.modified_at,
-            "list_id": todo.list_id,
-            "pinned": getattr(todo, 'pinned', False),
-            "priority": getattr(todo, 'priority', None),
-            # include bookmarked for initial SSR toggle state
-            "bookmarked": getattr(todo, 'bookmarked', False),
-            # reflect calendar ignore flag for template checkbox state
-            "calendar_ignored": getattr(todo, 'calendar_ignored', False),
-            # reflect first-date-only flag for template checkbox state
-            "first_date_only": getattr(todo, 'first_date_only', False),
-            # persist UI preference so template can render checkbox state
-            "lists_up_top": getattr(todo, 'lists_up_top', False),
-            # new: hide completed sublists preference (todo->list nesting)
-            "sublists_hide_done": getattr(todo, 'sublists_hide_done', False),
-            # persist Sort Links preference so template can render checkbox state
-            "sort_links": getattr(todo, 'sort_links', False),
-            "recurrence_rrule": getattr(todo, 'recurrence_rrule', False),
-            "recurrence_meta": getattr(todo, 'recurrence_meta', False),
-            "recurrence_dtstart": getattr(todo, 'recurrence_dtstart', False),
-            "recurrence_parser_version": getattr(todo, 'recurrence_parser_version', False),
-            "plain_dates_meta": getattr(todo, 'plain_dates_meta', False),
-        }
-        list_row = None
-        if lst:
-            list_row = {"id": lst.id, "name": lst.name, "completed": lst.completed, "lists_up_top": getattr(lst, 'lists_up_top', False)}
-        # Fetch sublists owned by this todo. Use explicit sibling position when set,
-        # else fall back to created_at ASC (older first). We'll also enrich with hashtags.
-        sublists = []
-        sub_ids = []
-        try:
-            # First select all sublists for this todo
-            qsubs = select(ListState).where(ListState.parent_todo_id == todo_id)
-            rsubs = await sess.exec(qsubs)
-            rows = rsubs.all()
-            # sort in-memory: by (position is not None, position) then created_at
-            def _sort_key(l):
-                pos = getattr(l, 'parent_todo_position', None)
-                created = getattr(l, 'created_at', None)
-                # Place items with a valid position before those with None
-                return (0 if pos is not None else 1, pos if pos is not None else 0, created or now_utc())
-            rows.sort(key=_sort_key)
-            # collect ids for a hashtag join
-            sub_ids = [l.id for l in rows if l.id is not None]
-            tag_map: dict[int, list[str]] = {}
-            if sub_ids:
-                qlh = select(ListHashtag.list_id, Hashtag.tag).join(Hashtag, Hashtag.id == ListHashtag.hashtag_id).where(ListHashtag.list_id.in_(sub_ids))
-                rlh = await sess.exec(qlh)
-                for lid, tag in rlh.all():
-                    tag_map.setdefault(lid, []).append(tag)
-            for l in rows:
-                sublists.append({
-                    'id': l.id,
-                    'name': l.name,
-                    'completed': getattr(l, 'completed', False),
-                    'created_at': getattr(l, 'created_at', None),
-                    'modified_at': getattr(l, 'modified_at', None),
-                    'hashtags': tag_map.get(l.id, []),
-                    'parent_todo_position': getattr(l, 'parent_todo_position', None),
-                    # placeholder for any higher-priority uncompleted todo in this sublist
-                    'override_priority': None,
-                    # include the sublist's own priority if present on the ORM object
-                    'priority': getattr(l, 'priority', None),
-                    # provide parent_list_position alias for templates that expect it
-                    'parent_list_position': getattr(l, 'parent_todo_position', None),
-                })
-        except Exception:
-            sublists = []
-    # Determine highest uncompleted todo priority per sublist (if any)
-        try:
-            if sub_ids:
-                todo_res = await sess.exec(select(Todo.id, Todo.list_id, Todo.priority).where(Todo.list_id.in_(sub_ids)).where(Todo.priority != None))
-                todo_id_rows = todo_res.all()
-                todo_map: dict[int, list[tuple[int,int]]] = {}
-                todo_ids = []
-                for tid, lid, pri in todo_id_rows:
-                    todo_map.setdefault(lid, []).append((tid, pri))
-                    todo_ids.append(tid)
-                completed_ids = set()
-                if todo_ids:
-                    try:
-                        qcomp = select(TodoCompletion.todo_id).join(CompletionType, CompletionType.id == TodoCompletion.completion_type_id).where(TodoCompletion.todo_id.in_(todo_ids)).where(CompletionType.name == 'default').where(TodoCompletion.done == True)
-                        cres = await sess.exec(qcomp)
-                        completed_ids = set(r[0] if isinstance(r, tuple) else r for r in cres.all())
-                    except Exception:
-                        completed_ids = set()
-                # diagnostic logging to help debug missing override priorities
-                try:
-                    logger.info('todo override diagnostic: todo_id_rows=%s', todo_id_rows)
-                    logger.info('todo override diagnostic: todo_map keys=%s', list(todo_map.keys()))
-                    logger.info('todo override diagnostic: completed_ids=%s', completed_ids)
-                except Exception:
-                    pass
-                # compute highest uncompleted priority per sublist
-                for sub in sublists:
-                    lid = sub.get('id')
-                    candidates = todo_map.get(lid, [])
-                    max_p = None
-                    for tid, pri in candidates:
-                        if tid in completed_ids:
-                            continue
-                        try:
-                            if pri is None:
-                                continue
-                            pv = int(pri)
-                        except Exception:
-                            continue
-                        if max_p is None or pv > max_p:
-                            max_p = pv
-                    if max_p is not None:
-                        sub['override_priority'] = max_p
-                # Also consider immediate child sublists' own priorities (not deeper levels)
-                try:
-                    q_child = await sess.exec(
-                        select(ListState.parent_list_id, func.max(ListState.priority))
-                        .where(ListState.parent_list_id.in_(sub_ids))
-                        .where(ListState.priority != None)
-                        .group_by(ListState.parent_list_id)
-                    )
-                    child_max_map: dict[int, int] = {}
-                    for pid, mx in q_child.all():
-                        try:
-                            child_max_map[int(pid)] = int(mx) if mx is not None else None
-                        except Exception:
-                            pass
-                    for sub in sublists:
-                        sid = sub.get('id')
-                        child_max = child_max_map.get(int(sid)) if sid is not None else None
-                        if child_max is not None:
-                            cur = sub.get('override_priority')
-                            sub['override_priority'] = max(cur if cur is not None else child_max, child_max)
-                except Exception:
-                    pass
-        except Exception:
-            # failure computing overrides should not break todo rendering
-            pass
-        # Apply sublists_hide_done filtering (remove completed sublists server-side)
-        try:
-            if todo_row.get('sublists_hide_done') and isinstance(sublists, list):
-                sublists = [s for s in sublists if not s.get('completed')]
-        except Exception:
-            pass
-        # Fetch outgoing links from this todo
-        links: list[dict] = []
-        try:
-            qlnk = select(ItemLink).where(ItemLink.src_type == 'todo').where(ItemLink.src_id == todo_id).order_by(ItemLink.position.asc().nullslast(), ItemLink.created_at.asc())
-            rlnk = await sess.exec(qlnk)
-            rows = rlnk.all()
-            todo_targets = [r.tgt_id for r in rows if r.tgt_type == 'todo']
-            list_targets = [r.tgt_id for r in rows if r.tgt_type == 'list']
-            todo_map: dict[int, dict] = {}
-            list_map: dict[int, dict] = {}
-            # Preload target titles
-            if todo_targets:
-                qtt = await sess.exec(select(Todo.id, Todo.text).where(Todo.id.in_(todo_targets)))
-                for tid, txt in qtt.all():
-                    todo_map[int(tid)] = {'id': int(tid), 'text': txt}
-            if list_targets:
-                qll = await sess.exec(select(ListState.id, ListState.name).where(ListState.id.in_(list_targets)))
-                for lid, name in qll.all():
-                    list_map[int(lid)] = {'id': int(lid), 'name': name}
-            # Preload hashtags for targets
-            tags_map_todo: dict[int, list[str]] = {}
-            tags_map_list: dict[int, list[str]] = {}
-            if todo_targets:
-                qth = select(TodoHashtag.todo_id, Hashtag.tag).join(Hashtag, Hashtag.id == TodoHashtag.hashtag_id).where(TodoHashtag.todo_id.in_(todo_targets))
-                rth = await sess.exec(qth)
-                for tid, tag in rth.all():
-                    try:
-                        tid_i = int(tid)
-                    except Exception:
-                        continue
-                    if isinstance(tag, str) and tag:
-                        tags_map_todo.setdefault(tid_i, []).append(tag)
-            # Determine completion status for todo targets using default completion types
-            todo_completed_ids: set[int] = set()
-            try:
-                if todo_map:
-                    todo_list_ids = list({v.get('list_id') for v in todo_map.values() if v.get('list_id') is not None})
-                    default_ct_ids: dict[int, int] = {}
-                    if todo_list_ids:
-                        qct = select(CompletionType).where(CompletionType.list_id.in_(todo_list_ids)).where(CompletionType.name == 'default')
-                        for ct in (await sess.exec(qct)).all():
-                            default_ct_ids[int(ct.list_id)] = int(ct.id)
-                    if default_ct_ids:
-                        qdone = select(TodoCompletion.todo_id).where(TodoCompletion.todo_id.in_(todo_targets)).where(TodoCompletion.completion_type_id.in_(list(default_ct_ids.values()))).where(TodoCompletion.done == True)
-                        for (tid_done,) in (await sess.exec(qdone)).all():
-                            try:
-                                todo_completed_ids.add(int(tid_done))
-                            except Exception:
-                                continue
-            except Exception:
-                todo_completed_ids = set()
-            if list_targets:
-                qlh = select(ListHashtag.list_id, Hashtag.tag).join(Hashtag, Hashtag.id == ListHashtag.hashtag_id).where(ListHashtag.list_id.in_(list_targets))
-                rlh = await sess.exec(qlh)
-                for lid, tag in rlh.all():
-                    try:
-                        lid_i = int(lid)
-                    except Exception:
-                        continue
-                    if isinstance(tag, str) and tag:
-                        tags_map_list.setdefault(lid_i, []).append(tag)
-            for r in rows:
-                d = {'id': r.id, 'tgt_type': r.tgt_type, 'tgt_id': r.tgt_id, 'label': r.label, 'position': r.position}
-                if r.tgt_type == 'todo':
-                    t = todo_map.get(int(r.tgt_id))
-                    if t:
-                        d['title'] = t.get('text')
-                        d['href'] = f"/html_no_js/todos/{t['id']}"
-                        d['tags'] = tags_map_todo.get(int(r.tgt_id), [])
-                        d['completed'] = (int(r.tgt_id) in todo_completed_ids)
-                elif r.tgt_type == 'list':
-                    l = list_map.get(int(r.tgt_id))
-                    if l:
-                        d['title'] = l.get('name')
-                        d['href'] = f"/html_no_js/lists/{l['id']}"
-                        d['tags'] = tags_map_list.get(int(r.tgt_id), [])
-                links.append(d)
-        except Exception:
-            links = []
+    # todo, list, sublists, links, hashtags and collations in a fixed number of
+    # batched queries (see app/todo_page.py)
+    page = await TodoPageLoader(current_user.id).load(todo_id)
+    todo_row = page.todo
+    list_row = page.list
+    sublists = page.sublists
+    links = page.links
     csrf_token = None
     from .auth import create_csrf_token
     csrf_token = create_csrf_token(current_user.username)
@@ -15033,7 +13704,7 @@ async def html_view_todo(request: Request, todo_id: int, current_user: User = De
         if todo_row.get('sort_links') and todo_row.get('note'):
             raw_note = str(todo_row.get('note') or '')
             # find all fn:link tags and their spans
-            link_tag_re = re.compile(r"(\{\{\s*fn:link[^{\}]*\}\})")
+            link_tag_re = FN_LINK_TOKEN_RE
             parts = link_tag_re.split(raw_note)
             # Collect link tokens with their original index in parts
             link_indices = []
@@ -15063,26 +13734,27 @@ async def html_view_todo(request: Request, todo_id: int, current_user: User = De
                 todo_ids = [t[2] for t in targets if t[1] == 'todo']
                 list_ids = [t[2] for t in targets if t[1] == 'list']
                 pr_map = {}
-                if todo_ids:
-                    try:
-                        q = await sess.exec(select(Todo.id, Todo.priority).where(Todo.id.in_(todo_ids)))
-                        for tid, pr in q.all():
-                            try:
-                                pr_map[f"todo:{int(tid)}"] = int(pr) if pr is not None else None
-                            except Exception:
-                                pr_map[f"todo:{int(tid)}"] = None
-                    except Exception:
-                        pass
-                if list_ids:
-                    try:
-                        q = await sess.exec(select(ListState.id, ListState.priority).where(ListState.id.in_(list_ids)))
-                        for lid, pr in q.all():
-                            try:
-                                pr_map[f"list:{int(lid)}"] = int(pr) if pr is not None else None
-                            except Exception:
-                                pr_map[f"list:{int(lid)}"] = None
-                    except Exception:
-                        pass
+                async with async_session() as sess:
+                    if todo_ids:
+                        try:
+                            q = await sess.exec(select(Todo.id, Todo.priority).where(Todo.id.in_(todo_ids)))
+                            for tid, pr in q.all():
+                                try:
+                                    pr_map[f"todo:{int(tid)}"] = int(pr) if pr is not None else None
+                                except Exception:
+                                    pr_map[f"todo:{int(tid)}"] = None
+                        except Exception:
+                            pass
+                    if list_ids:
+                        try:
+                            q = await sess.exec(select(ListState.id, ListState.priority).where(ListState.id.in_(list_ids)))
+                            for lid, pr in q.all():
+                                try:
+                                    pr_map[f"list:{int(lid)}"] = int(pr) if pr is not None else None
+                                except Exception:
+                                    pr_map[f"list:{int(lid)}"] = None
+                        except Exception:
+                            pass
                 # Build a list of (priority, original_order, idx, token)
                 enriched = []
                 for order, (idx, kind, tid, token) in enumerate(targets):
@@ -15102,6 +13774,13 @@ async def html_view_todo(request: Request, todo_id: int, current_user: User = De
     except Exception:
         # On any failure, leave note unchanged
         pass
+    # Resolve every fn:link in the note up front (a few IN queries) so the
+    # render_fn_tags filter does no per-link DB lookups while rendering
+    try:
+        async with async_session() as _fsess:
+            await prefetch_fn_link_labels(_fsess, [todo_row.get('note')])
+    except Exception:
+        logger.exception('fn:link prefetch failed for todo %s', todo_id)
     # debug: log outgoing links structure for this todo (temporary)
     try:
         logger.info('TODO_LINKS id=%s links=%s', todo_id, json.dumps(links, default=str, ensure_ascii=False))
@@ -15110,64 +13789,12 @@ async def html_view_todo(request: Request, todo_id: int, current_user: User = De
             logger.info('TODO_LINKS id=%s links=%s', todo_id, str(links))
         except Exception:
             pass
-    # Active collations for this user and whether this todo is linked to each
-    active_collations: list[dict] = []
-    try:
-        async with async_session() as sess2:
-            q = await sess2.exec(select(UserCollation).where(UserCollation.user_id == current_user.id).where(UserCollation.active == True))
-            rows = q.all()
-            ids = [r.list_id for r in rows]
-            names = {}
-            if ids:
-                r2 = await sess2.exec(select(ListState.id, ListState.name).where(ListState.id.in_(ids)).where(ListState.owner_id == current_user.id))
-                for lid, name in r2.all():
-                    names[int(lid)] = name
-            # Exclude any lists that are currently in Trash (parented to user's Trash list)
-            trashed: set[int] = set()
-            if ids:
-                trash_id = None
-                try:
-                    trq = await sess2.scalars(select(ListState.id).where(ListState.owner_id == current_user.id).where(ListState.name == 'Trash'))
-                    trash_id = trq.first()
-                except Exception:
-                    trash_id = None
-                if trash_id is not None:
-                    tq = await sess2.scalars(select(ListState.id).where(ListState.id.in_(ids)).where(ListState.parent_list_id == trash_id))
-                    trashed = set(int(v) for v in tq.all())
-            linked_map = {}
-            if ids:
-                r3 = await sess2.scalars(
-                    select(ItemLink.src_id)
-                    .where(ItemLink.src_type == 'list')
-                    .where(ItemLink.tgt_type == 'todo')
-                    .where(ItemLink.tgt_id == todo_id)
-                    .where(ItemLink.src_id.in_(ids))
-                )
-                for sid in r3.all():
-                    try:
-                        linked_map[int(sid)] = True
-                    except Exception:
-                        pass
-            # Include only lists that exist for this user (in names) and are not trashed
-            active_collations = [
-                {
-                    'list_id': int(r.list_id),
-                    'name': names.get(int(r.list_id)),
-                    'linked': bool(linked_map.get(int(r.list_id), False)),
-                }
-                for r in rows if (int(r.list_id) in names and int(r.list_id) not in trashed)
-            ]
-    except Exception:
-        # If anything fails here, log and fall back to empty so the page still renders
-        try:
-            logger.exception('Failed building active_collations for todo_id=%s user_id=%s', todo_id, getattr(current_user, 'id', None))
-        except Exception:
-            pass
-        active_collations = []
-
-    # Best-effort: record this todo visit for the current user so it appears on the recent page
+    # Best-effort: record this todo visit for the current user so it appears on the recent page.
+    # Ownership was checked by the loader, so skip record_todo_visit's re-check.
     try:
-        await record_todo_visit(todo_id=todo_id, current_user=current_user)
+        todo_visits.record(current_user.id, todo_id)
+        if not visit_buffer_enabled():
+            await todo_visits.flush(user_id=current_user.id)
     except Exception:
         try:
             logger.exception('failed to record todo visit for todo %s', todo_id)
@@ -15175,7 +13802,7 @@ async def html_view_todo(request: Request, todo_id: int, current_user: User = De
             pass
 
     # pass plain dicts (with datetime objects preserved) to avoid lazy DB loads
-    return TEMPLATES.TemplateResponse(request, 'todo.html', {"request": request, "todo": todo_row, "completed": completed, "list": list_row, "csrf_token": csrf_token, "client_tz": client_tz, "tags": todo_tags, "all_hashtags": all_hashtags, 'sublists': sublists, 'links': links, 'active_collations': active_collations})
+    return TEMPLATES.TemplateResponse(request, 'todo.html', {"request": request, **page.context(), "todo": todo_row, "list": list_row, "csrf_token": csrf_token, "client_tz": client_tz})
 
 @app.post('/html_no_js/todos/{todo_id}/sublists_hide_done')
 async def html_set_todo_sublists_hide_done(request: Request, todo_id: int, sublists_hide_done: str = Form(None), current_user: User = Depends(require_login)):
@@ -15257,16 +13884,15 @@ async def _add_link_core(sess, *, src_type: str, src_id: int, payload: AddLinkPa
     # compute default position if not provided
     pos = payload.position
     if pos is None:
-        q = await sess.exec(select(ItemLink.position).where(ItemLink.src_type == src_type).where(ItemLink.src_id == src_id))
-        vals = [v[0] if isinstance(v, (tuple, list)) else v for v in q.fetchall()]
         try:
-            pos = (max([vv for vv in vals if vv is not None]) + 1) if vals else 0
+            pos = await ordering.append_position(sess, ordering.link_siblings(src_type, src_id))
         except Exception:
             pos = 0
     link = ItemLink(src_type=src_type, src_id=src_id, tgt_type=payload.tgt_type, tgt_id=payload.tgt_id, label=(payload.label or None), position=pos, owner_id=owner_id)
     sess.add(link)
     try:
         await sess.commit()
+        link_graph.invalidate(owner_id)
     except IntegrityError:
         await sess.rollback()
         # already exists: fetch existing
@@ -15279,7 +13905,7 @@ async def _add_link_core(sess, *, src_type: str, src_id: int, payload: AddLinkPa
 
 
 async def _remove_link_core(sess, *, src_type: str, src_id: int, link_id: int, current_user: User) -> dict:
-    await _verify_owner_for_src(sess, src_type=src_type, src_id=src_id, current_user=current_user)
+    owner_id = await _verify_owner_for_src(sess, src_type=src_type, src_id=src_id, current_user=current_user)
     link = await sess.get(ItemLink, link_id)
     if not link or link.src_type != src_type or link.src_id != src_id:
         raise HTTPException(status_code=404, detail='link not found')
@@ -15288,6 +13914,7 @@ async def _remove_link_core(sess, *, src_type: str, src_id: int, link_id: int, c
         await sess.commit()
     except Exception:
         await sess.rollback()
+    link_graph.invalidate(owner_id)
     return {'ok': True, 'deleted': link_id}
 
 
@@ -15384,31 +14011,13 @@ async def html_create_sublist(
         if top is not None:
             tv = top.lower()
             place_top = tv in ('1', 'true', 'on', 'yes')
-        await _normalize_sublist_positions(sess, todo_id)
+        # gap-spaced positions: a new sublist goes before the first or after
+        # the last sibling without shifting the others
+        sibs = ordering.todo_sublist_siblings(todo_id)
         try:
-            qsiblings = await sess.exec(
-                select(ListState)
-                .where(ListState.parent_todo_id == todo_id)
-                .order_by(ListState.parent_todo_position.asc(), ListState.created_at.asc())
-            )
-            siblings = qsiblings.all()
+            next_pos = await (ordering.prepend_position(sess, sibs) if place_top else ordering.append_position(sess, sibs))
         except Exception:
-            siblings = []
-        if place_top and siblings:
-            for sib in siblings:
-                cur = getattr(sib, 'parent_todo_position', None)
-                if cur is None:
-                    continue
-                sib.parent_todo_position = cur + 1
-                sess.add(sib)
             next_pos = 0
-        else:
-            try:
-                existing_positions = [getattr(sib, 'parent_todo_position', None) for sib in siblings]
-                filtered = [pos for pos in existing_positions if pos is not None]
-                next_pos = (max(filtered) + 1) if filtered else 0
-            except Exception:
-                next_pos = 0
         sub = ListState(name=norm_name, owner_id=current_user.id, parent_todo_id=todo_id, parent_todo_position=next_pos)
         sess.add(sub)
         await sess.commit()
@@ -15433,29 +14042,6 @@ async def html_create_sublist(
     return _redirect_or_json(request, f'/html_no_js/todos/{todo_id}')
 
 
-async def _normalize_sublist_positions(sess, parent_todo_id: int):
-    """Ensure sibling positions are contiguous starting at 0 for a parent's sublists."""
-    q = await sess.scalars(select(ListState).where(ListState.parent_todo_id == parent_todo_id))
-    rows = q.all()
-    # order by current position (None last), then created_at
-    def _key(l):
-        pos = getattr(l, 'parent_todo_position', None)
-        cr = getattr(l, 'created_at', None) or now_utc()
-        return (0 if pos is not None else 1, pos if pos is not None else 0, cr)
-    rows.sort(key=_key)
-    changed = False
-    for idx, l in enumerate(rows):
-        if getattr(l, 'parent_todo_position', None) != idx:
-            l.parent_todo_position = idx
-            sess.add(l)
-            changed = True
-    if changed:
-        try:
-            await sess.commit()
-        except Exception:
-            await sess.rollback()
-
-
 class MoveSublistRequest(BaseModel):
     direction: str
 
@@ -15479,55 +14065,10 @@ async def _move_sublist_core(sess, *, current_user: User, todo_id: int, list_id:
     sub = await sess.get(ListState, list_id)
     if not sub or getattr(sub, 'parent_todo_id', None) != todo_id:
         raise HTTPException(status_code=404, detail='sublist not found')
-    # get siblings and positions
-    q = await sess.scalars(select(ListState).where(ListState.parent_todo_id == todo_id))
-    sibs = q.all()
-    # ensure positions are normalized first
-    await _normalize_sublist_positions(sess, todo_id)
-    await sess.refresh(sub)
-    # find neighbor to swap with
-    cur_pos = getattr(sub, 'parent_todo_position', None)
-    if cur_pos is None:
-        # assign to end
-        try:
-            maxp = max([getattr(s, 'parent_todo_position', -1) or -1 for s in sibs])
-        except Exception:
-            maxp = -1
-        sub.parent_todo_position = maxp + 1
-        sess.add(sub)
-        await sess.commit()
-        cur_pos = sub.parent_todo_position
-    if direction == 'up' and cur_pos > 0:
-        target_pos = cur_pos - 1
-    elif direction == 'down':
-        try:
-            maxp = max([getattr(s, 'parent_todo_position', -1) or -1 for s in sibs])
-        except Exception:
-            maxp = -1
-        if cur_pos < maxp:
-            target_pos = cur_pos + 1
-        else:
-            target_pos = None
-    else:
-        target_pos = None
-    if target_pos is None:
-        await _normalize_sublist_positions(sess, todo_id)
-        return {'ok': True, 'moved': False}
-    # find sibling currently at target_pos
-    other = None
-    for s in sibs:
-        if getattr(s, 'parent_todo_position', None) == target_pos:
-            other = s
-            break
-    # swap positions
-    sub.parent_todo_position, target_pos_val = target_pos, cur_pos
-    sess.add(sub)
-    if other:
-        other.parent_todo_position = target_pos_val
-        sess.add(other)
+    # one UPDATE of the moved sublist in the common case (see app/ordering.py)
+    moved = await ordering.move(sess, ordering.todo_sublist_siblings(todo_id), list_id, direction)
     await sess.commit()
-    await _normalize_sublist_positions(sess, todo_id)
-    return {'ok': True, 'moved': True}
+    return {'ok': True, 'moved': moved}
 
 
 @app.post('/api/todos/{todo_id}/sublists/{list_id}/move')
@@ -15569,27 +14110,6 @@ async def html_move_sublist(request: Request, todo_id: int, list_id: int, direct
 
 
 # ===== List -> List sublists (nested lists) =====
-async def _normalize_list_sublists_positions(sess, parent_list_id: int):
-    q = await sess.scalars(select(ListState).where(ListState.parent_list_id == parent_list_id))
-    rows = q.all()
-    def _key(l):
-        pos = getattr(l, 'parent_list_position', None)
-        cr = getattr(l, 'created_at', None) or now_utc()
-        return (0 if pos is not None else 1, pos if pos is not None else 0, cr)
-    rows.sort(key=_key)
-    changed = False
-    for idx, l in enumerate(rows):
-        if getattr(l, 'parent_list_position', None) != idx:
-            l.parent_list_position = idx
-            sess.add(l)
-            changed = True
-    if changed:
-        try:
-            await sess.commit()
-        except Exception:
-            await sess.rollback()
-
-
 @app.post('/html_no_js/lists/{list_id}/sublists/create')
 async def html_create_list_sublist(
     request: Request,
@@ -15616,32 +14136,11 @@ async def html_create_list_sublist(
         if top is not None:
             tv = top.lower()
             place_top = tv in ('1', 'true', 'on', 'yes')
-        await _normalize_list_sublists_positions(sess, list_id)
+        sibs = ordering.list_sublist_siblings(list_id)
         try:
-            qsiblings = await sess.exec(
-                select(ListState)
-                .where(ListState.parent_list_id == list_id)
-                .order_by(ListState.parent_list_position.asc(), ListState.created_at.asc())
-            )
-            siblings = qsiblings.all()
-        except Exception:
-            siblings = []
-        next_pos: int
-        if place_top and siblings:
-            for sib in siblings:
-                cur = getattr(sib, 'parent_list_position', None)
-                if cur is None:
-                    continue
-                sib.parent_list_position = cur + 1
-                sess.add(sib)
+            next_pos = await (ordering.prepend_position(sess, sibs) if place_top else ordering.append_position(sess, sibs))
+        except Exception:
             next_pos = 0
-        else:
-            try:
-                existing_positions = [getattr(sib, 'parent_list_position', None) for sib in siblings]
-                filtered = [pos for pos in existing_positions if pos is not None]
-                next_pos = (max(filtered) + 1) if filtered else 0
-            except Exception:
-                next_pos = 0
         sub = ListState(name=norm_name, owner_id=current_user.id, parent_list_id=list_id, parent_list_position=next_pos)
         sess.add(sub)
         await sess.commit()
@@ -15679,46 +14178,9 @@ async def _move_list_sublist_core(sess, *, current_user: User, list_id: int, sub
     sub = await sess.get(ListState, sub_id)
     if not sub or getattr(sub, 'parent_list_id', None) != list_id:
         raise HTTPException(status_code=404, detail='sublist not found')
-    q = await sess.scalars(select(ListState).where(ListState.parent_list_id == list_id))
-    sibs = q.all()
-    await _normalize_list_sublists_positions(sess, list_id)
-    await sess.refresh(sub)
-    cur_pos = getattr(sub, 'parent_list_position', None)
-    if cur_pos is None:
-        try:
-            maxp = max([getattr(s, 'parent_list_position', -1) or -1 for s in sibs])
-        except Exception:
-            maxp = -1
-        sub.parent_list_position = maxp + 1
-        sess.add(sub)
-        await sess.commit()
-        cur_pos = sub.parent_list_position
-    if direction == 'up' and cur_pos > 0:
-        target_pos = cur_pos - 1
-    elif direction == 'down':
-        try:
-            maxp = max([getattr(s, 'parent_list_position', -1) or -1 for s in sibs])
-        except Exception:
-            maxp = -1
-        target_pos = cur_pos + 1 if cur_pos < maxp else None
-    else:
-        target_pos = None
-    if target_pos is None:
-        await _normalize_list_sublists_positions(sess, list_id)
-        return {'ok': True, 'moved': False}
-    other = None
-    for s in sibs:
-        if getattr(s, 'parent_list_position', None) == target_pos:
-            other = s
-            break
-    sub.parent_list_position, target_pos_val = target_pos, cur_pos
-    sess.add(sub)
-    if other:
-        other.parent_list_position = target_pos_val
-        sess.add(other)
+    moved = await ordering.move(sess, ordering.list_sublist_siblings(list_id), sub_id, direction)
     await sess.commit()
-    await _normalize_list_sublists_positions(sess, list_id)
-    return {'ok': True, 'moved': True}
+    return {'ok': True, 'moved': moved}
 
 
 @app.post('/html_no_js/lists/{list_id}/sublists/{sub_id}/move')
@@ -0,0 +1,296 @@
+"""Always-on request metrics with per-route histograms (Prometheus text format).
+
+Goals
+- Cheap enough to leave on in production. There is no cProfile and no file
+  I/O, and a request costs a ContextVar set, a few perf_counter calls and a
+  couple of bisects. This complements the heavyweight RequestProfilerMiddleware
+  in app/profiling.py; it does not replace it.
+- Per route template and method: a latency histogram, a histogram of
+  SQL statements per request, and DB time vs Python time.
+- Process-wide counters for SQL issued outside any request (background tasks,
+  startup).
+
+Usage
+- app.add_middleware(MetricsMiddleware) once at import of app.main; it is a
+  plain ASGI middleware so it adds no BaseHTTPMiddleware task hop.
+- install_sql_listeners(engine) once; counts every cursor execute (including
+  ORM flushes) and times it.
+- TracedAsyncSession.execute/exec call note_query() so session-level query
+  calls are counted too.
+- GET /server/metrics renders render_prometheus().
+- METRICS_ENABLED=0 disables collection (the middleware becomes a pass-through).
+- add_request_observer(fn) registers fn(method, route, status, seconds, stats)
+  to run after each request (app/query_budget.py uses it). Observers handle
+  their own errors; an exception they raise propagates to the server.
+
+No locks: every update happens on the event loop thread (cursor events run
+in SQLAlchemy's greenlet on that same thread), and the snapshot for
+rendering copies the plain lists. A scrape racing an update can at worst see
+a count one request behind.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+import os
+import time
+
+# seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# statements per request
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def _enabled_from_env() -> bool:
+    return os.getenv('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+
+
+ENABLED = _enabled_from_env()
+
+
+class RequestStats:
+    """Mutable per-request counters; shared by reference with child tasks."""
+
+    __slots__ = ('queries', 'statements', 'db_seconds', 'shapes')
+
+    def __init__(self):
+        self.queries = 0
+        self.statements = 0
+        self.db_seconds = 0.0
+        # raw statement text -> executions; fingerprinted lazily by observers
+        self.shapes: dict[str, int] = {}
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('metrics_request_stats', default=None)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    return _request_stats.get()
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        # one slot per bound plus +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[int]:
+        out, acc = [], 0
+        for c in list(self.counts):
+            acc += c
+            out.append(acc)
+        return out
+
+
+class RouteStats:
+    __slots__ = ('latency', 'sql', 'db_seconds', 'python_seconds', 'queries', 'statuses')
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.sql = Histogram(SQL_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.python_seconds = 0.0
+        self.queries = 0
+        self.statuses: dict[str, int] = {}
+
+
+_observers: list = []
+
+
+def add_request_observer(fn) -> None:
+    if fn not in _observers:
+        _observers.append(fn)
+
+
+# (method, route template) -> RouteStats
+_routes: dict[tuple[str, str], RouteStats] = {}
+# SQL issued outside any request
+_background = {'queries': 0, 'statements': 0, 'db_seconds': 0.0}
+
+
+def reset() -> None:
+    _routes.clear()
+    _background.update(queries=0, statements=0, db_seconds=0.0)
+
+
+def note_query() -> None:
+    """Count one session-level execute/exec call (see TracedAsyncSession)."""
+    st = _request_stats.get()
+    if st is not None:
+        st.queries += 1
+    else:
+        _background['queries'] += 1
+
+
+def _note_statement(seconds: float, statement: str) -> None:
+    st = _request_stats.get()
+    if st is not None:
+        st.statements += 1
+        st.db_seconds += seconds
+        st.shapes[statement] = st.shapes.get(statement, 0) + 1
+    else:
+        _background['statements'] += 1
+        _background['db_seconds'] += seconds
+
+
+def install_sql_listeners(engine) -> None:
+    """Time every cursor execute on the engine; idempotent."""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    if getattr(sync_engine, '_fast_todo_metrics', False):
+        return
+
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_t0', []).append(time.perf_counter())
+
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('_metrics_t0')
+        if starts:
+            _note_statement(time.perf_counter() - starts.pop(), statement)
+
+    def _error(exception_context):
+        try:
+            starts = exception_context.connection.info.get('_metrics_t0')
+            if starts:
+                _note_statement(time.perf_counter() - starts.pop(), str(exception_context.statement or ''))
+        except Exception:
+            pass
+
+    event.listen(sync_engine, 'before_cursor_execute', _before)
+    event.listen(sync_engine, 'after_cursor_execute', _after)
+    event.listen(sync_engine, 'handle_error', _error)
+    sync_engine._fast_todo_metrics = True
+
+
+def route_label(scope) -> str:
+    route = scope.get('route')
+    path = getattr(route, 'path', None) or getattr(route, 'path_format', None)
+    if path:
+        return path
+    # static mounts: label by mount prefix, never by raw path (cardinality)
+    root = scope.get('root_path') or ''
+    app_root = scope.get('app_root_path') or ''
+    if root and root != app_root:
+        return root[len(app_root):] + '/*'
+    return UNMATCHED_ROUTE
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, st: RequestStats) -> None:
+    key = (method, route)
+    rs = _routes.get(key)
+    if rs is None:
+        rs = _routes.setdefault(key, RouteStats())
+    rs.latency.observe(seconds)
+    rs.sql.observe(st.statements)
+    rs.queries += st.queries
+    db = min(st.db_seconds, seconds)
+    rs.db_seconds += db
+    rs.python_seconds += seconds - db
+    code = str(status)
+    rs.statuses[code] = rs.statuses.get(code, 0) + 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording one observation per HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope.get('type') != 'http' or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        st = RequestStats()
+        token = _request_stats.set(st)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message.get('type') == 'http.response.start':
+                status_holder[0] = message.get('status', 500)
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+            method = scope.get('method', 'GET')
+            route = route_label(scope)
+            try:
+                observe_request(method, route, status_holder[0], elapsed, st)
+            except Exception:
+                pass
+        for fn in list(_observers):
+            fn(method, route, status_holder[0], elapsed, st)
+
+
+def _esc(v: str) -> str:
+    return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _fmt(v: float) -> str:
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def render_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+    lines: list[str] = []
+    snapshot = sorted(list(_routes.items()))
+
+    def hist(name: str, help_text: str, attr: str):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for (method, route), rs in snapshot:
+            h = getattr(rs, attr)
+            labels = f'method="{_esc(method)}",route="{_esc(route)}"'
+            cum = h.cumulative()
+            for bound, c in zip(list(h.bounds) + [float('inf')], cum):
+                lines.append(f'{name}_bucket{{{labels},le="{_fmt(bound)}"}} {c}')
+            lines.append(f'{name}_sum{{{labels}}} {_fmt(h.sum)}')
+            lines.append(f'{name}_count{{{labels}}} {h.count}')
+
+    def counter(name: str, help_text: str, attr: str):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for (method, route), rs in snapshot:
+            labels = f'method="{_esc(method)}",route="{_esc(route)}"'
+            lines.append(f'{name}{{{labels}}} {_fmt(getattr(rs, attr))}')
+
+    hist('fasttodo_http_request_duration_seconds', 'Request latency by route template.', 'latency')
+    hist('fasttodo_http_request_sql_statements', 'SQL statements executed per request.', 'sql')
+    counter('fasttodo_http_request_db_seconds_total', 'Time spent executing SQL during requests.', 'db_seconds')
+    counter('fasttodo_http_request_python_seconds_total', 'Request time not spent executing SQL.', 'python_seconds')
+    counter('fasttodo_http_request_session_queries_total', 'Session execute/exec calls during requests.', 'queries')
+
+    lines.append('# HELP fasttodo_http_responses_total Responses by route and status code.')
+    lines.append('# TYPE fasttodo_http_responses_total counter')
+    for (method, route), rs in snapshot:
+        for code, n in sorted(list(rs.statuses.items())):
+            lines.append(f'fasttodo_http_responses_total{{method="{_esc(method)}",route="{_esc(route)}",status="{code}"}} {n}')
+
+    lines.append('# HELP fasttodo_background_sql_statements_total SQL statements executed outside requests.')
+    lines.append('# TYPE fasttodo_background_sql_statements_total counter')
+    lines.append(f"fasttodo_background_sql_statements_total {_background['statements']}")
+    lines.append('# HELP fasttodo_background_db_seconds_total Time spent executing SQL outside requests.')
+    lines.append('# TYPE fasttodo_background_db_seconds_total counter')
+    lines.append(f"fasttodo_background_db_seconds_total {_fmt(_background['db_seconds'])}")
+    lines.append('# HELP fasttodo_background_session_queries_total Session execute/exec calls outside requests.')
+    lines.append('# TYPE fasttodo_background_session_queries_total counter')
+    lines.append(f"fasttodo_background_session_queries_total {_background['queries']}")
+    return '\n'.join(lines) + '\n'
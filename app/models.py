@@ -2,7 +2,7 @@ from typing import List, Optional
 from datetime import datetime
 from .utils import now_utc
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import UniqueConstraint
+from sqlalchemy import Index, UniqueConstraint
 
 
 class TodoHashtag(SQLModel, table=True):
@@ -124,6 +124,20 @@ class UserHashtag(SQLModel, table=True):
     metadata_json: Optional[str] = None
 
 
+class UserHashtagStats(SQLModel, table=True):
+    """Per-user hashtag usage counters, maintained incrementally by tag sync.
+
+    list_count/todo_count count the user's lists/todos currently linked to the
+    hashtag; last_used_at is the last time a link was added. See
+    app/hashtag_stats.py for how the rows are kept in step with the link tables.
+    """
+    user_id: int = Field(foreign_key='user.id', primary_key=True)
+    hashtag_id: int = Field(foreign_key='hashtag.id', primary_key=True)
+    list_count: int = Field(default=0)
+    todo_count: int = Field(default=0)
+    last_used_at: datetime | None = Field(default=None, index=True)
+
+
 class CompletionType(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
@@ -152,7 +166,8 @@ class Todo(SQLModel, table=True):
     first_date_only: bool = Field(default=False, index=True)
     created_at: datetime | None = Field(default_factory=now_utc)
     modified_at: datetime | None = Field(default_factory=now_utc)
-    deferred_until: Optional[datetime] = None
+    # Indexed so the undefer scheduler can seed pending deferrals cheaply
+    deferred_until: Optional[datetime] = Field(default=None, index=True)
     # Recurrence metadata: persisted parsed recurrence info to avoid reparsing
     recurrence_rrule: Optional[str] = None
     recurrence_meta: Optional[str] = None  # JSON-encoded string
@@ -176,6 +191,16 @@ class Todo(SQLModel, table=True):
     sublists_hide_done: bool = Field(default=False)
     # Arbitrary JSON metadata (JSON-encoded string)
     metadata_json: Optional[str] = None
+    # Denormalized "done" state: true when a TodoCompletion row for a
+    # CompletionType named 'default' has done=True. Maintained on every flush
+    # by app/completion_state.py so read paths can filter without the
+    # TodoCompletion/CompletionType join. completed_at is when it became done.
+    is_done: bool = Field(default=False)
+    completed_at: Optional[datetime] = None
+
+    __table_args__ = (
+        Index('ix_todo_list_id_is_done', 'list_id', 'is_done'),
+    )
 
     # Relationship should reflect that a todo always has a parent list.
     list: ListState = Relationship(
@@ -425,6 +450,23 @@ class ItemLink(SQLModel, table=True):
     )
 
 
+class LinkMapNode(SQLModel, table=True):
+    """Server-side link map layout: one row per node of a user's ItemLink graph.
+
+    node_id is 'list:<id>' or 'todo:<id>'. sig is a digest of the node's
+    neighbour ids, used to spot nodes whose edges changed. version is the
+    layout version that last placed (or removed) the node; removed rows are
+    kept as tombstones so delta clients can drop them. See app/linkmap_layout.py.
+    """
+    owner_id: int = Field(foreign_key='user.id', primary_key=True)
+    node_id: str = Field(primary_key=True)
+    x: float = 0.0
+    y: float = 0.0
+    sig: Optional[str] = None
+    version: int = Field(default=0, index=True)
+    removed: bool = Field(default=False)
+
+
 class TreeView(SQLModel, table=True):
     """A named, per-user saved view of selected tree roots.
 
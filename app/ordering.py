@@ -0,0 +1,168 @@
+"""Ordered siblings: gap-spaced positions and set-based renumbering.
+
+Goals
+- Moving a category or sublist up/down used to load every sibling as an ORM
+  object, renumber them 0..N-1 in Python with one UPDATE per changed row,
+  swap two positions and then renumber and re-read again.
+- Positions are now spaced GAP apart. A move writes only the moved row: it
+  takes the midpoint of the slot it moves into. New rows go after the max
+  (or before the min) with one aggregate query.
+- When a slot has no free integer (or positions are NULL or duplicated), the
+  whole sibling set is renumbered with a single
+  UPDATE ... FROM (SELECT id, ROW_NUMBER() OVER (...)) statement. It only
+  writes rows whose position actually changes.
+
+Usage
+- Describe a sibling set with one of the helpers: `category_siblings(owner_id)`,
+  `todo_sublist_siblings(todo_id)`, `list_sublist_siblings(list_id)` or
+  `link_siblings(src_type, src_id)` (or build a `Siblings` directly).
+- `await append_position(sess, sib)` / `await prepend_position(sess, sib)`
+  -> position for a new row.
+- `await move(sess, sib, item_id, 'up' | 'down')` -> True when it moved.
+- `await renumber(sess, sib)` -> rows rewritten; `await repair(sess, sib)`
+  renumbers only when positions are NULL or duplicated.
+- None of these commit, and they use Core UPDATEs, so ORM objects already
+  loaded in the session keep their old position until reloaded.
+
+Order is (position NULLS LAST, tie-break columns, id), the order the pages
+already used.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import func, or_
+from sqlalchemy import update as sqlalchemy_update
+from sqlmodel import select
+
+from .models import Category, ItemLink, ListState
+
+# spacing between neighbours after a renumber / for appended rows
+GAP = 1024
+
+
+@dataclass(frozen=True)
+class Siblings:
+    model: Any
+    position: Any
+    scope: tuple
+    tiebreak: tuple = ()
+
+    def order_by(self) -> tuple:
+        return (self.position.is_(None), self.position, *self.tiebreak, self.model.id)
+
+
+def category_siblings(owner_id: int) -> Siblings:
+    return Siblings(Category, Category.position, (Category.owner_id == owner_id,))
+
+
+def todo_sublist_siblings(todo_id: int) -> Siblings:
+    return Siblings(ListState, ListState.parent_todo_position, (ListState.parent_todo_id == todo_id,), (ListState.created_at,))
+
+
+def list_sublist_siblings(list_id: int) -> Siblings:
+    return Siblings(ListState, ListState.parent_list_position, (ListState.parent_list_id == list_id,), (ListState.created_at,))
+
+
+def link_siblings(src_type: str, src_id: int) -> Siblings:
+    return Siblings(ItemLink, ItemLink.position, (ItemLink.src_type == src_type, ItemLink.src_id == src_id), (ItemLink.created_at,))
+
+
+async def _scalar(sess, stmt):
+    v = (await sess.exec(stmt)).first()
+    return v[0] if isinstance(v, tuple) else v
+
+
+async def append_position(sess, sib: Siblings) -> int:
+    mx = await _scalar(sess, select(func.max(sib.position)).where(*sib.scope))
+    return 0 if mx is None else int(mx) + GAP
+
+
+async def prepend_position(sess, sib: Siblings) -> int:
+    mn = await _scalar(sess, select(func.min(sib.position)).where(*sib.scope))
+    return 0 if mn is None else int(mn) - GAP
+
+
+async def renumber(sess, sib: Siblings) -> int:
+    """Rewrite positions to 0, GAP, 2*GAP, ... in current order; one statement."""
+    M = sib.model
+    ranked = (
+        select(M.id.label('id'), func.row_number().over(order_by=sib.order_by()).label('rn'))
+        .where(*sib.scope)
+        .subquery('ranked')
+    )
+    new_pos = (ranked.c.rn - 1) * GAP
+    stmt = (
+        sqlalchemy_update(M)
+        .where(M.id == ranked.c.id)
+        .where(or_(sib.position.is_(None), sib.position != new_pos))
+        .values({sib.position.key: new_pos})
+        .execution_options(synchronize_session=False)
+    )
+    res = await sess.exec(stmt)
+    return int(res.rowcount or 0)
+
+
+async def repair(sess, sib: Siblings) -> int:
+    """Renumber only when some position is NULL or shared by two siblings."""
+    row = (await sess.exec(
+        select(func.count(), func.count(sib.position), func.count(func.distinct(sib.position))).where(*sib.scope)
+    )).first()
+    total, non_null, distinct = (int(v or 0) for v in row)
+    if total == non_null == distinct:
+        return 0
+    return await renumber(sess, sib)
+
+
+async def _ordered(sess, sib: Siblings) -> list[tuple[int, Optional[int]]]:
+    res = await sess.exec(select(sib.model.id, sib.position).where(*sib.scope).order_by(*sib.order_by()))
+    return [(int(i), p) for i, p in res.all()]
+
+
+def _slot(rows: list, i: int, direction: str) -> Optional[int]:
+    """Free position for rows[i] one step up/down, or None when there is none."""
+    j = i - 1 if direction == 'up' else i + 1
+    if direction == 'up':
+        hi = rows[j][1]
+        if hi is None:
+            return None
+        if j == 0:
+            return hi - GAP
+        lo = rows[j - 1][1]
+    else:
+        lo = rows[j][1]
+        if lo is None:
+            return None
+        if j == len(rows) - 1:
+            return lo + GAP
+        hi = rows[j + 1][1]
+    if lo is None or hi is None or hi - lo < 2:
+        return None
+    return (lo + hi) // 2
+
+
+async def move(sess, sib: Siblings, item_id: int, direction: str) -> bool:
+    """Move one sibling a step up or down; normally a single-row UPDATE."""
+    if direction not in ('up', 'down'):
+        raise ValueError('direction must be up or down')
+    rows = await _ordered(sess, sib)
+    ids = [r[0] for r in rows]
+    if int(item_id) not in ids:
+        return False
+    i = ids.index(int(item_id))
+    if (direction == 'up' and i == 0) or (direction == 'down' and i == len(rows) - 1):
+        return False
+    pos = _slot(rows, i, direction)
+    if pos is None:
+        await renumber(sess, sib)
+        rows = await _ordered(sess, sib)
+        pos = _slot(rows, i, direction)
+    M = sib.model
+    await sess.exec(
+        sqlalchemy_update(M)
+        .where(M.id == int(item_id))
+        .values({sib.position.key: pos})
+        .execution_options(synchronize_session=False)
+    )
+    return True
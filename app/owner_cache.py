@@ -0,0 +1,214 @@
+"""Per-user TTL caches dropped by session events.
+
+Goals
+- The visibility, link graph and hashtag vocabulary caches each keep one
+  immutable value per user, loaded on a miss, bounded by a TTL and dropped
+  whenever a write touches that user's rows. They used to carry identical
+  copies of the cache bookkeeping (TTL, generation counter, peek/get/stats)
+  and of the session hooks that drop entries at flush time and again once
+  the transaction commits.
+- Keep that machinery once here. Each cache supplies only its loader and the
+  rules for which owners a flush or bulk statement touches.
+- Bulk statements are resolved to owners by selecting the rows their own
+  WHERE clause matches (`where_owners`), so a statement scoped to one user
+  does not drop every user's entry.
+
+Usage
+- Subclass OwnerCache with `channel` (the app/cache_bus.py channel) and
+  `ttl_setting` (the app/config.py attribute name), implement
+  `async _load(sess, owner_id)`, create the singleton and call
+  `.subscribe()` on it.
+- `install_session_hooks(cache, flush_owners=fn(session) -> owners,
+  statement_owners=fn(state) -> owners)` registers after_flush /
+  do_orm_execute / after_commit / after_rollback listeners. Owner sets may
+  contain None, meaning every user; an empty set drops nothing. A helper that
+  raises drops every user.
+"""
+from __future__ import annotations
+
+from typing import Callable, Generic, Optional, TypeVar
+import logging
+import threading
+import time
+
+from sqlalchemy import BindParameter, event
+from sqlalchemy.orm import Session as _OrmSession
+
+from . import config
+from .cache_bus import cache_bus
+
+logger = logging.getLogger(__name__)
+
+V = TypeVar('V')
+
+
+class OwnerCache(Generic[V]):
+    """Caches one value per user; see the module docstring."""
+
+    channel: str = ''
+    ttl_setting: str = ''
+
+    def __init__(self, ttl: Optional[float] = None):
+        self._ttl = ttl
+        self._cache: dict[int, tuple[float, V]] = {}
+        self._lock = threading.Lock()
+        # bumped by every invalidation; a load that raced with one is not
+        # stored, so a commit landing mid-load cannot leave a stale entry
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl(self) -> float:
+        return getattr(config, self.ttl_setting) if self._ttl is None else self._ttl
+
+    def subscribe(self) -> 'OwnerCache[V]':
+        """Drop local entries when another worker process invalidates them."""
+        cache_bus.subscribe(self.channel, lambda owner_id: self.invalidate(owner_id, broadcast=False))
+        return self
+
+    def invalidate(self, owner_id: Optional[int] = None, *, broadcast: bool = True) -> None:
+        with self._lock:
+            self._generation += 1
+            if owner_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(int(owner_id), None)
+        if broadcast:
+            # other worker processes hold their own copies (app/cache_bus.py)
+            cache_bus.publish(self.channel, None if owner_id is None else int(owner_id))
+
+    def drop(self, owners) -> None:
+        """Invalidate a set of owners (None in the set: every user)."""
+        if None in owners:
+            self.invalidate(None)
+            return
+        for oid in owners:
+            self.invalidate(oid)
+
+    def peek(self, owner_id: int) -> Optional[V]:
+        """Return the cached entry without loading (None when absent/expired)."""
+        with self._lock:
+            ent = self._cache.get(int(owner_id))
+            if ent is None or ent[0] < time.monotonic():
+                return None
+            return ent[1]
+
+    async def get(self, sess, owner_id: int) -> V:
+        owner_id = int(owner_id)
+        ttl = self.ttl
+        if ttl > 0:
+            with self._lock:
+                ent = self._cache.get(owner_id)
+                if ent is not None and ent[0] >= time.monotonic():
+                    self.hits += 1
+                    return ent[1]
+                self.misses += 1
+                gen = self._generation
+        value = await self._load(sess, owner_id)
+        if ttl > 0:
+            with self._lock:
+                if self._generation == gen:
+                    self._cache[owner_id] = (time.monotonic() + ttl, value)
+        return value
+
+    async def _load(self, sess, owner_id: int) -> V:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._cache), 'hits': self.hits, 'misses': self.misses, 'ttl': self.ttl}
+
+    # --- transaction boundaries (see install_session_hooks) ---------------
+
+    @property
+    def pending_key(self) -> str:
+        return f'{self.channel}_pending'
+
+    def remember(self, session, owners) -> None:
+        """Drop owners now and again once the session's transaction ends."""
+        if owners:
+            self.drop(owners)
+            session.info.setdefault(self.pending_key, set()).update(owners)
+
+    def committed(self, session, owners: set) -> None:
+        if owners:
+            self.drop(owners)
+
+    def rolled_back(self, session, owners: set) -> None:
+        if owners:
+            self.drop(owners)
+
+
+def install_session_hooks(
+    cache: OwnerCache,
+    flush_owners: Optional[Callable] = None,
+    statement_owners: Optional[Callable] = None,
+) -> None:
+    """Register the ORM session listeners that keep `cache` in step with writes."""
+    if flush_owners is not None:
+        @event.listens_for(_OrmSession, 'after_flush')
+        def _on_flush(session, flush_context) -> None:
+            try:
+                cache.remember(session, flush_owners(session))
+            except Exception:
+                logger.exception('%s: could not resolve owners of flush', cache.channel)
+                cache.remember(session, {None})
+
+    if statement_owners is not None:
+        @event.listens_for(_OrmSession, 'do_orm_execute')
+        def _on_orm_execute(state) -> None:
+            try:
+                if not (state.is_insert or state.is_delete or state.is_update):
+                    return
+                cache.remember(state.session, statement_owners(state))
+            except Exception:
+                logger.exception('%s: could not resolve owners of bulk statement', cache.channel)
+                cache.remember(state.session, {None})
+
+    @event.listens_for(_OrmSession, 'after_commit')
+    def _on_commit(session) -> None:
+        cache.committed(session, session.info.pop(cache.pending_key, None) or set())
+
+    @event.listens_for(_OrmSession, 'after_rollback')
+    def _on_rollback(session) -> None:
+        cache.rolled_back(session, session.info.pop(cache.pending_key, None) or set())
+
+
+# --- bulk statement helpers --------------------------------------------------
+
+def statement_table(stmt) -> Optional[str]:
+    return getattr(getattr(stmt, 'table', None), 'name', None)
+
+
+def statement_columns(stmt) -> Optional[set]:
+    """Columns an INSERT/UPDATE sets (None when they cannot be read off it)."""
+    vals = getattr(stmt, '_values', None)
+    if not vals:
+        return None
+    return {getattr(k, 'key', None) or getattr(k, 'name', None) or str(k) for k in vals}
+
+
+def statement_literals(stmt) -> dict:
+    """Column -> plain value for the statement's VALUES/SET (expressions skipped)."""
+    out: dict = {}
+    for k, v in (getattr(stmt, '_values', None) or {}).items():
+        key = getattr(k, 'key', None) or getattr(k, 'name', None) or str(k)
+        if isinstance(v, BindParameter) and v.callable is None:
+            out[key] = v.value
+    return out
+
+
+def where_owners(state, owner_query) -> set:
+    """Distinct owners of the rows the statement's WHERE clause matches.
+
+    `owner_query` selects one owner column from the statement's table (joined
+    as needed). Statements without a WHERE clause, or run with executemany
+    parameters, resolve to None (every user).
+    """
+    where = getattr(state.statement, 'whereclause', None)
+    params = state.parameters
+    if where is None or isinstance(params, (list, tuple)):
+        return {None}
+    res = state.session.connection().execute(owner_query.where(where).distinct(), params or {})
+    return {o for (o,) in res.all()}
@@ -0,0 +1,178 @@
+"""Process pool for CPU-heavy date/recurrence parsing.
+
+Goals
+- Keep dateparser work (extract_dates_meta, parse_date_and_recurrence,
+  parse_text_to_rrule_string) off the single uvicorn event loop.
+- Let calendar rebuilds parse hundreds of texts in parallel across cores.
+
+Usage
+- Set DATE_PARSE_WORKERS=N (see app/config.py) to enable a pool of N worker
+  processes. Each worker seeds its own DateDataParser (the same options the
+  lifespan uses for `_DATE_DATA_PARSER`) and runs a few warm-up parses so the
+  first real request does not pay the locale loading cost.
+- Handlers await `parse_todo_text(combined)` for the create/update path,
+  `parse_todo_texts_many(texts)` for bulk imports and
+  `extract_dates_meta_many(texts)` to batch the calendar scan.
+- With DATE_PARSE_WORKERS=0 (the default) everything runs inline exactly as
+  before, which keeps tests deterministic and monkeypatch-friendly.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Sequence
+import asyncio
+import logging
+import multiprocessing
+import os
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# Texts parsed once in each worker after seeding the parser so dateparser has
+# loaded its English locale data and compiled its internal regexes.
+_WARMUP_TEXTS = (
+    'Meeting 12/9',
+    'Dentist Sep 3 2025',
+    'Water plants every 2 weeks',
+    'Pay rent monthly on the 1st',
+)
+
+
+def _worker_init() -> None:
+    try:
+        from dateparser.date import DateDataParser
+        from . import utils as _utils
+        _utils._DATE_DATA_PARSER = DateDataParser(languages=['en'], try_previous_locales=False, use_given_order=True)
+    except Exception:
+        # dateparser missing: the utils functions already degrade to []
+        return
+    for s in _WARMUP_TEXTS:
+        try:
+            _parse_todo_text_sync(s)
+        except Exception:
+            pass
+
+
+def _parse_todo_text_sync(combined: str) -> dict:
+    """Run the three parsers used when saving a todo in one call.
+
+    Returns {'dtstart', 'rrule', 'recurrence', 'plain_dates'} where
+    plain_dates is the raw extract_dates_meta output.
+    """
+    from . import utils as _utils
+    dtstart, rrule_str = _utils.parse_text_to_rrule_string(combined)
+    _, recdict = _utils.parse_date_and_recurrence(combined)
+    try:
+        plain = _utils.extract_dates_meta(combined)
+    except Exception:
+        plain = None
+    return {'dtstart': dtstart, 'rrule': rrule_str, 'recurrence': recdict, 'plain_dates': plain}
+
+
+def _parse_todo_text_chunk(texts: Sequence[str]) -> list[dict]:
+    out: list[dict] = []
+    for s in texts:
+        try:
+            out.append(_parse_todo_text_sync(s))
+        except Exception:
+            # one unparseable item must not fail the whole batch
+            out.append({'dtstart': None, 'rrule': '', 'recurrence': None, 'plain_dates': None})
+    return out
+
+
+def _extract_dates_meta_chunk(texts: Sequence[str]) -> list[list[dict]]:
+    from . import utils as _utils
+    out: list[list[dict]] = []
+    for s in texts:
+        try:
+            out.append(_utils.extract_dates_meta(s))
+        except Exception:
+            out.append([])
+    return out
+
+
+def pool_enabled() -> bool:
+    return _pool is not None
+
+
+def start_parse_pool(workers: Optional[int] = None) -> Optional[ProcessPoolExecutor]:
+    """Create the worker pool if configured. Idempotent."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    n = config.DATE_PARSE_WORKERS if workers is None else int(workers)
+    if n <= 0:
+        return None
+    try:
+        # 'spawn' avoids forking the running event loop and open DB handles
+        ctx = multiprocessing.get_context(os.getenv('DATE_PARSE_START_METHOD', 'spawn'))
+        _pool = ProcessPoolExecutor(max_workers=n, mp_context=ctx, initializer=_worker_init)
+        logger.info('date parse pool started with %d workers', n)
+    except Exception:
+        logger.exception('failed to start date parse pool; parsing stays inline')
+        _pool = None
+    return _pool
+
+
+def shutdown_parse_pool() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        try:
+            pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            logger.exception('error shutting down date parse pool')
+
+
+async def parse_todo_text(combined: str) -> dict:
+    """Parse recurrence + plain dates for a todo's combined text/note."""
+    pool = _pool
+    if pool is None:
+        return _parse_todo_text_sync(combined)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, _parse_todo_text_sync, combined)
+    except Exception:
+        # a broken pool (worker killed) must not break saves
+        logger.exception('date parse pool failed; parsing inline')
+        return _parse_todo_text_sync(combined)
+
+
+async def _map_chunked(fn, texts: Sequence[str]) -> list:
+    """Run fn (a chunk function) over texts, split across the pool's workers.
+
+    Texts are split into one chunk per worker so the per-task pickling cost is
+    paid a handful of times rather than once per text. Order is preserved.
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    pool = _pool
+    if pool is None or len(texts) < config.DATE_PARSE_MIN_BATCH:
+        return fn(texts)
+    loop = asyncio.get_running_loop()
+    workers = max(1, getattr(pool, '_max_workers', 1))
+    size = max(1, -(-len(texts) // workers))
+    chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+    try:
+        parts = await asyncio.gather(*(loop.run_in_executor(pool, fn, c) for c in chunks))
+    except Exception:
+        logger.exception('date parse pool failed; parsing batch inline')
+        return fn(texts)
+    out: list = []
+    for p in parts:
+        out.extend(p)
+    return out
+
+
+async def extract_dates_meta_many(texts: Sequence[str]) -> list[list[dict]]:
+    """Batch extract_dates_meta over many texts, preserving order."""
+    return await _map_chunked(_extract_dates_meta_chunk, texts)
+
+
+async def parse_todo_texts_many(texts: Sequence[str]) -> list[dict]:
+    """Batch parse_todo_text over many texts (e.g. a bulk import), preserving order."""
+    return await _map_chunked(_parse_todo_text_chunk, texts)
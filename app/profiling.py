@@ -4,20 +4,40 @@ Enable via environment variables (all optional; disabled by default):
 - PROFILE_REQUESTS=1  -> profile each HTTP request and write a .prof file
 - PROFILE_GLOBAL=1    -> profile the entire app lifetime and write a single .prof
 - PROFILE_DIR=profiles -> base directory to store profile outputs (default 'profiles')
+- PROFILE_SAMPLING=1  -> start the statistical sampling profiler at startup
+- PROFILE_SAMPLE_HZ=100 -> sampling rate for the sampling profiler
 
 Per-request middleware also writes a brief top-N summary alongside the .prof.
+
+The sampling profiler does not hook function calls, so it is cheap enough to
+run against production traffic. A daemon thread wakes PROFILE_SAMPLE_HZ times
+per second and reads the event loop thread's current Python stack through
+sys._current_frames(). Samples are aggregated as folded stacks per route
+template, the input format of flamegraph.pl / speedscope. Requests are tagged
+by RouteTagMiddleware. It is the innermost user middleware, so its coroutine
+frame sits on the stack whenever endpoint code runs, and the sampler maps
+that frame back to the request scope. Tasks in 3.11 do not expose their
+contextvars to other threads, so a frame registry stands in for the
+_sse_origin style of tagging. Samples with no request frame count as
+'<background>', or as '<idle>' when the loop is waiting in select().
+Start, stop and read it through /server/profile/sampling (see app.main).
+The sampler needs the GIL, so during CPU-bound stretches samples land at the
+interpreter switch interval (5ms by default, so about 200 Hz at most). Sync
+endpoints running in the threadpool are not sampled.
 """
 from __future__ import annotations
 
 import os
 import re
 import io
+import sys
 import time
 import atexit
 import cProfile
 import pstats
+import threading
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Optional
 
 from fastapi import FastAPI, Request
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -179,12 +199,191 @@ def stop_global_profiler() -> str | None:
     return prof_path
 
 
+# ---------------- sampling profiler ----------------
+
+# id(frame of RouteTagMiddleware.__call__) -> ASGI scope of that request
+_tagged_frames: dict[int, dict] = {}
+IDLE_ROUTE = '<idle>'
+BACKGROUND_ROUTE = '<background>'
+
+
+class RouteTagMiddleware:
+    """Innermost ASGI middleware marking which request owns a coroutine stack."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope.get('type') != 'http':
+            await self.app(scope, receive, send)
+            return
+        _sampler.loop_thread = threading.get_ident()
+        key = id(sys._getframe())
+        _tagged_frames[key] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _tagged_frames.pop(key, None)
+
+
+class SamplingProfiler:
+    """Background thread aggregating folded event-loop stacks per route."""
+
+    def __init__(self, hz: float = 100.0, max_depth: int = 64, max_stacks: int = 5000):
+        self.hz = hz
+        self.max_depth = max_depth
+        # distinct stacks kept per route; further new stacks fold into '<other>'
+        self.max_stacks = max_stacks
+        self.loop_thread: Optional[int] = None
+        self._lock = threading.Lock()
+        self._folded: dict[str, dict[str, int]] = {}
+        self._labels: dict[Any, str] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, hz: Optional[float] = None) -> None:
+        if hz:
+            self.hz = max(1.0, min(float(hz), 1000.0))
+        if self.running:
+            return
+        self._stop.clear()
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        t = self._thread
+        if t is not None:
+            t.join(timeout=1.0)
+        self._thread = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._folded = {}
+            self.samples = 0
+
+    def _run(self) -> None:
+        while not self._stop.wait(1.0 / self.hz):
+            try:
+                self.sample_once()
+            except Exception:
+                # never let the sampler thread die on an odd frame
+                pass
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, 'co_qualname', code.co_name)
+            label = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+            self._labels[code] = label
+        return label
+
+    def sample_once(self) -> None:
+        tid = self.loop_thread
+        if tid is None:
+            return
+        frame = sys._current_frames().get(tid)
+        if frame is None:
+            return
+        codes = []
+        route = None
+        f = frame
+        while f is not None:
+            scope = _tagged_frames.get(id(f))
+            if scope is not None:
+                route = _route_of(scope)
+                break
+            codes.append(f.f_code)
+            f = f.f_back
+        if route is None:
+            top = frame.f_code
+            if top.co_name in ('select', 'poll', 'control') and top.co_filename.endswith('selectors.py'):
+                route = IDLE_ROUTE
+            else:
+                route = BACKGROUND_ROUTE
+        # outermost first, deepest frames kept when truncating
+        codes = codes[:self.max_depth]
+        codes.reverse()
+        stack = ';'.join(self._label(c) for c in codes) or '<no-python-frames>'
+        with self._lock:
+            per_route = self._folded.setdefault(route, {})
+            if stack not in per_route and len(per_route) >= self.max_stacks:
+                stack = '<other>'
+            per_route[stack] = per_route.get(stack, 0) + 1
+            self.samples += 1
+
+    def routes(self) -> dict[str, int]:
+        with self._lock:
+            return {r: sum(st.values()) for r, st in self._folded.items()}
+
+    def folded(self, route: Optional[str] = None, include_idle: bool = False) -> str:
+        """Flamegraph input: 'route;frame;frame count' per line.
+
+        The route is the root frame, so one flamegraph splits by route.
+        """
+        with self._lock:
+            items = [(r, dict(st)) for r, st in self._folded.items()]
+        lines = []
+        for r, stacks in sorted(items):
+            if route is not None and r != route:
+                continue
+            if r == IDLE_ROUTE and not include_idle and route is None:
+                continue
+            rlabel = r.replace(';', ',').replace(' ', '_')
+            for stack, n in sorted(stacks.items(), key=lambda kv: -kv[1]):
+                lines.append(f"{rlabel};{stack} {n}")
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+    def status(self) -> dict:
+        return {
+            'running': self.running,
+            'hz': self.hz,
+            'samples': self.samples,
+            'started_at': self.started_at,
+            'routes': self.routes(),
+        }
+
+
+def _route_of(scope: dict) -> str:
+    try:
+        from .metrics import route_label
+        return route_label(scope)
+    except Exception:
+        return scope.get('path') or '<unknown>'
+
+
+def _sample_hz_from_env() -> float:
+    try:
+        return float(os.getenv('PROFILE_SAMPLE_HZ', '100'))
+    except Exception:
+        return 100.0
+
+
+_sampler = SamplingProfiler(hz=_sample_hz_from_env())
+
+
+def get_sampling_profiler() -> SamplingProfiler:
+    return _sampler
+
+
 def install_profiler(app: FastAPI) -> None:
     """Conditionally install request/global profilers based on env vars.
 
     - PROFILE_DIR sets the base directory (default 'profiles')
     - PROFILE_REQUESTS=1 enables per-request profiling
     - PROFILE_GLOBAL=1 enables global lifetime profiling
+    - PROFILE_SAMPLING=1 starts the sampling profiler (it can also be started
+      later via the admin endpoint; request tagging is always installed)
+
+    Call this right after creating the app: RouteTagMiddleware must be the
+    first middleware added so it ends up innermost.
     """
     try:
         base_dir = os.getenv('PROFILE_DIR', 'profiles')
@@ -196,6 +395,12 @@ def install_profiler(app: FastAPI) -> None:
         if req_flag and glob_flag:
             glob_flag = False
 
+        # request tagging for the sampling profiler: a dict set/pop per request.
+        # Added first so it ends up innermost (add_middleware prepends).
+        app.add_middleware(RouteTagMiddleware)
+        if str(os.getenv('PROFILE_SAMPLING', '0')).lower() in ('1', 'true', 'yes', 'on'):
+            _sampler.start()
+
         if req_flag:
             out_dir = os.path.join(base_dir, 'requests')
             app.add_middleware(RequestProfilerMiddleware, out_dir=out_dir)
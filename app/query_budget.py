@@ -0,0 +1,212 @@
+"""Per-request SQL statement budget and N+1 detector.
+
+Goals
+- Count SQL statements per request (from the metrics cursor listeners, so
+  ORM flushes count too) and check them against a per-route budget.
+- Fingerprint statements so one query shape repeated with different
+  parameters (the classic N+1 loop) is reported by name.
+- Log a structured `sql_budget.exceeded` warning when a route goes over its
+  budget or repeats a shape SQL_N1_THRESHOLD times. In 'raise' mode it also
+  raises QueryBudgetExceeded, which fails the test that made the request.
+- Let tests capture per-request counts: `with capture_queries() as q:` then
+  q.assert_max(...) / q.assert_no_n_plus_one(...). tests_bulk exposes this
+  as the `sql_queries` fixture.
+
+Usage
+- Importing the module registers it as a metrics request observer; app.main
+  imports it at startup.
+- Settings live in app/config.py (SQL_BUDGET_MODE, SQL_BUDGET_DEFAULT,
+  SQL_BUDGET_ROUTES, SQL_N1_THRESHOLD). set_budget(route, n) adjusts a
+  route at runtime.
+
+Fingerprint: placeholders are already '?' at the cursor. Numeric and string
+literals also become '?', and IN lists of any length collapse to '(?+)', so
+`WHERE id IN (?, ?)` and `WHERE id IN (?, ?, ?)` are the same shape.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+import json
+import logging
+import re
+import threading
+
+from . import config
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised in SQL_BUDGET_MODE=raise, or by QueryCapture assertions."""
+
+
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_SPACE_RE = re.compile(r'\s+')
+
+# raw statement text -> fingerprint; statement texts are few (compiled ORM
+# queries are cached), so this stays small. Cleared if it ever grows large.
+_fingerprints: dict[str, str] = {}
+_FINGERPRINT_CACHE_MAX = 4096
+
+
+def fingerprint(statement: str) -> str:
+    fp = _fingerprints.get(statement)
+    if fp is None:
+        s = _STRING_RE.sub('?', statement)
+        s = _NUMBER_RE.sub('?', s)
+        s = _IN_LIST_RE.sub('(?+)', s)
+        fp = _SPACE_RE.sub(' ', s).strip()
+        if len(_fingerprints) >= _FINGERPRINT_CACHE_MAX:
+            _fingerprints.clear()
+        _fingerprints[statement] = fp
+    return fp
+
+
+def _parse_route_budgets(spec: str) -> dict[str, int]:
+    out: dict[str, int] = {}
+    for part in (spec or '').split(','):
+        route, sep, n = part.strip().rpartition('=')
+        if not sep or not route:
+            continue
+        try:
+            out[route.strip()] = int(n)
+        except ValueError:
+            logger.warning('ignoring bad SQL_BUDGET_ROUTES entry %r', part)
+    return out
+
+
+_route_budgets: dict[str, int] = _parse_route_budgets(config.SQL_BUDGET_ROUTES)
+
+
+def set_budget(route: str, budget: Optional[int]) -> None:
+    """Set (or with None, clear) the statement budget for a route template."""
+    if budget is None:
+        _route_budgets.pop(route, None)
+    else:
+        _route_budgets[route] = int(budget)
+
+
+def budget_for(route: str) -> int:
+    return _route_budgets.get(route, config.SQL_BUDGET_DEFAULT)
+
+
+@dataclass
+class RequestQueries:
+    method: str
+    route: str
+    status: int
+    statements: int
+    db_seconds: float
+    # fingerprint -> executions, most repeated first
+    shapes: dict[str, int] = field(default_factory=dict)
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        return {fp: n for fp, n in self.shapes.items() if n >= threshold}
+
+    def summary(self, limit: int = 3) -> dict:
+        return {
+            'method': self.method,
+            'route': self.route,
+            'status': self.status,
+            'statements': self.statements,
+            'db_ms': round(self.db_seconds * 1000.0, 2),
+            'top_shapes': [{'count': n, 'sql': fp[:300]} for fp, n in list(self.shapes.items())[:limit]],
+        }
+
+
+def _collect(method: str, route: str, status: int, st: metrics.RequestStats) -> RequestQueries:
+    shapes: dict[str, int] = {}
+    for stmt, n in st.shapes.items():
+        fp = fingerprint(stmt)
+        shapes[fp] = shapes.get(fp, 0) + n
+    ordered = dict(sorted(shapes.items(), key=lambda kv: -kv[1]))
+    return RequestQueries(method, route, status, st.statements, st.db_seconds, ordered)
+
+
+class QueryCapture:
+    """Requests completed while the capture was active (see capture_queries)."""
+
+    def __init__(self):
+        self.requests: list[RequestQueries] = []
+        self._lock = threading.Lock()
+
+    def _add(self, rq: RequestQueries) -> None:
+        with self._lock:
+            self.requests.append(rq)
+
+    @property
+    def statements(self) -> int:
+        return sum(r.statements for r in self.requests)
+
+    def for_route(self, route: str) -> list[RequestQueries]:
+        return [r for r in self.requests if r.route == route]
+
+    def assert_max(self, budget: int, route: Optional[str] = None) -> None:
+        for r in (self.for_route(route) if route else self.requests):
+            if r.statements > budget:
+                raise QueryBudgetExceeded(f'{r.method} {r.route} ran {r.statements} statements (budget {budget}): {json.dumps(r.summary())}')
+
+    def assert_no_n_plus_one(self, threshold: Optional[int] = None, route: Optional[str] = None) -> None:
+        threshold = threshold or config.SQL_N1_THRESHOLD
+        for r in (self.for_route(route) if route else self.requests):
+            rep = r.repeated(threshold)
+            if rep:
+                fp, n = next(iter(rep.items()))
+                raise QueryBudgetExceeded(f'{r.method} {r.route} repeated one statement shape {n} times (threshold {threshold}): {fp[:300]}')
+
+
+_captures: list[QueryCapture] = []
+_captures_lock = threading.Lock()
+
+
+@contextmanager
+def capture_queries() -> Iterator[QueryCapture]:
+    """Record per-request statement counts for requests finishing inside the block.
+
+    Works across threads (TestClient runs the app in its own thread).
+    """
+    cap = QueryCapture()
+    with _captures_lock:
+        _captures.append(cap)
+    try:
+        yield cap
+    finally:
+        with _captures_lock:
+            _captures.remove(cap)
+
+
+def _observe(method: str, route: str, status: int, seconds: float, st: metrics.RequestStats) -> None:
+    mode = config.SQL_BUDGET_MODE
+    if mode == 'off' and not _captures:
+        return
+    budget = budget_for(route)
+    over = st.statements > budget
+    # fewer statements than the threshold cannot contain a repeated shape
+    if not (over or _captures or st.statements >= config.SQL_N1_THRESHOLD):
+        return
+    try:
+        rq = _collect(method, route, status, st)
+    except Exception:
+        logger.exception('query budget: could not summarise request')
+        return
+    for cap in list(_captures):
+        cap._add(rq)
+    if mode == 'off':
+        return
+    repeated = rq.repeated(config.SQL_N1_THRESHOLD)
+    if not (over or repeated):
+        return
+    payload = rq.summary()
+    payload['budget'] = budget
+    payload['n_plus_one'] = [{'count': n, 'sql': fp[:300]} for fp, n in repeated.items()]
+    logger.warning('sql_budget.exceeded %s', json.dumps(payload))
+    if mode == 'raise':
+        raise QueryBudgetExceeded(f'{method} {route}: {rq.statements} statements (budget {budget}), repeated shapes: {len(repeated)}')
+
+
+metrics.add_request_observer(_observe)
@@ -0,0 +1,837 @@
+"""Text-rendering template filters: linkify and {{fn:...}} tags.
+
+Goals
+- Compile the URL / anchor / fn-tag patterns once at import instead of on
+  every filter call; list and todo pages apply these filters per note.
+- Keep a bounded LRU of rendered Markup keyed by the input string so repeated
+  notes (re-renders, trash page, identical texts) skip escaping and regex work.
+- Resolve every fn:link target referenced by a page's texts up front with a
+  few IN queries (`prefetch_fn_link_labels`) instead of several sync DB
+  lookups per link during template rendering.
+
+Usage
+- TEMPLATES.env.filters['linkify'] = linkify (likewise render_fn_tags).
+- In an async route, before rendering:
+    await prefetch_fn_link_labels(sess, [todo.note, ...])
+  which fills the per-request `_fn_link_label_cache` the filter reads.
+- RENDER_FILTER_CACHE_SIZE (default 2048) bounds each LRU; 0 disables it.
+- `render_cache_stats()` returns hit/miss counters for diagnostics.
+
+Output of render_fn_tags depends on the DB for fn:link tags (labels,
+priorities, tags, completion). Texts without links are cached by text alone;
+texts with links only when every target was prefetched, keyed by the text plus
+the resolved target data, so a changed label never serves stale HTML.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Iterable, Optional
+import json
+import logging
+import os
+import re
+import threading
+from urllib.parse import quote_plus
+
+from markupsafe import Markup, escape
+from sqlmodel import select
+
+from . import config
+from .models import ListState, Todo, Hashtag, TodoHashtag, ListHashtag
+
+logger = logging.getLogger(__name__)
+
+# Per-request cache for fn:link label resolution to avoid DB lookups during template render
+_fn_link_label_cache: ContextVar[dict | None] = ContextVar('_fn_link_label_cache', default=None)
+
+# Regex for bare URLs in text segments (not inside existing anchors)
+URL_RE = re.compile(r"(https?://[^\s<]+)")
+# Regex to split into anchor vs non-anchor segments
+ANCHOR_RE = re.compile(r"(<a\b[^>]*>.*?</a>)", re.IGNORECASE | re.DOTALL)
+# Regex to find {{fn: ... }} non-greedy
+FN_TAG_RE = re.compile(r"\{\{\s*fn:([^\}]+?)\s*\}\}")
+# Whole {{fn:link ...}} tokens, used to split notes when sorting links
+FN_LINK_TOKEN_RE = re.compile(r"(\{\{\s*fn:link[^{\}]*\}\})")
+
+# texts longer than this are rendered but not cached
+_MAX_CACHED_LEN = 64 * 1024
+
+
+class _LRU:
+    """Small thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(0, int(maxsize))
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if not self.maxsize:
+            return None
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key, val) -> None:
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = val
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+def _cache_size() -> int:
+    try:
+        return int(os.getenv('RENDER_FILTER_CACHE_SIZE', '2048'))
+    except Exception:
+        return 2048
+
+
+_linkify_cache = _LRU(_cache_size())
+_fn_tags_cache = _LRU(_cache_size())
+
+
+def render_cache_stats() -> dict:
+    return {'linkify': _linkify_cache.stats(), 'render_fn_tags': _fn_tags_cache.stats()}
+
+
+def clear_render_caches() -> None:
+    _linkify_cache.clear()
+    _fn_tags_cache.clear()
+
+
+def _linkify_repl(m: re.Match) -> str:
+    url = m.group(1)
+    return f'<a href="{url}" target="_blank" rel="noopener noreferrer">{escape(url)}</a>'
+
+
+def _linkify_segment(segment: str) -> str:
+    # Escape non-anchor text first, then replace bare URLs with anchors
+    seg = escape(segment)
+    return URL_RE.sub(_linkify_repl, str(seg))
+
+
+def linkify(text: str | None) -> Markup:
+    """Convert bare http(s) URLs in text into clickable links and return
+    safe HTML Markup. Keeps other text escaped.
+    """
+    if not text:
+        return Markup("")
+
+    s = str(text)
+    cacheable = len(s) <= _MAX_CACHED_LEN
+    if cacheable:
+        hit = _linkify_cache.get(s)
+        if hit is not None:
+            return hit
+    parts = ANCHOR_RE.split(s)
+    out_parts: list[str] = []
+    for part in parts:
+        if not part:
+            continue
+        if ANCHOR_RE.match(part):
+            # Preserve existing anchors verbatim
+            out_parts.append(part)
+        else:
+            out_parts.append(_linkify_segment(part))
+    out = Markup(''.join(out_parts))
+    if cacheable:
+        _linkify_cache.put(s, out)
+    return out
+
+
+def _parse_fn_body(body: str) -> tuple[str, dict, Optional[str], Optional[str]]:
+    """Split a tag body into (identifier, args, label, confirm). Raises on malformed input."""
+    # Split off a label part after a '|' if present
+    label = None
+    confirm = None
+    if '|' in body:
+        before, after = body.split('|', 1)
+        body = before.strip()
+        label_part = after.strip()
+        # label may include ?confirm="..."
+        if '?confirm=' in label_part:
+            lp, conf = label_part.split('?confirm=', 1)
+            label = lp.strip()
+            # strip optional surrounding quotes
+            conf = conf.strip()
+            if (conf.startswith('"') and conf.endswith('"')) or (conf.startswith("'") and conf.endswith("'")):
+                conf = conf[1:-1]
+            confirm = conf
+        else:
+            label = label_part
+
+    # Now parse identifier and arg list
+    parts = body.split(None, 1)
+    identifier = parts[0].strip()
+    args_text = parts[1].strip() if len(parts) > 1 else ''
+
+    args = {}
+    if args_text:
+        # Support comma-separated key=val pairs, values may be quoted
+        # Simple parser: split on commas not inside quotes
+        cur = ''
+        in_q = None
+        pairs = []
+        for ch in args_text:
+            if ch in ('"', "'"):
+                if in_q is None:
+                    in_q = ch
+                elif in_q == ch:
+                    in_q = None
+                cur += ch
+            elif ch == ',' and in_q is None:
+                pairs.append(cur)
+                cur = ''
+            else:
+                cur += ch
+        if cur.strip():
+            pairs.append(cur)
+
+        for p in pairs:
+            if '=' in p:
+                k, v = p.split('=', 1)
+                k = k.strip()
+                v = v.strip()
+                # strip quotes
+                if (v.startswith('"') and v.endswith('"')) or (v.startswith("'") and v.endswith("'")):
+                    v = v[1:-1]
+                # normalize tags into a list
+                if k == 'tags':
+                    # allow tags="#a,#b" or tags=#a,#b (we split earlier on commas so handle single value)
+                    if isinstance(v, str) and ',' in v:
+                        args[k] = [t.strip() for t in v.split(',') if t.strip()]
+                    else:
+                        args[k] = [v]
+                else:
+                    args[k] = v
+            else:
+                # positional tag-like argument, e.g., #tag -> collect into tags list
+                val = p.strip()
+                if val:
+                    if 'tags' in args and isinstance(args['tags'], str):
+                        # convert stray string to list
+                        args['tags'] = [args['tags']]
+                    args.setdefault('tags', []).append(val)
+
+    # Final normalization: ensure tags is a list when present
+    if 'tags' in args and not isinstance(args['tags'], list):
+        if isinstance(args['tags'], str):
+            args['tags'] = [t.strip() for t in args['tags'].split(',') if t.strip()]
+        else:
+            args['tags'] = [args['tags']]
+    return identifier, args, label, confirm
+
+
+def _link_target(args: dict) -> tuple[Optional[str], Optional[int]]:
+    """Return (kind, id) for fn:link args; kind/id are None when not recognised."""
+    kind = None
+    target_id = None
+    # Prefer a combined target like "todo:123" or "list:45"
+    tval = args.get('target') if isinstance(args, dict) else None
+    if isinstance(tval, str) and ':' in tval:
+        k, v = tval.split(':', 1)
+        kind = (k or '').strip().lower()
+        try:
+            target_id = int((v or '').strip())
+        except Exception:
+            target_id = None
+    else:
+        # Accept separate keys: type + id, or todo/list keys directly
+        if 'type' in args and 'id' in args:
+            kind = str(args.get('type') or '').strip().lower()
+            try:
+                target_id = int(str(args.get('id') or '').strip())
+            except Exception:
+                target_id = None
+        elif 'todo' in args:
+            kind = 'todo'
+            try:
+                target_id = int(str(args.get('todo') or '').strip())
+            except Exception:
+                target_id = None
+        elif 'list' in args:
+            kind = 'list'
+            try:
+                target_id = int(str(args.get('list') or '').strip())
+            except Exception:
+                target_id = None
+    return kind, target_id
+
+
+def _render_fn_match(m: re.Match) -> str:
+    body = m.group(1).strip()
+    try:
+        identifier, args, label, confirm = _parse_fn_body(body)
+
+        # Build data-args JSON safely
+        data_args = json.dumps(args, ensure_ascii=False)
+
+        btn_label = (label or identifier)
+
+        # Escape label for HTML
+        esc_label = escape(btn_label)
+        esc_ident = escape(identifier)
+        esc_args = escape(data_args)
+
+        attrs = f'data-fn="{esc_ident}" data-args="{esc_args}"'
+        if confirm:
+            attrs += f' data-confirm="{escape(confirm)}"'
+
+        # For navigation-style functions (search.multi) render an anchor so
+        # middle-click / Ctrl+click / right-click -> open in new tab works
+        if identifier == 'search.multi':
+            # Build a simple query from tags if present (comma-separated)
+            q = ''
+            try:
+                if 'tags' in args and isinstance(args['tags'], list):
+                    # remove any internal whitespace from tags (server convention)
+                    cleaned = [t.replace(' ', '') for t in args['tags'] if isinstance(t, str)]
+                    # join with spaces so the search page receives separate tokens
+                    q = ' '.join(cleaned)
+            except Exception:
+                q = ''
+            href = '/html_no_js/search?q=' + quote_plus(q)
+            # Important: emit a plain anchor without data-fn so middle/Ctrl-click works and no exec-fn intercept
+            return f'<a class="fn-button" role="link" href="{escape(href)}">{esc_label}</a>'
+
+        # External URL link with optional custom label
+        if identifier == 'url':
+            try:
+                # Determine href from explicit args or first positional token
+                href_val = None
+                if isinstance(args, dict):
+                    href_val = args.get('href') or args.get('url')
+                    if (not href_val) and isinstance(args.get('tags'), list) and args.get('tags'):
+                        href_val = args['tags'][0]
+                href = str(href_val or '').strip()
+                # basic scheme safety: require http/https
+                if not href.lower().startswith('http://') and not href.lower().startswith('https://'):
+                    # if missing scheme but looks like domain, prepend http:// as a convenience
+                    if href and '://' not in href and ('.' in href or href.startswith('www.')):
+                        href = 'http://' + href
+                if not href:
+                    # malformed; fall back to button rendering
+                    raise ValueError('missing href')
+                # Label: use custom label if provided; else show the URL
+                link_label = btn_label if label else href
+                # Attributes
+                target = (args.get('target') if isinstance(args, dict) else None) or '_blank'
+                rel = (args.get('rel') if isinstance(args, dict) else None) or 'noopener noreferrer'
+                # Optional nofollow/noreferrer flags
+                try:
+                    def _is_true(v):
+                        s = str(v).strip().lower() if v is not None else ''
+                        return s in ('1','true','yes','on') or v is True
+                    if isinstance(args, dict) and (_is_true(args.get('nofollow')) or ('nofollow' in args and args.get('nofollow') is None)):
+                        if 'nofollow' not in rel:
+                            rel = (rel + ' nofollow').strip()
+                except Exception:
+                    pass
+                return (
+                    f'<a class="fn-button fn-url" role="link" href="{escape(href)}" target="{escape(target)}" rel="{escape(rel)}">'
+                    f'{escape(link_label)}</a>'
+                )
+            except Exception:
+                # fall through to default
+                pass
+
+        # Navigation link to a specific todo or list by id
+        if identifier == 'link':
+            try:
+                kind, target_id = _link_target(args)
+
+                if kind in ('todo', 'list') and isinstance(target_id, int) and target_id > 0:
+                    href = f"/html_no_js/{'todos' if kind=='todo' else 'lists'}/{target_id}"
+                    # Resolve label: prefer explicit |Label; else use the actual item name/text when possible
+                    has_custom_label = bool(label)
+                    link_label = btn_label if has_custom_label else None
+                    link_priority: int | None = None
+                    link_tags: list[str] | None = None
+                    # determine if priority should be suppressed via args
+                    def _is_false(v: str | bool | None) -> bool:
+                        if v is None:
+                            return False
+                        if isinstance(v, bool):
+                            return (v is False)
+                        s = str(v).strip().lower()
+                        return s in ('0','false','no','off')
+                    show_prio = True
+                    try:
+                        if _is_false(args.get('show_priority')) or _is_false(args.get('priority')) or ('no_priority' in args) or ('nopriority' in args):
+                            show_prio = False
+                    except Exception:
+                        show_prio = True
+                    # First check per-request cache for name, priority, and tags
+                    cache = _fn_link_label_cache.get() or {}
+                    cache_key = f"{kind}:{target_id}"
+                    cached = cache.get(cache_key) if cache else None
+                    # entries written by prefetch_fn_link_labels are complete
+                    # (a missing priority or target really is missing)
+                    prefetched = isinstance(cached, dict) and bool(cached.get('resolved'))
+                    if isinstance(cached, dict):
+                        try:
+                            if link_priority is None:
+                                link_priority = cached.get('priority')
+                            # Only adopt cached label when no custom label given
+                            if not has_custom_label and (not link_label):
+                                link_label = cached.get('name') or cached.get('label')
+                            if link_tags is None:
+                                ct = cached.get('tags')
+                                if isinstance(ct, list):
+                                    link_tags = [str(x) for x in ct if isinstance(x, str)] or []
+                        except Exception:
+                            pass
+                    elif isinstance(cached, str) and cached and not has_custom_label and not link_label:
+                        link_label = cached
+
+                    # Decide if we need a DB lookup: if label is missing (no custom) or we need priority or tags
+                    need_lookup = not prefetched and ((not has_custom_label and not link_label) or (show_prio and (link_priority is None)) or (link_tags is None))
+                    resolved_name: str | None = None
+                    if need_lookup:
+                        # Try SQLAlchemy sync session first; if that fails (e.g., async driver), try sqlite3 direct.
+                        looked_up = False
+                        try:
+                            from .db import engine, TracedSyncSession
+                            with TracedSyncSession(bind=getattr(engine, 'sync_engine', None)) as _s:
+                                if kind == 'todo':
+                                    res = _s.execute(select(Todo.text, Todo.priority).where(Todo.id == target_id)).first()
+                                    if res:
+                                        txt = res[0] if isinstance(res, (tuple, list)) else None
+                                        pr = res[1] if isinstance(res, (tuple, list)) and len(res) > 1 else None
+                                        if isinstance(txt, str) and txt.strip():
+                                            resolved_name = txt.strip()
+                                            if not has_custom_label and not link_label:
+                                                link_label = resolved_name
+                                        try:
+                                            if link_priority is None:
+                                                link_priority = int(pr) if pr is not None else None
+                                        except Exception:
+                                            link_priority = None
+                                        # fetch hashtags for todo
+                                        try:
+                                            qtags = select(Hashtag.tag).join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id).where(TodoHashtag.todo_id == target_id)
+                                            rtags = _s.execute(qtags).all()
+                                            tags_list: list[str] = []
+                                            for row in rtags:
+                                                val = row[0] if isinstance(row, (tuple, list)) else row
+                                                if isinstance(val, str) and val:
+                                                    tags_list.append(val)
+                                            link_tags = tags_list
+                                        except Exception:
+                                            pass
+                                        looked_up = True
+                                else:
+                                    res = _s.execute(select(ListState.name, ListState.priority).where(ListState.id == target_id)).first()
+                                    if res:
+                                        name = res[0] if isinstance(res, (tuple, list)) else None
+                                        pr = res[1] if isinstance(res, (tuple, list)) and len(res) > 1 else None
+                                        if isinstance(name, str) and name.strip():
+                                            resolved_name = name.strip()
+                                            if not has_custom_label and not link_label:
+                                                link_label = resolved_name
+                                        try:
+                                            if link_priority is None:
+                                                link_priority = int(pr) if pr is not None else None
+                                        except Exception:
+                                            link_priority = None
+                                        # fetch hashtags for list
+                                        try:
+                                            qtags = select(Hashtag.tag).join(ListHashtag, ListHashtag.hashtag_id == Hashtag.id).where(ListHashtag.list_id == target_id)
+                                            rtags = _s.execute(qtags).all()
+                                            tags_list: list[str] = []
+                                            for row in rtags:
+                                                val = row[0] if isinstance(row, (tuple, list)) else row
+                                                if isinstance(val, str) and val:
+                                                    tags_list.append(val)
+                                            link_tags = tags_list
+                                        except Exception:
+                                            pass
+                                        looked_up = True
+                        except Exception:
+                            pass
+                        # Fallback: direct sqlite3 if using local sqlite DB
+                        if not looked_up:
+                            try:
+                                from .db import DATABASE_URL as _DB_URL
+                                from .db import _sqlite_path_from_url as _sqlite_path_from_url
+                                path = _sqlite_path_from_url(_DB_URL)
+                                if path:
+                                    import sqlite3
+                                    import os as _os
+                                    abs_path = _os.path.abspath(path)
+                                    if _os.path.exists(abs_path):
+                                        con = sqlite3.connect(abs_path)
+                                        try:
+                                            cur = con.cursor()
+                                            if kind == 'todo':
+                                                cur.execute('SELECT text, priority FROM todo WHERE id = ?', (target_id,))
+                                            else:
+                                                cur.execute('SELECT name, priority FROM liststate WHERE id = ?', (target_id,))
+                                            row = cur.fetchone()
+                                            if row:
+                                                if isinstance(row[0], str) and row[0].strip():
+                                                    resolved_name = row[0].strip()
+                                                    if not has_custom_label and not link_label:
+                                                        link_label = resolved_name
+                                                try:
+                                                    if link_priority is None:
+                                                        link_priority = int(row[1]) if len(row) > 1 and row[1] is not None else None
+                                                except Exception:
+                                                    link_priority = None
+                                            # fetch hashtags via sqlite
+                                            try:
+                                                if kind == 'todo':
+                                                    cur.execute('SELECT h.tag FROM hashtag h JOIN todohashtag th ON th.hashtag_id = h.id WHERE th.todo_id = ?', (target_id,))
+                                                else:
+                                                    cur.execute('SELECT h.tag FROM hashtag h JOIN listhashtag lh ON lh.hashtag_id = h.id WHERE lh.list_id = ?', (target_id,))
+                                                rows = cur.fetchall()
+                                                link_tags = [r[0] for r in rows if r and isinstance(r[0], str) and r[0]]
+                                            except Exception:
+                                                pass
+                                        finally:
+                                            try:
+                                                con.close()
+                                            except Exception:
+                                                pass
+                            except Exception:
+                                pass
+                    # If tags were not resolved yet, attempt a light sqlite fallback just for hashtags
+                    if link_tags is None:
+                        try:
+                            from .db import DATABASE_URL as _DB_URL
+                            from .db import _sqlite_path_from_url as _sqlite_path_from_url
+                            path = _sqlite_path_from_url(_DB_URL)
+                            if path:
+                                import sqlite3
+                                import os as _os
+                                abs_path = _os.path.abspath(path)
+                                if _os.path.exists(abs_path):
+                                    con = sqlite3.connect(abs_path)
+                                    try:
+                                        cur = con.cursor()
+                                        if kind == 'todo':
+                                            cur.execute('SELECT h.tag FROM hashtag h JOIN todohashtag th ON th.hashtag_id = h.id WHERE th.todo_id = ?', (target_id,))
+                                        else:
+                                            cur.execute('SELECT h.tag FROM hashtag h JOIN listhashtag lh ON lh.hashtag_id = h.id WHERE lh.list_id = ?', (target_id,))
+                                        rows = cur.fetchall()
+                                        link_tags = [r[0] for r in rows if r and isinstance(r[0], str) and r[0]]
+                                        if config.DEBUG_FN_LINKS:
+                                            try:
+                                                import os as _os
+                                                import time as _time
+                                                _os.makedirs('debug_logs', exist_ok=True)
+                                                with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
+                                                    _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
+                                                    _f.write(f"[{_ts}] sqlite-tags kind={kind} id={target_id} count={len(link_tags or [])} rows={link_tags!r}\n")
+                                            except Exception:
+                                                pass
+                                    finally:
+                                        try:
+                                            con.close()
+                                        except Exception:
+                                            pass
+                        except Exception:
+                            pass
+                    # Final debug snapshot of what will be rendered
+                    if config.DEBUG_FN_LINKS:
+                        try:
+                            import os as _os
+                            import time as _time
+                            _os.makedirs('debug_logs', exist_ok=True)
+                            with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
+                                _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
+                                _f.write(f"[{_ts}] final-tags kind={kind} id={target_id} tags={link_tags!r}\n")
+                        except Exception:
+                            pass
+                    if link_label is None:
+                        # Final fallback if lookup failed
+                        link_label = f"Todo #{target_id}" if kind == 'todo' else f"List #{target_id}"
+                    else:
+                        # Save into per-request cache for subsequent references in same render/request
+                        cache = _fn_link_label_cache.get() or {}
+                        try:
+                            cache_key = f"{kind}:{target_id}"
+                            # Store true resolved name when available; avoid caching custom labels as titles
+                            store_name = resolved_name if isinstance(resolved_name, str) and resolved_name else (None if has_custom_label else link_label)
+                            entry = cache.get(cache_key) if isinstance(cache.get(cache_key), dict) else {}
+                            if store_name:
+                                entry['name'] = store_name
+                                entry['label'] = store_name
+                            if link_priority is not None:
+                                entry['priority'] = link_priority
+                            if isinstance(link_tags, list):
+                                entry['tags'] = [str(x) for x in link_tags if isinstance(x, str)]
+                            if entry:
+                                cache[cache_key] = entry
+                                _fn_link_label_cache.set(cache)
+                        except Exception:
+                            pass
+                    # Important: do NOT include data-fn/data-args here so clicks navigate normally (no exec-fn)
+                    # Optionally append priority circle if available and not suppressed
+                    def _circled(n: int | None) -> str:
+                        try:
+                            if n is None:
+                                return ''
+                            n = int(n)
+                            if 1 <= n <= 10:
+                                return chr(0x2460 + (n - 1))
+                            return str(n)
+                        except Exception:
+                            return ''
+                    pr_html = ''
+                    if show_prio and (link_priority is not None):
+                        ch = _circled(link_priority)
+                        if ch:
+                            pr_html = f' <span class="meta priority-inline" title="Priority {int(link_priority)}"><span class="priority-circle">{escape(ch)}</span></span>'
+                    # Place the priority markup inside the anchor so post-processing (linkify) preserves it
+                    # Build hashtags as separate tag-chip anchors outside the main link
+                    tags_html = ''
+                    try:
+                        if isinstance(link_tags, list) and link_tags:
+                            chips: list[str] = []
+                            for t in link_tags:
+                                if not isinstance(t, str) or not t:
+                                    continue
+                                chips.append(f'<a class="tag-chip" href="/html_no_js/search?q={quote_plus(t)}" role="link">{escape(t)}</a>')
+                            if chips:
+                                # No wrapper span to avoid linkify escaping non-anchor HTML; chips have their own spacing.
+                                tags_html = ' ' + ''.join(chips)
+                    except Exception:
+                        tags_html = ''
+                    # Optional debug logging for troubleshooting link rendering
+                    try:
+                        if config.DEBUG_FN_LINKS:
+                            try:
+                                import os as _os
+                                import time as _time
+                                _os.makedirs('debug_logs', exist_ok=True)
+                                with open(_os.path.join('debug_logs', 'fn_link_debug.log'), 'a', encoding='utf-8') as _f:
+                                    _ts = _time.strftime('%Y-%m-%d %H:%M:%S')
+                                    _f.write(f"[{_ts}] fn:link kind={kind} id={target_id} label={link_label!r} pr={link_priority!r} tags={link_tags!r}\n")
+                            except Exception:
+                                pass
+                    except Exception:
+                        pass
+                    # Compose label using Markup to avoid double-escaping of our span fragments
+                    label_html = escape(link_label) + Markup(pr_html)
+                    # Attempt to detect whether the target todo is completed so
+                    # we can mark inline anchors with `done` and let CSS
+                    # apply a strikethrough. Best-effort: try a sync DB
+                    # lookup first, fall back to sqlite direct query.
+                    link_completed = False
+                    if prefetched and 'done' in cached:
+                        link_completed = bool(cached.get('done'))
+                    try:
+                        if kind == 'todo' and isinstance(target_id, int) and not (prefetched and 'done' in cached):
+                            try:
+                                from .db import engine, TracedSyncSession
+                                with TracedSyncSession(bind=getattr(engine, 'sync_engine', None)) as _s:
+                                    q = _s.execute(select(Todo.id).where(Todo.id == target_id).where(Todo.is_done == True))
+                                    row = q.first()
+                                    if row:
+                                        link_completed = True
+                            except Exception:
+                                try:
+                                    from .db import DATABASE_URL as _DB_URL
+                                    from .db import _sqlite_path_from_url as _sqlite_path_from_url
+                                    path = _sqlite_path_from_url(_DB_URL)
+                                    if path:
+                                        import sqlite3
+                                        import os as _os
+                                        abs_path = _os.path.abspath(path)
+                                        if _os.path.exists(abs_path):
+                                            con = sqlite3.connect(abs_path)
+                                            try:
+                                                cur = con.cursor()
+                                                cur.execute("SELECT tc.todo_id FROM todocompletion tc JOIN completiontype ct ON tc.completion_type_id = ct.id WHERE tc.todo_id = ? AND ct.name = 'default' AND tc.done = 1", (target_id,))
+                                                prow = cur.fetchone()
+                                                if prow:
+                                                    link_completed = True
+                                            finally:
+                                                try:
+                                                    con.close()
+                                                except Exception:
+                                                    pass
+                                except Exception:
+                                    pass
+                    except Exception:
+                        pass
+                    cls = 'fn-button fn-link'
+                    if link_completed:
+                        cls += ' done'
+                    return f'<a class="{cls}" role="link" href="{escape(href)}">{label_html}</a>' + tags_html
+                # If parsing failed, fall through to default button rendering
+            except Exception:
+                pass
+
+        return f'<button type="button" class="fn-button" {attrs}>{esc_label}</button>'
+    except Exception:
+        # On any parse error, return the original text escaped
+        return escape(m.group(0))
+
+
+def _link_targets_in(text: str) -> Optional[list[tuple[str, int]]]:
+    """Return the (kind, id) of every fn:link tag in text; None if a link tag
+    could not be parsed (its rendering then falls back to per-tag handling)."""
+    targets: list[tuple[str, int]] = []
+    for m in FN_TAG_RE.finditer(text):
+        try:
+            identifier, args, _label, _confirm = _parse_fn_body(m.group(1).strip())
+        except Exception:
+            continue
+        if identifier != 'link':
+            continue
+        kind, target_id = _link_target(args)
+        if kind in ('todo', 'list') and isinstance(target_id, int) and target_id > 0:
+            targets.append((kind, target_id))
+        else:
+            return None
+    return targets
+
+
+def _fn_tags_cache_key(s: str) -> Optional[tuple]:
+    # pure texts: the text itself; texts with links: the text plus the
+    # prefetched data each link renders, or None (not cacheable)
+    if 'fn:' not in s:
+        return (s,)
+    targets = _link_targets_in(s)
+    if targets is None:
+        return None
+    if not targets:
+        return (s,)
+    cache = _fn_link_label_cache.get() or {}
+    resolved = []
+    for kind, target_id in targets:
+        entry = cache.get(f"{kind}:{target_id}")
+        if not (isinstance(entry, dict) and entry.get('resolved')):
+            return None
+        resolved.append((
+            kind, target_id, entry.get('name'), entry.get('priority'),
+            tuple(entry.get('tags') or ()), bool(entry.get('done')),
+        ))
+    return (s, tuple(resolved))
+
+
+def render_fn_tags(text: str | None) -> Markup:
+    """Render {{fn:...}} tags into safe HTML buttons with data attributes.
+
+    Recognizes tags of the form:
+      {{fn:identifier arg1=val1,arg2=val2 | Label ?confirm="Are you sure?"}}
+
+    Produces HTML like:
+      <button data-fn="identifier" data-args='{"arg1":"val1"}'>Label</button>
+
+    Malformed tags are returned escaped.
+    """
+    if not text:
+        return Markup("")
+
+    s = str(text)
+    key = None
+    if len(s) <= _MAX_CACHED_LEN:
+        try:
+            key = _fn_tags_cache_key(s)
+        except Exception:
+            key = None
+        if key is not None:
+            hit = _fn_tags_cache.get(key)
+            if hit is not None:
+                return hit
+    # We need to run tag replacement on the raw text, not the escaped one, to preserve parsing
+    try:
+        out = Markup(FN_TAG_RE.sub(_render_fn_match, s))
+    except Exception:
+        return Markup(escape(text))
+    if key is not None:
+        _fn_tags_cache.put(key, out)
+    return out
+
+
+async def prefetch_fn_link_labels(sess, texts: Iterable[Optional[str]]) -> int:
+    """Resolve every fn:link target referenced in texts ahead of rendering.
+
+    Loads names, priorities, hashtags and default-completion state for all
+    targets with at most five IN queries and stores complete entries in the
+    per-request `_fn_link_label_cache`, so render_fn_tags needs no DB access
+    for them. Existing string seeds (route-provided labels) are kept as the
+    label. Returns the number of targets resolved.
+    """
+    todo_ids: set[int] = set()
+    list_ids: set[int] = set()
+    for t in texts or []:
+        if not t or 'fn:' not in str(t):
+            continue
+        for kind, target_id in _link_targets_in(str(t)) or []:
+            (todo_ids if kind == 'todo' else list_ids).add(target_id)
+    cache = _fn_link_label_cache.get()
+    if not isinstance(cache, dict):
+        cache = {}
+    todo_ids = {i for i in todo_ids if not (isinstance(cache.get(f"todo:{i}"), dict) and cache[f"todo:{i}"].get('resolved'))}
+    list_ids = {i for i in list_ids if not (isinstance(cache.get(f"list:{i}"), dict) and cache[f"list:{i}"].get('resolved'))}
+    if not todo_ids and not list_ids:
+        return 0
+    found: dict[str, dict[str, Any]] = {}
+    tags: dict[str, list[str]] = {}
+    done: set[int] = set()
+    if todo_ids:
+        ids = sorted(todo_ids)
+        for tid, txt, pr, is_done in (await sess.exec(select(Todo.id, Todo.text, Todo.priority, Todo.is_done).where(Todo.id.in_(ids)))).all():
+            found[f"todo:{int(tid)}"] = {'name': txt, 'priority': pr}
+            if is_done:
+                done.add(int(tid))
+        qt = select(TodoHashtag.todo_id, Hashtag.tag).join(Hashtag, Hashtag.id == TodoHashtag.hashtag_id).where(TodoHashtag.todo_id.in_(ids))
+        for tid, tag in (await sess.exec(qt)).all():
+            if isinstance(tag, str) and tag:
+                tags.setdefault(f"todo:{int(tid)}", []).append(tag)
+    if list_ids:
+        ids = sorted(list_ids)
+        for lid, name, pr in (await sess.exec(select(ListState.id, ListState.name, ListState.priority).where(ListState.id.in_(ids)))).all():
+            found[f"list:{int(lid)}"] = {'name': name, 'priority': pr}
+        ql = select(ListHashtag.list_id, Hashtag.tag).join(Hashtag, Hashtag.id == ListHashtag.hashtag_id).where(ListHashtag.list_id.in_(ids))
+        for lid, tag in (await sess.exec(ql)).all():
+            if isinstance(tag, str) and tag:
+                tags.setdefault(f"list:{int(lid)}", []).append(tag)
+    keys = [f"todo:{i}" for i in sorted(todo_ids)] + [f"list:{i}" for i in sorted(list_ids)]
+    for key in keys:
+        entry: dict[str, Any] = {'resolved': True, 'tags': tags.get(key, [])}
+        row = found.get(key)
+        seed = cache.get(key)
+        name = None
+        if isinstance(seed, str) and seed:
+            name = seed
+        elif row is not None and isinstance(row.get('name'), str) and row['name'].strip():
+            name = row['name'].strip()
+        if name:
+            entry['name'] = name
+            entry['label'] = name
+        if row is not None:
+            try:
+                entry['priority'] = int(row['priority']) if row.get('priority') is not None else None
+            except Exception:
+                entry['priority'] = None
+        if key.startswith('todo:'):
+            entry['done'] = int(key.split(':', 1)[1]) in done
+        cache[key] = entry
+    _fn_link_label_cache.set(cache)
+    return len(keys)
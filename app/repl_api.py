@@ -23,6 +23,7 @@ from sqlmodel import select
 
 from .db import async_session
 from .models import ListState, Todo, User
+from .undefer import undefer_scheduler
 
 
 # --- Thread-local loop management for blocking helpers ---
@@ -85,12 +86,122 @@ class TodoRef:
         return f"<Todo #{self.id} {self.list_path} :: {self.text}>"
 
 
+# --- Cached directory tree ---
+class _DirTree:
+    """Snapshot of one user's list hierarchy, loaded with a single SELECT.
+
+    Path resolution, ref paths and `ls -R` used to issue one query per path
+    component / ancestor / child list. The tree keeps only
+    (id, name, parent_list_id, parent_todo_id) per list, so it stays small even
+    for users with thousands of lists. It is a cache: lookups that hit it are
+    re-checked against the DB rows they return, and a miss triggers one reload.
+    """
+
+    def __init__(self, rows):
+        # id -> (name, parent_list_id, parent_todo_id)
+        self.nodes: dict[int, tuple[str, Optional[int], Optional[int]]] = {}
+        # parent list id (None = root) -> child ids in creation order
+        self.children: dict[Optional[int], list[int]] = {}
+        # (parent list id, name) -> id; the first-created list wins on duplicates
+        self.by_name: dict[tuple[Optional[int], str], int] = {}
+        for lid, name, parent_list_id, parent_todo_id in rows:
+            self.nodes[lid] = (name, parent_list_id, parent_todo_id)
+            if parent_list_id is not None:
+                self.children.setdefault(parent_list_id, []).append(lid)
+            elif parent_todo_id is None:
+                self.children.setdefault(None, []).append(lid)
+            if parent_todo_id is None:
+                self.by_name.setdefault((parent_list_id, name), lid)
+
+    @classmethod
+    async def load(cls, sess, user_id: int) -> "_DirTree":
+        q = (
+            select(ListState.id, ListState.name, ListState.parent_list_id, ListState.parent_todo_id)
+            .where(ListState.owner_id == user_id)
+            .order_by(ListState.created_at.asc(), ListState.id.asc())
+        )
+        res = await sess.exec(q)
+        return cls(res.all())
+
+    def resolve(self, parts: list[str]) -> Optional[list[int]]:
+        """Return the ids along /parts[0]/parts[1]/..., or None if any is missing."""
+        chain: list[int] = []
+        parent: Optional[int] = None
+        for name in parts:
+            lid = self.by_name.get((parent, name))
+            if lid is None:
+                return None
+            chain.append(lid)
+            parent = lid
+        return chain
+
+    def matches(self, row: ListState) -> bool:
+        node = self.nodes.get(row.id)
+        return node is not None and node == (row.name, row.parent_list_id, row.parent_todo_id)
+
+    def path(self, name: str, parent_list_id: Optional[int], parent_todo_id: Optional[int]) -> str:
+        # same shape _listref always produced: parent_list names only, with a
+        # '(@todo:<id>)' suffix when the topmost list hangs off a todo
+        names = [name]
+        loop_guard = 0
+        while parent_list_id and loop_guard < 100:
+            loop_guard += 1
+            node = self.nodes.get(parent_list_id)
+            if node is None:
+                break
+            names.append(node[0])
+            parent_list_id, parent_todo_id = node[1], node[2]
+        path = "/" + "/".join(reversed(names))
+        if parent_todo_id:
+            path = f"{path}(@todo:{parent_todo_id})"
+        return path
+
+    def path_of(self, list_id: int) -> str:
+        name, parent_list_id, parent_todo_id = self.nodes[list_id]
+        return self.path(name, parent_list_id, parent_todo_id)
+
+
 # --- Core context ---
 class Repl:
     def __init__(self, user: User):
         self.user = user
         self.cwd: Optional[Union[ListRef, TodoRef]] = None  # container context
         self.output_format: str = "table"
+        # name -> id tree of the user's lists; dropped after REPL mutations
+        # and reloaded lazily (see _DirTree)
+        self._tree: Optional[_DirTree] = None
+
+    # -------- Tree cache --------
+    def invalidate(self):
+        """invalidate()
+
+        Drop the cached list tree; it is reloaded on next use. Only needed
+        after changing lists outside this REPL session.
+        """
+        self._tree = None
+        return self
+
+    async def _tree_for(self, sess, refresh: bool = False) -> _DirTree:
+        tree = self._tree
+        if tree is None or refresh:
+            tree = await _DirTree.load(sess, self.user.id)
+            self._tree = tree
+        return tree
+
+    async def _load_tree(self) -> _DirTree:
+        async with async_session() as sess:
+            return await self._tree_for(sess, refresh=True)
+
+    def _abs_path(self, path: str) -> str:
+        path = path.strip()
+        if not path.startswith('/'):
+            # relative: interpret under cwd if cwd is a list
+            base_path = self.pwd()
+            if base_path != '/':
+                path = base_path.rstrip('/') + '/' + path
+            else:
+                path = '/' + path
+        return path
 
     # -------- Resolution --------
     def L(self, ident: Union[int, str]) -> ListRef:
@@ -105,14 +216,7 @@ class Repl:
                 raise ValueError("list not found")
             return self._listref(row)
         # path
-        path = ident.strip()
-        if not path.startswith('/'):
-            # relative: interpret under cwd if cwd is a list
-            base_path = self.pwd()
-            if base_path != '/':
-                path = base_path.rstrip('/') + '/' + path
-            else:
-                path = '/' + path
+        path = self._abs_path(ident)
         row = _run(self._get_list_by_path(path))
         if not row:
             raise ValueError(f"list not found for path: {path}")
@@ -169,7 +273,8 @@ class Repl:
 
         List lists and todos under the current directory or a given List.
         selector: path string or ListRef
-        recursive: when True, includes single-level descendants recursively.
+        recursive: when True, walks the whole subtree (ls -R); at '/' this
+        lists every list and todo reachable from the top-level lists.
         Returns a table string (default fmt) or JSON list when fmt('json').
         """
         base: Optional[ListRef] = None
@@ -180,24 +285,7 @@ class Repl:
             base = selector
         else:
             base = self.L(selector)
-        rows: list[dict[str, Any]] = []
-        if base is None:
-            # top-level lists only
-            lists = _run(self._lists_in_container(None, None))
-            rows = [
-                {"type": "list", "id": l.id, "name": l.name, "path": self._listref(l).path}
-                for l in lists
-            ]
-        else:
-            lists, todos = _run(self._lists_and_todos_under_list(base.id))
-            rows.extend({"type": "list", "id": l.id, "name": l.name, "path": self._listref(l).path} for l in lists)
-            rows.extend({"type": "todo", "id": t.id, "text": t.text, "list": base.path} for t in todos)
-            if recursive:
-                for l in lists:
-                    subref = self._listref(l)
-                    sub_lists, sub_todos = _run(self._lists_and_todos_under_list(l.id))
-                    rows.extend({"type": "list", "id": sl.id, "name": sl.name, "path": self._listref(sl).path} for sl in sub_lists)
-                    rows.extend({"type": "todo", "id": st.id, "text": st.text, "list": subref.path} for st in sub_todos)
+        rows = _run(self._ls_rows(base, recursive))
         return _tabulate(rows, ["type", "id", "name", "text", "path", "list"]) if self.output_format == "table" else rows
 
     def show(self, x: Union[ListRef, TodoRef, int, str, Tuple[str, str]]):
@@ -235,7 +323,9 @@ class Repl:
         Create a list at root, under a List, or under a Todo (sublist).
         Props: priority, expanded, hide_done, lists_up_top, hide_icons, completed, category_id.
         """
-        return _run(self._new_list(name, at, props))
+        row = _run(self._new_list(name, at, props))
+        self._tree = None
+        return self._listref(row)
 
     def new_todo(self, text: str, at: Optional[Union[ListRef, TodoRef]] = None, **props) -> TodoRef:
         """new_todo(text, at=None, **props) -> TodoRef
@@ -243,7 +333,8 @@ class Repl:
         Create a todo under a given List (or the todo's parent list when at is a Todo).
         Props: note, pinned, priority, deferred_until, recurrence_*.
         """
-        return _run(self._new_todo(text, at, props))
+        row = _run(self._new_todo(text, at, props))
+        return self._todoref(row)
 
     def add_sublist(self, name: str, to: Union[ListRef, TodoRef], **props) -> ListRef:
         """add_sublist(name, to, **props) -> ListRef
@@ -275,6 +366,15 @@ class Repl:
         l = self.L(x) if not isinstance(x, ListRef) else x
         return _run(self._set_list_fields(l.id, props))
 
+    def setprops(self, items, **props) -> list[dict]:
+        """setprops(items, **props) -> list
+
+        Bulk setprop: set the same fields on many Lists/Todos in one session
+        and one transaction. Items take the same forms as setprop (refs, ids,
+        paths, (list_path, text)); nothing is written unless all resolve.
+        """
+        return _run(self._set_fields_many(list(items), props))
+
     def mv(self, src: Union[ListRef, TodoRef, int, str, Tuple[str, str]], dest: Union[ListRef, TodoRef, str]):
         """mv(src, dest)
 
@@ -309,27 +409,34 @@ class Repl:
             return res.first()
 
     async def _get_list_by_path(self, path: str) -> Optional[ListState]:
-        # path like /A/B/C across parent_list chains
+        # path like /A/B/C across parent_list chains, resolved against the
+        # cached tree; the rows along the chain are then fetched in one query
+        # to confirm the cache still matches the DB
         parts = [p for p in path.strip('/').split('/') if p]
-        parent_list_id = None
-        parent_todo_id = None
-        current: Optional[ListState] = None
+        if not parts:
+            return None
         async with async_session() as sess:
-            for i, name in enumerate(parts):
-                q = select(ListState).where(
-                    ListState.name == name,
-                    ListState.owner_id == self.user.id,
-                    (ListState.parent_list_id == parent_list_id) if parent_list_id is not None else (ListState.parent_list_id == None),
-                    (ListState.parent_todo_id == parent_todo_id) if parent_todo_id is not None else (ListState.parent_todo_id == None),
-                )
-                res = await sess.exec(q)
-                current = res.first()
-                if not current:
-                    return None
-                # next segment searches under this list (by default)
-                parent_list_id = current.id
-                parent_todo_id = None
-        return current
+            return await self._list_by_parts(sess, parts)
+
+    async def _list_by_parts(self, sess, parts: list[str]) -> Optional[ListState]:
+        cached = self._tree is not None
+        tree = await self._tree_for(sess)
+        row = await self._resolve_chain(sess, tree, parts)
+        if row is None and cached:
+            # stale cache (lists created/renamed/moved outside this REPL)
+            tree = await self._tree_for(sess, refresh=True)
+            row = await self._resolve_chain(sess, tree, parts)
+        return row
+
+    async def _resolve_chain(self, sess, tree: _DirTree, parts: list[str]) -> Optional[ListState]:
+        chain = tree.resolve(parts)
+        if not chain:
+            return None
+        res = await sess.scalars(select(ListState).where(ListState.id.in_(chain), ListState.owner_id == self.user.id))
+        rows = {r.id: r for r in res.all()}
+        if len(rows) != len(chain) or not all(tree.matches(r) for r in rows.values()):
+            return None
+        return rows[chain[-1]]
 
     async def _get_todo_by_id(self, todo_id: int) -> Optional[Todo]:
         async with async_session() as sess:
@@ -348,27 +455,57 @@ class Repl:
             res = await sess.scalars(select(Todo).where(Todo.list_id == list_id, Todo.text == text))
             return res.first()
 
-    async def _lists_in_container(self, parent_list_id: Optional[int], parent_todo_id: Optional[int]) -> list[ListState]:
+    async def _ls_rows(self, base: Optional[ListRef], recursive: bool) -> list[dict[str, Any]]:
+        # whole listing in one session: a fresh tree (one query, which also
+        # refreshes the cache) plus one query for the todos of every list shown
         async with async_session() as sess:
-            q = select(ListState).where(ListState.owner_id == self.user.id)
-            if parent_list_id is None:
-                q = q.where(ListState.parent_list_id == None)
-            else:
-                q = q.where(ListState.parent_list_id == parent_list_id)
-            if parent_todo_id is None:
-                q = q.where(ListState.parent_todo_id == None)
-            else:
-                q = q.where(ListState.parent_todo_id == parent_todo_id)
-            res = await sess.exec(q.order_by(ListState.created_at.asc()))
-            return res.all()
+            tree = await self._tree_for(sess, refresh=True)
+            if base is not None and base.id not in tree.nodes:
+                raise ValueError("list not found")
+            start = base.id if base is not None else None
+            # lists whose contents are shown; at '/' only top-level lists are
+            # listed unless recursive
+            shown: list[int] = [] if start is None else [start]
+            if recursive:
+                stack = list(reversed(tree.children.get(start, [])))
+                seen = set(shown)
+                while stack:
+                    lid = stack.pop()
+                    if lid in seen:
+                        continue
+                    seen.add(lid)
+                    shown.append(lid)
+                    stack.extend(reversed(tree.children.get(lid, [])))
+            todos_by_list: dict[int, list[tuple[int, str]]] = {}
+            if shown:
+                tq = await sess.exec(select(Todo.id, Todo.text, Todo.list_id).where(Todo.list_id.in_(shown)).order_by(Todo.id.asc()))
+                for tid, text, lid in tq.all():
+                    todos_by_list.setdefault(lid, []).append((tid, text))
+        rows: list[dict[str, Any]] = []
 
-    async def _lists_and_todos_under_list(self, list_id: int) -> tuple[list[ListState], list[Todo]]:
-        async with async_session() as sess:
-            lq = await sess.scalars(select(ListState).where(ListState.owner_id == self.user.id, ListState.parent_list_id == list_id))
-            tq = await sess.exec(select(Todo).where(Todo.list_id == list_id))
-            return lq.all(), tq.all()
+        def list_rows(parent: Optional[int]):
+            rows.extend(
+                {"type": "list", "id": cid, "name": tree.nodes[cid][0], "path": tree.path_of(cid)}
+                for cid in tree.children.get(parent, [])
+            )
+
+        def todo_rows(lid: int, list_path: str):
+            rows.extend({"type": "todo", "id": tid, "text": text, "list": list_path} for tid, text in todos_by_list.get(lid, []))
+
+        if start is None:
+            list_rows(None)
+            # with recursive, each top-level list's contents follow
+            for lid in shown:
+                list_rows(lid)
+                todo_rows(lid, tree.path_of(lid))
+        else:
+            # base contents first, then each descendant's contents (depth-first)
+            for lid in shown:
+                list_rows(lid)
+                todo_rows(lid, base.path if lid == start else tree.path_of(lid))
+        return rows
 
-    async def _new_list(self, name: str, at: Optional[Union[ListRef, TodoRef]], props: dict) -> ListRef:
+    async def _new_list(self, name: str, at: Optional[Union[ListRef, TodoRef]], props: dict) -> ListState:
         async with async_session() as sess:
             lst = ListState(name=name, owner_id=self.user.id)
             if at is None:
@@ -384,9 +521,9 @@ class Repl:
             sess.add(lst)
             await sess.commit()
             await sess.refresh(lst)
-            return self._listref(lst)
+            return lst
 
-    async def _new_todo(self, text: str, at: Optional[Union[ListRef, TodoRef]], props: dict) -> TodoRef:
+    async def _new_todo(self, text: str, at: Optional[Union[ListRef, TodoRef]], props: dict) -> Todo:
         async with async_session() as sess:
             dest_list_id: Optional[int] = None
             if at is None:
@@ -399,6 +536,7 @@ class Repl:
                     sess.add(lst)
                     await sess.commit()
                     await sess.refresh(lst)
+                    self._tree = None
                 dest_list_id = lst.id
             elif isinstance(at, ListRef):
                 dest_list_id = at.id
@@ -413,7 +551,9 @@ class Repl:
             sess.add(todo)
             await sess.commit()
             await sess.refresh(todo)
-            return self._todoref(todo)
+            if todo.deferred_until is not None:
+                undefer_scheduler.schedule(todo.id, todo.deferred_until)
+            return todo
 
     async def _set_list_fields(self, list_id: int, props: dict) -> dict:
         async with async_session() as sess:
@@ -426,6 +566,7 @@ class Repl:
             sess.add(row)
             await sess.commit()
             await sess.refresh(row)
+            self._tree = None
             return {"id": row.id, "name": row.name}
 
     async def _set_todo_fields(self, todo_id: int, props: dict) -> dict:
@@ -443,8 +584,81 @@ class Repl:
             sess.add(row)
             await sess.commit()
             await sess.refresh(row)
+            if 'deferred_until' in props and row.deferred_until is not None:
+                undefer_scheduler.schedule(row.id, row.deferred_until)
             return {"id": row.id, "text": row.text}
 
+    async def _set_fields_many(self, items: list, props: dict) -> list[dict]:
+        async with async_session() as sess:
+            targets: list[tuple[str, int]] = []
+            for x in items:
+                if isinstance(x, TodoRef):
+                    targets.append(("todo", x.id))
+                elif isinstance(x, ListRef):
+                    targets.append(("list", x.id))
+                elif isinstance(x, int):
+                    targets.append(("list", x))
+                elif isinstance(x, str):
+                    path = self._abs_path(x)
+                    row = await self._list_by_parts(sess, [p for p in path.strip('/').split('/') if p])
+                    if row is None:
+                        raise ValueError(f"list not found for path: {path}")
+                    targets.append(("list", row.id))
+                elif isinstance(x, tuple) and len(x) == 2:
+                    path = self._abs_path(x[0])
+                    lst = await self._list_by_parts(sess, [p for p in path.strip('/').split('/') if p])
+                    if lst is None:
+                        raise ValueError(f"list not found for path: {path}")
+                    res = await sess.scalars(select(Todo).where(Todo.list_id == lst.id, Todo.text == x[1]))
+                    t = res.first()
+                    if t is None:
+                        raise ValueError("todo not found in list")
+                    targets.append(("todo", t.id))
+                else:
+                    raise ValueError(f"invalid selector: {x!r}")
+            list_ids = sorted({i for kind, i in targets if kind == "list"})
+            todo_ids = sorted({i for kind, i in targets if kind == "todo"})
+            lists: dict[int, ListState] = {}
+            todos: dict[int, Todo] = {}
+            if list_ids:
+                res = await sess.scalars(select(ListState).where(ListState.id.in_(list_ids), ListState.owner_id == self.user.id))
+                lists = {r.id: r for r in res.all()}
+                missing = [i for i in list_ids if i not in lists]
+                if missing:
+                    raise ValueError(f"list not found: {missing[0]}")
+            if todo_ids:
+                res = await sess.exec(
+                    select(Todo, ListState.owner_id)
+                    .join(ListState, ListState.id == Todo.list_id, isouter=True)
+                    .where(Todo.id.in_(todo_ids))
+                )
+                for t, owner_id in res.all():
+                    if owner_id != self.user.id:
+                        raise ValueError("forbidden")
+                    todos[t.id] = t
+                missing = [i for i in todo_ids if i not in todos]
+                if missing:
+                    raise ValueError(f"todo not found: {missing[0]}")
+            for row in list(lists.values()) + list(todos.values()):
+                for k, v in props.items():
+                    if hasattr(row, k):
+                        setattr(row, k, v)
+                sess.add(row)
+            await sess.commit()
+            if lists:
+                self._tree = None
+            out: list[dict] = []
+            for kind, i in targets:
+                if kind == "list":
+                    out.append({"id": i, "name": lists[i].name})
+                else:
+                    out.append({"id": i, "text": todos[i].text})
+        if 'deferred_until' in props:
+            for t in todos.values():
+                if t.deferred_until is not None:
+                    undefer_scheduler.schedule(t.id, t.deferred_until)
+        return out
+
     async def _move_todo_to_list(self, todo_id: int, dest_list_id: int) -> dict:
         async with async_session() as sess:
             t = await sess.get(Todo, todo_id)
@@ -489,28 +703,17 @@ class Repl:
             sess.add(lst)
             await sess.commit()
             await sess.refresh(lst)
+            self._tree = None
             return {"id": lst.id, "parent_list_id": lst.parent_list_id, "parent_todo_id": lst.parent_todo_id}
 
     # --- ref builders ---
     def _listref(self, row: ListState) -> ListRef:
-        # compute path by walking up parent_list chain
-        names = [row.name]
-        parent_list_id = row.parent_list_id
-        parent_todo_id = row.parent_todo_id
-        # For now, only embed parent_list names in path; if parent is a todo,
-        # show as '/.../<list>(@todo:<id>)' to disambiguate.
-        loop_guard = 0
-        while parent_list_id and loop_guard < 100:
-            loop_guard += 1
-            parent = _run(self._get_list_by_id(parent_list_id))
-            if not parent:
-                break
-            names.append(parent.name)
-            parent_list_id = parent.parent_list_id
-            parent_todo_id = parent.parent_todo_id
-        path = "/" + "/".join(reversed(names))
-        if parent_todo_id:
-            path = f"{path}(@todo:{parent_todo_id})"
+        # path comes from the cached tree (no per-ancestor queries); reload it
+        # once if the row is newer than the cache
+        tree = self._tree
+        if tree is None or not tree.matches(row):
+            tree = _run(self._load_tree())
+        path = tree.path(row.name, row.parent_list_id, row.parent_todo_id)
         return ListRef(id=row.id, name=row.name, path=path)
 
     def _todoref(self, row: Todo) -> TodoRef:
@@ -561,7 +764,7 @@ def run_code_for_user(user: User, code: str, repl: Optional[Repl] = None, env_lo
         cmds = {
             'L': 'Resolve List by id or path',
             'T': 'Resolve Todo by id or (list_path, text)',
-            'ls': 'List lists/todos under cwd or given list',
+            'ls': 'List lists/todos under cwd or given list (recursive=True for ls -R)',
             'show': 'Show properties of a list or todo',
             'cd': 'Change current directory to a list',
             'pwd': 'Print current directory path',
@@ -570,6 +773,8 @@ def run_code_for_user(user: User, code: str, repl: Optional[Repl] = None, env_lo
             'add_sublist': 'Create sublist under list/todo',
             'rename': 'Rename a list or todo',
             'setprop': 'Set fields on a list or todo',
+            'setprops': 'Set fields on many lists/todos in one transaction',
+            'invalidate': 'Reload the cached list tree on next use',
             'mv': 'Move list/todo to new container',
             'fmt': "Set output format: 'table' or 'json'",
         }
@@ -600,6 +805,8 @@ def run_code_for_user(user: User, code: str, repl: Optional[Repl] = None, env_lo
         "add_sublist": repl.add_sublist,
         "rename": repl.rename,
         "setprop": repl.setprop,
+        "setprops": repl.setprops,
+        "invalidate": repl.invalidate,
         "mv": repl.mv,
         "fmt": repl.fmt,
         "help": _help,
@@ -0,0 +1,295 @@
+"""Static assets: versioned URLs, precompressed siblings, long-lived caching.
+
+Goals
+- Bundles such as static/calendar-preact.bundle.js were served raw by
+  StaticFiles with no Cache-Control, so phones on mobile data re-fetched or
+  revalidated them heuristically and always downloaded them uncompressed.
+- Templates link versioned URLs (`no_js/todo.js` -> `no_js/todo.<hash>.js`,
+  hash = first 10 hex chars of the file's sha256). A versioned URL whose hash
+  matches the current file is served with
+  `Cache-Control: public, max-age=STATIC_IMMUTABLE_MAX_AGE, immutable`; a new
+  deploy changes the hash and therefore the URL. URLs with an outdated hash
+  still get the current file, but with `no-cache`, and plain unversioned URLs
+  (service worker, PWA shell, ES module imports) get `no-cache` so they
+  revalidate by ETag.
+- `build()` writes `.gz` (and `.br` when the optional brotli package is
+  installed) siblings next to every compressible file under static/, at the
+  highest compression levels, since this runs once rather than per request.
+  Siblings carry their source's mtime and are only used while they are at
+  least as new as the source; siblings that do not save at least 5% are not
+  kept.
+- AssetStaticFiles picks the best sibling the client accepts (content
+  negotiation on Accept-Encoding) and sends it with Content-Encoding and
+  Vary: Accept-Encoding. Files without a sibling fall through to the
+  on-the-fly CompressionMiddleware (app/compression.py).
+
+Usage
+- `app.mount('/static', AssetStaticFiles(directory='static'), name='static')`.
+- In templates: `{{ static_url('calendar-init.js') }}`.
+- Siblings are built at startup by the leader worker (STATIC_PRECOMPRESS=1,
+  the default), or by hand: `python -m app.static_assets build [--force]`.
+  They are build output and not tracked in git.
+"""
+from __future__ import annotations
+
+from mimetypes import guess_type
+from typing import Optional
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import re
+import stat
+import sys
+import threading
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from . import config
+from .compression import brotli, choose_encoding
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = 'static'
+HASH_LEN = 10
+COMPRESSIBLE = frozenset({'.js', '.mjs', '.css', '.html', '.json', '.svg', '.txt', '.map', '.webmanifest', '.xml'})
+# smaller files are not worth a sibling (headers dominate)
+MIN_SIZE = 256
+# (coding, file suffix), in server preference order
+SIBLINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_VERSIONED_RE = re.compile(r'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{%d})(?P<ext>\.[A-Za-z0-9]+)$' % HASH_LEN)
+
+
+def versioned_name(rel: str, digest: str) -> str:
+    root, ext = os.path.splitext(rel)
+    return f'{root}.{digest}{ext}'
+
+
+def split_versioned(rel: str) -> Optional[tuple[str, str]]:
+    """'js/tree.0123456789.js' -> ('js/tree.js', '0123456789'); None otherwise."""
+    m = _VERSIONED_RE.match(rel)
+    if m is None:
+        return None
+    return m['stem'] + m['ext'], m['hash']
+
+
+class AssetIndex:
+    """Content hashes of the files under one directory, cached by (mtime, size)."""
+
+    def __init__(self, directory: str = STATIC_DIR, prefix: str = '/static/'):
+        self.directory = directory
+        self.prefix = prefix
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, rel: str) -> Optional[str]:
+        path = os.path.join(self.directory, rel)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        with self._lock:
+            ent = self._hashes.get(rel)
+            if ent is not None and ent[0] == st.st_mtime_ns and ent[1] == st.st_size:
+                return ent[2]
+        h = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 16), b''):
+                    h.update(block)
+        except OSError:
+            return None
+        digest = h.hexdigest()[:HASH_LEN]
+        with self._lock:
+            self._hashes[rel] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def url(self, rel: str) -> str:
+        """Versioned URL for a file under the directory (plain URL if missing)."""
+        rel = rel.lstrip('/')
+        digest = self.digest(rel)
+        return self.prefix + (versioned_name(rel, digest) if digest else rel)
+
+
+assets = AssetIndex()
+
+
+def static_url(rel: str) -> str:
+    """Jinja global: `{{ static_url('no_js/todo.js') }}`."""
+    return assets.url(rel)
+
+
+def immutable_cache_control() -> str:
+    return f'public, max-age={config.STATIC_IMMUTABLE_MAX_AGE}, immutable'
+
+
+class AssetStaticFiles(StaticFiles):
+    """StaticFiles with versioned URLs and precompressed siblings; see the module docstring."""
+
+    def __init__(self, *args, index: Optional[AssetIndex] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # pass an AssetIndex for any directory other than static/
+        self.index = index or assets
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await super().get_response(path, scope)
+        full_path, st = await anyio.to_thread.run_sync(self.lookup_path, path)
+        cache_control = 'no-cache'
+        if not (st and stat.S_ISREG(st.st_mode)):
+            parts = split_versioned(path.replace(os.sep, '/'))
+            if parts is None:
+                return await super().get_response(path, scope)
+            rel, digest = parts
+            full_path, st = await anyio.to_thread.run_sync(self.lookup_path, rel)
+            if not (st and stat.S_ISREG(st.st_mode)):
+                return await super().get_response(path, scope)
+            if await anyio.to_thread.run_sync(self.index.digest, rel) == digest:
+                cache_control = immutable_cache_control()
+            # else: a URL from before the last deploy; serve the current file
+            # but do not let it be pinned under the old name
+        return self._asset_response(full_path, st, scope, cache_control)
+
+    def _asset_response(self, full_path: str, st, scope, cache_control: str) -> Response:
+        request_headers = Headers(scope=scope)
+        headers = {'Cache-Control': cache_control}
+        media_type = guess_type(full_path)[0] or 'text/plain'
+        send_path, send_st = full_path, st
+        if os.path.splitext(full_path)[1].lower() in COMPRESSIBLE:
+            headers['Vary'] = 'Accept-Encoding'
+            fresh = {}
+            for coding, suffix in SIBLINGS:
+                try:
+                    sst = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                if sst.st_mtime_ns >= st.st_mtime_ns:
+                    fresh[coding] = (full_path + suffix, sst)
+            coding = choose_encoding(request_headers.get('accept-encoding'), tuple(c for c, _ in SIBLINGS if c in fresh)) if fresh else None
+            if coding is not None:
+                send_path, send_st = fresh[coding]
+                headers['Content-Encoding'] = coding
+        response = FileResponse(send_path, stat_result=send_st, media_type=media_type, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# --- build step ---------------------------------------------------------------
+
+def _encoders(gzip_level: int, brotli_quality: int):
+    out = []
+    if brotli is not None:
+        out.append(('.br', lambda data: brotli.compress(data, quality=brotli_quality)))
+    out.append(('.gz', lambda data: gzip.compress(data, compresslevel=gzip_level, mtime=0)))
+    return out
+
+
+def _write_sibling(dst: str, data: bytes, src_stat) -> None:
+    # write-then-rename, so a worker serving the file never sees half of it
+    tmp = f'{dst}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.utime(tmp, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+    os.replace(tmp, dst)
+
+
+def build(directory: str = STATIC_DIR, *, force: bool = False, gzip_level: int = 9, brotli_quality: int = 11) -> dict:
+    """Write .gz/.br siblings for compressible files; returns counters."""
+    # bytes: suffix -> [source bytes, sibling bytes] over the siblings written
+    stats = {'files': 0, 'written': 0, 'fresh': 0, 'skipped': 0, 'removed': 0, 'bytes': {}}
+    encoders = _encoders(gzip_level, brotli_quality)
+    suffixes = tuple(s for _, s in SIBLINGS)
+    for root, _dirs, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith('.tmp'):
+                continue
+            if name.endswith(suffixes):
+                source = path[:-3]
+                # drop siblings whose source is gone (only ours: x.js.gz, not archive.gz)
+                if os.path.splitext(source)[1].lower() in COMPRESSIBLE and not os.path.exists(source):
+                    try:
+                        os.unlink(path)
+                        stats['removed'] += 1
+                    except OSError:
+                        pass
+                continue
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats['files'] += 1
+            if st.st_size < MIN_SIZE:
+                stats['skipped'] += 1
+                continue
+            data = None
+            for suffix, encode in encoders:
+                dst = path + suffix
+                if not force:
+                    try:
+                        if os.stat(dst).st_mtime_ns == st.st_mtime_ns:
+                            stats['fresh'] += 1
+                            continue
+                    except OSError:
+                        pass
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                out = encode(data)
+                if len(out) > len(data) * 0.95:
+                    try:
+                        os.unlink(dst)
+                    except OSError:
+                        pass
+                    stats['skipped'] += 1
+                    continue
+                _write_sibling(dst, out, st)
+                stats['written'] += 1
+                tot = stats['bytes'].setdefault(suffix, [0, 0])
+                tot[0] += len(data)
+                tot[1] += len(out)
+    return stats
+
+
+def precompress(directory: str = STATIC_DIR) -> Optional[dict]:
+    """build() for startup: logs instead of raising (static/ may be read-only)."""
+    try:
+        stats = build(directory)
+    except Exception:
+        logger.exception('static precompression failed')
+        return None
+    logger.info('static precompression: %d files, %d siblings written, %d up to date, %d removed%s',
+                stats['files'], stats['written'], stats['fresh'], stats['removed'],
+                '' if brotli is not None else ' (brotli not installed: gzip only)')
+    return stats
+
+
+def _main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog='python -m app.static_assets', description='Precompress static assets.')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    b = sub.add_parser('build', help='write .gz/.br siblings next to compressible files')
+    b.add_argument('--dir', default=STATIC_DIR)
+    b.add_argument('--force', action='store_true', help='rewrite siblings that look up to date')
+    args = ap.parse_args(argv)
+    stats = build(args.dir, force=args.force)
+    print(f"{stats['files']} files: {stats['written']} siblings written, {stats['fresh']} up to date, "
+          f"{stats['skipped']} skipped, {stats['removed']} stale removed")
+    for suffix, (n_in, n_out) in sorted(stats['bytes'].items()):
+        print(f"  {suffix}: {n_in} -> {n_out} bytes")
+    if brotli is None:
+        print('  brotli not installed: only .gz siblings were written')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(_main())
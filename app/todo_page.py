@@ -0,0 +1,318 @@
+"""Todo detail page loader: everything html_view_todo renders, in a fixed
+number of batched queries.
+
+Goals
+- The todo page used to run a chain of small queries: the todo, its list,
+  completions, its hashtags, two hashtag-suggestion queries, sublists, their
+  hashtags, three more for sublist override priorities, link targets split by
+  kind with hashtags for each kind, then collations, their names, Trash and
+  backlinks in a second session, and a visit check that re-read the todo.
+- The statement count is now fixed, whatever the number of sublists, links or
+  collations:
+    1. todo + parent list + "any completion done" (one joined SELECT)
+    2. sublists with their override priority as correlated aggregates
+    3. link targets (todos and lists in one UNION ALL)
+    4. hashtags of the todo, its sublists and link targets (one UNION ALL)
+  and, in a second session that runs concurrently with the above:
+    5. active collations joined to their (owned) list names
+  Outgoing links, collation backlinks and Trash come from the per-user
+  caches in app/link_graph.py and app/visibility.py (one query each on a
+  miss). Hashtag suggestions are not part of the page: todo.html fetches
+  them from /api/hashtags/vocab (ETag-validated, app/hashtag_vocab.py).
+- The two sessions only run concurrently when the engine hands out a
+  separate connection per session (the default NullPool). With a shared
+  connection pool (StaticPool / SingletonThreadPool) they run one after the
+  other in a single session.
+
+Usage
+- `page = await TodoPageLoader(current_user.id).load(todo_id)` returns a
+  `TodoPage`, or raises HTTPException 404 (no todo) / 403 (another user's list).
+- `page.context()` is the dict of template variables todo.html consumes.
+  Rows stay plain dicts so the template can use `row.get(...)` as before.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Optional
+import asyncio
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import and_, exists, func, literal, null, union_all
+from sqlalchemy.orm import aliased
+from sqlalchemy.pool import SingletonThreadPool, StaticPool
+from sqlmodel import select
+
+from . import ordering
+from .db import async_session, engine
+from .link_graph import link_graph, outgoing_links
+from .models import Hashtag, ListHashtag, ListState, Todo, TodoCompletion, TodoHashtag, UserCollation
+from .visibility import visibility
+
+logger = logging.getLogger(__name__)
+
+# Todo columns copied into the template's `todo` dict (missing ones -> False,
+# as the handler's getattr defaults did)
+_TODO_FIELDS = (
+    'id', 'text', 'note', 'created_at', 'modified_at', 'list_id', 'pinned', 'priority',
+    'bookmarked', 'calendar_ignored', 'first_date_only', 'lists_up_top', 'sublists_hide_done',
+    'sort_links', 'recurrence_rrule', 'recurrence_meta', 'recurrence_dtstart',
+    'recurrence_parser_version', 'plain_dates_meta',
+)
+
+
+@dataclass(slots=True)
+class TodoPage:
+    todo: dict
+    list: Optional[dict]
+    completed: bool
+    owner_id: Optional[int]
+    tags: list[str] = field(default_factory=list)
+    sublists: list[dict] = field(default_factory=list)
+    links: list[dict] = field(default_factory=list)
+    active_collations: list[dict] = field(default_factory=list)
+
+    def context(self) -> dict[str, Any]:
+        return {
+            'todo': self.todo,
+            'completed': self.completed,
+            'list': self.list,
+            'tags': self.tags,
+            'sublists': self.sublists,
+            'links': self.links,
+            'active_collations': self.active_collations,
+        }
+
+
+def _can_fan_out() -> bool:
+    """True when two sessions get two connections (safe to read concurrently)."""
+    try:
+        return not isinstance(engine.sync_engine.pool, (StaticPool, SingletonThreadPool))
+    except Exception:
+        return False
+
+
+def _override(todo_max, child_max) -> Optional[int]:
+    vals = []
+    for v in (todo_max, child_max):
+        try:
+            if v is not None:
+                vals.append(int(v))
+        except Exception:
+            pass
+    return max(vals) if vals else None
+
+
+class TodoPageLoader:
+    """Loads one todo page for `user_id`; see the module docstring."""
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+
+    async def load(self, todo_id: int) -> TodoPage:
+        if _can_fan_out():
+            main, side = await asyncio.gather(
+                self._load_main(todo_id),
+                self._load_user_side(todo_id),
+                return_exceptions=True,
+            )
+            if isinstance(main, BaseException):
+                raise main
+            if isinstance(side, BaseException):
+                logger.warning('todo page: user-side load failed for todo %s: %r', todo_id, side)
+                side = []
+        else:
+            main = await self._load_main(todo_id)
+            side = await self._load_user_side(todo_id)
+        page = main
+        page.active_collations = side
+        return page
+
+    # ---- todo, list, sublists, links, hashtags (one session) ----
+    async def _load_main(self, todo_id: int) -> TodoPage:
+        async with async_session() as sess:
+            done_q = exists().where(TodoCompletion.todo_id == Todo.id).where(TodoCompletion.done == True)
+            cols = [getattr(Todo, f) for f in _TODO_FIELDS if hasattr(Todo, f)]
+            q = (
+                select(*cols, ListState.id, ListState.name, ListState.completed, ListState.lists_up_top,
+                       ListState.owner_id, done_q.label('any_done'))
+                .outerjoin(ListState, ListState.id == Todo.list_id)
+                .where(Todo.id == todo_id)
+            )
+            row = (await sess.exec(q)).first()
+            if row is None:
+                raise HTTPException(status_code=404, detail='todo not found')
+            n = len(cols)
+            todo = {f: False for f in _TODO_FIELDS}
+            todo.update({c.key: v for c, v in zip(cols, row[:n])})
+            l_id, l_name, l_completed, l_up_top, owner_id, any_done = row[n:]
+            # require login: only owners or public lists allowed
+            if l_id is not None and owner_id not in (None, self.user_id):
+                raise HTTPException(status_code=403, detail='forbidden')
+            lst = None
+            if l_id is not None:
+                lst = {'id': l_id, 'name': l_name, 'completed': l_completed, 'lists_up_top': l_up_top or False}
+            page = TodoPage(todo=todo, list=lst, completed=bool(any_done), owner_id=owner_id)
+
+            page.sublists = await self._sublists(sess, todo_id, bool(todo.get('sublists_hide_done')))
+            edges = []
+            try:
+                edges = await outgoing_links(sess, owner_id, 'todo', todo_id)
+            except Exception:
+                logger.exception('todo page: links failed for todo %s', todo_id)
+            targets = await self._link_targets(sess, edges)
+            tags = await self._tags(
+                sess,
+                todo_ids=[todo_id] + [e.tgt_id for e in edges if e.tgt_type == 'todo'],
+                list_ids=[s['id'] for s in page.sublists] + [e.tgt_id for e in edges if e.tgt_type == 'list'],
+            )
+        page.tags = tags.get(('todo', int(todo_id)), [])
+        for s in page.sublists:
+            s['hashtags'] = tags.get(('list', int(s['id'])), [])
+        page.links = self._link_rows(edges, targets, tags)
+        return page
+
+    async def _sublists(self, sess, todo_id: int, hide_done: bool) -> list[dict]:
+        child = aliased(ListState)
+        todo_max = (
+            select(func.max(Todo.priority))
+            .where(Todo.list_id == ListState.id)
+            .where(Todo.priority != None)
+            .where(Todo.is_done == False)
+            .correlate(ListState)
+            .scalar_subquery()
+        )
+        child_max = (
+            select(func.max(child.priority))
+            .where(child.parent_list_id == ListState.id)
+            .where(child.priority != None)
+            .correlate(ListState)
+            .scalar_subquery()
+        )
+        q = (
+            select(ListState.id, ListState.name, ListState.completed, ListState.created_at,
+                   ListState.modified_at, ListState.parent_todo_position, ListState.priority,
+                   todo_max, child_max)
+            .where(ListState.parent_todo_id == todo_id)
+            .order_by(*ordering.todo_sublist_siblings(todo_id).order_by())
+        )
+        out: list[dict] = []
+        try:
+            rows = (await sess.exec(q)).all()
+        except Exception:
+            logger.exception('todo page: sublists failed for todo %s', todo_id)
+            return out
+        for lid, name, completed, created, modified, pos, prio, tmax, cmax in rows:
+            # hide completed sublists server-side when the todo asks for it
+            if hide_done and completed:
+                continue
+            out.append({
+                'id': lid,
+                'name': name,
+                'completed': completed or False,
+                'created_at': created,
+                'modified_at': modified,
+                'hashtags': [],
+                'parent_todo_position': pos,
+                # highest priority among uncompleted todos and direct child sublists
+                'override_priority': _override(tmax, cmax),
+                'priority': prio,
+                # provide parent_list_position alias for templates that expect it
+                'parent_list_position': pos,
+            })
+        return out
+
+    async def _link_targets(self, sess, edges) -> dict[tuple[str, int], tuple]:
+        todo_ids = sorted({int(e.tgt_id) for e in edges if e.tgt_type == 'todo'})
+        list_ids = sorted({int(e.tgt_id) for e in edges if e.tgt_type == 'list'})
+        parts = []
+        if todo_ids:
+            parts.append(select(literal('todo').label('k'), Todo.id.label('id'), Todo.text.label('title'), Todo.is_done.label('done')).where(Todo.id.in_(todo_ids)))
+        if list_ids:
+            parts.append(select(literal('list').label('k'), ListState.id.label('id'), ListState.name.label('title'), null().label('done')).where(ListState.id.in_(list_ids)))
+        if not parts:
+            return {}
+        stmt = parts[0] if len(parts) == 1 else union_all(*parts)
+        try:
+            res = await sess.exec(stmt)
+            return {(k, int(i)): (title, done) for k, i, title, done in res.all()}
+        except Exception:
+            logger.exception('todo page: link targets failed')
+            return {}
+
+    async def _tags(self, sess, *, todo_ids: list[int], list_ids: list[int]) -> dict[tuple[str, int], list[str]]:
+        parts = []
+        if todo_ids:
+            parts.append(
+                select(literal('todo').label('k'), TodoHashtag.todo_id.label('id'), Hashtag.tag.label('tag'))
+                .join(Hashtag, Hashtag.id == TodoHashtag.hashtag_id)
+                .where(TodoHashtag.todo_id.in_(sorted(set(todo_ids))))
+            )
+        if list_ids:
+            parts.append(
+                select(literal('list').label('k'), ListHashtag.list_id.label('id'), Hashtag.tag.label('tag'))
+                .join(Hashtag, Hashtag.id == ListHashtag.hashtag_id)
+                .where(ListHashtag.list_id.in_(sorted(set(list_ids))))
+            )
+        if not parts:
+            return {}
+        stmt = parts[0] if len(parts) == 1 else union_all(*parts)
+        out: dict[tuple[str, int], list[str]] = {}
+        try:
+            for k, i, tag in (await sess.exec(stmt)).all():
+                if isinstance(tag, str) and tag:
+                    out.setdefault((k, int(i)), []).append(tag)
+        except Exception:
+            logger.exception('todo page: hashtags failed')
+        return out
+
+    @staticmethod
+    def _link_rows(edges, targets, tags) -> list[dict]:
+        rows: list[dict] = []
+        for e in edges:
+            d = {'id': e.id, 'tgt_type': e.tgt_type, 'tgt_id': e.tgt_id, 'label': e.label, 'position': e.position}
+            key = (e.tgt_type, int(e.tgt_id))
+            hit = targets.get(key)
+            if hit is not None:
+                title, done = hit
+                d['title'] = title
+                d['tags'] = tags.get(key, [])
+                if e.tgt_type == 'todo':
+                    d['href'] = f"/html_no_js/todos/{int(e.tgt_id)}"
+                    d['completed'] = bool(done)
+                else:
+                    d['href'] = f"/html_no_js/lists/{int(e.tgt_id)}"
+            rows.append(d)
+        return rows
+
+    # ---- per-user data: collations (second session) ----
+    async def _load_user_side(self, todo_id: int) -> list[dict]:
+        async with async_session() as sess:
+            return await self._collations(sess, todo_id)
+
+    async def _collations(self, sess, todo_id: int) -> list[dict]:
+        uid = self.user_id
+        try:
+            rows = (await sess.exec(
+                select(UserCollation.list_id, ListState.name)
+                .join(ListState, and_(ListState.id == UserCollation.list_id, ListState.owner_id == uid))
+                .where(UserCollation.user_id == uid)
+                .where(UserCollation.active == True)
+            )).all()
+            if not rows:
+                return []
+            # lists moved to Trash (or below one); cached per user
+            try:
+                trashed = (await visibility.get(sess, uid)).trashed_list_ids
+            except Exception:
+                trashed = frozenset()
+            # collations linking to this todo (backlinks in the link graph)
+            holding = (await link_graph.get(sess, uid)).sources('todo', todo_id, 'list')
+            return [
+                {'list_id': int(lid), 'name': name, 'linked': int(lid) in holding}
+                for lid, name in rows if int(lid) not in trashed
+            ]
+        except Exception:
+            # If anything fails here, log and fall back to empty so the page still renders
+            logger.exception('todo page: active collations failed for todo %s user %s', todo_id, uid)
+            return []
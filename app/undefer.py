@@ -0,0 +1,209 @@
+"""Event-driven scheduler that clears Todo.deferred_until when it falls due.
+
+Goals
+- Replace the fixed-interval full-table poll with a min-heap of upcoming
+  deferral times so the worker sleeps exactly until the next due todo.
+- Clear due deferrals with a single bulk UPDATE (plus one UPDATE touching the
+  affected lists) instead of loading and saving ORM rows one by one.
+
+Usage
+- Call `await undefer_scheduler.seed()` at startup; this reads pending
+  deferrals through the `ix_todo_deferred_until` index.
+- Start `undefer_scheduler.run(stop_event)` as a background task.
+- Call `undefer_scheduler.schedule(todo_id, deferred_until)` whenever a todo
+  is deferred. Safe to call from other threads (e.g. the REPL event loop).
+
+Heap entries are never removed when a todo is re-deferred or undeferred
+manually; the bulk UPDATE re-checks `deferred_until <= now` so stale entries
+are simply dropped when they surface.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+import asyncio
+import heapq
+import logging
+import os
+import threading
+
+from sqlalchemy import update as sqlalchemy_update
+from sqlmodel import select
+
+from .utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+def _as_aware(dt: datetime) -> datetime:
+    # SQLite returns naive datetimes; all stored values are UTC.
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+async def clear_due_deferrals(sess, now: Optional[datetime] = None, todo_ids: Optional[Iterable[int]] = None) -> int:
+    """Clear deferred_until on every due todo (optionally restricted to todo_ids).
+
+    Issues one SELECT and at most two bulk UPDATEs. Caller is responsible for
+    commit. Returns the number of todos undeferred.
+    """
+    from .models import Todo, ListState
+    now = now or now_utc()
+    q = select(Todo.id, Todo.list_id).where(Todo.deferred_until != None).where(Todo.deferred_until <= now)
+    if todo_ids is not None:
+        ids = sorted({int(i) for i in todo_ids})
+        if not ids:
+            return 0
+        q = q.where(Todo.id.in_(ids))
+    res = await sess.execute(q)
+    rows = res.all()
+    if not rows:
+        return 0
+    due_ids = [int(r[0]) for r in rows]
+    list_ids = sorted({int(r[1]) for r in rows if r[1] is not None})
+    await sess.execute(
+        sqlalchemy_update(Todo)
+        .where(Todo.id.in_(due_ids))
+        .values(deferred_until=None, modified_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    if list_ids:
+        await sess.execute(
+            sqlalchemy_update(ListState)
+            .where(ListState.id.in_(list_ids))
+            .values(modified_at=now)
+            .execution_options(synchronize_session=False)
+        )
+    return len(due_ids)
+
+
+class UndeferScheduler:
+    """Min-heap of (due_ts, todo_id) driving a single sleeping worker."""
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory
+        self._heap: list[tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from .db import async_session
+            self._session_factory = async_session
+        return self._session_factory
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        """Return the epoch timestamp of the earliest pending entry, if any."""
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    def schedule(self, todo_id: int, due_at: Optional[datetime]) -> None:
+        """Register a deferral. Wakes the worker if it is now the earliest."""
+        if todo_id is None or due_at is None:
+            return
+        ts = _as_aware(due_at).timestamp()
+        with self._lock:
+            earliest = not self._heap or ts < self._heap[0][0]
+            heapq.heappush(self._heap, (ts, int(todo_id)))
+        if earliest:
+            self._notify()
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is None or wake is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        try:
+            if running is loop:
+                wake.set()
+            else:
+                loop.call_soon_threadsafe(wake.set)
+        except RuntimeError:
+            # worker loop already closed
+            pass
+
+    async def seed(self) -> int:
+        """Load all pending deferrals from the DB. Returns the number loaded.
+
+        Safe to call again (e.g. on a leader takeover): entries already in the
+        heap are not added twice.
+        """
+        from .models import Todo
+        async with self._sessions()() as sess:
+            res = await sess.execute(select(Todo.id, Todo.deferred_until).where(Todo.deferred_until != None))
+            rows = res.all()
+        entries = []
+        for tid, du in rows:
+            if isinstance(du, datetime):
+                entries.append((_as_aware(du).timestamp(), int(tid)))
+        with self._lock:
+            present = set(self._heap)
+            entries = [e for e in entries if e not in present]
+            self._heap.extend(entries)
+            heapq.heapify(self._heap)
+        self._notify()
+        return len(entries)
+
+    def _pop_due(self, now_ts: float) -> list[tuple[float, int]]:
+        out: list[tuple[float, int]] = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now_ts:
+                out.append(heapq.heappop(self._heap))
+        return out
+
+    async def run_once(self) -> int:
+        """Clear every heap entry that is due now. Returns todos undeferred."""
+        now = now_utc()
+        entries = self._pop_due(now.timestamp())
+        if not entries:
+            return 0
+        try:
+            async with self._sessions()() as sess:
+                n = await clear_due_deferrals(sess, now=now, todo_ids=[tid for _, tid in entries])
+                if n:
+                    await sess.commit()
+        except BaseException:
+            # e.g. "database is locked": put them back so run() retries them
+            with self._lock:
+                for e in entries:
+                    heapq.heappush(self._heap, e)
+            raise
+        return n
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while not stop_event.is_set():
+            try:
+                # clear before reading the heap so a concurrent schedule()
+                # between the two steps still wakes us
+                self._wake.clear()
+                nxt = self.next_due()
+                timeout = None if nxt is None else max(0.0, nxt - now_utc().timestamp())
+                if timeout is None or timeout > 0:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                n = await self.run_once()
+                if n:
+                    logger.debug('undefer scheduler cleared %d todos', n)
+            except asyncio.CancelledError:
+                break
+            except Exception:
+                logger.exception('undefer scheduler encountered an error')
+                # avoid a hot loop if the DB is unavailable
+                await asyncio.sleep(float(os.getenv('UNDEFER_RETRY_SECONDS', '5')))
+
+
+undefer_scheduler = UndeferScheduler()
@@ -4,21 +4,44 @@ import os
 import json
 import logging
 import re
-try:
-    import dateparser.search
-    import dateparser
-except Exception:
-    dateparser = None
-    dateparser_search = None
-else:
-    dateparser_search = dateparser.search
-    # Prefer DateDataParser when available; seed with English to avoid full
-    # automatic language detection overhead.
-    try:
-        from dateparser.date import DateDataParser
-        _DATE_DATA_PARSER = DateDataParser(languages=['en'])
-    except Exception:
-        _DATE_DATA_PARSER = None
+import threading
+
+# dateparser is imported lazily: it costs most of `import app` (~1s, mostly
+# timezone tables) and many entry points (scripts, tests of unrelated code,
+# the REPL) never parse a date. _ensure_dateparser() fills these globals on
+# first use; they stay None when dateparser is not installed.
+dateparser = None
+dateparser_search = None
+# Prefer DateDataParser when available; seeded with English to avoid full
+# automatic language detection overhead. The app lifespan / parse pool may
+# install a differently-configured instance before first use.
+_DATE_DATA_PARSER = None
+_dateparser_loaded = False
+_dateparser_lock = threading.Lock()
+
+
+def _ensure_dateparser() -> None:
+    global dateparser, dateparser_search, _DATE_DATA_PARSER, _dateparser_loaded
+    if _dateparser_loaded:
+        return
+    with _dateparser_lock:
+        if _dateparser_loaded:
+            return
+        try:
+            import dateparser.search as _search
+            import dateparser as _dp
+        except Exception:
+            _dateparser_loaded = True
+            return
+        if _DATE_DATA_PARSER is None:
+            try:
+                from dateparser.date import DateDataParser
+                _DATE_DATA_PARSER = DateDataParser(languages=['en'])
+            except Exception:
+                _DATE_DATA_PARSER = None
+        dateparser = _dp
+        dateparser_search = _search
+        _dateparser_loaded = True
 
 logger = logging.getLogger(__name__)
 
@@ -378,6 +401,7 @@ def extract_dates(text: str | None) -> list[datetime]:
     """
     if not text:
         return []
+    _ensure_dateparser()
     if dateparser is None or dateparser_search is None:
         logger.warning('dateparser not available; extract_dates will return empty list')
         return []
@@ -917,6 +941,7 @@ def extract_dates_meta(text: str | None) -> list[dict]:
     """
     if not text:
         return []
+    _ensure_dateparser()
     if dateparser is None or dateparser_search is None:
         logger.warning('dateparser not available; extract_dates_meta will return empty list')
         return []
@@ -1564,6 +1589,7 @@ def parse_date_and_recurrence(text: str) -> tuple[datetime | None, dict | None]:
     """
     if not text:
         return None, None
+    _ensure_dateparser()
     if dateparser is None or dateparser_search is None:
         return None, None
     try:
@@ -0,0 +1,216 @@
+"""Per-user Trash visibility resolver.
+
+Goals
+- Look up a user's Trash list id, and the set of lists hidden by Trash, once
+  instead of in every handler. Search, priorities, calendar, collations,
+  recent and tree views each used to run their own
+  `ListState.name == 'Trash'` query, and some loaded the whole (unscoped)
+  ListTrashMeta table on every request.
+- "Hidden" means: the Trash list itself, lists recorded in ListTrashMeta for
+  the user, and everything below those (child lists through parent_list_id
+  and sublists of todos in a hidden list through parent_todo_id).
+
+Usage
+- `vis = await visibility.get(sess, user_id)` returns a frozen Visibility:
+  `vis.trash_list_id`, `vis.trashed_list_ids` (frozenset, excludes the Trash
+  list itself), `vis.hidden_list_ids` and `vis.is_hidden(list_id)`.
+- Entries are dropped by session events whenever a flush or bulk statement
+  creates, deletes or re-parents a list, touches ListTrashMeta, or moves or
+  deletes a todo (trash, restore and move endpoints all go through these), and
+  again after that transaction commits (app/owner_cache.py). Only the owners
+  of the lists involved are dropped; bulk statements are resolved to owners
+  by selecting the rows their WHERE clause matches. Code that changes lists
+  with raw SQL should call `invalidate_visibility(owner_id)`;
+  VISIBILITY_CACHE_TTL bounds staleness otherwise. Other worker processes drop their copies through
+  app/cache_bus.py.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional
+import logging
+
+from sqlalchemy import or_
+from sqlalchemy.orm import aliased
+from sqlalchemy import inspect as sa_inspect
+from sqlmodel import select
+
+from .models import ListState, ListTrashMeta, Todo
+from .owner_cache import (
+    OwnerCache, install_session_hooks, statement_columns, statement_literals,
+    statement_table, where_owners,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Visibility:
+    owner_id: int
+    trash_list_id: Optional[int]
+    # lists moved to Trash and their descendants (not the Trash list itself)
+    trashed_list_ids: frozenset
+
+    @property
+    def hidden_list_ids(self) -> frozenset:
+        if self.trash_list_id is None:
+            return self.trashed_list_ids
+        return self.trashed_list_ids | {self.trash_list_id}
+
+    def is_hidden(self, list_id: Optional[int]) -> bool:
+        if list_id is None:
+            return False
+        return list_id == self.trash_list_id or list_id in self.trashed_list_ids
+
+
+def trash_list_id_stmt(owner_id: int):
+    # lowest id wins if a user somehow has several lists named Trash
+    return select(ListState.id).where(ListState.owner_id == owner_id).where(ListState.name == 'Trash').order_by(ListState.id).limit(1)
+
+
+def _hidden_lists_cte(owner_id: int, trash_list_id: Optional[int] = None, name: str = 'hidden_lists'):
+    """Recursive CTE of list ids hidden from `owner_id` by Trash.
+
+    Seeds are the Trash list (when given) and the user's ListTrashMeta lists;
+    the recursive members add child lists and sublists of todos in any list
+    already in the set. UNION (not UNION ALL) makes parent cycles harmless.
+    """
+    seed_cond = ListState.id.in_(select(ListTrashMeta.list_id))
+    if trash_list_id is not None:
+        seed_cond = or_(seed_cond, ListState.id == trash_list_id)
+    cte = (
+        select(ListState.id.label('id'))
+        .where(ListState.owner_id == owner_id)
+        .where(seed_cond)
+        .cte(name, recursive=True)
+    )
+    child = aliased(ListState)
+    sub = aliased(ListState)
+    return cte.union(
+        select(child.id).where(child.parent_list_id == cte.c.id),
+        select(sub.id).join(Todo, sub.parent_todo_id == Todo.id).where(Todo.list_id == cte.c.id),
+    )
+
+
+class VisibilityResolver(OwnerCache[Visibility]):
+    """Caches one Visibility per user; see the module docstring."""
+
+    channel = 'visibility'
+    ttl_setting = 'VISIBILITY_CACHE_TTL'
+
+    async def _load(self, sess, owner_id: int) -> Visibility:
+        trash_id = (await sess.exec(trash_list_id_stmt(owner_id))).first()
+        if isinstance(trash_id, tuple):
+            trash_id = trash_id[0]
+        cte = _hidden_lists_cte(owner_id, trash_id)
+        ids = {int(r[0] if isinstance(r, tuple) else r) for r in (await sess.exec(select(cte.c.id))).all()}
+        ids.discard(trash_id)
+        return Visibility(owner_id, trash_id, frozenset(ids))
+
+
+visibility = VisibilityResolver().subscribe()
+
+
+def invalidate_visibility(owner_id: Optional[int] = None) -> None:
+    """Drop the cached Visibility for one user (None: every user)."""
+    visibility.invalidate(owner_id)
+
+
+# --- invalidation hooks ------------------------------------------------------
+
+_LIST_COLUMNS = frozenset({'parent_list_id', 'parent_todo_id', 'name', 'owner_id'})
+
+
+def _changed(obj, columns) -> bool:
+    try:
+        attrs = sa_inspect(obj).attrs
+        return any(attrs[c].history.has_changes() for c in columns)
+    except Exception:
+        return True
+
+
+def _list_owners(session, list_ids) -> set:
+    """Owners of the given lists; None stands for a public or missing list."""
+    ids = sorted({int(i) for i in list_ids if i is not None})
+    if not ids:
+        return set()
+    rows = session.connection().execute(select(ListState.id, ListState.owner_id).where(ListState.id.in_(ids))).all()
+    owners = {o for _i, o in rows}
+    if len(rows) < len(ids):
+        owners.add(None)
+    return owners
+
+
+def _affected_owners(session) -> set:
+    owners: set = set()
+    todo_lists: set = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ListState):
+            if obj in session.dirty and not _changed(obj, _LIST_COLUMNS):
+                continue
+            if obj in session.dirty and _changed(obj, ('owner_id',)):
+                hist = sa_inspect(obj).attrs.owner_id.history
+                owners.update(hist.deleted or ())
+                owners.update(hist.added or ())
+            else:
+                owners.add(getattr(obj, 'owner_id', None))
+        elif isinstance(obj, ListTrashMeta):
+            owners.add(getattr(obj, 'original_owner_id', None))
+        elif isinstance(obj, Todo):
+            # a moved or deleted todo carries its sublists with it: drop the
+            # owners of the lists it left and joined
+            if obj in session.new:
+                continue
+            if obj in session.deleted:
+                todo_lists.add(getattr(obj, 'list_id', None))
+            elif _changed(obj, ('list_id',)):
+                hist = sa_inspect(obj).attrs.list_id.history
+                todo_lists.update(hist.deleted or ())
+                todo_lists.update(hist.added or ())
+    owners |= _list_owners(session, todo_lists)
+    return owners
+
+
+def _statement_owners(state) -> set:
+    """Owners whose lists a bulk liststate/todo/listtrashmeta statement touches.
+
+    Existing rows are found with the statement's own WHERE clause; owners
+    named (or implied through list_id) by its VALUES are added. Anything that
+    cannot be resolved yields None (every user).
+    """
+    stmt = state.statement
+    name = statement_table(stmt)
+    if name not in ('liststate', 'listtrashmeta', 'todo'):
+        return set()
+    cols = statement_columns(stmt)
+    if state.is_update and name != 'listtrashmeta':
+        watched = _LIST_COLUMNS if name == 'liststate' else {'list_id'}
+        if cols is not None and not (cols & watched):
+            return set()
+    if state.is_insert and name == 'todo':
+        return set()
+    if isinstance(state.parameters, (list, tuple)):
+        # executemany: one set of values per row, not worth resolving
+        return {None}
+    owners: set = set()
+    if not state.is_insert:
+        if name == 'liststate':
+            q = select(ListState.owner_id)
+        elif name == 'listtrashmeta':
+            q = select(ListTrashMeta.original_owner_id)
+        else:
+            q = select(ListState.owner_id).select_from(Todo).outerjoin(ListState, ListState.id == Todo.list_id)
+        owners |= where_owners(state, q)
+    new_col = {'liststate': 'owner_id', 'listtrashmeta': 'original_owner_id', 'todo': 'list_id'}[name]
+    if state.is_insert or new_col in (cols or ()):
+        lits = statement_literals(stmt)
+        if new_col not in lits:
+            return {None}
+        if name == 'todo':
+            owners |= _list_owners(state.session, [lits[new_col]])
+        else:
+            owners.add(lits[new_col])
+    return owners
+
+
+install_session_hooks(visibility, flush_owners=_affected_owners, statement_owners=_statement_owners)
@@ -0,0 +1,339 @@
+"""Write-behind buffer for recent list/todo visit tracking.
+
+Goals
+- Take the RecentListVisit/RecentTodoVisit writes (position shifting, upsert,
+  prune, commits) off the page-view request path so they stop competing with
+  real edits for SQLite's single writer lock.
+- Coalesce repeated visits per (user, item) and apply the top-N position
+  maintenance for many visits in one periodic transaction.
+- Keep reads consistent: `view()` replays not-yet-flushed visits over the
+  stored rows, so /lists/recent and /html_no_js/recent reflect a visit as soon
+  as it has been acknowledged.
+
+Usage
+- `list_visits.record(user_id, list_id)` / `todo_visits.record(user_id, todo_id)`
+  from the visit endpoints (no DB access, returns immediately).
+- `await list_visits.view(sess, user_id, limit)` returns
+  [(item_id, visited_at, position), ...]: positioned (top-N) rows by position
+  first, then the rest by visited_at desc.
+- The lifespan runs `run_visit_flusher(stop_event)`, which flushes every
+  VISIT_FLUSH_SECONDS (default 2) or sooner once VISIT_BUFFER_MAX (default 500)
+  visits are pending, plus a final flush on shutdown.
+- VISIT_BUFFER_ENABLED=0 restores write-through (each record is flushed by the
+  endpoint before it responds).
+
+The top-N semantics are those of the original endpoints: revisiting an item
+already in the top N only refreshes visited_at; any other visit shifts the
+top N down by one, evicts the last slot and puts the item at position 0.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import logging
+import os
+import threading
+
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from .utils import now_utc
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+def buffer_enabled() -> bool:
+    return os.getenv('VISIT_BUFFER_ENABLED', '1').lower() not in ('0', 'false', 'no')
+
+
+class VisitBuffer:
+    """Pending visits for one table, keyed by user, in arrival order."""
+
+    def __init__(self, kind: str, top_n_env: str, cap_env: str):
+        self.kind = kind
+        self.top_n_env = top_n_env
+        self.cap_env = cap_env
+        self._lock = threading.Lock()
+        # user_id -> [[item_id, visited_at], ...] in visit order
+        self._pending: dict[int, list[list]] = {}
+        # events taken by an in-progress flush; still visible to view()
+        self._inflight: dict[int, list[list]] = {}
+        self._count = 0
+        self._wake: Optional[asyncio.Event] = None
+        self.flushes = 0
+        self.coalesced = 0
+
+    # --- model plumbing -------------------------------------------------
+    @property
+    def model(self):
+        from .models import RecentListVisit, RecentTodoVisit
+        return RecentListVisit if self.kind == 'list' else RecentTodoVisit
+
+    @property
+    def item_col(self) -> str:
+        return 'list_id' if self.kind == 'list' else 'todo_id'
+
+    @property
+    def table(self) -> str:
+        return 'recentlistvisit' if self.kind == 'list' else 'recenttodovisit'
+
+    def top_n(self) -> int:
+        return _env_int(self.top_n_env, 10)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return self._count
+
+    # --- recording --------------------------------------------------------
+    def record(self, user_id: int, item_id: int, visited_at: Optional[datetime] = None) -> datetime:
+        """Queue a visit. Returns the visited_at timestamp acknowledged."""
+        now = visited_at or now_utc()
+        uid, iid = int(user_id), int(item_id)
+        # A repeat visit can be folded into the earlier pending one when the
+        # replay is guaranteed to still find the item in the top N at that
+        # point: each later event shifts it down at most one slot.
+        max_later = max(0, self.top_n() - 2)
+        with self._lock:
+            events = self._pending.setdefault(uid, [])
+            for back, ev in enumerate(reversed(events)):
+                if back > max_later:
+                    break
+                if ev[0] == iid:
+                    ev[1] = now
+                    self.coalesced += 1
+                    return now
+            events.append([iid, now])
+            self._count += 1
+            full = self._count >= _env_int('VISIT_BUFFER_MAX', 500)
+        if full and self._wake is not None:
+            self._wake.set()
+        return now
+
+    def _events_for(self, user_id: int) -> list[list]:
+        with self._lock:
+            return [list(e) for e in self._inflight.get(user_id, [])] + [list(e) for e in self._pending.get(user_id, [])]
+
+    # --- replay -----------------------------------------------------------
+    @staticmethod
+    def _replay(state: dict[int, list], events: list[list], top_n: int) -> set[int]:
+        """Apply events to state {item_id: [position, visited_at]} in place.
+
+        Returns the set of item ids whose row changed.
+        """
+        changed: set[int] = set()
+        evict_pos = max(0, top_n - 1)
+        for iid, ts in events:
+            cur = state.get(iid)
+            if cur is not None and cur[0] is not None and cur[0] < top_n:
+                cur[1] = ts
+                changed.add(iid)
+                continue
+            # shift positions [0, evict_pos) down one, then evict whatever
+            # now sits at or beyond evict_pos (two passes, like the SQL did)
+            for other_id, st in state.items():
+                if st[0] is not None and st[0] < evict_pos:
+                    st[0] += 1
+                    changed.add(other_id)
+            for other_id, st in state.items():
+                if st[0] is not None and st[0] >= evict_pos:
+                    st[0] = None
+                    changed.add(other_id)
+            if cur is None:
+                state[iid] = [0, ts]
+            else:
+                cur[0] = 0
+                cur[1] = ts
+            changed.add(iid)
+        return changed
+
+    async def _load_state(self, sess, user_id: int, item_ids: list[int]) -> dict[int, list]:
+        """Load the positioned rows plus any rows for item_ids."""
+        M = self.model
+        col = getattr(M, self.item_col)
+        state: dict[int, list] = {}
+        q = select(col, M.position, M.visited_at).where(M.user_id == user_id).where(M.position != None)
+        for iid, pos, ts in (await sess.exec(q)).all():
+            state[int(iid)] = [pos, ts]
+        rest = [i for i in item_ids if i not in state]
+        if rest:
+            q2 = select(col, M.position, M.visited_at).where(M.user_id == user_id).where(col.in_(rest))
+            for iid, pos, ts in (await sess.exec(q2)).all():
+                state[int(iid)] = [pos, ts]
+        return state
+
+    # --- reads --------------------------------------------------------------
+    async def view(self, sess, user_id: int, limit: int) -> list[tuple[int, datetime, Optional[int]]]:
+        """Stored rows with pending visits applied, top-N first then by recency."""
+        M = self.model
+        col = getattr(M, self.item_col)
+        top_n = self.top_n()
+        events = self._events_for(user_id)
+        pending_ids = list(dict.fromkeys(e[0] for e in events))
+        state = await self._load_state(sess, user_id, pending_ids)
+        if events:
+            self._replay(state, events, top_n)
+        # candidates for the non-positioned tail: enough stored rows that
+        # items promoted by pending visits cannot leave the tail short
+        q = (
+            select(col, M.visited_at)
+            .where(M.user_id == user_id)
+            .where(M.position == None)
+            .order_by(M.visited_at.desc())
+            .limit(max(0, int(limit)) + len(pending_ids) + top_n)
+        )
+        for iid, ts in (await sess.exec(q)).all():
+            state.setdefault(int(iid), [None, ts])
+        top = sorted(((i, st) for i, st in state.items() if st[0] is not None and st[0] < top_n), key=lambda x: x[1][0])
+        top_ids = {i for i, _ in top}
+
+        def _ts_key(item):
+            ts = item[1][1]
+            if not isinstance(ts, datetime):
+                return 0.0
+            # stored values come back naive (UTC); pending ones are aware
+            if ts.tzinfo is None:
+                ts = ts.replace(tzinfo=timezone.utc)
+            return ts.timestamp()
+
+        rest = sorted(((i, st) for i, st in state.items() if i not in top_ids), key=_ts_key, reverse=True)
+        out = [(i, st[1], st[0]) for i, st in top] + [(i, st[1], None) for i, st in rest]
+        return out[:max(0, int(limit))] if limit is not None else out
+
+    # --- flushing -------------------------------------------------------------
+    async def flush(self, session_factory=None, user_id: Optional[int] = None) -> int:
+        """Write pending visits (all users, or one) in a single transaction.
+
+        Returns the number of visit events applied.
+        """
+        with self._lock:
+            if user_id is None:
+                batch, self._pending = self._pending, {}
+            else:
+                evs = self._pending.pop(int(user_id), None)
+                batch = {int(user_id): evs} if evs else {}
+            n = sum(len(v) for v in batch.values())
+            self._count -= n
+            for uid, evs in batch.items():
+                self._inflight.setdefault(uid, []).extend(evs)
+        if not batch:
+            return 0
+        if session_factory is None:
+            from .db import async_session as session_factory
+        try:
+            async with session_factory() as sess:
+                await self._write_batch(sess, batch)
+                await sess.commit()
+        except Exception:
+            logger.exception('failed to flush %s visits; requeueing %d', self.kind, n)
+            with self._lock:
+                for uid, evs in batch.items():
+                    self._pending[uid] = evs + self._pending.get(uid, [])
+                self._count += n
+            raise
+        finally:
+            with self._lock:
+                for uid in batch:
+                    self._inflight.pop(uid, None)
+        self.flushes += 1
+        return n
+
+    async def _write_batch(self, sess, batch: dict[int, list[list]]) -> None:
+        from .models import ListState, Todo
+        M = self.model
+        top_n = self.top_n()
+        cap = _env_int(self.cap_env, 100)
+        # drop visits to items deleted since they were recorded
+        all_ids = sorted({e[0] for evs in batch.values() for e in evs})
+        parent = ListState if self.kind == 'list' else Todo
+        res = await sess.exec(select(parent.id).where(parent.id.in_(all_ids)))
+        alive = {int(i) for i in res.all()}
+        rows: list[dict] = []
+        users: list[int] = []
+        for uid, evs in batch.items():
+            evs = [e for e in evs if e[0] in alive]
+            if not evs:
+                continue
+            users.append(uid)
+            state = await self._load_state(sess, uid, list(dict.fromkeys(e[0] for e in evs)))
+            changed = self._replay(state, evs, top_n)
+            for iid in changed:
+                pos, ts = state[iid]
+                rows.append({'user_id': uid, self.item_col: iid, 'position': pos, 'visited_at': ts})
+        if rows:
+            ins = sqlite_insert(M)
+            await sess.execute(
+                ins.on_conflict_do_update(
+                    index_elements=['user_id', self.item_col],
+                    set_={'position': ins.excluded.position, 'visited_at': ins.excluded.visited_at},
+                ),
+                rows,
+            )
+        if cap > 0:
+            # Prune older visits per user to keep storage bounded (same rule
+            # as before: keep the `cap` most recently visited rows).
+            prune_sql = text(
+                f"DELETE FROM {self.table} WHERE (user_id, {self.item_col}) IN ("
+                f"SELECT user_id, {self.item_col} FROM ("
+                f"SELECT user_id, {self.item_col}, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY visited_at DESC) AS rn "
+                f"FROM {self.table} WHERE user_id = :uid) t WHERE t.rn > :cap)"
+            )
+            for uid in users:
+                try:
+                    await sess.exec(prune_sql.bindparams(uid=uid, cap=cap))
+                except Exception:
+                    # Best-effort pruning; do not fail the flush
+                    pass
+
+    def attach_wake(self, wake: Optional[asyncio.Event]) -> None:
+        self._wake = wake
+
+
+list_visits = VisitBuffer('list', 'RECENT_LISTS_TOP_N', 'RECENT_LISTS_PER_USER')
+todo_visits = VisitBuffer('todo', 'RECENT_TODOS_TOP_N', 'RECENT_TODOS_PER_USER')
+
+
+async def flush_all_visits() -> int:
+    n = 0
+    for buf in (list_visits, todo_visits):
+        try:
+            n += await buf.flush()
+        except Exception:
+            pass
+    return n
+
+
+async def run_visit_flusher(stop_event: asyncio.Event) -> None:
+    """Background task: flush both buffers periodically or when full."""
+    wake = asyncio.Event()
+    for buf in (list_visits, todo_visits):
+        buf.attach_wake(wake)
+    try:
+        interval = float(os.getenv('VISIT_FLUSH_SECONDS', '2'))
+    except Exception:
+        interval = 2.0
+    try:
+        while not stop_event.is_set():
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            n = await flush_all_visits()
+            if n:
+                logger.debug('flushed %d buffered visits', n)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        for buf in (list_visits, todo_visits):
+            buf.attach_wake(None)
+        # final flush so acknowledged visits survive a clean shutdown
+        await flush_all_visits()
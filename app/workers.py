@@ -0,0 +1,171 @@
+"""Multi-process serving mode: startup serialisation and a leader worker.
+
+Goals
+- Let the app run as several uvicorn worker processes
+  (`WEB_CONCURRENCY=N uvicorn app.main:app`, or the systemd unit's WORKERS
+  setting) so CPU-bound page rendering is no longer limited to one core.
+- Workers share one SQLite file, so startup work that writes (init_db's
+  migrations, the ServerState row) runs under a file lock, one worker at a
+  time.
+- Singleton background jobs (tombstone pruning, static precompression, the
+  embedded SSH REPL) run in one "leader" worker only. Leadership is an
+  exclusive flock held for the life of the process; if the leader exits, the
+  next worker to ask takes over, and `watch_leadership()` runs its takeover
+  hook (re-seeding the undefer scheduler).
+- Per-process caches stay coherent through app/cache_bus.py.
+
+State that stays per process, by design:
+- the recent-visits write buffer (app/visits.py): each worker flushes its own
+  buffer every VISIT_FLUSH_SECONDS, so "recent" views can lag by that long
+  for visits recorded by another worker;
+- the undefer scheduler's timers: every worker seeds its heap from the
+  database at startup and wakes todos it deferred itself; clearing is
+  idempotent (it rechecks deferred_until), so several workers firing the same
+  deferral is harmless. A deferral held only by a worker that exits is picked
+  up by the next worker to start, or by the leader's re-seed on takeover;
+- debug tooling: the in-memory log ring (app/log_pipeline.py) and the
+  /server/logs/stream and _sse_debug subscribers only see the worker that
+  served the request. CSRF tokens are signed JWTs and need no shared state.
+
+Usage
+- `multi_worker()` tells whether peers may exist (CACHE_BUS=1, or auto with
+  WEB_WORKERS > 1).
+- `async with startup_lock(): ...` around startup writes.
+- `is_leader()` is True in single-process mode and in the one worker holding
+  the leader lock otherwise.
+- `watch_leadership(stop_event, on_gain)` as a background task calls
+  `on_gain()` when this worker takes over from a leader that exited.
+"""
+from __future__ import annotations
+
+from contextlib import asynccontextmanager
+from typing import Optional
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+from . import config
+
+logger = logging.getLogger(__name__)
+
+_leader_fd: Optional[int] = None
+_leader_lock = threading.Lock()
+
+
+def multi_worker() -> bool:
+    mode = config.CACHE_BUS
+    if mode in ('1', 'true', 'yes', 'on'):
+        return True
+    if mode in ('0', 'false', 'no', 'off'):
+        return False
+    return config.WEB_WORKERS > 1
+
+
+def runtime_dir() -> str:
+    """Directory shared by the workers of one server (sockets and lock files)."""
+    if config.CACHE_BUS_DIR:
+        return config.CACHE_BUS_DIR
+    try:
+        from .db import DATABASE_URL, _sqlite_path_from_url
+        key = _sqlite_path_from_url(DATABASE_URL) or DATABASE_URL or ''
+    except Exception:
+        key = ''
+    digest = hashlib.sha1(os.path.abspath(key).encode('utf-8') if key else b'default').hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f'fast_todo-{digest}')
+
+
+def _open_lock(name: str) -> int:
+    d = runtime_dir()
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    return os.open(os.path.join(d, name), os.O_RDWR | os.O_CREAT, 0o600)
+
+
+@asynccontextmanager
+async def startup_lock():
+    """Serialise startup writes across workers (no-op in single-process mode)."""
+    if fcntl is None or not multi_worker():
+        yield
+        return
+    fd = _open_lock('startup.lock')
+    try:
+        # blocking flock off the event loop; other workers wait their turn
+        await asyncio.get_running_loop().run_in_executor(None, fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        except Exception:
+            pass
+        os.close(fd)
+
+
+def is_leader() -> bool:
+    """True when this process should run the singleton background jobs.
+
+    Cheap to call repeatedly: once acquired the lock is kept until exit, and a
+    worker that was not leader retries (and takes over after the leader dies).
+    """
+    global _leader_fd
+    if fcntl is None or not multi_worker():
+        return True
+    with _leader_lock:
+        if _leader_fd is not None:
+            return True
+        fd = None
+        try:
+            fd = _open_lock('leader.lock')
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if fd is not None:
+                os.close(fd)
+            return False
+        _leader_fd = fd
+        try:
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode('ascii'))
+        except Exception:
+            pass
+        logger.info('worker %d is the leader', os.getpid())
+        return True
+
+
+async def watch_leadership(stop_event: asyncio.Event, on_gain, interval: Optional[float] = None) -> None:
+    """Poll for leadership every `interval` seconds; await `on_gain()` on takeover.
+
+    Returns at once in single-process mode or when already the leader (the
+    lock is kept until exit, so there is nothing left to watch).
+    """
+    if is_leader():
+        return
+    interval = config.LEADER_CHECK_SECONDS if interval is None else interval
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        if is_leader():
+            try:
+                await on_gain()
+            except Exception:
+                logger.exception('leadership takeover hook failed')
+            return
+
+
+def release_leader() -> None:
+    global _leader_fd
+    with _leader_lock:
+        fd, _leader_fd = _leader_fd, None
+    if fd is not None and fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
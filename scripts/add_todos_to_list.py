@@ -24,13 +24,15 @@ What it does:
         - nojs   -> POST form to /html_no_js/login with Accept: application/json
         - tailwind -> JSON POST to /html_tailwind/login
  2. Captures session/access/csrf cookies (server sets them) in the client cookie jar.
- 3. For each provided todo text: POST /todos {text, list_id} using JSON.
+ 3. For each provided todo text: POST /todos {text, list_id} using JSON
+    (or, with --bulk, a single POST /todos/bulk carrying every item).
  4. Prints per-item success/failure; exits non-zero if any failure.
 
 Flags & behavior:
     --login-style defaults to 'nojs'. Override with environment variable FT_LOGIN_STYLE.
     --note can be supplied multiple times (one total for all, or one per todo).
     --verbose prints cookie summary (values redacted to first 8 chars).
+    --bulk sends all todos in one request/transaction (all-or-nothing).
 
 Security guidance:
     - Do NOT hardcode passwords in the script or commit them to version control.
@@ -48,6 +50,7 @@ import httpx
 LOGIN_PATH_TAILWIND = "/html_tailwind/login"
 LOGIN_PATH_NOJS = "/html_no_js/login"
 CREATE_TODO_PATH = "/todos"
+BULK_CREATE_TODO_PATH = "/todos/bulk"
 
 def login_tailwind(client: httpx.Client, base_url: str, username: str, password: str) -> dict:
     """JSON login endpoint (tailwind variant)."""
@@ -89,6 +92,19 @@ def create_todo(client: httpx.Client, base_url: str, list_id: int, text: str, no
         return False, f"Unexpected response: {data}"
     return True, data
 
+def create_todos_bulk(client: httpx.Client, base_url: str, items: list[dict]):
+    url = base_url.rstrip('/') + BULK_CREATE_TODO_PATH
+    r = client.post(url, json={"items": items})
+    if r.status_code != 200:
+        return False, f"HTTP {r.status_code}: {r.text[:200]}"
+    try:
+        data = r.json()
+    except Exception as e:
+        return False, f"Invalid JSON response: {e}"
+    if len(data.get('ids') or []) != len(items):
+        return False, f"Unexpected response: {data}"
+    return True, data
+
 def parse_args(argv: List[str]) -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Add todos to a list via API")
     p.add_argument('--base-url', default=os.environ.get('FT_BASE_URL', 'http://127.0.0.1:8000'), help='Base URL, e.g. https://0.0.0.0:10443')
@@ -99,6 +115,7 @@ def parse_args(argv: List[str]) -> argparse.Namespace:
     p.add_argument('--verbose', action='store_true', help='Verbose output (show cookies)')
     p.add_argument('--todos', nargs='+', required=True, help='Todo text entries')
     p.add_argument('--note', action='append', help='Optional notes (parallel to todos, repeats)')
+    p.add_argument('--bulk', action='store_true', help='Create all todos with one POST /todos/bulk request')
     p.add_argument('--timeout', type=float, default=10.0)
     return p.parse_args(argv)
 
@@ -128,6 +145,20 @@ def main(argv: List[str]) -> int:
         if csrf:
             # Update cookie if not already present (server sets, but be safe)
             client.cookies.set('csrf_token', csrf)
+        if args.bulk:
+            items = []
+            for idx, text in enumerate(args.todos):
+                item = {"text": text, "list_id": args.list_id}
+                if notes:
+                    item["note"] = notes[0] if len(notes) == 1 else notes[idx]
+                items.append(item)
+            ok, data = create_todos_bulk(client, args.base_url, items)
+            if not ok:
+                print(f"[FAIL] bulk create of {len(items)} todos: {data}")
+                return 1
+            for tid, text in zip(data['ids'], args.todos):
+                print(f"[OK] #{tid} '{text}'")
+            return 0
         for idx, text in enumerate(args.todos):
             note = None
             if notes:
@@ -1,27 +1,25 @@
 #!/bin/bash
 set -euo pipefail
 
-# File and backup directory
-DB_FILE="fast_todo.db"
-BACKUP_DIR="backups"
+# Online backup of the app database (see app/backup.py).
+#
+# Uses SQLite's backup API instead of `cp`, so it is safe while the server is
+# writing and includes anything still in the -wal file. The database is the
+# one the app uses: DATABASE_URL, else DEFAULT_SQLITE_DB_FILENAME
+# (fast_todo_main.db), else the legacy fast_todo.db.
+#
+# Environment (all optional): BACKUP_DIR (default backups), BACKUP_KEEP
+# (default 10), BACKUP_COMPRESSION (none|gzip|zstd|auto, default gzip),
+# BACKUP_METHOD (backup|vacuum). Extra arguments are passed through, e.g.
+#   scripts/backup_db.sh --keep 30 --compress auto
+#   scripts/backup_db.sh --verify backups/fast_todo_main_20260101_000000_000000.db.gz
 
-# Create backup dir if missing
-mkdir -p "$BACKUP_DIR"
+# run from the repository root so relative database paths resolve as for the app
+cd "$(dirname "$0")/.."
 
-# Timestamped filename
-TIMESTAMP=$(date +"%Y%m%d_%H%M%S")
-BACKUP_FILE="$BACKUP_DIR/fast_todo_${TIMESTAMP}.db"
-
-# Copy the file
-if [[ -f "$DB_FILE" ]]; then
-    cp "$DB_FILE" "$BACKUP_FILE"
-    echo "Backup created: $BACKUP_FILE"
-else
-    echo "Error: $DB_FILE not found!"
-    exit 1
+PYTHON="${PYTHON:-python3}"
+if [[ -x .venv/bin/python ]]; then
+    PYTHON=.venv/bin/python
 fi
 
-# Rotate (keep only 10 newest)
-cd "$BACKUP_DIR"
-ls -1t fast_todo_*.db 2>/dev/null | tail -n +11 | xargs -r rm --
-
+exec "$PYTHON" -m app.backup "$@"
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Throughput of the server at different uvicorn worker counts.
+
+For each worker count this starts `uvicorn app.main:app` with
+WEB_CONCURRENCY=N on a scratch database (never the real one), loads a
+server-rendered list page with many todos from --concurrency clients for
+--seconds, and reports requests/s and latency percentiles. It then checks
+cache coherence across workers: a todo carrying a new hashtag is created
+through one connection and the hashtag vocabulary is read back over fresh
+connections (spread over the workers by the kernel); any read missing the new
+tag is counted as stale.
+
+Scaling is bounded by the number of CPU cores; on a one-core machine every
+worker count gives about the same throughput.
+
+Usage examples:
+  python scripts/bench_workers.py
+  python scripts/bench_workers.py --workers 1 2 4 8 --seconds 20 --concurrency 32
+  python scripts/bench_workers.py --todos 400 --path '/html_no_js/lists/{list_id}'
+  python scripts/bench_workers.py --json debug_logs/bench_workers.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+USER, PASSWORD = 'bench', 'benchpass'
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _env(db_path: str, bus_dir: str, workers: int) -> dict:
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'bench-workers-secret')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env['DATABASE_URL'] = f'sqlite+aiosqlite:///{db_path}'
+    env['WEB_CONCURRENCY'] = str(workers)
+    env['CACHE_BUS_DIR'] = bus_dir
+    # keep the run side-effect free: no debugger, no SSH REPL, quiet logs
+    env.pop('ENABLE_DEBUGPY', None)
+    env.pop('SSH_REPL_ENABLE', None)
+    return env
+
+
+async def _wait_up(base: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base) as c:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f'server exited with {proc.returncode}')
+            try:
+                r = await c.post('/auth/token', json={'username': USER, 'password': PASSWORD})
+                if r.status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError('server did not come up')
+
+
+async def _login(c: httpx.AsyncClient) -> None:
+    r = await c.post('/auth/token', json={'username': USER, 'password': PASSWORD})
+    r.raise_for_status()
+    c.cookies.set('access_token', r.json()['access_token'])
+
+
+async def _seed(base: str, todos: int) -> int:
+    async with httpx.AsyncClient(base_url=base, timeout=60) as c:
+        await _login(c)
+        r = await c.post('/lists', params={'name': 'bench list'})
+        r.raise_for_status()
+        lid = r.json()['id']
+        for i in range(todos):
+            r = await c.post('/todos', json={'text': f'bench todo {i} #bench{i % 20}', 'list_id': lid})
+            r.raise_for_status()
+        return lid
+
+
+async def _load(base: str, path: str, seconds: float, concurrency: int) -> dict:
+    lat: list[float] = []
+    errors = 0
+    stop = time.monotonic() + seconds
+
+    async def client():
+        nonlocal errors
+        # one keep-alive connection per client, so clients spread over workers
+        async with httpx.AsyncClient(base_url=base, timeout=60) as c:
+            await _login(c)
+            while time.monotonic() < stop:
+                t0 = time.perf_counter()
+                try:
+                    r = await c.get(path)
+                    if r.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.TransportError:
+                    errors += 1
+                    continue
+                lat.append(time.perf_counter() - t0)
+
+    t0 = time.monotonic()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.monotonic() - t0
+    lat.sort()
+
+    def pct(p):
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))] * 1000.0, 1) if lat else None
+
+    return {
+        'requests': len(lat),
+        'errors': errors,
+        'rps': round(len(lat) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'mean_ms': round(statistics.fmean(lat) * 1000.0, 1) if lat else None,
+    }
+
+
+async def _coherence(base: str, list_id: int, reads: int) -> dict:
+    tag = f'#fresh{uuid.uuid4().hex[:8]}'
+    # fresh connection per request so reads land on different workers
+    hdr = {'Connection': 'close'}
+    async with httpx.AsyncClient(base_url=base, timeout=30) as c:
+        await _login(c)
+        for _ in range(reads):
+            await c.get('/api/hashtags/vocab', headers=hdr)
+        r = await c.post('/todos', json={'text': f'coherence probe {tag}', 'list_id': list_id}, headers=hdr)
+        r.raise_for_status()
+        stale = 0
+        for _ in range(reads):
+            r = await c.get('/api/hashtags/vocab', params={'prefix': tag}, headers=hdr)
+            if tag not in r.json().get('tags', []):
+                stale += 1
+    return {'reads': reads, 'stale': stale}
+
+
+async def _run_one(args, workers: int, tmp: str) -> dict:
+    db_path = os.path.join(tmp, f'bench_{workers}.db')
+    bus_dir = os.path.join(tmp, f'bus_{workers}')
+    env = _env(db_path, bus_dir, workers)
+    subprocess.run([sys.executable, os.path.join(ROOT, 'scripts', 'add_user.py'), USER, PASSWORD, '--db', db_path],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    port = _free_port()
+    base = f'http://127.0.0.1:{port}'
+    cmd = [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(workers), '--log-level', 'warning', '--no-access-log']
+    log = open(os.path.join(tmp, f'server_{workers}.log'), 'wb')
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        await _wait_up(base, proc)
+        list_id = await _seed(base, args.todos)
+        path = args.path.format(list_id=list_id)
+        # warm every worker's caches before measuring
+        await _load(base, path, min(2.0, args.seconds), args.concurrency)
+        res = await _load(base, path, args.seconds, args.concurrency)
+        res['workers'] = workers
+        res['coherence'] = await _coherence(base, list_id, max(8, 4 * workers))
+        return res
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+async def _main(args) -> int:
+    tmp = tempfile.mkdtemp(prefix='bench_workers_')
+    results = []
+    try:
+        for n in args.workers:
+            res = await _run_one(args, n, tmp)
+            results.append(res)
+            coh = res['coherence']
+            print(f"workers={n:<3} {res['rps']:>8.1f} req/s  p50={res['p50_ms']}ms  p95={res['p95_ms']}ms  "
+                  f"errors={res['errors']}  stale_reads={coh['stale']}/{coh['reads']}", flush=True)
+    finally:
+        if args.keep:
+            print(f'scratch files kept in {tmp}')
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+    if results and results[0]['rps']:
+        base_rps = results[0]['rps']
+        for res in results[1:]:
+            print(f"  x{res['workers']} workers: {res['rps'] / base_rps:.2f}x the {results[0]['workers']}-worker throughput")
+    print(f'cpu cores: {os.cpu_count()}')
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+    return 1 if any(r['coherence']['stale'] for r in results) else 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    ap.add_argument('--seconds', type=float, default=10.0)
+    ap.add_argument('--concurrency', type=int, default=16)
+    ap.add_argument('--todos', type=int, default=200, help='todos in the benchmarked list')
+    ap.add_argument('--path', default='/html_no_js/lists/{list_id}', help='page to load ({list_id} is filled in)')
+    ap.add_argument('--json', help='also write the results to this file')
+    ap.add_argument('--keep', action='store_true', help='keep the scratch database and server logs')
+    return asyncio.run(_main(ap.parse_args()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,46 @@
+"""Check (and optionally repair) the denormalized Todo.is_done column.
+
+Compares each todo's stored is_done with its TodoCompletion rows for the
+'default' completion type (see app/completion_state.py). Normal app writes
+keep them in step; mismatches come from raw SQL edits or old databases.
+
+Usage:
+  source .venv/bin/activate
+  python scripts/check_completion_state.py            # report only
+  python scripts/check_completion_state.py --repair   # rewrite mismatching rows
+  python scripts/check_completion_state.py --json
+
+Exit code:
+  0 -- consistent (or repaired)
+  2 -- mismatches found and not repaired
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from app.db import async_session, init_db
+from app.completion_state import check_consistency
+
+
+async def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--repair', action='store_true', help='rewrite mismatching rows')
+    ap.add_argument('--limit', type=int, default=1000, help='max mismatches to report/repair per run')
+    ap.add_argument('--json', action='store_true')
+    args = ap.parse_args(argv)
+
+    await init_db()
+    async with async_session() as sess:
+        rows = await check_consistency(sess, repair=args.repair, limit=args.limit)
+    if args.json:
+        print(json.dumps({'mismatches': rows, 'repaired': bool(args.repair and rows)}))
+    else:
+        for r in rows:
+            print(f"todo {r['todo_id']}: is_done={r['is_done']} expected={r['expected']}")
+        print(f"{len(rows)} mismatching todo(s){' repaired' if args.repair and rows else ''}")
+    return 2 if rows and not args.repair else 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -35,6 +35,8 @@ SSL_CERTFILE=${SSL_CERTFILE:-$WORKDIR/.certs/fullchain.pem}
 SSL_KEYFILE=${SSL_KEYFILE:-$WORKDIR/.certs/privkey.pem}
 RUN_AS_USER=${RUN_AS_USER:-www-data}
 RUN_AS_GROUP=${RUN_AS_GROUP:-www-data}
+# uvicorn worker processes (written as WEB_CONCURRENCY, see app/workers.py)
+WORKERS=${WORKERS:-1}
 
 echo "Installer settings:"
 cat <<EOF
@@ -45,6 +47,7 @@ SSL_CERTFILE=$SSL_CERTFILE
 SSL_KEYFILE=$SSL_KEYFILE
 RUN_AS_USER=$RUN_AS_USER
 RUN_AS_GROUP=$RUN_AS_GROUP
+WORKERS=$WORKERS
 EOF
 
 if [ "$DRY_RUN" -eq 0 ] && [ "$ASSUME_YES" -eq 0 ]; then
@@ -96,6 +99,7 @@ SSL_CERTFILE=${SSL_CERTFILE}
 SSL_KEYFILE=${SSL_KEYFILE}
 RUN_AS_USER=${RUN_AS_USER}
 RUN_AS_GROUP=${RUN_AS_GROUP}
+WEB_CONCURRENCY=${WORKERS}
 EOF
 )
 
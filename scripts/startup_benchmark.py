@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""Import-time / startup benchmark for app.main with a regression threshold.
+
+Runs `python -X importtime -c "import app.main"` in fresh interpreters,
+reports the slowest modules, and fails (exit 1) when:
+  - the best-of-N import time exceeds --max-ms, or
+  - it regressed more than --tolerance against a saved --baseline, or
+  - a module that should load lazily (dateparser, asyncssh, app.repl_api by
+    default) was imported eagerly.
+
+Optionally also times init_db() on the configured database (--init-db), which
+with a current schema_version row should skip all migration passes.
+
+Usage examples:
+  # Quick report
+  python scripts/startup_benchmark.py
+
+  # CI-style gate against a stored baseline
+  python scripts/startup_benchmark.py --runs 5 --baseline debug_logs/startup_baseline.json --tolerance 0.25
+
+  # Record a new baseline
+  python scripts/startup_benchmark.py --runs 5 --baseline debug_logs/startup_baseline.json --save-baseline
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import Sequence
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_LAZY = ('dateparser', 'asyncssh', 'app.repl_api')
+_LINE_RE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$')
+
+_INIT_DB_SNIPPET = """
+import asyncio, time
+t0 = time.perf_counter()
+import app.main  # noqa: F401
+t1 = time.perf_counter()
+from app.db import init_db
+asyncio.run(init_db())
+t2 = time.perf_counter()
+asyncio.run(init_db())
+t3 = time.perf_counter()
+print('STARTUP_TIMES', (t1 - t0) * 1000.0, (t2 - t1) * 1000.0, (t3 - t2) * 1000.0)
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'startup-benchmark-secret')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    # keep the run side-effect free: no debugger, no SSH REPL
+    env.pop('ENABLE_DEBUGPY', None)
+    env.pop('SSH_REPL_ENABLE', None)
+    return env
+
+
+def parse_importtime(stderr: str) -> dict[str, tuple[int, int]]:
+    """Return {module: (self_us, cumulative_us)} from -X importtime output."""
+    out: dict[str, tuple[int, int]] = {}
+    for line in stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            out[m.group(4)] = (int(m.group(1)), int(m.group(2)))
+    return out
+
+
+def run_once(python: str) -> dict[str, tuple[int, int]]:
+    proc = subprocess.run(
+        [python, '-X', 'importtime', '-c', 'import app.main'],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr[-4000:])
+        raise SystemExit(f'import app.main failed with exit code {proc.returncode}')
+    return parse_importtime(proc.stderr)
+
+
+def run_init_db(python: str) -> tuple[float, float, float] | None:
+    proc = subprocess.run([python, '-c', _INIT_DB_SNIPPET], cwd=ROOT, env=_env(), capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith('STARTUP_TIMES'):
+            _, a, b, c = line.split()
+            return float(a), float(b), float(c)
+    sys.stderr.write(proc.stderr[-4000:])
+    return None
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument('--runs', type=int, default=3, help='fresh interpreters to run; best time is used')
+    ap.add_argument('--top', type=int, default=15, help='slowest modules to list')
+    ap.add_argument('--max-ms', type=float, default=float(os.getenv('STARTUP_IMPORT_MAX_MS', '0') or 0),
+                    help='fail when import app.main takes longer (0 = no absolute limit)')
+    ap.add_argument('--baseline', help='JSON file with a previous result')
+    ap.add_argument('--tolerance', type=float, default=0.2, help='allowed regression vs baseline (0.2 = +20%%)')
+    ap.add_argument('--save-baseline', action='store_true', help='write this result to --baseline')
+    ap.add_argument('--lazy', default=','.join(DEFAULT_LAZY),
+                    help='comma-separated modules that must not be imported by app.main')
+    ap.add_argument('--init-db', action='store_true', help='also time init_db() (cold, then warm)')
+    ap.add_argument('--python', default=sys.executable)
+    args = ap.parse_args(argv)
+
+    runs = [run_once(args.python) for _ in range(max(1, args.runs))]
+    totals = [r.get('app.main', (0, 0))[1] / 1000.0 for r in runs]
+    best_idx = min(range(len(totals)), key=totals.__getitem__)
+    best, best_run = totals[best_idx], runs[best_idx]
+    print(f'import app.main: best {best:.1f} ms, runs ' + ', '.join(f'{t:.1f}' for t in totals))
+
+    print('\nslowest modules by self time (best run):')
+    for name, (self_us, cum_us) in sorted(best_run.items(), key=lambda kv: -kv[1][0])[:args.top]:
+        print(f'  {self_us / 1000.0:8.1f} ms self {cum_us / 1000.0:8.1f} ms cum  {name}')
+    print('\napp modules by cumulative time:')
+    app_mods = [(n, v) for n, v in best_run.items() if n == 'app' or n.startswith('app.')]
+    for name, (self_us, cum_us) in sorted(app_mods, key=lambda kv: -kv[1][1])[:args.top]:
+        print(f'  {cum_us / 1000.0:8.1f} ms cum  {name}')
+
+    failures: list[str] = []
+    lazy = [m.strip() for m in (args.lazy or '').split(',') if m.strip()]
+    eager = [m for m in lazy if m in best_run]
+    if eager:
+        failures.append('imported eagerly by app.main: ' + ', '.join(eager))
+
+    if args.init_db:
+        t = run_init_db(args.python)
+        if t is None:
+            failures.append('init_db timing run failed')
+        else:
+            print(f'\ninit_db: first {t[1]:.1f} ms, second {t[2]:.1f} ms (import {t[0]:.1f} ms)')
+
+    if args.max_ms and best > args.max_ms:
+        failures.append(f'import time {best:.1f} ms exceeds --max-ms {args.max_ms:.1f}')
+
+    if args.baseline and not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fh:
+            base = float(json.load(fh).get('import_ms') or 0)
+        if base:
+            limit = base * (1.0 + args.tolerance)
+            print(f'\nbaseline {base:.1f} ms, limit {limit:.1f} ms')
+            if best > limit:
+                failures.append(f'import time {best:.1f} ms regressed past {limit:.1f} ms (baseline {base:.1f} ms)')
+
+    if args.save_baseline:
+        if not args.baseline:
+            ap.error('--save-baseline needs --baseline')
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump({'import_ms': round(best, 1), 'python': sys.version.split()[0]}, fh)
+        print(f'\nsaved baseline {best:.1f} ms to {args.baseline}')
+
+    for f in failures:
+        print('FAIL:', f)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
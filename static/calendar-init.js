@@ -16,10 +16,11 @@ function setCookie(name, value, days) {
   document.cookie = name + '=' + (value || '') + expires + '; path=/';
 }
 
-// Initialize calendar when module loads
-export async function initializeCalendar(year, month, initialOccurrences) {
-  const { initCalendar } = await import('/static/calendar-preact.bundle.js');
-  const { setupEventDelegation } = await import('/static/calendar-events.js');
+// Initialize calendar when module loads. `assets` carries the versioned
+// module URLs from the page (static_url); the plain paths are the fallback.
+export async function initializeCalendar(year, month, initialOccurrences, assets = {}) {
+  const { initCalendar } = await import(assets.bundle || '/static/calendar-preact.bundle.js');
+  const { setupEventDelegation } = await import(assets.events || '/static/calendar-events.js');
   
   // Initialize Preact calendar
   initCalendar('preact-calendar-root', initialOccurrences);
@@ -11,10 +11,19 @@
   }
   function linkColor(){ return '#9ca3af'; /* gray-400 */ }
 
+  // Layout version of the data on screen (see /html_no_js/linkmap/delta)
+  var layoutVersion = 0;
+  var graph = null;
+
+  function hasLayout(data){
+    var nodes = data.nodes || [];
+    return nodes.length > 0 && nodes.every(n => typeof n.x === 'number' && typeof n.y === 'number');
+  }
+
   function initGraph(data){
     var el = $('#graph');
     if(!el){ return; }
-    var graph = ForceGraph()(el)
+    graph = ForceGraph()(el)
       .backgroundColor('#000000')
       .graphData(data)
       .nodeId('id')
@@ -143,10 +152,40 @@
       });
     } catch(e) {}
 
+    // Positions come precomputed from the server; skip the in-browser simulation
+    if (hasLayout(data)) { try { graph.cooldownTicks(0); } catch(e){} }
+
     // Fit to graph after render
     setTimeout(function(){ try { graph.zoomToFit(400, 50); } catch(e){} }, 250);
   }
 
+  // Merge a delta reply: drop removed/changed nodes and every link touching
+  // them, then add the returned nodes and links.
+  function applyDelta(d){
+    if (!graph || !d) return;
+    if (d.full) { layoutVersion = d.version || 0; graph.graphData(computeDegrees({ nodes: d.nodes || [], links: d.links || [] })); return; }
+    if (!(d.nodes || []).length && !(d.removed || []).length) { layoutVersion = d.version || layoutVersion; return; }
+    var cur = graph.graphData();
+    var touched = Object.create(null);
+    (d.removed || []).forEach(id => { touched[id] = true; });
+    (d.nodes || []).forEach(n => { touched[n.id] = true; });
+    function endId(v){ return typeof v === 'object' && v ? v.id : v; }
+    var nodes = cur.nodes.filter(n => !touched[n.id]).concat(d.nodes || []);
+    var links = cur.links
+      .map(l => ({ source: endId(l.source), target: endId(l.target) }))
+      .filter(l => !touched[l.source] && !touched[l.target])
+      .concat(d.links || []);
+    layoutVersion = d.version || layoutVersion;
+    graph.graphData(computeDegrees({ nodes: nodes, links: links }));
+  }
+
+  function refreshDelta(){
+    if (!graph || document.hidden) return;
+    fetchJSON('/html_no_js/linkmap/delta?since=' + encodeURIComponent(layoutVersion))
+      .then(applyDelta)
+      .catch(err => { console.warn('link map delta failed', err); });
+  }
+
   function computeDegrees(data){
     try {
       var deg = Object.create(null);
@@ -163,11 +202,14 @@
 
   document.addEventListener('DOMContentLoaded', function(){
     fetchJSON('/html_no_js/linkmap/data')
-      .then(d => computeDegrees(d))
+      .then(d => { layoutVersion = d.version || 0; return computeDegrees(d); })
       .then(d => initGraph(d))
       .catch(err => {
         console.error('Failed to load link map data', err);
         var el = $('#graph'); if(el){ el.innerHTML = '<div class="meta">Failed to load link map.</div>'; }
       });
+    // Pick up link changes made in other tabs when this one is shown again
+    document.addEventListener('visibilitychange', refreshDelta);
+    window.addEventListener('focus', refreshDelta);
   });
 })();
@@ -0,0 +1,37 @@
+// fast_todo: per-user hashtag suggestion vocabulary (served from /static)
+// Fetched once per page from /api/hashtags/vocab. The reply carries an ETag
+// (app/hashtag_vocab.py), so the browser revalidates its cached copy with
+// If-None-Match and only downloads the tags again when they changed.
+'use strict';
+
+(function(){
+	var pending = null;
+
+	// window.ftHashtagVocab() -> Promise of the sorted tag array ('#tag', ...)
+	function load(url){
+		if (!pending){
+			pending = fetch(url || '/api/hashtags/vocab', { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+				.then(function(r){ if (!r.ok) throw new Error('HTTP ' + r.status); return r.json(); })
+				.then(function(data){ return (data && Array.isArray(data.tags)) ? data.tags : []; })
+				.catch(function(){ pending = null; return []; });
+		}
+		return pending;
+	}
+	window.ftHashtagVocab = load;
+
+	// <datalist data-hashtag-vocab> elements get one <option> per tag
+	function fillDatalists(){
+		var lists = document.querySelectorAll('datalist[data-hashtag-vocab]');
+		if (!lists.length) return;
+		load(lists[0].getAttribute('data-hashtag-vocab')).then(function(tags){
+			Array.prototype.forEach.call(lists, function(dl){
+				var frag = document.createDocumentFragment();
+				tags.forEach(function(t){ var o = document.createElement('option'); o.value = t; frag.appendChild(o); });
+				dl.innerHTML = '';
+				dl.appendChild(frag);
+			});
+		});
+	}
+	if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', fillDatalists);
+	else fillDatalists();
+})();
@@ -356,6 +356,19 @@ async def client(ensure_db):
         yield ac
 
 
+@pytest_asyncio.fixture
+async def logged_in(client):
+    """Give `client` a csrf_token cookie for form posts; returns (user_id, csrf) of testuser."""
+    from app.auth import create_csrf_token
+    from app.models import User
+
+    csrf = create_csrf_token("testuser")
+    client.cookies.set("csrf_token", csrf)
+    async with async_session() as sess:
+        uid = (await sess.exec(select(User.id).where(User.username == "testuser"))).first()
+    return uid, csrf
+
+
 
 def pytest_collection_modifyitems(session, config, items):
     """Skip recurrence/occurrence-heavy tests when recurrence detection is disabled.
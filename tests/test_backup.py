@@ -0,0 +1,96 @@
+import gzip
+import sqlite3
+import threading
+import pytest
+from app import backup, config
+
+pytestmark = pytest.mark.asyncio
+
+
+def _wal_db(path, rows=200):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA wal_autocheckpoint=0')
+    conn.execute('CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)')
+    conn.executemany('INSERT INTO t (v) VALUES (?)', [('x' * 200,) for _ in range(rows)])
+    conn.commit()
+    return conn
+
+
+def _rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute('SELECT count(*) FROM t').fetchone()[0], conn.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def test_snapshot_includes_wal_rotates_and_verifies(tmp_path):
+    db = str(tmp_path / 'live.db')
+    conn = _wal_db(db)
+    # committed but still only in the -wal file (no checkpoint)
+    conn.executemany('INSERT INTO t (v) VALUES (?)', [('y',) for _ in range(50)])
+    conn.commit()
+    assert (tmp_path / 'live.db-wal').stat().st_size > 0
+    dest = str(tmp_path / 'bk')
+
+    results = [backup.backup_database(db, dest, compression='gzip', keep=2, pages_per_step=4, step_sleep=0) for _ in range(3)]
+    kept = backup.list_backups(dest, db)
+    assert [b['path'] for b in kept] == [results[2].path, results[1].path]
+    assert results[2].rotated == [results[0].path.rsplit('/', 1)[1]]
+    assert all(b['has_checksum'] for b in kept)
+
+    res = results[2]
+    assert res.path.endswith('.db.gz') and res.sha256 and res.pages > 1
+    v = backup.verify_backup(res.path, deep=True)
+    assert v['checksum_ok'] is True and v['integrity_ok'] is True
+    raw = str(tmp_path / 'restored.db')
+    with gzip.open(res.path, 'rb') as fi, open(raw, 'wb') as fo:
+        fo.write(fi.read())
+    assert _rows(raw) == (250, 'delete')
+
+    with open(res.path, 'r+b') as f:
+        f.seek(10)
+        f.write(b'\x00\x01')
+    assert backup.verify_backup(res.path)['checksum_ok'] is False
+    conn.close()
+
+
+async def test_vacuum_method_and_concurrent_writer(tmp_path):
+    db = str(tmp_path / 'live.db')
+    _wal_db(db, rows=2000).close()
+    stop = threading.Event()
+
+    def writer():
+        w = sqlite3.connect(db, timeout=10)
+        while not stop.is_set():
+            w.execute('INSERT INTO t (v) VALUES (?)', ('w',))
+            w.commit()
+        w.close()
+
+    th = threading.Thread(target=writer)
+    th.start()
+    try:
+        a = backup.backup_database(db, str(tmp_path / 'bk'), compression='none', keep=0, pages_per_step=8, step_sleep=0)
+        b = backup.backup_database(db, str(tmp_path / 'bk'), method='vacuum', compression='none', keep=0)
+    finally:
+        stop.set()
+        th.join()
+    for r in (a, b):
+        n, mode = _rows(r.path)
+        assert n >= 2000 and mode == 'delete'
+        assert backup.verify_backup(r.path, deep=True)['integrity_ok'] is True
+    with pytest.raises(backup.BackupError):
+        backup.backup_database(db, str(tmp_path / 'bk'), compression='brotli')
+
+
+async def test_admin_backup_endpoint(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'BACKUP_DIR', str(tmp_path))
+    r = await client.post('/auth/token', json={'username': 'testuser', 'password': 'testpass'})
+    client.cookies.set('access_token', r.json()['access_token'])
+    r = await client.post('/admin/backup', params={'verify': '1', 'keep': '3'})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body['ok'] is True and body['verify']['integrity_ok'] is True
+    listed = (await client.get('/admin/backups')).json()['backups']
+    assert [b['path'] for b in listed] == [body['backup']['path']]
@@ -0,0 +1,78 @@
+import asyncio
+import json
+import socket
+import pytest
+from app import cache_bus as cache_bus_mod
+from app.cache_bus import CacheBus
+from app.visibility import Visibility, visibility
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _settle():
+    # one tick to send the coalesced datagram, one to receive it
+    for _ in range(3):
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.01)
+
+
+async def test_publish_reaches_peers_coalesced_and_gaps_flush(tmp_path):
+    a, b = CacheBus(str(tmp_path), name='a'), CacheBus(str(tmp_path), name='b')
+    got = []
+    b.subscribe('things', got.append)
+    b.subscribe('other', lambda k: got.append(('other', k)))
+    assert a.start() and b.start()
+    try:
+        a.publish('things', 1)
+        a.publish('things', [2, 3])
+        a.publish('things', 1)
+        await _settle()
+        assert sorted(got) == [1, 2, 3]
+        # one datagram for the three publishes
+        assert a.sent == 1 and b.received == 1
+
+        got.clear()
+        a.publish('things', 4)
+        a.publish('things', None)
+        await _settle()
+        assert got == [None]
+
+        # a lost datagram (sequence gap) drops every subscribed channel
+        got.clear()
+        a._seq += 1
+        a.publish('things', 5)
+        await _settle()
+        assert b.gaps == 1
+        assert sorted(got, key=str) == [('other', None), None]
+    finally:
+        a.stop()
+        b.stop()
+    assert not list(tmp_path.glob('*.sock'))
+
+
+async def test_dead_peer_socket_is_unlinked(tmp_path):
+    dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    dead.bind(str(tmp_path / '999999.sock'))
+    dead.close()
+    a = CacheBus(str(tmp_path), name='a')
+    assert a.start()
+    try:
+        a.publish('things', 1)
+        await _settle()
+    finally:
+        a.stop()
+    assert not (tmp_path / '999999.sock').exists()
+
+
+async def test_visibility_entry_dropped_by_peer_message(tmp_path, monkeypatch):
+    bus = CacheBus(str(tmp_path), name='self')
+    monkeypatch.setattr(bus, '_handlers', cache_bus_mod.cache_bus._handlers)
+    visibility._cache[424242] = (10 ** 12, Visibility(424242, None, frozenset()))
+    visibility._cache[424243] = (10 ** 12, Visibility(424243, None, frozenset()))
+    bus.dispatch(json.dumps({'o': 'peer', 's': 1, 'c': {'visibility': [424242]}}).encode())
+    assert visibility.peek(424242) is None
+    assert visibility.peek(424243) is not None
+    visibility.invalidate(424243)
+    # own datagrams are ignored
+    bus.dispatch(json.dumps({'o': bus._origin, 's': 2, 'c': {'visibility': None}}).encode())
+    assert bus.received == 1
@@ -0,0 +1,73 @@
+import uuid
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.db import engine
+
+pytestmark = pytest.mark.asyncio
+
+
+@contextmanager
+def _count_statements():
+    seen = []
+
+    def _before(conn, cursor, statement, params, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before)
+    try:
+        yield seen
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', _before)
+
+
+async def _make_lists(client, n, prefix):
+    ids = []
+    for i in range(n):
+        r = await client.post('/lists', params={'name': f'{prefix}-{i} #v2tag'})
+        assert r.status_code == 200
+        lid = r.json()['id']
+        ids.append(lid)
+        await client.post('/todos', json={'text': f'todo {i}', 'list_id': lid, 'priority': i % 3 + 1})
+    return ids
+
+
+async def test_v2_keyset_pages_and_projection(client):
+    prefix = f'v2-{uuid.uuid4().hex[:6]}'
+    ids = await _make_lists(client, 5, prefix)
+    r = await client.get('/client/json/v2/lists', params={'per_page': 2, 'fields': 'name,uncompleted_count,hashtags'})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    rows = [row for rows in body['lists_by_category'].values() for row in rows]
+    assert len(rows) == 2
+    assert set(rows[0].keys()) == {'id', 'name', 'uncompleted_count', 'hashtags'}
+    # newest first: the two lists created last
+    assert {row['id'] for row in rows} == set(ids[-2:])
+    assert all(row['uncompleted_count'] == 1 and '#v2tag' in row['hashtags'] for row in rows)
+    pg = body['pagination']
+    assert pg['has_next'] is True and pg['has_prev'] is False
+
+    # walk forward then back with the cursors
+    nxt = pg['next_cursor']
+    r2 = await client.get('/client/json/v2/lists', params={'per_page': 2, 'cursor_created_at': nxt['created_at'], 'cursor_id': nxt['id'], 'include': ''})
+    body2 = r2.json()
+    assert 'categories' not in body2 and 'pinned_todos' not in body2
+    ids2 = [row['id'] for rows in body2['lists_by_category'].values() for row in rows]
+    assert set(ids2) == set(ids[-4:-2])
+    assert body2['pagination']['has_prev'] is True
+    prv = body2['pagination']['prev_cursor']
+    r3 = await client.get('/client/json/v2/lists', params={'per_page': 2, 'dir': 'prev', 'cursor_created_at': prv['created_at'], 'cursor_id': prv['id']})
+    ids3 = [row['id'] for rows in r3.json()['lists_by_category'].values() for row in rows]
+    assert set(ids3) == set(ids[-2:])
+    assert r3.json()['pagination']['has_prev'] is False
+
+
+async def test_v2_statement_count_independent_of_page_size(client):
+    await _make_lists(client, 6, f'v2n-{uuid.uuid4().hex[:6]}')
+    counts = []
+    for per_page in (1, 6):
+        with _count_statements() as seen:
+            r = await client.get('/client/json/v2/lists', params={'per_page': per_page})
+            assert r.status_code == 200
+        counts.append(len(seen))
+    assert counts[0] == counts[1]
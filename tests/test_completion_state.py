@@ -0,0 +1,66 @@
+import uuid
+import pytest
+from sqlalchemy import text
+from app.db import async_session
+from app.models import Todo
+from app.completion_state import check_consistency
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _todo(client):
+    r = await client.post('/lists', params={'name': f'done-{uuid.uuid4().hex[:6]}'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': 'denormalized done', 'list_id': lid})
+    return lid, r.json()['id']
+
+
+async def _state(tid):
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        return t.is_done, t.completed_at
+
+
+async def test_complete_and_undo_maintain_is_done(client):
+    lid, tid = await _todo(client)
+    assert await _state(tid) == (False, None)
+
+    r = await client.post(f'/todos/{tid}/complete', params={'done': True})
+    assert r.status_code == 200
+    done, at = await _state(tid)
+    assert done is True and at is not None
+
+    # another completion type does not count as done, and re-completing keeps the timestamp
+    await client.post(f'/todos/{tid}/complete', params={'completion_type': 'other', 'done': True})
+    await client.post(f'/todos/{tid}/complete', params={'done': True})
+    assert await _state(tid) == (True, at)
+
+    r = await client.post(f'/todos/{tid}/complete', params={'done': False})
+    assert r.status_code == 200
+    assert await _state(tid) == (False, None)
+
+
+async def test_loaded_todo_objects_follow_the_flush(client):
+    lid, tid = await _todo(client)
+    from app.models import CompletionType, TodoCompletion
+    from sqlmodel import select
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        ct = (await sess.exec(select(CompletionType).where(CompletionType.list_id == lid).where(CompletionType.name == 'default'))).first()
+        sess.add(TodoCompletion(todo_id=tid, completion_type_id=ct.id, done=True))
+        await sess.commit()
+        assert t.is_done is True and t.completed_at is not None
+
+
+async def test_consistency_check_finds_and_repairs_raw_sql_drift(client):
+    lid, tid = await _todo(client)
+    await client.post(f'/todos/{tid}/complete', params={'done': True})
+    async with async_session() as sess:
+        await sess.exec(text('UPDATE todo SET is_done = 0, completed_at = NULL WHERE id = :id').bindparams(id=tid))
+        await sess.commit()
+        rows = await check_consistency(sess, limit=100000)
+        assert {'todo_id': tid, 'is_done': False, 'expected': True} in rows
+        await check_consistency(sess, repair=True, limit=100000)
+        assert not [r for r in await check_consistency(sess, limit=100000) if r['todo_id'] == tid]
+    done, at = await _state(tid)
+    assert done is True and at is not None
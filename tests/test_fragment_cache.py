@@ -0,0 +1,67 @@
+import re
+import uuid
+import pytest
+from app import fragment_cache
+from app.main import TEMPLATES
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _list_with_todos(client, n):
+    r = await client.post('/lists', params={'name': f'frag-{uuid.uuid4().hex[:6]}'})
+    lid = r.json()['id']
+    ids = []
+    for i in range(n):
+        r = await client.post('/todos', json={'text': f'frag todo {i} #fragtag', 'list_id': lid})
+        ids.append(r.json()['id'])
+    return lid, ids
+
+
+async def test_list_page_reuses_row_fragments(client):
+    lid, ids = await _list_with_todos(client, 3)
+    before = fragment_cache.fragment_cache_stats()
+    r1 = await client.get(f'/html_no_js/lists/{lid}')
+    assert r1.status_code == 200
+    mid = fragment_cache.fragment_cache_stats()
+    assert mid['misses'] - before['misses'] >= 3
+    r2 = await client.get(f'/html_no_js/lists/{lid}')
+    after = fragment_cache.fragment_cache_stats()
+    assert after['hits'] - mid['hits'] >= 3
+    for tid in ids:
+        assert f'id="todo-{tid}"' in r2.text
+    # cached rows carry this request's CSRF token, never the placeholder
+    assert fragment_cache.CSRF_PLACEHOLDER not in r2.text
+    row = re.search(rf'<tr id="todo-{ids[1]}".*?</tr>', r2.text, re.S).group(0)
+    row_tokens = set(re.findall(r'name="_csrf" value="([^"]+)"', row))
+    assert len(row_tokens) == 1 and row_tokens <= set(re.findall(r'name="_csrf" value="([^"]+)"', r2.text.replace(row, '')))
+
+    # completing a todo re-renders just that row
+    await client.post(f'/todos/{ids[0]}/complete')
+    s0 = fragment_cache.fragment_cache_stats()
+    r3 = await client.get(f'/html_no_js/lists/{lid}')
+    s1 = fragment_cache.fragment_cache_stats()
+    assert s1['misses'] - s0['misses'] == 1
+    row = re.search(rf'<tr id="todo-{ids[0]}".*?</tr>', r3.text, re.S).group(0)
+    assert '☑' in row
+
+
+async def test_row_key_tracks_state_and_flags():
+    t = {'id': 1, 'text': 'x', 'modified_at': None, 'completed': False, 'tags': ['#a']}
+    k = fragment_cache.row_key('table', t, [], 'v1', ('UTC',))
+    assert k == fragment_cache.row_key('table', dict(t), [], 'v1', ('UTC',))
+    assert k != fragment_cache.row_key('table', {**t, 'completed': True}, [], 'v1', ('UTC',))
+    assert k != fragment_cache.row_key('table', {**t, 'tags': ['#b']}, [], 'v1', ('UTC',))
+    assert k != fragment_cache.row_key('table', t, [7], 'v1', ('UTC',))
+    assert k != fragment_cache.row_key('table', t, [], 'v2', ('UTC',))
+    assert k != fragment_cache.row_key('li', t, [], 'v1', ('UTC',))
+    assert k != fragment_cache.row_key('table', t, [], 'v1', ('Australia/Sydney',))
+
+
+async def test_rows_match_inline_macro_render():
+    rows = [{'id': 5, 'text': 'a <b>', 'note': 'see https://example.com', 'created_at': None, 'modified_at': None,
+             'completed': False, 'pinned': True, 'priority': 2, 'extra_completions': [], 'tags': ['#z', '#a']}]
+    fragment_cache.render_todo_rows(TEMPLATES.env, rows, variant='li', list_row={'id': 1}, client_tz='UTC', csrf_token='tok')
+    html = str(rows[0]['row_html'])
+    module = TEMPLATES.env.get_template(fragment_cache.ROW_TEMPLATE).module
+    assert html == str(module.list_item(rows[0], [], {}, {'id': 1}, 'UTC', None))
+    assert 'a &lt;b&gt;' in html and 'priority-circle">②' in html
@@ -0,0 +1,53 @@
+import pytest
+from sqlmodel import select
+from app.db import async_session
+from app.models import Hashtag, TodoHashtag
+from app.hashtag_cache import hashtag_cache, resolve_hashtag_ids, sync_hashtag_links
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_new_tag_published_only_after_commit(ensure_db):
+    async with async_session() as sess:
+        ids = await resolve_hashtag_ids(sess, ['#cacherollback'])
+        assert '#cacherollback' in ids
+        await sess.rollback()
+    found, missing = hashtag_cache.get_many(['#cacherollback'])
+    assert missing == ['#cacherollback']
+
+    async with async_session() as sess:
+        ids = await resolve_hashtag_ids(sess, ['CacheCommit'])
+        await sess.commit()
+    found, missing = hashtag_cache.get_many(['#cachecommit'])
+    assert found == {'#cachecommit': ids['#cachecommit']}
+
+
+async def test_sync_links_replaces_set(client):
+    r = await client.post('/lists', params={'name': 'cache-links'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': 'x #ca #cb', 'list_id': lid})
+    tid = r.json()['id']
+    async with async_session() as sess:
+        ids = await resolve_hashtag_ids(sess, ['#cb', '#cc'])
+        await sync_hashtag_links(sess, TodoHashtag, TodoHashtag.todo_id, tid, ids.values())
+        await sess.commit()
+        res = await sess.exec(
+            select(Hashtag.tag).join(TodoHashtag, TodoHashtag.hashtag_id == Hashtag.id).where(TodoHashtag.todo_id == tid)
+        )
+        assert sorted(res.all()) == ['#cb', '#cc']
+
+
+async def test_deleted_hashtag_is_discarded(client):
+    r = await client.post('/lists', params={'name': 'cache-del'})
+    lid = r.json()['id']
+    await client.post('/todos', json={'text': 'y #cachedel', 'list_id': lid})
+    found, _ = hashtag_cache.get_many(['#cachedel'])
+    old_id = found['#cachedel']
+    hashtag_cache.discard_ids([old_id])
+    _, missing = hashtag_cache.get_many(['#cachedel'])
+    assert missing == ['#cachedel']
+    # a later resolve repopulates from the DB with the same id
+    async with async_session() as sess:
+        ids = await resolve_hashtag_ids(sess, ['#cachedel'])
+        await sess.commit()
+    assert ids['#cachedel'] == old_id
@@ -0,0 +1,120 @@
+import uuid
+import pytest
+from sqlmodel import select
+from app.db import async_session
+from app.models import User, UserHashtagStats, Hashtag, Todo
+from app import hashtag_stats
+
+pytestmark = pytest.mark.asyncio
+
+# the test DB persists between runs; keep tags unique per run
+_RUN = uuid.uuid4().hex[:6]
+
+
+async def _user_id():
+    async with async_session() as sess:
+        return (await sess.exec(select(User.id).where(User.username == 'testuser'))).first()
+
+
+async def _stats_row(uid, tag):
+    async with async_session() as sess:
+        q = (
+            select(UserHashtagStats)
+            .join(Hashtag, Hashtag.id == UserHashtagStats.hashtag_id)
+            .where(UserHashtagStats.user_id == uid)
+            .where(Hashtag.tag == tag)
+        )
+        return (await sess.exec(q)).first()
+
+
+async def test_sync_updates_counters_incrementally(client):
+    uid = await _user_id()
+    r = await client.post('/lists', params={'name': 'stats-list #statsl'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': f'one #statst{_RUN}', 'list_id': lid})
+    t1 = r.json()['id']
+    await client.post('/todos', json={'text': f'two #statst{_RUN}', 'list_id': lid})
+    row = await _stats_row(uid, f'#statst{_RUN}')
+    assert row is not None and row.todo_count == 2 and row.last_used_at is not None
+
+    # re-syncing one todo without the tag decrements the counter
+    from app.main import _sync_todo_hashtags
+    async with async_session() as sess:
+        await _sync_todo_hashtags(sess, t1, ['#other'])
+    row = await _stats_row(uid, f'#statst{_RUN}')
+    assert row.todo_count == 1
+
+
+async def test_top_and_recent_views(client):
+    r = await client.post('/lists', params={'name': 'stats-views'})
+    lid = r.json()['id']
+    for i in range(3):
+        await client.post('/todos', json={'text': f'pop {i} #statspopular{_RUN}', 'list_id': lid})
+    await client.post('/todos', json={'text': f'rare #statsrare{_RUN}', 'list_id': lid})
+
+    r = await client.get('/api/hashtags/stats', params={'order': 'top', 'prefix': '#stats', 'limit': 500})
+    assert r.status_code == 200
+    tags = [h['tag'] for h in r.json()['hashtags']]
+    assert tags.index(f'#statspopular{_RUN}') < tags.index(f'#statsrare{_RUN}')
+
+    r = await client.get('/api/hashtags/stats', params={'order': 'recent', 'prefix': '#stats'})
+    assert r.json()['hashtags'][0]['tag'] == f'#statsrare{_RUN}'
+
+    r = await client.get('/api/lookup/names', params={'tags': f'statspopular{_RUN}'})
+    assert r.json()['tags'][0] == {'tag': f'#statspopular{_RUN}', 'count': 3}
+
+    r = await client.get('/html_no_js/hashtags', params={'sort': 'top'})
+    assert r.status_code == 200
+    assert f'data-tag="#statspopular{_RUN}"' in r.text
+
+
+async def test_untracked_removal_applies_delta(client):
+    uid = await _user_id()
+    r = await client.post('/lists', params={'name': 'stats-untracked'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': f'x #statsuntracked{_RUN}', 'list_id': lid})
+    tid = r.json()['id']
+    await client.post('/todos', json={'text': f'y #statsuntracked{_RUN}', 'list_id': lid})
+    hashtag_stats._take_stale()
+    # single-tag removal endpoint does not maintain the counters itself
+    r = await client.delete(f'/todos/{tid}/hashtags', params={'tag': f'#statsuntracked{_RUN}'})
+    assert r.status_code in (200, 204), r.text
+    row = await _stats_row(uid, f'#statsuntracked{_RUN}')
+    assert row.todo_count == 1
+    # and neither does todo deletion; no rebuild is queued for either
+    async with async_session() as sess:
+        other = (await sess.exec(select(Todo.id).where(Todo.list_id == lid).where(Todo.id != tid))).first()
+    r = await client.delete(f'/todos/{other}')
+    assert r.status_code == 200
+    row = await _stats_row(uid, f'#statsuntracked{_RUN}')
+    assert row.todo_count == 0
+    assert hashtag_stats._take_stale() == set()
+
+
+async def test_reads_do_not_rebuild(client, monkeypatch):
+    async def _boom(*a, **kw):
+        raise AssertionError('GET must not rebuild')
+    monkeypatch.setattr(hashtag_stats, 'rebuild_user_stats', _boom)
+    hashtag_stats.mark_all_stale(broadcast=False)
+    r = await client.get('/api/hashtags/stats', params={'order': 'top'})
+    assert r.status_code == 200
+    r = await client.get('/html_no_js/hashtags')
+    assert r.status_code == 200
+    hashtag_stats._take_stale()
+
+
+async def test_rebuild_stale_user(client):
+    uid = await _user_id()
+    r = await client.post('/lists', params={'name': 'stats-rebuild'})
+    lid = r.json()['id']
+    await client.post('/todos', json={'text': f'z #statsrebuild{_RUN}', 'list_id': lid})
+    async with async_session() as sess:
+        row = await _stats_row(uid, f'#statsrebuild{_RUN}')
+        await sess.delete(await sess.get(UserHashtagStats, (row.user_id, row.hashtag_id)))
+        await sess.commit()
+    assert await _stats_row(uid, f'#statsrebuild{_RUN}') is None
+    hashtag_stats._take_stale()
+    hashtag_stats.mark_user_stale(uid, broadcast=False)
+    assert await hashtag_stats.rebuild_stale() == 1
+    row = await _stats_row(uid, f'#statsrebuild{_RUN}')
+    assert row is not None and row.todo_count == 1
@@ -0,0 +1,82 @@
+import uuid
+import pytest
+from app.hashtag_vocab import Vocab, hashtag_vocab
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_vocab_prefix_index_and_deltas():
+    v = Vocab.build(1, {1: ('#shop', 2), 2: ('#sched', 1), 3: ('#alpha', 1), 4: ('#s', 1), 5: ('#zero', 0)})
+    assert v.tags == ('#alpha', '#s', '#sched', '#shop')
+    assert v.prefix('#s') == ['#s', '#sched', '#shop']
+    assert v.prefix('sh') == ['#shop']
+    assert v.prefix('#q') == [] and v.prefix('') == list(v.tags)
+    assert v.prefix('#s', limit=2) == ['#s', '#sched']
+    from collections import Counter
+    w = v.apply({6: ('#beta', 1), 1: ('#shop', 1)}, Counter({2: 1, 1: 1}))
+    assert w.tags == ('#alpha', '#beta', '#s', '#shop')
+    assert w.counts[1] == ('#shop', 2)
+    assert w.etag != v.etag and Vocab.build(1, dict(w.counts)).etag == w.etag
+
+
+async def test_tag_sync_updates_cached_vocab_and_etag(client, logged_in):
+    uid, _ = logged_in
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'hv-{tag}'})).json()['id']
+    tid = (await client.post('/todos', json={'text': f'vocab #va{tag}', 'list_id': lid})).json()['id']
+
+    r = await client.get('/api/hashtags/vocab')
+    assert r.status_code == 200
+    body = r.json()
+    assert f'#va{tag}' in body['tags'] and body['tags'] == sorted(body['tags'])
+    etag = r.headers['etag']
+    assert (await client.get('/api/hashtags/vocab', headers={'If-None-Match': etag})).status_code == 304
+    assert (await client.get('/api/hashtags/vocab', params={'prefix': f'va{tag}'})).json()['tags'] == [f'#va{tag}']
+
+    # tag sync adjusts the cached entry in place (no reload)
+    before = hashtag_vocab.peek(uid)
+    assert before is not None
+    misses = hashtag_vocab.misses
+    r = await client.patch(f'/todos/{tid}', json={'text': f'vocab #vb{tag}'})
+    assert r.status_code == 200
+    after = hashtag_vocab.peek(uid)
+    assert after is not None and after is not before
+    assert {f'#va{tag}', f'#vb{tag}'} <= set(after.tags)
+    r = await client.get('/api/hashtags/vocab', headers={'If-None-Match': etag})
+    assert r.status_code == 200 and r.headers['etag'] != etag
+    assert f'#vb{tag}' in r.json()['tags']
+    assert hashtag_vocab.misses == misses
+
+    # removing the last use of a tag outside tag sync drops and reloads the entry
+    r = await client.delete(f'/todos/{tid}/hashtags', params={'tag': f'#va{tag}'})
+    assert r.status_code == 200
+    assert hashtag_vocab.peek(uid) is None
+    tags = (await client.get('/api/hashtags/vocab')).json()['tags']
+    assert f'#va{tag}' not in tags and f'#vb{tag}' in tags
+
+    # the todo page fetches it from the endpoint instead of inlining it
+    page = await client.get(f'/html_no_js/todos/{tid}')
+    assert 'data-hashtag-vocab="/api/hashtags/vocab"' in page.text
+    assert f'<option value="#vb{tag}">' not in page.text
+    r = await client.get('/api/hashtags/vocab')
+    assert {'authorization', 'cookie'} <= {v.strip().lower() for v in r.headers['vary'].split(',')}
+
+
+async def test_untracked_link_write_drops_only_its_owner(client, logged_in):
+    from app.db import async_session
+    from app.models import User
+    uid, _ = logged_in
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'hv-own-{tag}'})).json()['id']
+    tid = (await client.post('/todos', json={'text': f'own #vo{tag}', 'list_id': lid})).json()['id']
+    async with async_session() as sess:
+        other = User(username=f'hv-other-{tag}', password_hash='x')
+        sess.add(other)
+        await sess.commit()
+        other_id = other.id
+        await hashtag_vocab.get(sess, uid)
+        await hashtag_vocab.get(sess, other_id)
+    r = await client.delete(f'/todos/{tid}/hashtags', params={'tag': f'#vo{tag}'})
+    assert r.status_code == 200
+    assert hashtag_vocab.peek(uid) is None
+    assert hashtag_vocab.peek(other_id) is not None
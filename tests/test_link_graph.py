@@ -0,0 +1,107 @@
+import uuid
+import pytest
+from sqlalchemy import event
+from app.db import async_session, engine
+from app.models import ItemLink
+from app.link_graph import link_graph
+from app.query_budget import capture_queries
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _items(client, n=3):
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'lg-{tag}'})).json()['id']
+    tids = [(await client.post('/todos', json={'text': f'lg {tag} {i}', 'list_id': lid})).json()['id'] for i in range(n)]
+    return lid, tids
+
+
+async def _graph(uid):
+    async with async_session() as sess:
+        return await link_graph.get(sess, uid)
+
+
+async def test_add_and_remove_link_update_forward_and_backlinks(client, logged_in):
+    uid, csrf = logged_in
+    lid, (a, b, c) = await _items(client)
+    hdr = {'Accept': 'application/json'}
+    r1 = await client.post(f'/html_no_js/todos/{a}/links', data={'_csrf': csrf, 'tgt_type': 'todo', 'tgt_id': b, 'label': 'next'}, headers=hdr)
+    r2 = await client.post(f'/html_no_js/todos/{a}/links', data={'_csrf': csrf, 'tgt_type': 'list', 'tgt_id': lid}, headers=hdr)
+    await client.post(f'/html_no_js/todos/{c}/links', data={'_csrf': csrf, 'tgt_type': 'todo', 'tgt_id': b}, headers=hdr)
+    assert r1.status_code == 200 and r2.status_code == 200
+
+    g = await _graph(uid)
+    out = g.outgoing('todo', a)
+    assert [(e.tgt_type, e.tgt_id, e.label) for e in out] == [('todo', b, 'next'), ('list', lid, None)]
+    assert {e.src_id for e in g.incoming('todo', b)} == {a, c}
+
+    r = await client.post(f"/html_no_js/todos/{a}/links/{r1.json()['id']}/delete", data={'_csrf': csrf}, headers=hdr)
+    assert r.status_code == 200
+    g = await _graph(uid)
+    assert [e.tgt_id for e in g.outgoing('todo', a)] == [lid]
+    assert {e.src_id for e in g.incoming('todo', b)} == {c}
+
+
+async def test_collation_toggle_updates_membership(client, logged_in):
+    uid, csrf = logged_in
+    lid, (a, b, c) = await _items(client)
+    coll = (await client.post('/lists', params={'name': f'lg-coll-{uuid.uuid4().hex[:6]}'})).json()['id']
+    r = await client.post('/client/json/collations', json={'list_id': coll, 'active': True})
+    assert r.status_code == 200
+    await _graph(uid)  # warm the cache before the ORM write
+    r = await client.post(f'/client/json/collations/{coll}/toggle', json={'todo_id': a, 'link': True})
+    assert r.json()['linked'] is True
+    g = await _graph(uid)
+    assert g.pairs('list', [coll], 'todo') == [(coll, a)]
+    assert g.sources('todo', a, 'list') == {coll}
+
+    r = await client.get('/client/json/collations/status', params={'todo_id': a})
+    assert {m['list_id']: m['linked'] for m in r.json()['memberships']}.get(coll) is True
+
+
+async def test_linkmap_is_one_pass_and_cache_hits_skip_sql(client, logged_in):
+    uid, csrf = logged_in
+    lid, tids = await _items(client, n=12)
+    async with async_session() as sess:
+        for t in tids[1:]:
+            sess.add(ItemLink(src_type='todo', src_id=tids[0], tgt_type='todo', tgt_id=t, owner_id=uid))
+        await sess.commit()
+
+    with capture_queries() as q:
+        r = await client.get('/html_no_js/linkmap/data')
+    assert r.status_code == 200
+    labels = {n['id']: n['label'] for n in r.json()['nodes']}
+    assert all(labels[f'todo:{t}'].startswith('lg ') for t in tids)
+    [req] = q.for_route('/html_no_js/linkmap/data')
+    assert req.statements <= 8
+    q.assert_no_n_plus_one(threshold=5)
+
+    g = await _graph(uid)
+    seen = []
+
+    def _on(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    event.listen(engine.sync_engine, 'before_cursor_execute', _on)
+    try:
+        again = await _graph(uid)
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', _on)
+    assert again is g and seen == []
+
+
+async def test_bulk_itemlink_delete_drops_only_its_owner(client, logged_in):
+    from sqlalchemy import delete as sqlalchemy_delete
+    from app.models import User
+    uid, csrf = logged_in
+    lid, (a, b, c) = await _items(client)
+    async with async_session() as sess:
+        other = User(username=f'lg-other-{uuid.uuid4().hex[:8]}', password_hash='x')
+        sess.add(other)
+        await sess.commit()
+        other_id = other.id
+    await _graph(uid)
+    await _graph(other_id)
+    async with async_session() as sess:
+        await sess.exec(sqlalchemy_delete(ItemLink).where(ItemLink.src_type == 'list').where(ItemLink.src_id == lid).where(ItemLink.owner_id == uid))
+        await sess.commit()
+    assert link_graph.peek(other_id) is not None
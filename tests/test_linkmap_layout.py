@@ -0,0 +1,61 @@
+import uuid
+import pytest
+from app.linkmap_layout import compute_layout
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _link(client, csrf, src, tgt):
+    r = await client.post(f'/html_no_js/todos/{src}/links', data={'_csrf': csrf, 'tgt_type': 'todo', 'tgt_id': tgt}, headers={'Accept': 'application/json'})
+    assert r.status_code == 200
+    return r.json()['id']
+
+
+async def test_compute_layout_moves_only_movable_nodes():
+    adj = {'a': {'b'}, 'b': {'a', 'c'}, 'c': {'b'}, 'd': set()}
+    full = compute_layout(adj, {}, adj, iterations=30)
+    assert set(full) == set(adj)
+    assert len({p for p in full.values()}) == 4
+    fixed = {n: full[n] for n in ('a', 'b', 'd')}
+    adj['c'] = {'b', 'e'}
+    adj['e'] = {'c'}
+    part = compute_layout(adj, fixed, {'c', 'e'}, iterations=30)
+    assert set(part) == {'c', 'e'}
+    assert compute_layout(adj, fixed, {'c', 'e'}, iterations=30) == part
+
+
+async def test_linkmap_data_has_layout_and_delta_returns_only_changes(client, logged_in):
+    _, csrf = logged_in
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'lm-{tag}'})).json()['id']
+    a, b, c, d = [(await client.post('/todos', json={'text': f'lm {tag} {i}', 'list_id': lid})).json()['id'] for i in range(4)]
+    ab = await _link(client, csrf, a, b)
+
+    full = (await client.get('/html_no_js/linkmap/data')).json()
+    v1 = full['version']
+    nodes = {n['id']: n for n in full['nodes']}
+    assert {f'todo:{a}', f'todo:{b}'} <= set(nodes)
+    assert all(isinstance(n['x'], float) and isinstance(n['y'], float) for n in full['nodes'])
+    assert {'source': f'todo:{a}', 'target': f'todo:{b}'} in full['links']
+    # nothing changed: same version, empty delta
+    assert (await client.get('/html_no_js/linkmap/data')).json()['version'] == v1
+    assert (await client.get('/html_no_js/linkmap/delta', params={'since': v1})).json()['nodes'] == []
+
+    await _link(client, csrf, c, d)
+    delta = (await client.get('/html_no_js/linkmap/delta', params={'since': v1})).json()
+    v2 = delta['version']
+    assert v2 > v1 and delta['full'] is False
+    assert {n['id'] for n in delta['nodes']} == {f'todo:{c}', f'todo:{d}'}
+    assert delta['links'] == [{'source': f'todo:{c}', 'target': f'todo:{d}'}]
+    again = {n['id']: n for n in (await client.get('/html_no_js/linkmap/data')).json()['nodes']}
+    assert (again[f'todo:{a}']['x'], again[f'todo:{a}']['y']) == (nodes[f'todo:{a}']['x'], nodes[f'todo:{a}']['y'])
+
+    r = await client.post(f'/html_no_js/todos/{a}/links/{ab}/delete', data={'_csrf': csrf}, headers={'Accept': 'application/json'})
+    assert r.status_code == 200
+    delta = (await client.get('/html_no_js/linkmap/delta', params={'since': v2})).json()
+    assert {f'todo:{a}', f'todo:{b}'} <= set(delta['removed'])
+    assert not {n['id'] for n in delta['nodes']} & {f'todo:{a}', f'todo:{b}'}
+
+    # a version from the future (e.g. another database) gets a full reply
+    future = (await client.get('/html_no_js/linkmap/delta', params={'since': delta['version'] + 100})).json()
+    assert future['full'] is True and f'todo:{c}' in {n['id'] for n in future['nodes']}
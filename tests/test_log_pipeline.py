@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import uuid
+import pytest
+from app import log_pipeline
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_ring_buffer_wraps_and_keeps_order():
+    rb = log_pipeline.RingBuffer(3)
+    for i in range(5):
+        rb.append(i)
+    assert rb.items() == [2, 3, 4] and len(rb) == 3
+    rb.clear()
+    rb.append('x')
+    assert rb.items() == ['x']
+
+
+async def test_sampler_rates():
+    assert [log_pipeline.Sampler(1).hit() for _ in range(3)] == [True] * 3
+    assert not any(log_pipeline.Sampler(0).hit() for _ in range(3))
+    s = log_pipeline.Sampler(4)
+    assert sum(s.hit() for _ in range(12)) == 3
+
+
+async def test_records_are_formatted_lazily_on_read():
+    log_pipeline.install()
+
+    class Probe:
+        calls = 0
+
+        def __str__(self):
+            Probe.calls += 1
+            return 'probe'
+
+    # only the pipeline handler: pytest's capture handlers format eagerly
+    lg = logging.getLogger('test.pipeline.lazy')
+    lg.propagate = False
+    lg.addHandler(log_pipeline._pipeline.handler)
+    marker = uuid.uuid4().hex
+    try:
+        lg.warning('lazy %s %s', marker, Probe())
+    finally:
+        lg.removeHandler(log_pipeline._pipeline.handler)
+    await log_pipeline.drain()
+    assert Probe.calls == 0
+    hits = [r for r in log_pipeline.recent(level='warning') if marker in r['message']]
+    assert len(hits) == 1 and Probe.calls == 1
+    assert hits[0]['logger'] == 'test.pipeline.lazy' and hits[0]['message'].endswith(f'lazy {marker} probe')
+    # the formatted dict is memoised on the record
+    log_pipeline.recent()
+    assert Probe.calls == 1
+
+
+async def test_exceptions_keep_traceback_text():
+    marker = uuid.uuid4().hex
+    try:
+        raise ValueError(marker)
+    except ValueError:
+        logging.getLogger('test.pipeline').exception('boom')
+    await log_pipeline.drain()
+    msg = log_pipeline.recent(level='ERROR')[-1]['message']
+    assert 'Traceback' in msg and f'ValueError: {marker}' in msg
+
+
+async def test_subscribers_receive_records():
+    q: asyncio.Queue = asyncio.Queue()
+    log_pipeline.subscribe(q)
+    try:
+        marker = uuid.uuid4().hex
+        logging.getLogger('test.pipeline').warning('sub %s', marker)
+        rec = await asyncio.wait_for(q.get(), 2)
+        while marker not in rec['message']:
+            rec = await asyncio.wait_for(q.get(), 2)
+        assert rec['level'] == 'WARNING'
+    finally:
+        log_pipeline.unsubscribe(q)
+
+
+async def test_server_logs_post_then_get(client):
+    marker = uuid.uuid4().hex
+    r = await client.post('/server/logs', json={'level': 'WARNING', 'message': marker})
+    assert r.status_code in (200, 303)
+    r = await client.get('/server/logs', params={'level': 'WARNING', 'limit': 50})
+    assert r.status_code == 200
+    assert any(marker in rec['message'] for rec in r.json()['logs'])
@@ -0,0 +1,54 @@
+import re
+import uuid
+import pytest
+from app import metrics
+
+pytestmark = pytest.mark.asyncio
+
+
+def _sample(text, name, **labels):
+    want = ','.join(f'{k}="{v}"' for k, v in labels.items())
+    for line in text.splitlines():
+        if line.startswith(name + '{') and want in line:
+            return float(line.rsplit(' ', 1)[1])
+    return None
+
+
+async def test_histogram_buckets_are_cumulative():
+    h = metrics.Histogram((1, 5))
+    for v in (0, 1, 3, 9):
+        h.observe(v)
+    assert h.cumulative() == [2, 3, 4] and h.count == 4 and h.sum == 13
+
+
+async def test_metrics_per_route_template(client):
+    r = await client.post('/lists', params={'name': f'metrics-{uuid.uuid4().hex[:6]}'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': 'metrics todo', 'list_id': lid})
+    tid = r.json()['id']
+    before = metrics.render_prometheus()
+    n0 = _sample(before, 'fasttodo_http_request_duration_seconds_count', method='GET', route='/todos/{todo_id}') or 0
+    for _ in range(3):
+        assert (await client.get(f'/todos/{tid}')).status_code == 200
+
+    r = await client.get('/server/metrics')
+    assert r.status_code == 200
+    assert r.headers['content-type'].startswith('text/plain')
+    text = r.text
+    assert '# TYPE fasttodo_http_request_duration_seconds histogram' in text
+    # labelled by the route template, not the concrete path
+    assert f'route="/todos/{tid}"' not in text
+    assert _sample(text, 'fasttodo_http_request_duration_seconds_count', method='GET', route='/todos/{todo_id}') == n0 + 3
+    inf = _sample(text, 'fasttodo_http_request_duration_seconds_bucket', method='GET', route='/todos/{todo_id}', le='+Inf')
+    assert inf == n0 + 3
+    # each GET ran at least one statement
+    assert _sample(text, 'fasttodo_http_request_sql_statements_sum', method='GET', route='/todos/{todo_id}') >= 3
+    assert _sample(text, 'fasttodo_http_request_db_seconds_total', method='GET', route='/todos/{todo_id}') > 0
+    assert _sample(text, 'fasttodo_http_responses_total', method='GET', route='/todos/{todo_id}', status='200') >= 3
+
+
+async def test_unmatched_paths_share_one_label(client):
+    await client.get(f'/no-such-path-{uuid.uuid4().hex}')
+    text = metrics.render_prometheus()
+    assert not re.search(r'route="/no-such-path-', text)
+    assert _sample(text, 'fasttodo_http_responses_total', route=metrics.UNMATCHED_ROUTE, status='404') >= 1
@@ -0,0 +1,109 @@
+import uuid
+import pytest
+from sqlalchemy import event
+from sqlmodel import select
+from app import ordering
+from app.auth import create_csrf_token
+from app.db import async_session, engine
+from app.models import Category, ListState, User
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _categories(positions):
+    async with async_session() as sess:
+        u = User(username=f'ord-{uuid.uuid4().hex[:8]}', password_hash='x')
+        sess.add(u)
+        await sess.commit()
+        cats = [Category(name=f'c{i}', position=p, owner_id=u.id) for i, p in enumerate(positions)]
+        sess.add_all(cats)
+        await sess.commit()
+        return u.id, [c.id for c in cats]
+
+
+async def _order(uid):
+    async with async_session() as sess:
+        rows = (await sess.exec(select(Category.id, Category.position).where(Category.owner_id == uid).order_by(Category.position, Category.id))).all()
+    return [(int(i), p) for i, p in rows]
+
+
+class _Statements:
+    def __enter__(self):
+        self.sql = []
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._on)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(engine.sync_engine, 'before_cursor_execute', self._on)
+
+    def _on(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'INSERT', 'DELETE', 'WITH')):
+            self.sql.append(statement)
+
+
+async def test_renumber_is_one_statement_and_idempotent(ensure_db):
+    uid, (a, b, c, d) = await _categories([5, 5, 0, 7])
+    sib = ordering.category_siblings(uid)
+    async with async_session() as sess:
+        with _Statements() as st:
+            # c already sits at 0, so three rows are rewritten
+            assert await ordering.repair(sess, sib) == 3
+        await sess.commit()
+    assert sum(s.lstrip().upper().startswith('UPDATE') for s in st.sql) == 1
+    assert await _order(uid) == [(c, 0), (a, ordering.GAP), (b, 2 * ordering.GAP), (d, 3 * ordering.GAP)]
+    async with async_session() as sess:
+        assert await ordering.repair(sess, sib) == 0
+        assert await ordering.renumber(sess, sib) == 0
+
+
+async def test_move_writes_one_row_and_renumbers_when_out_of_gaps(ensure_db):
+    uid, (a, b, c) = await _categories([0, 1, 2])
+    sib = ordering.category_siblings(uid)
+    async with async_session() as sess:
+        # contiguous positions leave no gap: renumber, then move
+        assert await ordering.move(sess, sib, c, 'up') is True
+        await sess.commit()
+    assert [i for i, _ in await _order(uid)] == [a, c, b]
+
+    before = dict(await _order(uid))
+    async with async_session() as sess:
+        with _Statements() as st:
+            assert await ordering.move(sess, sib, c, 'up') is True
+        await sess.commit()
+        assert await ordering.move(sess, sib, c, 'up') is False
+        assert await ordering.append_position(sess, sib) == max(before.values()) + ordering.GAP
+    assert [s.lstrip().split()[0].upper() for s in st.sql] == ['SELECT', 'UPDATE']
+    after = dict(await _order(uid))
+    assert [i for i, _ in await _order(uid)] == [c, a, b]
+    assert {k for k in after if after[k] != before[k]} == {c}
+
+
+async def test_sublist_create_top_and_move_api(client):
+    r = await client.post('/auth/token', json={'username': 'testuser', 'password': 'testpass'})
+    client.cookies.set('access_token', r.json()['access_token'])
+    csrf = create_csrf_token('testuser')
+    client.cookies.set('csrf_token', csrf)
+    lid = (await client.post('/lists', params={'name': f'ord-{uuid.uuid4().hex[:6]}'})).json()['id']
+    tid = (await client.post('/todos', json={'text': 'ordered parent', 'list_id': lid})).json()['id']
+    hdr = {'Accept': 'application/json'}
+    ids = []
+    for name, top in (('one', None), ('two', None), ('zero', '1')):
+        data = {'_csrf': csrf, 'name': name}
+        if top:
+            data['top'] = top
+        r = await client.post(f'/html_no_js/todos/{tid}/sublists/create', data=data, headers=hdr)
+        assert r.status_code == 200
+        ids.append(r.json()['id'])
+    one, two, zero = ids
+
+    async def order():
+        async with async_session() as sess:
+            rows = (await sess.exec(select(ListState.id).where(ListState.parent_todo_id == tid).order_by(*ordering.todo_sublist_siblings(tid).order_by()))).all()
+        return [int(i) for i in rows]
+
+    assert await order() == [zero, one, two]
+    r = await client.post(f'/api/todos/{tid}/sublists/{two}/move', json={'direction': 'up'})
+    assert r.status_code == 200 and r.json()['moved'] is True
+    assert await order() == [zero, two, one]
+    r = await client.post(f'/api/todos/{tid}/sublists/{zero}/move', json={'direction': 'up'})
+    assert r.json()['moved'] is False
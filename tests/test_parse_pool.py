@@ -0,0 +1,79 @@
+import uuid
+import pytest
+from app import parse_pool
+from app.utils import extract_dates_meta, parse_text_to_rrule_string
+
+pytestmark = pytest.mark.asyncio
+
+TEXTS = [
+    'Meeting 1 Sep 2025',
+    'Lunch 2/9',
+    'nothing to see here',
+    'Water plants every 2 weeks',
+    'Finals 10 Sep and 12 Sep - review on 9 Sep',
+]
+
+
+def _strip(metas):
+    return [[(m.get('match_text'), m.get('year_explicit'), m.get('month'), m.get('day')) for m in ms] for ms in metas]
+
+
+async def test_inline_batch_matches_direct_calls():
+    assert not parse_pool.pool_enabled()
+    metas = await parse_pool.extract_dates_meta_many(TEXTS)
+    assert _strip(metas) == _strip([extract_dates_meta(t) for t in TEXTS])
+
+
+async def test_parse_todo_text_inline():
+    parsed = await parse_pool.parse_todo_text('Water plants every 2 weeks')
+    _, rrule = parse_text_to_rrule_string('Water plants every 2 weeks')
+    assert parsed['rrule'] == rrule
+    assert set(parsed) == {'dtstart', 'rrule', 'recurrence', 'plain_dates'}
+
+
+async def test_process_pool_matches_inline(monkeypatch):
+    from app import config
+    monkeypatch.setattr(config, 'DATE_PARSE_MIN_BATCH', 1)
+    pool = parse_pool.start_parse_pool(workers=2)
+    assert pool is not None
+    try:
+        metas = await parse_pool.extract_dates_meta_many(TEXTS * 3)
+        assert len(metas) == len(TEXTS) * 3
+        assert _strip(metas) == _strip([extract_dates_meta(t) for t in TEXTS * 3])
+        parsed = await parse_pool.parse_todo_text('Pay rent monthly')
+        assert parsed['rrule'] == parse_text_to_rrule_string('Pay rent monthly')[1]
+    finally:
+        parse_pool.shutdown_parse_pool()
+    assert not parse_pool.pool_enabled()
+
+
+async def test_calendar_batch_skips_negative_cached_texts(client, monkeypatch):
+    import json
+    import app.main as main
+    from app.db import async_session
+    from app.models import Todo
+
+    tag = uuid.uuid4().hex[:6]
+    r = await client.post('/lists', data={'name': f'NegCacheBatch {tag}'})
+    list_id = r.json()['id']
+    cached = (await client.post('/todos', json={'list_id': list_id, 'text': f'Cached {tag} 3 Sep 2025'})).json()
+    fresh = (await client.post('/todos', json={'list_id': list_id, 'text': f'Fresh {tag} 4 Sep 2025'})).json()
+    async with async_session() as sess:
+        t = await sess.get(Todo, cached['id'])
+        t.metadata_json = json.dumps({'calendar_extract_cache': {
+            'v': 1, 'text_hash': main._calendar_text_hash(t.text), 'found_any': False}})
+        sess.add(t)
+        await sess.commit()
+
+    sent: list[str] = []
+
+    async def _many(texts):
+        sent.extend(texts)
+        return [extract_dates_meta(x) for x in texts]
+
+    monkeypatch.setattr(main, 'parse_pool_enabled', lambda: True)
+    monkeypatch.setattr(main, 'extract_dates_meta_many', _many)
+    r = await client.get('/calendar/occurrences', params={'start': '2025-09-01T00:00:00+00:00', 'end': '2025-09-10T00:00:00+00:00'})
+    assert r.status_code == 200
+    assert fresh['text'] in sent
+    assert cached['text'] not in sent
@@ -0,0 +1,49 @@
+import uuid
+import pytest
+from app import config, query_budget
+from app.query_budget import fingerprint, capture_queries, QueryBudgetExceeded
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_fingerprint_collapses_parameters_and_in_lists():
+    a = fingerprint('SELECT * FROM todo WHERE id IN (?, ?)  AND list_id = 5')
+    b = fingerprint("SELECT * FROM todo\n WHERE id IN (?,?,?) AND list_id = 12")
+    assert a == b == 'SELECT * FROM todo WHERE id IN (?+) AND list_id = ?'
+    assert fingerprint("SELECT 'x''y', t1.id FROM t1") == 'SELECT ?, t1.id FROM t1'
+
+
+async def test_capture_counts_statements_per_request(client):
+    r = await client.post('/lists', params={'name': f'qb-{uuid.uuid4().hex[:6]}'})
+    lid = r.json()['id']
+    with capture_queries() as q:
+        await client.get(f'/lists/{lid}')
+    [req] = q.for_route('/lists/{list_id}')
+    assert req.status == 200 and req.statements >= 1
+    assert sum(req.shapes.values()) == req.statements
+    q.assert_max(req.statements)
+    with pytest.raises(QueryBudgetExceeded):
+        q.assert_max(req.statements - 1)
+
+
+async def test_repeated_shapes_warn_and_raise(client, monkeypatch, caplog):
+    # threshold 1 / budget 0 make any request trip the detector
+    r = await client.post('/lists', params={'name': f'qb-n1-{uuid.uuid4().hex[:6]}'})
+    lid = r.json()['id']
+    route = '/lists/{list_id}'
+    monkeypatch.setattr(config, 'SQL_N1_THRESHOLD', 1)
+    with capture_queries() as q:
+        await client.get(f'/lists/{lid}')
+    with pytest.raises(QueryBudgetExceeded):
+        q.assert_no_n_plus_one(threshold=1)
+
+    query_budget.set_budget(route, 0)
+    try:
+        with caplog.at_level('WARNING', logger='app.query_budget'):
+            await client.get(f'/lists/{lid}')
+        assert any('sql_budget.exceeded' in rec.getMessage() and '"budget": 0' in rec.getMessage() for rec in caplog.records)
+        monkeypatch.setattr(config, 'SQL_BUDGET_MODE', 'raise')
+        with pytest.raises(QueryBudgetExceeded):
+            await client.get(f'/lists/{lid}')
+    finally:
+        query_budget.set_budget(route, None)
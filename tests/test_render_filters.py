@@ -0,0 +1,67 @@
+import uuid
+import pytest
+from app.db import async_session
+from app.render_filters import (
+    linkify, render_fn_tags, prefetch_fn_link_labels, render_cache_stats,
+    clear_render_caches, _fn_link_label_cache,
+)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_linkify_escapes_links_and_caches():
+    clear_render_caches()
+    text = f'see https://example.com/{uuid.uuid4().hex} <b> and <a href="/x">kept</a>'
+    out = linkify(text)
+    assert '&lt;b&gt;' in out
+    assert '<a href="/x">kept</a>' in out
+    assert 'target="_blank" rel="noopener noreferrer">https://example.com/' in out
+    assert linkify(text) == out
+    stats = render_cache_stats()['linkify']
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+async def test_fn_tags_without_links_are_cached():
+    clear_render_caches()
+    text = '{{fn:search.multi #a,#b | Find}} and {{fn:url https://example.com | Ex}}'
+    out = render_fn_tags(text)
+    assert '/html_no_js/search?q=%23a+%23b' in out and 'class="fn-button fn-url"' in out
+    assert render_fn_tags(text) == out
+    assert render_cache_stats()['render_fn_tags']['hits'] == 1
+
+
+async def test_prefetched_links_render_without_lookups(client):
+    r = await client.post('/lists', params={'name': f'rf-list-{uuid.uuid4().hex[:6]} #rflist'})
+    lid = r.json()['id']
+    r = await client.post('/todos', json={'text': 'rf target #rftag', 'list_id': lid, 'priority': 3})
+    tid = r.json()['id']
+    note = f'{{{{fn:link target=todo:{tid}}}}} {{{{fn:link list={lid}}}}} {{{{fn:link todo=999999999}}}}'
+
+    token = _fn_link_label_cache.set({})
+    try:
+        async with async_session() as sess:
+            assert await prefetch_fn_link_labels(sess, [note, None]) == 3
+        cache = _fn_link_label_cache.get()
+        assert cache[f'todo:{tid}']['tags'] == ['#rftag'] and cache[f'todo:{tid}']['done'] is False
+        out = render_fn_tags(note)
+        assert f'href="/html_no_js/todos/{tid}">rf target' in out
+        assert 'priority-circle">③' in out
+        assert f'/html_no_js/lists/{lid}' in out and '#rflist' in out
+        assert 'Todo #999999999' in out
+        # same text with the same resolved data is served from the LRU
+        hits = render_cache_stats()['render_fn_tags']['hits']
+        assert render_fn_tags(note) == out
+        assert render_cache_stats()['render_fn_tags']['hits'] == hits + 1
+    finally:
+        _fn_link_label_cache.reset(token)
+
+    # completing the target changes the cache key, so the link is re-rendered as done
+    r = await client.post(f'/todos/{tid}/complete')
+    assert r.status_code == 200
+    token = _fn_link_label_cache.set({})
+    try:
+        async with async_session() as sess:
+            await prefetch_fn_link_labels(sess, [note])
+        assert 'fn-button fn-link done' in render_fn_tags(note)
+    finally:
+        _fn_link_label_cache.reset(token)
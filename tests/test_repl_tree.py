@@ -0,0 +1,94 @@
+import asyncio
+import uuid
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app.db import async_session, engine
+from app.models import ListState, Todo, User
+from app.repl_api import Repl
+
+pytestmark = pytest.mark.asyncio
+
+
+@contextmanager
+def _count_statements():
+    seen = []
+
+    def _before(conn, cursor, statement, params, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before)
+    try:
+        yield seen
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', _before)
+
+
+async def _repl_with_tree():
+    # /A/B/C with one todo in each list
+    async with async_session() as sess:
+        u = User(username=f'repltree-{uuid.uuid4().hex[:8]}', password_hash='x')
+        sess.add(u)
+        await sess.commit()
+        await sess.refresh(u)
+        parent = None
+        ids = []
+        for name in ('A', 'B', 'C'):
+            lst = ListState(name=name, owner_id=u.id, parent_list_id=parent)
+            sess.add(lst)
+            await sess.commit()
+            await sess.refresh(lst)
+            sess.add(Todo(text=f'todo in {name}', list_id=lst.id))
+            await sess.commit()
+            parent = lst.id
+            ids.append(lst.id)
+    return Repl(u), ids
+
+
+async def test_path_lookup_uses_cached_tree(ensure_db):
+    repl, (a, b, c) = await _repl_with_tree()
+    ref = await asyncio.to_thread(repl.L, '/A/B/C')
+    assert ref.id == c and ref.path == '/A/B/C'
+    # warm cache: one statement regardless of depth
+    with _count_statements() as seen:
+        ref = await asyncio.to_thread(repl.L, '/A/B/C')
+    assert ref.id == c and len(seen) == 1
+
+    # mutations through the REPL invalidate the tree
+    await asyncio.to_thread(repl.rename, ref, 'C2')
+    assert (await asyncio.to_thread(repl.L, '/A/B/C2')).id == c
+    with pytest.raises(ValueError):
+        await asyncio.to_thread(repl.L, '/A/B/C')
+
+    # lists created elsewhere are found after one reload
+    async with async_session() as sess:
+        lst = ListState(name='D', owner_id=repl.user.id, parent_list_id=b)
+        sess.add(lst)
+        await sess.commit()
+        await sess.refresh(lst)
+    assert (await asyncio.to_thread(repl.L, '/A/B/D')).id == lst.id
+
+
+async def test_recursive_ls_and_bulk_set(ensure_db):
+    repl, (a, b, c) = await _repl_with_tree()
+    repl.fmt('json')
+    with _count_statements() as seen:
+        rows = await asyncio.to_thread(repl.ls, '/A', True)
+    assert [(r['type'], r.get('path') or r.get('list')) for r in rows] == [
+        ('list', '/A/B'), ('todo', '/A'),
+        ('list', '/A/B/C'), ('todo', '/A/B'),
+        ('todo', '/A/B/C'),
+    ]
+    # path lookup (1, warm cache after the first) + ls tree + todos
+    assert len(seen) <= 4
+
+    out = await asyncio.to_thread(repl.setprops, ['/A', b, ('/A/B/C', 'todo in C')], priority=3)
+    assert [o['id'] for o in out][:2] == [a, b]
+    async with async_session() as sess:
+        assert (await sess.get(ListState, a)).priority == 3
+        assert (await sess.get(ListState, b)).priority == 3
+    # all-or-nothing: one bad selector leaves the others untouched
+    with pytest.raises(ValueError):
+        await asyncio.to_thread(repl.setprops, [c, '/A/missing'], priority=1)
+    async with async_session() as sess:
+        assert (await sess.get(ListState, c)).priority != 1
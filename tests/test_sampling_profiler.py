@@ -0,0 +1,63 @@
+import threading
+import types
+import pytest
+from app.profiling import RouteTagMiddleware, SamplingProfiler, BACKGROUND_ROUTE
+
+pytestmark = pytest.mark.asyncio
+
+
+async def test_samples_are_folded_under_route_template():
+    prof = SamplingProfiler(hz=100)
+    prof.loop_thread = threading.get_ident()
+
+    def busy_leaf():
+        prof.sample_once()
+
+    async def endpoint(scope, receive, send):
+        busy_leaf()
+
+    scope = {'type': 'http', 'path': '/items/7', 'route': types.SimpleNamespace(path='/items/{item_id}')}
+    await RouteTagMiddleware(endpoint)(scope, None, None)
+    # outside any tagged request the sample is background work
+    prof.sample_once()
+
+    assert prof.routes() == {'/items/{item_id}': 1, BACKGROUND_ROUTE: 1}
+    lines = prof.folded(route='/items/{item_id}').splitlines()
+    assert len(lines) == 1
+    stack, count = lines[0].rsplit(' ', 1)
+    frames = stack.split(';')
+    assert count == '1' and frames[0] == '/items/{item_id}'
+    # outermost first: the endpoint frame comes before the leaf
+    assert frames[1].startswith('test_samples_are_folded_under_route_template.<locals>.endpoint')
+    assert 'busy_leaf' in frames[-2] and 'sample_once' in frames[-1]
+    prof.reset()
+    assert prof.routes() == {} and prof.folded() == ''
+
+
+async def test_stack_count_is_bounded():
+    prof = SamplingProfiler(hz=100, max_stacks=1)
+    prof.loop_thread = threading.get_ident()
+
+    def a():
+        prof.sample_once()
+
+    def b():
+        prof.sample_once()
+
+    a()
+    b()
+    stacks = prof.folded().splitlines()
+    assert len(stacks) == 2 and any(s.startswith(f'{BACKGROUND_ROUTE};<other> ') for s in stacks)
+
+
+async def test_sampling_admin_endpoint(client):
+    r = await client.post('/server/profile/sampling', json={'action': 'start', 'hz': 200})
+    assert r.status_code == 200 and r.json()['running'] is True and r.json()['hz'] == 200
+    try:
+        assert (await client.get('/server/profile/sampling')).json()['running'] is True
+        r = await client.get('/server/profile/sampling/folded')
+        assert r.status_code == 200 and r.headers['content-type'].startswith('text/plain')
+    finally:
+        r = await client.post('/server/profile/sampling', json={'action': 'stop'})
+    assert r.json()['running'] is False
+    assert (await client.post('/server/profile/sampling', json={'action': 'bogus'})).status_code == 400
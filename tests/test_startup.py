@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import event, text
+from app.db import engine, init_db, SCHEMA_VERSION
+
+pytestmark = pytest.mark.asyncio
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def _count_statements():
+    seen = []
+
+    def _on(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    return seen, _on
+
+
+async def test_init_db_skips_migrations_when_schema_is_current():
+    await init_db()
+    seen, fn = _count_statements()
+    event.listen(engine.sync_engine, 'before_cursor_execute', fn)
+    try:
+        await init_db()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', fn)
+    assert not [s for s in seen if s.lstrip().upper().startswith(('PRAGMA', 'ALTER', 'CREATE', 'DELETE'))]
+    assert len(seen) <= 5
+
+    async with engine.connect() as conn:
+        row = (await conn.execute(text('SELECT version, fingerprint FROM schema_version WHERE id = 1'))).first()
+    assert row[0] == SCHEMA_VERSION and row[1].startswith(f'{SCHEMA_VERSION}:')
+
+
+async def test_missing_version_row_reruns_migrations(monkeypatch):
+    async with engine.begin() as conn:
+        await conn.execute(text('DELETE FROM schema_version'))
+    seen, fn = _count_statements()
+    event.listen(engine.sync_engine, 'before_cursor_execute', fn)
+    try:
+        await init_db()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', fn)
+    assert any(s.startswith('PRAGMA') for s in seen)
+    async with engine.connect() as conn:
+        assert (await conn.execute(text('SELECT COUNT(*) FROM schema_version'))).scalar() == 1
+
+    monkeypatch.setenv('FORCE_SCHEMA_MIGRATIONS', '1')
+    seen.clear()
+    event.listen(engine.sync_engine, 'before_cursor_execute', fn)
+    try:
+        await init_db()
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', fn)
+    assert any(s.startswith('PRAGMA') for s in seen)
+
+
+async def test_heavy_modules_are_not_imported_by_app_main():
+    code = 'import sys, app.main; print(sorted(m for m in ("dateparser", "asyncssh", "app.repl_api") if m in sys.modules))'
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    assert proc.stdout.strip().splitlines()[-1] == '[]'
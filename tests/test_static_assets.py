@@ -0,0 +1,128 @@
+import gzip
+import os
+import httpx
+import pytest
+from httpx import ASGITransport
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from app import static_assets
+from app.compression import CompressionMiddleware
+
+pytestmark = pytest.mark.asyncio
+
+BIG = 'line of a large page\n' * 200
+
+
+def _mini_app(static_dir=None):
+    async def big(request):
+        return PlainTextResponse(BIG)
+
+    async def small(request):
+        return PlainTextResponse('tiny')
+
+    async def binary(request):
+        return Response(os.urandom(4096), media_type='application/octet-stream')
+
+    async def stream(request):
+        async def gen():
+            for _ in range(3):
+                yield BIG.encode()
+        return StreamingResponse(gen(), media_type='text/html')
+
+    async def events(request):
+        async def gen():
+            yield b'data: x\n\n' * 400
+        return StreamingResponse(gen(), media_type='text/event-stream')
+
+    routes = [Route('/big', big), Route('/small', small), Route('/bin', binary),
+              Route('/stream', stream), Route('/events', events)]
+    if static_dir:
+        idx = static_assets.AssetIndex(static_dir)
+        routes.append(Mount('/static', static_assets.AssetStaticFiles(directory=static_dir, index=idx)))
+    mini = Starlette(routes=routes)
+    mini.add_middleware(CompressionMiddleware, minimum_size=1024, content_types=('text/plain', 'text/html', 'text/javascript'))
+    return mini
+
+
+async def test_compression_thresholds_types_and_streaming():
+    async with httpx.AsyncClient(transport=ASGITransport(app=_mini_app()), base_url='http://t') as c:
+        r = await c.get('/big', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['content-encoding'] == 'gzip'
+        assert 'accept-encoding' in r.headers['vary'].lower()
+        assert int(r.headers['content-length']) < len(BIG) // 5
+        assert r.text == BIG
+
+        r = await c.get('/big', headers={'Accept-Encoding': 'identity'})
+        assert 'content-encoding' not in r.headers and r.text == BIG
+
+        for path in ('/small', '/bin', '/events'):
+            r = await c.get(path, headers={'Accept-Encoding': 'gzip'})
+            assert 'content-encoding' not in r.headers, path
+
+        r = await c.get('/stream', headers={'Accept-Encoding': 'gzip'})
+        assert r.headers['content-encoding'] == 'gzip'
+        assert 'content-length' not in r.headers
+        assert r.text == BIG * 3
+
+        r = await c.get('/big', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'})
+        assert 'content-encoding' not in r.headers
+
+
+async def test_versioned_urls_and_precompressed_siblings(tmp_path):
+    (tmp_path / 'js').mkdir()
+    src = tmp_path / 'js' / 'bundle.js'
+    src.write_text('export const x = 1;\n' * 300)
+    (tmp_path / 'tiny.js').write_text('1;')
+    (tmp_path / 'gone.js.gz').write_bytes(b'stale')
+
+    stats = static_assets.build(str(tmp_path))
+    assert stats['removed'] == 1 and not (tmp_path / 'gone.js.gz').exists()
+    assert (tmp_path / 'js' / 'bundle.js.gz').exists() and not (tmp_path / 'tiny.js.gz').exists()
+    assert gzip.decompress((tmp_path / 'js' / 'bundle.js.gz').read_bytes()) == src.read_bytes()
+    assert static_assets.build(str(tmp_path))['written'] == 0
+
+    idx = static_assets.AssetIndex(str(tmp_path))
+    url = idx.url('js/bundle.js')
+    assert url.startswith('/static/js/bundle.') and url.endswith('.js') and url != '/static/js/bundle.js'
+
+    async with httpx.AsyncClient(transport=ASGITransport(app=_mini_app(str(tmp_path))), base_url='http://t') as c:
+        r = await c.get(url, headers={'Accept-Encoding': 'br, gzip'})
+        assert r.status_code == 200
+        assert 'immutable' in r.headers['cache-control']
+        assert r.headers['content-encoding'] == 'gzip'
+        assert r.headers['content-type'].startswith('text/javascript')
+        assert r.text == src.read_text()
+        r2 = await c.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': r.headers['etag']})
+        assert r2.status_code == 304
+
+        r = await c.get('/static/js/bundle.js', headers={'Accept-Encoding': 'identity'})
+        assert r.headers['cache-control'] == 'no-cache' and 'content-encoding' not in r.headers
+
+        # an outdated hash still works but is not cached for long
+        r = await c.get('/static/js/bundle.0000000000.js')
+        assert r.status_code == 200 and r.headers['cache-control'] == 'no-cache'
+
+        # a changed source makes the sibling stale: it is no longer served
+        src.write_text('export const y = 2;\n' * 300)
+        os.utime(src, ns=(src.stat().st_atime_ns, (tmp_path / 'js' / 'bundle.js.gz').stat().st_mtime_ns + 10**9))
+        r = await c.get(idx.url('js/bundle.js'), headers={'Accept-Encoding': 'gzip'})
+        assert r.text == src.read_text()
+        assert idx.url('js/bundle.js') != url
+
+
+async def test_app_pages_link_versioned_static_urls(client):
+    url = static_assets.static_url('calendar-preact.bundle.js')
+    assert static_assets.split_versioned(url[len('/static/'):])[0] == 'calendar-preact.bundle.js'
+    static_assets.build()
+    sibling = os.path.join(static_assets.STATIC_DIR, 'calendar-preact.bundle.js.gz')
+    r = await client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert 'immutable' in r.headers['cache-control']
+    assert r.headers.get('content-encoding') == 'gzip'
+    # the /static mount sends the precompressed sibling as is
+    assert int(r.headers['content-length']) == os.path.getsize(sibling)
+    r = await client.get('/html_no_js/', headers={'Accept-Encoding': 'gzip'})
+    assert r.status_code == 200
+    assert r.headers.get('content-encoding') == 'gzip'
+    assert static_assets.static_url('js/fn-button.js') in r.text
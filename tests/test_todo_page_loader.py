@@ -0,0 +1,75 @@
+import uuid
+import pytest
+from app.query_budget import capture_queries
+from app.todo_page import TodoPageLoader
+
+pytestmark = pytest.mark.asyncio
+
+ROUTE = '/html_no_js/todos/{todo_id}'
+
+
+async def _grow(client, csrf, tid, lid, tag, n):
+    hdr = {'Accept': 'application/json'}
+    for i in range(n):
+        r = await client.post(f'/html_no_js/todos/{tid}/sublists/create', data={'_csrf': csrf, 'name': f'sub {tag} {i}'}, headers=hdr)
+        assert r.status_code == 200
+        sub = r.json()['id']
+        await client.post(f'/lists/{sub}/hashtags', params={'tag': f's{tag}'})
+        await client.post('/todos', json={'text': f'in sub {i}', 'list_id': sub, 'priority': 3 + i % 5})
+        other = (await client.post('/todos', json={'text': f'target {tag} {i} #t{tag}', 'list_id': lid})).json()['id']
+        r = await client.post(f'/html_no_js/todos/{tid}/links', data={'_csrf': csrf, 'tgt_type': 'todo', 'tgt_id': other}, headers=hdr)
+        assert r.status_code == 200
+
+
+async def _statements(client, tid):
+    # first request warms the per-user link / visibility caches
+    assert (await client.get(f'/html_no_js/todos/{tid}')).status_code == 200
+    with capture_queries() as q:
+        r = await client.get(f'/html_no_js/todos/{tid}')
+    assert r.status_code == 200
+    [req] = q.for_route(ROUTE)
+    q.assert_no_n_plus_one(threshold=3)
+    return req.statements, r.text
+
+
+async def test_statement_count_does_not_grow_with_sublists_and_links(client, logged_in):
+    uid, csrf = logged_in
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'tp-{tag}'})).json()['id']
+    tid = (await client.post('/todos', json={'text': f'page {tag} #p{tag}', 'list_id': lid})).json()['id']
+    coll = (await client.post('/lists', params={'name': f'tp-coll-{tag}'})).json()['id']
+    await client.post('/client/json/collations', json={'list_id': coll, 'active': True})
+
+    await _grow(client, csrf, tid, lid, tag, 1)
+    small, _ = await _statements(client, tid)
+    await _grow(client, csrf, tid, lid, tag, 8)
+    large, html = await _statements(client, tid)
+    assert small == large, (small, large)
+    assert large <= 8
+    assert f'sub {tag} 7' in html and f'target {tag} 7' in html
+
+
+async def test_loader_view_model(client, logged_in):
+    uid, csrf = logged_in
+    tag = uuid.uuid4().hex[:6]
+    lid = (await client.post('/lists', params={'name': f'tp-{tag}'})).json()['id']
+    tid = (await client.post('/todos', json={'text': f'page {tag} #p{tag}', 'list_id': lid})).json()['id']
+    coll = (await client.post('/lists', params={'name': f'tp-coll-{tag}'})).json()['id']
+    await client.post('/client/json/collations', json={'list_id': coll, 'active': True})
+    await client.post(f'/client/json/collations/{coll}/toggle', json={'todo_id': tid, 'link': True})
+    await _grow(client, csrf, tid, lid, tag, 2)
+
+    page = await TodoPageLoader(uid).load(tid)
+    assert page.todo['id'] == tid and page.list['id'] == lid and page.completed is False
+    assert page.tags == [f'#p{tag}']
+    # suggestions come from /api/hashtags/vocab, not the page
+    assert 'all_hashtags' not in page.context()
+    assert [s['name'] for s in page.sublists] == [f'sub {tag} 0', f'sub {tag} 1']
+    assert [s['override_priority'] for s in page.sublists] == [3, 4]
+    assert all(s['hashtags'] == [f'#s{tag}'] for s in page.sublists)
+    assert [l['title'] for l in page.links] == [f'target {tag} 0', f'target {tag} 1']
+    assert all(l['tags'] == [f'#t{tag}'] and l['completed'] is False for l in page.links)
+    assert {'list_id': coll, 'name': f'tp-coll-{tag}', 'linked': True} in page.active_collations
+    with pytest.raises(Exception) as ei:
+        await TodoPageLoader(uid).load(10 ** 9)
+    assert getattr(ei.value, 'status_code', None) == 404
@@ -0,0 +1,70 @@
+import pytest
+from sqlmodel import select
+from app.db import async_session
+from app.models import Todo, TodoHashtag, Hashtag
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _make_list(client, name):
+    r = await client.post('/lists', params={'name': name})
+    assert r.status_code == 200
+    return r.json()['id']
+
+
+async def test_bulk_create_inserts_in_order_with_hashtags(client):
+    l1 = await _make_list(client, 'bulk-a')
+    l2 = await _make_list(client, 'bulk-b')
+    items = [
+        {'text': 'first #bulktag', 'list_id': l1},
+        {'text': 'second', 'list_id': l2, 'note': 'has #bulknote', 'priority': 3},
+        {'text': 'third #bulktag', 'list_id': l1},
+    ]
+    r = await client.post('/todos/bulk', json={'items': items})
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body['created'] == 3
+    ids = body['ids']
+    assert len(ids) == 3 and ids == sorted(ids)
+
+    async with async_session() as sess:
+        todos = {t.id: t for t in (await sess.exec(select(Todo).where(Todo.id.in_(ids)))).all()}
+        assert todos[ids[0]].text == 'first'
+        assert todos[ids[0]].list_id == l1
+        assert todos[ids[1]].priority == 3
+        assert todos[ids[1]].created_at is not None
+        res = await sess.exec(
+            select(TodoHashtag.todo_id, Hashtag.tag)
+            .join(Hashtag, Hashtag.id == TodoHashtag.hashtag_id)
+            .where(TodoHashtag.todo_id.in_(ids))
+        )
+        links = set(res.all())
+    assert links == {(ids[0], '#bulktag'), (ids[1], '#bulknote'), (ids[2], '#bulktag')}
+
+
+async def test_bulk_create_is_all_or_nothing(client):
+    l1 = await _make_list(client, 'bulk-atomic')
+    r = await client.post('/todos/bulk', json=[
+        {'text': 'ok', 'list_id': l1},
+        {'text': 'bad list', 'list_id': 99999999},
+    ])
+    assert r.status_code == 404
+    r = await client.post('/todos/bulk', json={'items': [{'text': 'ok', 'list_id': l1}, {'list_id': l1}]})
+    assert r.status_code == 400
+    assert 'items[1]' in r.json()['detail']
+    async with async_session() as sess:
+        res = await sess.exec(select(Todo).where(Todo.list_id == l1))
+        assert res.all() == []
+
+
+async def test_client_json_bulk_create(client):
+    l1 = await _make_list(client, 'bulk-json')
+    r = await client.post('/client/json/todos/bulk', json={'items': [
+        {'text': 'Pay rent every month', 'list_id': l1},
+        {'text': 'plain', 'list_id': l1},
+    ]})
+    assert r.status_code == 200, r.text
+    ids = r.json()['ids']
+    async with async_session() as sess:
+        t = await sess.get(Todo, ids[0])
+        assert t.recurrence_rrule
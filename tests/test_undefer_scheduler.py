@@ -0,0 +1,168 @@
+import asyncio
+import os
+import pytest
+from datetime import timedelta
+from app.db import async_session
+from app.models import Todo
+from app.undefer import UndeferScheduler
+from app.utils import now_utc
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _make_todo(client, name):
+    r = await client.post('/lists', params={'name': name})
+    assert r.status_code == 200
+    lid = r.json()['id']
+    rt = await client.post('/todos', json={'text': f'{name}-todo', 'list_id': lid})
+    assert rt.status_code == 200
+    return rt.json()['id']
+
+
+async def test_scheduler_heap_orders_by_due_time():
+    sched = UndeferScheduler()
+    now = now_utc()
+    sched.schedule(2, now + timedelta(hours=2))
+    sched.schedule(1, now + timedelta(hours=1))
+    sched.schedule(3, now + timedelta(hours=3))
+    assert len(sched) == 3
+    assert sched.next_due() == pytest.approx((now + timedelta(hours=1)).timestamp())
+
+
+async def test_run_once_clears_only_due_entries(client):
+    due_id = await _make_todo(client, 'sched-due')
+    later_id = await _make_todo(client, 'sched-later')
+    async with async_session() as sess:
+        t1 = await sess.get(Todo, due_id)
+        t1.deferred_until = now_utc() - timedelta(seconds=1)
+        t2 = await sess.get(Todo, later_id)
+        t2.deferred_until = now_utc() + timedelta(hours=1)
+        sess.add_all([t1, t2])
+        await sess.commit()
+        du1, du2 = t1.deferred_until, t2.deferred_until
+
+    sched = UndeferScheduler()
+    sched.schedule(due_id, du1)
+    sched.schedule(later_id, du2)
+    n = await sched.run_once()
+    assert n == 1
+    assert len(sched) == 1
+
+    async with async_session() as sess:
+        assert (await sess.get(Todo, due_id)).deferred_until is None
+        assert (await sess.get(Todo, later_id)).deferred_until is not None
+
+
+async def test_stale_entry_after_redefer_is_ignored(client):
+    tid = await _make_todo(client, 'sched-stale')
+    sched = UndeferScheduler()
+    # entry says due now, but the todo has since been deferred further
+    sched.schedule(tid, now_utc() - timedelta(seconds=1))
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        t.deferred_until = now_utc() + timedelta(hours=1)
+        sess.add(t)
+        await sess.commit()
+    assert await sched.run_once() == 0
+    async with async_session() as sess:
+        assert (await sess.get(Todo, tid)).deferred_until is not None
+
+
+async def test_worker_wakes_on_schedule(client):
+    tid = await _make_todo(client, 'sched-wake')
+    due = now_utc() + timedelta(milliseconds=200)
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        t.deferred_until = due
+        sess.add(t)
+        await sess.commit()
+
+    sched = UndeferScheduler()
+    stop = asyncio.Event()
+    task = asyncio.create_task(sched.run(stop))
+    try:
+        # worker is idle with an empty heap; scheduling must wake it
+        await asyncio.sleep(0.05)
+        sched.schedule(tid, due)
+        for _ in range(40):
+            await asyncio.sleep(0.05)
+            async with async_session() as sess:
+                if (await sess.get(Todo, tid)).deferred_until is None:
+                    break
+        async with async_session() as sess:
+            assert (await sess.get(Todo, tid)).deferred_until is None
+    finally:
+        stop.set()
+        task.cancel()
+        try:
+            await task
+        except BaseException:
+            pass
+
+
+async def test_new_leader_fires_deferral_held_by_exited_worker(client, monkeypatch, tmp_path):
+    import fcntl
+    from app import config, workers
+    monkeypatch.setattr(config, 'CACHE_BUS', '1')
+    monkeypatch.setattr(config, 'CACHE_BUS_DIR', str(tmp_path))
+    # another worker is leader; this one started before the deferral existed
+    old_leader = workers._open_lock('leader.lock')
+    fcntl.flock(old_leader, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    sched = UndeferScheduler()
+    assert not workers.is_leader()
+
+    tid = await _make_todo(client, 'sched-takeover')
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        t.deferred_until = now_utc() - timedelta(seconds=1)
+        sess.add(t)
+        await sess.commit()
+
+    stop = asyncio.Event()
+    runner = asyncio.create_task(sched.run(stop))
+    watcher = asyncio.create_task(workers.watch_leadership(stop, sched.seed, interval=0.02))
+    try:
+        await asyncio.sleep(0.1)
+        assert not watcher.done() and len(sched) == 0
+        # the worker that scheduled the deferral (the old leader) exits
+        os.close(old_leader)
+        await asyncio.wait_for(watcher, 2)
+        assert workers.is_leader()
+        for _ in range(100):
+            async with async_session() as sess:
+                if (await sess.get(Todo, tid)).deferred_until is None:
+                    break
+            await asyncio.sleep(0.02)
+        async with async_session() as sess:
+            assert (await sess.get(Todo, tid)).deferred_until is None
+    finally:
+        stop.set()
+        runner.cancel()
+        workers.release_leader()
+
+
+async def test_failed_clear_keeps_entries_for_retry(client):
+    tid = await _make_todo(client, 'sched-retry')
+    async with async_session() as sess:
+        t = await sess.get(Todo, tid)
+        t.deferred_until = now_utc() - timedelta(seconds=1)
+        sess.add(t)
+        await sess.commit()
+        du = t.deferred_until
+
+    class _Locked:
+        async def __aenter__(self):
+            raise RuntimeError('database is locked')
+
+        async def __aexit__(self, *exc):
+            return False
+
+    sched = UndeferScheduler(session_factory=_Locked)
+    sched.schedule(tid, du)
+    with pytest.raises(RuntimeError):
+        await sched.run_once()
+    assert len(sched) == 1
+
+    sched._session_factory = async_session
+    assert await sched.run_once() == 1
+    assert len(sched) == 0
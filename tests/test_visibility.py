@@ -0,0 +1,115 @@
+import uuid
+import pytest
+from sqlalchemy import event
+from sqlalchemy import update as sqlalchemy_update
+from app.db import async_session, engine
+from app.models import ListState, Todo, User
+from app.visibility import visibility
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _tree(client):
+    """parent list -> child list -> todo -> sublist; returns their ids."""
+    tag = uuid.uuid4().hex[:6]
+    parent = (await client.post('/lists', params={'name': f'vis-parent-{tag}'})).json()['id']
+    async with async_session() as sess:
+        child = ListState(name=f'vis-child-{tag}', owner_id=(await sess.get(ListState, parent)).owner_id, parent_list_id=parent)
+        sess.add(child)
+        await sess.commit()
+        todo = Todo(text=f'vis todo {tag}', list_id=child.id)
+        sess.add(todo)
+        await sess.commit()
+        sub = ListState(name=f'vis-sub-{tag}', owner_id=child.owner_id, parent_todo_id=todo.id)
+        sess.add(sub)
+        await sess.commit()
+        return parent, child.id, todo.id, sub.id
+
+
+async def test_trash_hides_descendants_and_restore_invalidates(client, logged_in):
+    uid, csrf = logged_in
+    parent, child, todo_id, sub = await _tree(client)
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+    assert not ({parent, child, sub} & vis.hidden_list_ids)
+
+    r = await client.post(f'/html_no_js/lists/{parent}/delete', data={'_csrf': csrf})
+    assert r.status_code in (200, 302, 303)
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+    assert vis.trash_list_id is not None and vis.is_hidden(vis.trash_list_id)
+    assert {parent, child, sub} <= vis.trashed_list_ids
+
+    r = await client.post(f'/html_no_js/trash/lists/{parent}/restore', data={'_csrf': csrf})
+    assert r.status_code in (200, 302, 303)
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+    assert not ({parent, child, sub} & vis.hidden_list_ids)
+
+
+async def test_trashed_child_and_cache_hits_skip_sql(client, logged_in):
+    uid, csrf = logged_in
+    parent, child, todo_id, sub = await _tree(client)
+    await client.post(f'/html_no_js/lists/{child}/delete', data={'_csrf': csrf})
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+    assert {child, sub} <= vis.trashed_list_ids and parent not in vis.hidden_list_ids
+
+    seen = []
+
+    def _on(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    event.listen(engine.sync_engine, 'before_cursor_execute', _on)
+    try:
+        async with async_session() as sess:
+            again = await visibility.get(sess, uid)
+    finally:
+        event.remove(engine.sync_engine, 'before_cursor_execute', _on)
+    assert again is vis and seen == []
+
+
+async def test_moving_a_todo_into_trash_hides_its_sublists(client, logged_in):
+    uid, csrf = logged_in
+    parent, child, todo_id, sub = await _tree(client)
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+        assert not vis.is_hidden(sub)
+        trash_id = vis.trash_list_id
+        if trash_id is None:
+            trash = ListState(name='Trash', owner_id=uid)
+            sess.add(trash)
+            await sess.commit()
+            trash_id = trash.id
+        todo = await sess.get(Todo, todo_id)
+        todo.list_id = trash_id
+        sess.add(todo)
+        await sess.commit()
+    async with async_session() as sess:
+        vis = await visibility.get(sess, uid)
+    assert vis.is_hidden(sub) and not vis.is_hidden(child)
+
+
+async def test_bulk_and_todo_writes_drop_only_their_owner(client, logged_in):
+    uid, csrf = logged_in
+    parent, child, todo_id, sub = await _tree(client)
+    async with async_session() as sess:
+        other = User(username=f'vis-other-{uuid.uuid4().hex[:8]}', password_hash='x')
+        sess.add(other)
+        await sess.commit()
+        other_id = other.id
+        await visibility.get(sess, uid)
+        await visibility.get(sess, other_id)
+    assert visibility.peek(uid) is not None and visibility.peek(other_id) is not None
+
+    async with async_session() as sess:
+        await sess.exec(sqlalchemy_update(ListState).where(ListState.id == child).values(parent_list_id=None))
+        await sess.commit()
+    assert visibility.peek(uid) is None and visibility.peek(other_id) is not None
+
+    async with async_session() as sess:
+        await visibility.get(sess, uid)
+        todo = await sess.get(Todo, todo_id)
+        todo.list_id = parent
+        sess.add(todo)
+        await sess.commit()
+    assert visibility.peek(uid) is None and visibility.peek(other_id) is not None
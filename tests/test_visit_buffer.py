@@ -0,0 +1,111 @@
+import uuid
+import pytest
+from sqlmodel import select
+from app.db import async_session
+from app.models import ListState, RecentListVisit, User
+from app.visits import VisitBuffer
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _user_with_lists(n):
+    async with async_session() as sess:
+        u = User(username=f'visitbuf-{uuid.uuid4().hex[:8]}', password_hash='x')
+        sess.add(u)
+        await sess.commit()
+        await sess.refresh(u)
+        lists = [ListState(name=f'vb{i}', owner_id=u.id) for i in range(n)]
+        sess.add_all(lists)
+        await sess.commit()
+        return u.id, [l.id for l in lists]
+
+
+async def test_flush_matches_view_and_top_n_semantics(ensure_db, monkeypatch):
+    monkeypatch.setenv('RECENT_LISTS_TOP_N', '3')
+    buf = VisitBuffer('list', 'RECENT_LISTS_TOP_N', 'RECENT_LISTS_PER_USER')
+    uid, (a, b, c, d) = await _user_with_lists(4)
+    for lid in (a, b, c, d):
+        buf.record(uid, lid)
+    async with async_session() as sess:
+        before = await buf.view(sess, uid, 10)
+    # D at top, C next; A and B evicted from the top-N but still recent
+    assert [(i, p) for i, _, p in before] == [(d, 0), (c, 1), (b, None), (a, None)]
+
+    assert await buf.flush() == 4
+    assert buf.pending_count() == 0
+    async with async_session() as sess:
+        after = await buf.view(sess, uid, 10)
+        rows = (await sess.exec(select(RecentListVisit).where(RecentListVisit.user_id == uid))).all()
+    assert [(i, p) for i, _, p in after] == [(i, p) for i, _, p in before]
+    assert {r.list_id: r.position for r in rows} == {a: None, b: None, c: 1, d: 0}
+
+    # revisiting a top-N item only refreshes visited_at
+    buf.record(uid, c)
+    await buf.flush()
+    async with async_session() as sess:
+        view = await buf.view(sess, uid, 2)
+    assert [(i, p) for i, _, p in view] == [(d, 0), (c, 1)]
+
+
+async def test_repeat_visits_are_coalesced(ensure_db):
+    buf = VisitBuffer('list', 'RECENT_LISTS_TOP_N', 'RECENT_LISTS_PER_USER')
+    uid, (a, b) = await _user_with_lists(2)
+    for _ in range(5):
+        buf.record(uid, a)
+        buf.record(uid, b)
+    assert buf.pending_count() == 2
+    assert buf.coalesced == 8
+    await buf.flush()
+    async with async_session() as sess:
+        rows = (await sess.exec(select(RecentListVisit).where(RecentListVisit.user_id == uid))).all()
+    assert {r.list_id: r.position for r in rows} == {b: 0, a: 1}
+
+
+async def test_visits_to_deleted_items_are_dropped(ensure_db):
+    buf = VisitBuffer('list', 'RECENT_LISTS_TOP_N', 'RECENT_LISTS_PER_USER')
+    uid, (a,) = await _user_with_lists(1)
+    buf.record(uid, a)
+    buf.record(uid, 999999999)
+    await buf.flush()
+    async with async_session() as sess:
+        rows = (await sess.exec(select(RecentListVisit.list_id).where(RecentListVisit.user_id == uid))).all()
+    assert rows == [a]
+
+
+async def test_recent_lists_page_past_sublists(ensure_db, monkeypatch):
+    from app.main import _get_recent_lists_impl
+    from app.visits import list_visits
+    monkeypatch.setenv('RECENT_LISTS_TOP_N', '3')
+    uid, (a, b) = await _user_with_lists(2)
+    async with async_session() as sess:
+        subs = [ListState(name=f'vbsub{i}', owner_id=uid, parent_list_id=a) for i in range(8)]
+        sess.add_all(subs)
+        await sess.commit()
+        sub_ids = [s.id for s in subs]
+        user = await sess.get(User, uid)
+    # the two top-level lists are older than more than top_n + limit sublists
+    for lid in [a, b] + sub_ids:
+        list_visits.record(uid, lid)
+    recent = await _get_recent_lists_impl(2, user)
+    assert [l.id for l in recent] == [b, a]
+    await list_visits.flush()
+    recent = await _get_recent_lists_impl(5, user)
+    assert [l.id for l in recent] == [b, a]
+
+
+async def test_unbuffered_visit_survives_flush_failure(ensure_db, monkeypatch):
+    from app.main import record_list_visit
+    from app.visits import list_visits
+    monkeypatch.setenv('VISIT_BUFFER_ENABLED', '0')
+    uid, (a,) = await _user_with_lists(1)
+    async with async_session() as sess:
+        user = await sess.get(User, uid)
+
+    async def _locked(sess, batch):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(list_visits, '_write_batch', _locked)
+    out = await record_list_visit(list_id=a, current_user=user)
+    assert out['list_id'] == a
+    # requeued for the background flusher
+    monkeypatch.undo()
+    assert await list_visits.flush(user_id=uid) == 1
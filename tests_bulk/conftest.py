@@ -120,3 +120,16 @@ def make_todo(app_client: TestClient, auth_headers: dict):
         assert r.status_code == 200, r.text
         return r.json()["id"]
     return _make
+
+
+@pytest.fixture
+def sql_queries(app_client: TestClient):
+    """Context-manager factory recording SQL statements per request.
+
+        with sql_queries() as q:
+            app_client.get(...)
+        q.assert_max(60, route='/html_no_js/')
+        q.assert_no_n_plus_one()
+    """
+    from app.query_budget import capture_queries
+    return capture_queries
@@ -0,0 +1,87 @@
+import pytest
+
+
+pytestmark = pytest.mark.bulk
+
+
+# Statement budgets for the heaviest pages. They sit a little above what the
+# pages ran when these tests were written; growth past them usually means a
+# per-item query crept into a loop.
+BUDGETS = {
+    '/html_no_js/': 50,
+    '/html_no_js/lists/{list_id}': 30,
+    '/html_no_js/tree': 30,
+    '/calendar/occurrences': 20,
+}
+
+
+@pytest.fixture(scope="module")
+def populated_list(make_list, make_todo):
+    lid = make_list("BudgetList")
+    for i in range(30):
+        make_todo(lid, text=f"budget todo {i} #budget due {i % 28 + 1}/1/2030", note=f"note {i}")
+    for i in range(5):
+        make_list(f"BudgetSibling{i}")
+    return lid
+
+
+def test_list_page_statement_budget(app_client, auth_headers, populated_list, sql_queries):
+    with sql_queries() as q:
+        r = app_client.get(f"/html_no_js/lists/{populated_list}", headers=auth_headers)
+    assert r.status_code == 200, r.text
+    route = '/html_no_js/lists/{list_id}'
+    assert q.for_route(route), q.requests
+    q.assert_max(BUDGETS[route], route=route)
+    q.assert_no_n_plus_one(route=route)
+
+
+def test_list_page_count_does_not_grow_with_todos(app_client, auth_headers, make_list, make_todo, sql_queries):
+    small, large = make_list("BudgetSmall"), make_list("BudgetLarge")
+    make_todo(small, text="only todo")
+    for i in range(40):
+        make_todo(large, text=f"many {i}")
+    with sql_queries() as q:
+        app_client.get(f"/html_no_js/lists/{small}", headers=auth_headers)
+        app_client.get(f"/html_no_js/lists/{large}", headers=auth_headers)
+    a, b = q.for_route('/html_no_js/lists/{list_id}')
+    # a handful of extra statements is fine; one per todo is not
+    assert b.statements - a.statements < 10, (a.summary(), b.summary())
+
+
+def test_tree_view_statement_budget(app_client, auth_headers, populated_list, sql_queries):
+    with sql_queries() as q:
+        r = app_client.get("/html_no_js/tree", params={"show_todos": True}, headers=auth_headers)
+    assert r.status_code == 200, r.text
+    q.assert_max(BUDGETS['/html_no_js/tree'], route='/html_no_js/tree')
+    q.assert_no_n_plus_one(route='/html_no_js/tree')
+
+
+def test_index_statement_budget(app_client, sql_queries):
+    # the index needs a cookie session (bearer-only requests are redirected
+    # to the login page), so log a fresh user in on a separate client
+    from fastapi.testclient import TestClient
+    from tests_bulk.conftest import _create_user_and_login
+
+    username, password, tok = _create_user_and_login(app_client)
+    headers = {"Authorization": f"Bearer {tok}"}
+    for i in range(8):
+        r = app_client.post("/lists", params={"name": f"IndexBudget{i}"}, headers=headers)
+        lid = r.json()["id"]
+        app_client.post("/todos", json={"text": f"index todo {i} #idx", "list_id": lid}, headers=headers)
+    browser = TestClient(app_client.app)
+    r = browser.post("/html_no_js/login", data={"username": username, "password": password})
+    assert r.status_code == 200, r.text
+    with sql_queries() as q:
+        r = browser.get("/html_no_js/")
+    assert r.status_code == 200, r.text
+    assert q.for_route('/html_no_js/') and q.for_route('/html_no_js/')[0].status == 200
+    q.assert_max(BUDGETS['/html_no_js/'], route='/html_no_js/')
+    q.assert_no_n_plus_one(route='/html_no_js/')
+
+
+def test_calendar_occurrences_statement_budget(app_client, auth_headers, populated_list, sql_queries):
+    with sql_queries() as q:
+        r = app_client.get("/calendar/occurrences", headers=auth_headers)
+    assert r.status_code == 200, r.text
+    q.assert_max(BUDGETS['/calendar/occurrences'], route='/calendar/occurrences')
+    q.assert_no_n_plus_one(route='/calendar/occurrences')